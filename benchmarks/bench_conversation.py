@@ -0,0 +1,63 @@
+"""
+Benchmark de memoria y tiempo del modelo de conversación (chat_cli.conversation).
+
+Compara, para una conversación de N mensajes (10k por defecto):
+  - antes: la TUI copiaba la lista en cada mensaje (`history = history + [dict]`)
+    y el proveedor guardaba su propia lista de dicts;
+  - ahora: una sola Conversation con mensajes __slots__ añadidos en el lugar.
+
+Uso: python benchmarks/bench_conversation.py [--messages 10000]
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from chat_cli.conversation import Conversation, now_timestamp
+
+def _texts(count):
+    # Contenido de tamaño realista y distinto en cada mensaje
+    return [(("user", f"Pregunta {i}: ¿cómo optimizo la consulta número {i}?") if i % 2 == 0 else
+             ("assistant", f"Respuesta {i}: " + "usa un índice compuesto y evita SELECT *. " * 4))
+            for i in range(count)]
+
+def legacy(texts):
+    tui_history, provider_history = [], []
+    for role, content in texts:
+        timestamp = now_timestamp()
+        tui_history = tui_history + [{"role": role, "content": content, "timestamp": timestamp}]
+        provider_history.append({"role": role, "content": content})
+    return tui_history, provider_history
+
+def single_source(texts):
+    conversation = Conversation()
+    for role, content in texts:
+        conversation.add(role, content)
+    return conversation
+
+def measure(function, texts):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(texts)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return elapsed, current, peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=10_000)
+    args = parser.parse_args()
+    texts = _texts(args.messages)
+    print(f"Conversación de {args.messages} mensajes (el contenido de texto no se cuenta)")
+    print(f"{'modelo':<16}{'tiempo (ms)':>14}{'memoria (KiB)':>16}{'pico (KiB)':>14}")
+    for name, function in (("dicts + copias", legacy), ("Conversation", single_source)):
+        elapsed, current, peak = measure(function, texts)
+        print(f"{name:<16}{elapsed * 1000:>14.1f}{current / 1024:>16.0f}{peak / 1024:>14.0f}")
+
+if __name__ == "__main__":
+    main()
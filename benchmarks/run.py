@@ -0,0 +1,424 @@
+"""
+Micro-benchmarks de las rutas críticas del cliente.
+
+Casos: guardar/cargar history.json (1k a 100k mensajes), parseo del streaming
+de cada proveedor, render de Markdown y bucle de repintado de la TUI,
+construcción del payload (_prepare_messages, _build_payload), import en frío
+de chat_cli.cli y un turno de `chat-cli repl` frente al import de la TUI.
+Con cassettes grabados en benchmarks/cassettes/ (ver chat_cli/providers/cassette.py)
+se añaden casos `replay.*` que reproducen tráfico real de Anthropic, OpenAI u
+Ollama sin red: el stream completo del proveedor y un turno del REPL (render e
+historial).
+
+Uso:
+    python benchmarks/run.py                         # Todos los casos -> benchmarks/results.json
+    python benchmarks/run.py -k history --quick      # Filtrar por nombre, tamaños reducidos
+    python benchmarks/run.py --save-baseline         # Guarda benchmarks/baselines/<python>-<plataforma>.json
+    python benchmarks/run.py --compare benchmarks/baselines/cpython-3.11-linux.json --threshold 0.15
+    python benchmarks/run.py -k replay --cassettes grabaciones/ --replay-speed 1
+
+Con --compare, el código de salida es 1 si algún caso es más lento que la línea
+base en más del umbral (mediana por llamada). Las líneas base son tiempos
+absolutos de la máquina que las grabó: solo sirven para comparar en esa misma
+máquina (o una equivalente); en otra, genera antes la propia con --save-baseline.
+"""
+
+import argparse
+import asyncio
+import fnmatch
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+BASELINES_DIR = Path(__file__).resolve().parent / "baselines"
+DEFAULT_OUTPUT = Path(__file__).resolve().parent / "results.json"
+CASSETTES_DIR = Path(__file__).resolve().parent / "cassettes"
+DEFAULT_THRESHOLD = 0.15   # 15 % más lento que la línea base se considera regresión
+
+CASES = {}   # nombre -> función(quick) que prepara el caso y retorna el callable a medir
+
+def case(name, sizes=None, quick_sizes=None):
+    """Registra un caso; con `sizes`, uno por tamaño ("nombre[tamaño]")."""
+    def register(setup):
+        if sizes is None:
+            CASES[name] = lambda quick: setup()
+        else:
+            for size in sizes:
+                CASES[f"{name}[{size}]"] = (lambda size: lambda quick: setup(size))(size)
+                CASES[f"{name}[{size}]"].quick = size in (quick_sizes or sizes)
+        return setup
+    return register
+
+def _messages(count):
+    return [{"role": "user" if i % 2 == 0 else "assistant",
+             "content": f"Mensaje {i}: " + "texto de ejemplo con algo de contenido. " * 4,
+             "timestamp": "2025-05-01 10:00:00"} for i in range(count)]
+
+_tmp_dir = None
+
+def _tmp_path(name):
+    """Ruta de trabajo de un caso; el directorio temporal se crea al primer uso y se borra al salir."""
+    global _tmp_dir
+    if _tmp_dir is None:
+        _tmp_dir = tempfile.TemporaryDirectory(prefix="chat_cli_bench_")
+    return os.path.join(_tmp_dir.name, name)
+
+# --- Historial ---
+
+@case("history.save", sizes=(1_000, 10_000, 100_000), quick_sizes=(1_000, 10_000))
+def _history_save(size):
+    from chat_cli.history import save_history
+    messages, path = _messages(size), _tmp_path(f"save-{size}.json")
+    return lambda: save_history(messages, path)
+
+@case("history.load", sizes=(1_000, 10_000, 100_000), quick_sizes=(1_000, 10_000))
+def _history_load(size):
+    from chat_cli.history import load_history, save_history
+    path = _tmp_path(f"load-{size}.json")
+    save_history(_messages(size), path)
+    return lambda: load_history(path)
+
+@case("conversation.append", sizes=(10_000,))
+def _conversation_append(size):
+    from chat_cli.conversation import Conversation
+    texts = [(m["role"], m["content"], m["timestamp"]) for m in _messages(size)]
+
+    def run():
+        conversation = Conversation()
+        for role, content, timestamp in texts:
+            conversation.add(role, content, timestamp)
+    return run
+
+# --- Parseo de streaming (2 000 fragmentos por respuesta) ---
+
+STREAM_TOKENS = 2_000
+
+@case("stream.anthropic")
+def _stream_anthropic():
+    from chat_cli.providers.anthropic import AnthropicProvider
+    provider = AnthropicProvider(api_key="bench")
+    lines = [b'data: {"type": "message_start", "message": {"usage": {"input_tokens": 10}}}']
+    lines += [b"event: content_block_delta", b'data: {"type": "content_block_delta", "index": 0, '
+              b'"delta": {"type": "text_delta", "text": "palabra "}}'] * STREAM_TOKENS
+    lines += [b'data: {"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": 2000}}']
+    return lambda: sum(1 for _ in provider._iter_stream_text(lines))
+
+@case("stream.ollama")
+def _stream_ollama():
+    from chat_cli.providers.ollama import OllamaProvider
+    provider = OllamaProvider(model="bench")
+    lines = [b'{"model": "bench", "message": {"role": "assistant", "content": "palabra "}, "done": false}'] * STREAM_TOKENS
+    lines += [b'{"model": "bench", "done": true, "prompt_eval_count": 10, "eval_count": 2000}']
+    return lambda: sum(1 for _ in provider._iter_stream_text(lines))
+
+@case("stream.openai")
+def _stream_openai():
+    from chat_cli.providers.openai import OpenAIProvider
+    from openai.types.chat import ChatCompletionChunk
+    chunk = ChatCompletionChunk.model_validate({
+        "id": "c", "object": "chat.completion.chunk", "created": 0, "model": "bench",
+        "choices": [{"index": 0, "delta": {"content": "palabra "}, "finish_reason": None}]})
+    chunks = [chunk] * STREAM_TOKENS
+    provider = OpenAIProvider(api_key="bench", model="bench")
+    provider.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+        create=lambda **kwargs: iter(chunks))))
+
+    def run():
+        provider.history = []  # Cada turno se añade al historial: que no crezca entre repeticiones
+        return sum(1 for _ in provider.stream_message("hola"))
+    return run
+
+@case("stream.gemini")
+def _stream_gemini():
+    from google.ai import generativelanguage as glm
+    from chat_cli.providers.gemini import GeminiProvider
+    content = glm.Content(role="model", parts=[glm.Part(text="palabra ")])
+    chunks = [glm.GenerateContentResponse(candidates=[glm.Candidate(content=content)])] * (STREAM_TOKENS - 1)
+    chunks.append(glm.GenerateContentResponse(
+        candidates=[glm.Candidate(content=content, finish_reason=glm.Candidate.FinishReason.STOP)],
+        usage_metadata={"prompt_token_count": 10, "candidates_token_count": 2000, "total_token_count": 2010}))
+    provider = GeminiProvider(api_key="bench", model="bench")
+    # Transporte falso bajo el SDK: mide stream_message completo (ChatSession, GenerateContentResponse
+    # y el parseo de cada fragmento) sin red
+    provider.client._client = SimpleNamespace(stream_generate_content=lambda request, **kwargs: iter(chunks))
+
+    def run():
+        provider.history = []
+        return sum(1 for _ in provider.stream_message("hola"))
+    return run
+
+# --- Render de la TUI ---
+
+RESPONSE = ("## Respuesta\n\nTexto con **negritas**, `código` y una lista:\n\n" +
+            "".join(f"- elemento {i}\n" for i in range(20)) +
+            "\n```python\n" + "".join(f"def funcion_{i}(x):\n    return x * {i}\n\n" for i in range(30)) + "```\n" +
+            "Conclusión final del ejemplo. " * 20)
+
+@case("render.markdown_frame")
+def _render_markdown():
+    from rich.console import Console
+    from chat_cli.highlight import CachedMarkdown
+    console = Console(file=io.StringIO(), width=100, force_terminal=True, color_system="truecolor")
+
+    def run():
+        console.file.seek(0)
+        console.file.truncate()
+        console.print(CachedMarkdown(RESPONSE))
+    return run
+
+@case("render.scheduler_flush")
+def _render_scheduler():
+    from chat_cli.render import RenderScheduler
+    tokens = [RESPONSE[i:i + 8] for i in range(0, len(RESPONSE), 8)] * 4
+
+    def run():
+        frames = []
+        # FPS muy alto: mide el costo propio del bucle de coalescencia y repintado
+        scheduler = RenderScheduler(max_fps=10_000, min_fps=10_000, queue_size=256)
+        asyncio.run(scheduler.run(lambda: iter(tokens), lambda text: frames.append(len(text))))
+    return run
+
+# --- Payloads ---
+
+@case("payload.anthropic_prepare_messages", sizes=(100, 1_000))
+def _payload_anthropic(size):
+    from chat_cli.providers.anthropic import AnthropicProvider
+    provider = AnthropicProvider(api_key="bench")
+    history = [{"role": m["role"], "content": m["content"]} for m in _messages(size)]
+
+    def run():
+        provider.history = list(history)
+        provider._prepare_messages("nueva pregunta")
+    return run
+
+@case("payload.ollama_build_payload", sizes=(100, 1_000))
+def _payload_ollama(size):
+    from chat_cli.conversation import Conversation
+    from chat_cli.providers.ollama import OllamaProvider
+    provider = OllamaProvider(model="bench")
+    provider.history = Conversation(_messages(size))
+    return lambda: json.dumps(provider._build_payload(stream=True))
+
+# --- Arranque ---
+
+def _cold_import(module):
+    command = [sys.executable, "-c", f"import {module}"]
+    env = {**os.environ, "PYTHONPATH": str(ROOT), "PYTHONDONTWRITEBYTECODE": "1"}
+    return lambda: subprocess.run(command, env=env, check=True)
+
+@case("import.chat_cli_cli")
+def _import_cli():
+    return _cold_import("chat_cli.cli")
+
+# `chat-cli repl` frente a la TUI: arranque y costo de un turno en streaming
+@case("import.chat_cli_repl")
+def _import_repl():
+    return _cold_import("chat_cli.repl")
+
+@case("import.chat_cli_tui")
+def _import_tui():
+    return _cold_import("chat_cli.tui")
+
+@case("repl.stream_turn")
+def _repl_turn():
+    from rich.console import Console
+    from chat_cli.repl import Repl
+    tokens = [RESPONSE[i:i + 8] for i in range(0, len(RESPONSE), 8)]
+    provider = SimpleNamespace(model="bench", history=[], stream_message=lambda prompt: iter(tokens))
+    console = Console(file=io.StringIO(), width=100, force_terminal=True)
+    repl = Repl(provider, console=console, history_file=_tmp_path("repl-history.json"))
+    repl.usage.record_turn = lambda *args: None
+    repl.max_fps = 30
+
+    def run():
+        console.file.seek(0)
+        console.file.truncate()
+        repl.turn("hola")
+    return run
+
+# --- Tráfico grabado (cassettes) ---
+
+# Sufijo de la ruta de la petición -> proveedor que la genera
+CASSETTE_ENDPOINTS = (("/v1/messages", "anthropic"), ("/chat/completions", "openai"), ("/api/chat", "ollama"))
+
+def _cassette_provider(cassette):
+    """(proveedor, modelo) de la primera petición de chat grabada, o (None, None)."""
+    for interaction in cassette.interactions:
+        request = interaction["request"]
+        for suffix, name in CASSETTE_ENDPOINTS:
+            if urlsplit(request["url"]).path.endswith(suffix):
+                return name, (request["body"] or {}).get("model")
+    return None, None
+
+def _replay_provider(path, speed):
+    from chat_cli.providers import get_provider_class
+    from chat_cli.providers.cassette import Cassette, set_cassette
+    cassette = set_cassette(Cassette(path, mode="replay", speed=speed))
+    name, model = _cassette_provider(cassette)
+    if name is None:
+        raise ValueError(f"{path}: sin peticiones de chat reconocibles")
+    kwargs = {"anthropic": {"api_key": "cassette", "mcp_enabled": False}, "openai": {"api_key": "cassette"}}
+    return get_provider_class(name)(model=model, **kwargs.get(name, {}))
+
+def register_cassettes(directory, speed: float = 0.0):
+    """Registra `replay.<archivo>.stream` y `replay.<archivo>.repl_turn` por cada cassette de `directory`."""
+    names = []
+    for path in sorted(Path(directory).glob("*.jsonl")):
+        def stream(quick, path=path):
+            provider = _replay_provider(path, speed)
+
+            def run():
+                provider.history = []
+                return sum(1 for _ in provider.stream_message("hola"))
+            return run
+
+        def repl_turn(quick, path=path):
+            from rich.console import Console
+            from chat_cli.repl import Repl
+            provider = _replay_provider(path, speed)
+            console = Console(file=io.StringIO(), width=100, force_terminal=True)
+            repl = Repl(provider, console=console, history_file=_tmp_path(f"replay-{path.stem}.json"))
+            repl.usage.record_turn = lambda *args: None
+            repl.max_fps = 30
+
+            def run():
+                console.file.seek(0)
+                console.file.truncate()
+                repl.conversation.clear()
+                repl.turn("hola")
+            return run
+        for kind, setup in (("stream", stream), ("repl_turn", repl_turn)):
+            CASES[f"replay.{path.stem}.{kind}"] = setup
+            names.append(f"replay.{path.stem}.{kind}")
+    return names
+
+def measure(function, repeat: int, min_time: float):
+    """Tiempos por llamada (segundos) de `repeat` muestras de al menos `min_time` cada una."""
+    timer = timeit.Timer(function)
+    loops = 1
+    while True:
+        elapsed = timer.timeit(loops)
+        if elapsed >= min_time or loops >= 1_000_000:
+            break
+        loops = max(loops * 2, int(loops * min_time / max(elapsed, 1e-9)))
+    samples = [elapsed / loops] + [t / loops for t in timer.repeat(repeat - 1, loops)]
+    return {"min": min(samples), "median": statistics.median(samples), "mean": statistics.fmean(samples),
+            "loops": loops, "repeat": repeat}
+
+def run_cases(pattern: str = None, quick: bool = False, smoke: bool = False, repeat: int = 5,
+              min_time: float = 0.2, echo=print):
+    results = {}
+    for name, setup in CASES.items():
+        if pattern and not fnmatch.fnmatch(name, f"*{pattern}*"):
+            continue
+        if (quick or smoke) and not getattr(setup, "quick", True):
+            continue
+        function = setup(quick)
+        if smoke:
+            start = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - start
+            results[name] = {"min": elapsed, "median": elapsed, "mean": elapsed, "loops": 1, "repeat": 1}
+        else:
+            results[name] = measure(function, repeat, min_time)
+        echo(f"{name:<45}{results[name]['median'] * 1000:>12.3f} ms")
+    return results
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"python": platform.python_version(), "implementation": platform.python_implementation(),
+            "platform": platform.platform(), "machine": platform.machine(), "commit": commit,
+            "date": datetime.now().isoformat(timespec="seconds")}
+
+def baseline_path() -> Path:
+    return BASELINES_DIR / f"{platform.python_implementation().lower()}-{platform.python_version_tuple()[0]}." \
+                           f"{platform.python_version_tuple()[1]}-{sys.platform}.json"
+
+def compare(results, baseline, threshold: float = DEFAULT_THRESHOLD):
+    """Filas (caso, base, actual, cambio relativo, regresión) de los casos presentes en ambos."""
+    rows = []
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous:
+            continue
+        change = result["median"] / previous["median"] - 1 if previous["median"] else 0.0
+        rows.append((name, previous["median"], result["median"], change, change > threshold))
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmarks de chat_cli")
+    parser.add_argument("-k", dest="pattern", help="Solo los casos cuyo nombre contiene este texto (admite comodines)")
+    parser.add_argument("--quick", action="store_true", help="Omite los tamaños más grandes")
+    parser.add_argument("--smoke", action="store_true", help="Ejecuta cada caso una sola vez (verificación rápida)")
+    parser.add_argument("--repeat", type=int, default=5, help="Muestras por caso")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Duración mínima de cada muestra (s)")
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT, help="Archivo JSON de resultados")
+    parser.add_argument("--save-baseline", action="store_true", help="Guarda también los resultados como línea base")
+    parser.add_argument("--compare", type=Path, help="Línea base JSON con la que comparar")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Aumento relativo de la mediana que cuenta como regresión (0.15 = 15 %%)")
+    parser.add_argument("--cassettes", type=Path, default=CASSETTES_DIR,
+                        help="Directorio con cassettes (*.jsonl) para los casos replay.*")
+    parser.add_argument("--replay-speed", type=float, default=0.0,
+                        help="Velocidad de reproducción de los cassettes (0 = instantánea, 1 = tiempos originales)")
+    parser.add_argument("--list", action="store_true", help="Lista los casos y termina")
+    args = parser.parse_args(argv)
+
+    if args.cassettes.is_dir():
+        register_cassettes(args.cassettes, args.replay_speed)
+
+    if args.list:
+        print("\n".join(CASES))
+        return 0
+    try:
+        results = run_cases(args.pattern, args.quick, args.smoke, args.repeat, args.min_time)
+    finally:
+        from chat_cli.providers.cassette import set_cassette
+        set_cassette(None)  # Los casos replay.* dejan activo su cassette
+    report = {"environment": environment(), "results": results}
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, indent=2))
+    print(f"\nResultados guardados en {args.output}")
+    if args.save_baseline:
+        path = baseline_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(report, indent=2))
+        print(f"Línea base guardada en {path}")
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        rows = compare(results, baseline, args.threshold)
+        print(f"\nComparación con {args.compare} (umbral {args.threshold:.0%}):")
+        recorded = baseline.get("environment") or {}
+        current = environment()
+        if any(recorded.get(key) not in (None, current[key]) for key in ("platform", "machine", "python")):
+            print(f"Aviso: la línea base se grabó en otra máquina ({recorded.get('platform')}, Python "
+                  f"{recorded.get('python')}); los tiempos absolutos no son comparables.")
+        for name, previous, current, change, regression in rows:
+            flag = "  REGRESIÓN" if regression else ""
+            print(f"{name:<45}{previous * 1000:>10.3f} -> {current * 1000:>10.3f} ms  {change:+7.1%}{flag}")
+        regressions = [row[0] for row in rows if row[4]]
+        if regressions:
+            print(f"\n{len(regressions)} regresiones: {', '.join(regressions)}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
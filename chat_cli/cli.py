@@ -1,98 +1,74 @@
 import typer
-from .providers import get_provider_names
-from .providers.openai import OpenAIProvider
-from .providers.ollama import OllamaProvider
-from .providers.gemini import GeminiProvider
-from .providers.anthropic import AnthropicProvider
-from .tui import ChatApp
-from .history import load_history, save_history, add_message, clear_history, export_history_txt
+from typing import List
+from .providers import get_provider_names, create_provider
+from .history import clear_history
+from .usage import USAGE_FILE, usage_report
+from .config import get_setting
 from rich.console import Console
-from rich.markdown import Markdown
 from rich.prompt import Prompt, Confirm 
 from rich.panel import Panel 
+from rich.table import Table
 import sys 
+import time
+# Textual, Rich Markdown y los SDK de proveedores se importan dentro de cada comando:
+# `chat-cli ask` no debe pagar su tiempo de carga.
 
 console = Console()
 app = typer.Typer(add_completion=False) 
 
 # --- Helper Functions --- 
 
-def _get_provider_instance(provider_name: str, model: str = None, stream: bool = False, mcp: bool = False):
-    """Initializes and returns a provider instance."""
+def _get_provider_instance(provider_name: str, model: str = None, stream: bool = False, mcp: bool = False,
+                           discovery=None):
+    """
+    Initializes and returns a provider instance, pre-warming its connection in the background.
+    With a ProviderDiscovery from the startup menu, the instance it already built is reused.
+    """
+    from .providers.connection import start_prewarm
+    from .daemon import get_remote_provider
+    if provider_name not in get_provider_names():
+        console.print(f"Proveedor '{provider_name}' no soportado.", style="red")
+        raise typer.Exit(1)
+    # Con `chat-cli daemon` corriendo, el proveedor ya está inicializado y conectado allí
+    # (salvo `auto`, que enruta localmente para mostrar su decisión en cada turno)
+    remote = None if provider_name == "auto" else \
+        get_remote_provider(provider_name, model=model, mcp_enabled=mcp and provider_name == "anthropic")
+    if remote is not None:
+        return remote
+    reused = discovery.take(provider_name, model) if discovery else None
+    if reused is not None:
+        if mcp and hasattr(reused, "set_mcp_enabled"):
+            reused.set_mcp_enabled(True)
+            console.print("Model Context Protocol (M.C.P) activado para Anthropic.")
+        start_prewarm(reused)  # Mantiene viva la conexión que abrió el sondeo
+        return reused
     try:
-        if provider_name == "openai":
-            return OpenAIProvider(model=model) 
-        elif provider_name == "ollama":
-            return OllamaProvider(model=model) 
-        elif provider_name == "gemini":
-            return GeminiProvider(model=model) 
+        if provider_name == "auto" and discovery:
+            instance = create_provider(provider_name, model=model, provider_factory=discovery.provider_factory)
         elif provider_name == "anthropic":
-            anth_provider = AnthropicProvider(model=model, mcp_enabled=mcp) 
+            instance = create_provider(provider_name, model=model, mcp_enabled=mcp) 
             if mcp:
                 console.print("Model Context Protocol (M.C.P) activado para Anthropic.")
-            return anth_provider
         else:
-            console.print(f"Proveedor '{provider_name}' no soportado.", style="red")
-            raise typer.Exit(1)
+            instance = create_provider(provider_name, model=model) 
     except Exception as e:
         console.print(f"Error al inicializar el proveedor {provider_name}: {e}", style="red")
         raise typer.Exit(1)
+    # Abre DNS/TCP/TLS mientras la TUI se monta, para que el primer turno no pague el handshake
+    start_prewarm(instance)
+    return instance
 
-def _run_chat_session(provider_instance, provider_name: str, stream: bool):
-    """Runs the simple command-line chat session."""
-    history_file = "history.json"
-    history = load_history(history_file)
-
-    console.print(Panel(f"Chat iniciado con [bold]{provider_name.capitalize()}[/bold]. Modelo: [bold]{provider_instance.model}[/bold]. Escribe 'exit' o 'salir' para terminar.", title="[green]Sesión de Chat[/green]"))
-    while True:
-        prompt_text = Prompt.ask("[cyan]Tú[/cyan]")
-        if prompt_text.lower() in ("exit", "salir"): 
-            console.print("Saliendo del chat.")
-            break
-        
-        add_message(history, "user", prompt_text)
-        respuesta = ""
-        max_retries = 2 
-
-        with console.status("[yellow]Pensando...[/yellow]", spinner="dots"):
-            for attempt in range(max_retries + 1):
-                try:
-                    if stream and hasattr(provider_instance, "stream_message"):
-                        console.print(f"[bold]{provider_name.capitalize()}:[/bold] ", end="")
-                        current_line_tokens = []
-                        for token in provider_instance.stream_message(prompt_text):
-                            print(token, end="", flush=True)
-                            respuesta += token
-                            current_line_tokens.append(token)
-                            if "\n" in token:
-                                console.print(f"[bold]{provider_name.capitalize()}:[/bold] ", end="") 
-                        print() 
-                    else:
-                        respuesta = provider_instance.send_message(prompt_text)
-                        console.print(f"[bold]{provider_name.capitalize()}:[/bold]")
-                        console.print(Markdown(respuesta))
-                    break  
-                except Exception as e:
-                    console.print(f"Error en el proveedor: {e}", style="red")
-                    if attempt < max_retries:
-                        console.print("Reintentando...")
-                    else:
-                        respuesta = f"[Error] No se pudo obtener respuesta tras varios intentos."
-                        console.print(Markdown(respuesta), style="red")
-        
-        add_message(history, provider_name, respuesta)
-        save_history(history, history_file)
-
-def _run_tui_session(provider_instance, model: str, stream: bool):
+def _run_tui_session(provider_instance, model: str, stream: bool, schema: dict = None):
     """Runs the Text User Interface (TUI) chat session."""
-    app_tui = ChatApp(provider=provider_instance, model=model, stream=stream) 
+    from .tui import ChatApp
+    app_tui = ChatApp(provider=provider_instance, model=model, stream=stream, schema=schema) 
     app_tui.run()
 
 # --- Typer Commands --- 
 
 @app.command()
 def chat(
-    provider: str = typer.Option(..., "-p", "--provider", help="Proveedor LLM (ollama, gemini, openai, anthropic)", rich_help_panel="Configuración del Chat"),
+    provider: str = typer.Option(..., "-p", "--provider", help="Proveedor LLM (ollama, gemini, openai, anthropic, auto)", rich_help_panel="Configuración del Chat"),
     model: str = typer.Option(None, "-m", "--model", help="Modelo a usar (opcional)", rich_help_panel="Configuración del Chat"),
     stream: bool = typer.Option(False, "-s", "--stream", help="Activar streaming de tokens", rich_help_panel="Configuración del Chat"),
     mcp: bool = typer.Option(False, "--mcp", help="Activar Model Context Protocol (Anthropic)", rich_help_panel="Configuración del Chat")
@@ -101,100 +77,305 @@ def chat(
     p_instance = _get_provider_instance(provider, model, stream, mcp)
     _run_tui_session(p_instance, model or p_instance.model, stream) # Pass model for TUI, can be p_instance.model if not specified
 
+@app.command()
+def repl(
+    provider: str = typer.Option(..., "-p", "--provider", help="Proveedor LLM (ollama, gemini, openai, anthropic, auto)"),
+    model: str = typer.Option(None, "-m", "--model", help="Modelo a usar (opcional)"),
+    no_stream: bool = typer.Option(False, "--no-stream", help="Esperar la respuesta completa en lugar de hacer streaming"),
+    mcp: bool = typer.Option(False, "--mcp", help="Activar Model Context Protocol (Anthropic)")
+):
+    """Chat ligero en la terminal, sin TUI (ideal para SSH o conexiones lentas)."""
+    from .repl import Repl
+    p_instance = _get_provider_instance(provider, model, not no_stream, mcp)
+    Repl(p_instance, model or p_instance.model, stream=not no_stream, console=console).run()
+
+@app.command()
+def ask(
+    prompt: List[str] = typer.Argument(None, help="Prompt a enviar. Si se omite (o además), se lee de stdin."),
+    provider: str = typer.Option(None, "-p", "--provider", help="Proveedor LLM (por defecto ask.provider en config.yaml u ollama)"),
+    model: str = typer.Option(None, "-m", "--model", help="Modelo a usar (opcional)"),
+    json_schema: str = typer.Option(None, "--json-schema", help="Archivo (o JSON en línea) con un JSON Schema: la salida se valida y se escribe como JSONL")
+):
+    """Envía un único prompt y escribe la respuesta en stdout (ideal para scripts y tuberías)."""
+    from .headless import EXIT_USAGE, read_prompt, run_ask
+    provider_name = provider or get_setting("ask", "provider", get_provider_names()[0])
+    schema = None
+    if json_schema:
+        from .structured import load_schema
+        try:
+            schema = load_schema(json_schema)
+        except (OSError, ValueError) as e:
+            typer.echo(f"Error: {e}", err=True)
+            raise typer.Exit(EXIT_USAGE)
+    raise typer.Exit(run_ask(provider_name, model, read_prompt(prompt), schema=schema))
+
+@app.command("map")
+def map_reduce(
+    file: str = typer.Argument(..., help="Documento a procesar (puede ser mayor que el contexto del modelo)"),
+    prompt: List[str] = typer.Argument(..., help="Prompt que se aplica a cada fragmento"),
+    reduce_prompt: str = typer.Option(None, "-r", "--reduce", help="Prompt para combinar los resultados (por defecto uno genérico)"),
+    provider: str = typer.Option(None, "-p", "--provider", help="Proveedor LLM (por defecto ask.provider en config.yaml u ollama)"),
+    model: str = typer.Option(None, "-m", "--model", help="Modelo a usar (opcional)"),
+    split: str = typer.Option("paragraph", "--split", help="Cortar en párrafos (paragraph), líneas (line) o espacios (tokens)"),
+    chunk_tokens: int = typer.Option(None, "--chunk-tokens", help="Tokens por fragmento (por defecto mapreduce.chunk_tokens o 2000)"),
+    parallel: int = typer.Option(None, "--parallel", help="Peticiones simultáneas (por defecto mapreduce.parallel o 4)"),
+    fresh: bool = typer.Option(False, "--fresh", help="Descarta los resultados guardados de una ejecución anterior")
+):
+    """Aplica un prompt a cada fragmento de un documento grande y combina los resultados (map-reduce)."""
+    from .mapreduce import MapReduceError, MapReduceJob
+    provider_name = provider or get_setting("ask", "provider", get_provider_names()[0])
+    if provider_name not in get_provider_names():
+        typer.echo(f"Error: proveedor '{provider_name}' no soportado.", err=True)
+        raise typer.Exit(2)
+    try:
+        job = MapReduceJob(file, " ".join(prompt), reduce_prompt, provider_name, model, split, chunk_tokens, parallel,
+                           on_progress=lambda message: typer.echo(message, err=True))
+        if fresh:
+            job.checkpoint.remove()
+        start = time.perf_counter()
+        result = job.run()
+    except (OSError, ValueError) as e:
+        typer.echo(f"Error: {e}", err=True)
+        raise typer.Exit(2)
+    except MapReduceError as e:
+        for where, error in e.failures:
+            typer.echo(f"  {where}: {error}", err=True)
+        typer.echo(f"Error: {e}", err=True)
+        raise typer.Exit(1)
+    stats = job.stats
+    typer.echo(f"{stats['chunks']} fragmentos, {stats['levels']} niveles de reduce, {stats['calls']} peticiones "
+               f"({stats['cached']} reutilizadas) en {time.perf_counter() - start:.1f} s.", err=True)
+    typer.echo(result)
+
+@app.command()
+def daemon(
+    stop: bool = typer.Option(False, "--stop", help="Detiene el daemon en ejecución"),
+    status: bool = typer.Option(False, "--status", help="Muestra el estado del daemon")
+):
+    """Mantiene los proveedores inicializados y conectados para que ask, chat y la TUI arranquen al instante."""
+    from .daemon import daemon_status, get_socket_path, run_daemon, stop_daemon
+    socket_path = get_socket_path()
+    if stop:
+        if stop_daemon(socket_path):
+            console.print("[green]Daemon detenido.[/green]")
+        else:
+            console.print("[yellow]No hay un daemon en ejecución.[/yellow]")
+        return
+    if status:
+        info = daemon_status(socket_path)
+        if info is None:
+            console.print("[yellow]No hay un daemon en ejecución.[/yellow]")
+            raise typer.Exit(1)
+        providers = ", ".join(info.get("providers") or []) or "ninguno"
+        console.print(f"Daemon activo (PID {info['pid']}) en {socket_path}. "
+                      f"Activo hace {int(info['uptime'])} s, {info['requests']} peticiones. Proveedores: {providers}")
+        return
+    console.print(f"Daemon escuchando en [bold]{socket_path}[/bold]. Ctrl+C para detenerlo.")
+    try:
+        run_daemon(socket_path)
+    except RuntimeError as e:
+        console.print(f"[red]{e}[/red]")
+        raise typer.Exit(1)
+
+@app.command()
+def serve(
+    host: str = typer.Option(None, "--host", help="Interfaz en la que escuchar (por defecto gateway.host o 127.0.0.1)"),
+    port: int = typer.Option(None, "--port", help="Puerto (por defecto gateway.port o 8080)")
+):
+    """Expone todos los proveedores como una API compatible con OpenAI (/v1/chat/completions, /v1/models)."""
+    from .gateway import DEFAULT_HOST, DEFAULT_PORT, run_gateway
+    shown_host = host or get_setting("gateway", "host", DEFAULT_HOST)
+    shown_port = port if port is not None else get_setting("gateway", "port", DEFAULT_PORT)
+    console.print(f"Gateway escuchando en [bold]http://{shown_host}:{shown_port}/v1[/bold]. Ctrl+C para detenerlo.")
+    try:
+        run_gateway(host, port)
+    except OSError as e:
+        console.print(f"[red]No se pudo abrir el puerto: {e}[/red]")
+        raise typer.Exit(1)
+
+@app.command()
+def index(
+    directory: str = typer.Argument(..., help="Directorio a indexar (código, documentación...)"),
+    query: str = typer.Option(None, "-q", "--query", help="Muestra los fragmentos más relevantes para esta consulta"),
+    top_k: int = typer.Option(5, "-k", "--top-k", help="Número de fragmentos a mostrar con --query"),
+    workers: int = typer.Option(None, "--workers", help="Procesos para indexar (por defecto retrieval.workers o CPUs)")
+):
+    """Crea o actualiza el índice local de un directorio para usarlo con /attach en la TUI."""
+    from .retrieval import open_index
+    start = time.perf_counter()
+    try:
+        doc_index, stats = open_index(directory, workers)
+    except ValueError as e:
+        console.print(f"[red]{e}[/red]")
+        raise typer.Exit(1)
+    console.print(f"Índice de [bold]{doc_index.root}[/bold]: {stats['files']} archivos, {stats['chunks']} fragmentos "
+                  f"({stats['added']} nuevos, {stats['updated']} modificados, {stats['removed']} eliminados) "
+                  f"en {time.perf_counter() - start:.2f} s.")
+    if query:
+        for result in doc_index.search(query, top_k):
+            console.print(f"[bold]{result['path']}:{result['line']}[/bold] [dim](puntaje {result['score']:.2f})[/dim]")
+            console.print(result["text"].rstrip(), markup=False, highlight=False)
+
 @app.command()
 def limpiar_historial():
     """Limpia el historial de chat."""
     clear_history("history.json")
     console.print("[green]Historial limpiado exitosamente.[/green]")
 
-@app.command()
-def exportar_historial_txt(destino: str = typer.Argument("historial.txt", help="Archivo de destino para la exportación.")):
-    """Exporta el historial a un archivo de texto plano."""
+def _export(destino: str, formato: str = None, desde: str = None, hasta: str = None,
+            sesion: int = None, rol: str = None):
+    """Exporta history.json en streaming mostrando el progreso."""
+    from datetime import datetime
+    from .export import export_history, format_for
+    try:
+        fmt = format_for(destino, formato)
+        since = datetime.fromisoformat(desde) if desde else None
+        until = datetime.fromisoformat(hasta) if hasta else None
+    except ValueError as e:
+        console.print(f"[red]{e}[/red]")
+        raise typer.Exit(1)
     try:
-        history = load_history("history.json")
-        export_history_txt(history, destino)
-        console.print(f"[green]Historial exportado a {destino}.[/green]")
+        with console.status(f"Exportando a {destino}...") as status:
+            count = export_history("history.json", destino, fmt, since, until, sesion, rol,
+                                   progress=lambda n: status.update(f"Exportando a {destino}... {n} mensajes"))
+        console.print(f"[green]Historial exportado a {destino} ({count} mensajes, formato {fmt}).[/green]")
     except FileNotFoundError:
         console.print("[red]No se encontró el archivo de historial.[/red]")
     except Exception as e:
         console.print(f"[red]Error al exportar el historial: {e}[/red]")
 
+@app.command()
+def exportar(
+    destino: str = typer.Argument(..., help="Archivo de destino; la extensión define el formato (.txt, .md, .html, .jsonl, .csv)"),
+    formato: str = typer.Option(None, "-f", "--formato", help="Formato explícito: txt, md, html, jsonl o csv"),
+    desde: str = typer.Option(None, "--desde", help="Solo mensajes desde esta fecha (AAAA-MM-DD[ HH:MM:SS])"),
+    hasta: str = typer.Option(None, "--hasta", help="Solo mensajes hasta esta fecha (AAAA-MM-DD[ HH:MM:SS])"),
+    sesion: int = typer.Option(None, "--sesion", help="Solo la sesión N (tramos separados por pausas de export.session_gap minutos)"),
+    rol: str = typer.Option(None, "--rol", help="Solo mensajes de este rol (user, assistant)")
+):
+    """Exporta el historial en streaming a texto, Markdown, HTML, JSONL o CSV, con filtros."""
+    _export(destino, formato, desde, hasta, sesion, rol)
+
+@app.command()
+def exportar_historial_txt(destino: str = typer.Argument("historial.txt", help="Archivo de destino para la exportación.")):
+    """Exporta el historial a un archivo de texto plano."""
+    _export(destino, "txt")
+
+@app.command()
+def usage(days: int = typer.Option(7, "-d", "--days", help="Días a incluir en el reporte (0 = todo el registro)")):
+    """Muestra el consumo de tokens y el costo estimado por día y modelo."""
+    rows = usage_report(USAGE_FILE, days)
+    if not rows:
+        console.print("[yellow]No hay consumo registrado en el período.[/yellow]")
+        return
+    table = Table(title=f"Uso de tokens ({'todo' if days <= 0 else f'últimos {days} días'})")
+    table.add_column("Día")
+    table.add_column("Proveedor")
+    table.add_column("Modelo")
+    table.add_column("Turnos", justify="right")
+    table.add_column("Prompt", justify="right")
+    table.add_column("Respuesta", justify="right")
+    table.add_column("Costo (USD)", justify="right")
+    totals = {"turns": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0}
+    for row in rows:
+        table.add_row(row["day"], row["provider"], row["model"], str(row["turns"]),
+                      str(row["prompt_tokens"]), str(row["completion_tokens"]), f"{row['cost']:.4f}")
+        for key in totals:
+            totals[key] += row[key]
+    table.add_section()
+    table.add_row("[bold]Total[/bold]", "", "", str(totals["turns"]), str(totals["prompt_tokens"]),
+                  str(totals["completion_tokens"]), f"[bold]{totals['cost']:.4f}[/bold]")
+    console.print(table)
+
 @app.command()
 def tui(
-    provider: str = typer.Option(..., "-P", "--provider-tui", help="Proveedor LLM para TUI", rich_help_panel="Configuración TUI"), 
+    provider: str = typer.Option(..., "-P", "--provider-tui", help="Proveedor LLM para TUI (ollama, gemini, openai, anthropic, auto)", rich_help_panel="Configuración TUI"), 
     model: str = typer.Option(None, "-M", "--model-tui", help="Modelo a usar en TUI (opcional)", rich_help_panel="Configuración TUI"),
     stream: bool = typer.Option(False, "-S", "--stream-tui", help="Activar streaming en TUI", rich_help_panel="Configuración TUI"),
-    mcp: bool = typer.Option(False, "--mcp-tui", help="Activar MCP en TUI (Anthropic)", rich_help_panel="Configuración TUI")
+    mcp: bool = typer.Option(False, "--mcp-tui", help="Activar MCP en TUI (Anthropic)", rich_help_panel="Configuración TUI"),
+    json_schema: str = typer.Option(None, "--json-schema", help="Archivo (o JSON en línea) con un JSON Schema para validar las respuestas", rich_help_panel="Configuración TUI")
 ):
     """Inicia la interfaz TUI de chat."""
+    schema = None
+    if json_schema:
+        from .structured import load_schema
+        try:
+            schema = load_schema(json_schema)
+        except (OSError, ValueError) as e:
+            console.print(f"[red]Error: {e}[/red]")
+            raise typer.Exit(1)
     console.print(Panel(f"Iniciando TUI con proveedor: [bold]{provider}[/bold], modelo: [bold]{model or 'default'}[/bold], stream: {stream}", title="[blue]Interfaz TUI[/blue]"))
     p_instance = _get_provider_instance(provider, model, stream, mcp)
-    _run_tui_session(p_instance, model or p_instance.model, stream) 
+    _run_tui_session(p_instance, model or p_instance.model, stream, schema) 
 
 # --- New Default TUI Flow --- 
 
-def _select_chat_options():
+DISCOVERY_WAIT = 1.5  # Segundos que el menú espera a los sondeos antes de preguntar el proveedor
+
+def _show_discovery(results, names):
+    """Tabla con el estado de cada proveedor sondeado (los pendientes aparecen como 'detectando')."""
+    table = Table(box=None, header_style="bold")
+    table.add_column("Proveedor")
+    table.add_column("Estado")
+    table.add_column("Modelos", justify="right")
+    for name in names:
+        info = results.get(name)
+        if info is None:
+            table.add_row(name, "[yellow]detectando...[/yellow]", "")
+        elif info.available:
+            table.add_row(name, f"[green]disponible[/green] [dim]({info.elapsed:.1f} s)[/dim]", str(len(info.models) or "-"))
+        else:
+            table.add_row(name, f"[red]{info.error or 'no disponible'}[/red]", "")
+    console.print(table)
+
+def _ask_model(label: str, models, default_model: str):
+    """Elige un modelo de la lista detectada (o lo pide a mano si no hay lista)."""
+    if not models:
+        return Prompt.ask(f"Ingresa el nombre del modelo {label}", default=default_model)
+    choices = models + ["(Ingresar manualmente)"]
+    model_name = Prompt.ask(f"Selecciona un modelo de {label}", choices=choices,
+                            default=default_model if default_model in models else models[0])
+    if model_name == "(Ingresar manualmente)":
+        model_name = Prompt.ask(f"Ingresa el nombre del modelo {label}", default=default_model)
+    return model_name
+
+def _select_chat_options(discovery=None):
     """Handles interactive selection of provider, model, and other chat options."""
+    from .discovery import ProviderDiscovery
     console.print(Panel("[bold green]Configuración de la Sesión de Chat TUI[/bold green]", expand=False))
 
     available_providers = get_provider_names()
     if not available_providers:
         console.print("[red]No hay proveedores configurados. Saliendo.[/red]")
         raise typer.Exit(1)
-        
+
+    # Los sondeos corren en paralelo desde el banner; aquí solo se espera un momento a los pendientes
+    discovery = discovery or ProviderDiscovery().start()
+    with console.status("[yellow]Detectando proveedores...[/yellow]", spinner="dots"):
+        results = discovery.wait(DISCOVERY_WAIT)
+    _show_discovery(results, discovery.names)
+    ready = [name for name in available_providers if name in results and results[name].available]
+
     provider_name = Prompt.ask(
         "Selecciona un proveedor LLM",
         choices=available_providers,
-        default=available_providers[0]
+        default=ready[0] if ready else available_providers[0]
     )
 
     model_name = None
-    if provider_name == "ollama":
-        console.print("Detectando modelos locales de Ollama...")
-        local_models = OllamaProvider.list_local_models()
-        if local_models:
-            choices = local_models + ["(Ingresar manualmente)"]
-            model_name = Prompt.ask(
-                "Selecciona un modelo de Ollama",
-                choices=choices,
-                default=local_models[0]
-            )
-            if model_name == "(Ingresar manualmente)":
-                model_name = Prompt.ask("Ingresa el nombre del modelo Ollama", default=OllamaProvider().model)
-        else:
-            console.print("No se detectaron modelos locales de Ollama o hubo un error.")
-            model_name = Prompt.ask("Ingresa el nombre del modelo Ollama", default=OllamaProvider().model)
-    elif provider_name == "openai":
-        # Try to list models
-        console.print("Detectando modelos de OpenAI...")
-        openai_provider_for_listing = OpenAIProvider() # No model needed for listing
-        available_models = openai_provider_for_listing.list_models()
-
-        default_model = OpenAIProvider().model # Get default model for fallback prompt
-
-        if available_models:
-            choices = available_models + ["(Ingresar manualmente)"]
-            # Try to set a sensible default from the list, fallback to provider's default
-            prompt_default = default_model
-            if default_model in available_models:
-                prompt_default = default_model
-            elif available_models: # If default not in list, pick first from list
-                prompt_default = available_models[0]
-
-            model_name = Prompt.ask(
-                "Selecciona un modelo de OpenAI",
-                choices=choices,
-                default=prompt_default
-            )
-            if model_name == "(Ingresar manualmente)":
-                model_name = Prompt.ask("Ingresa el nombre del modelo OpenAI", default=default_model)
-        else:
-            console.print("No se pudieron listar modelos de OpenAI (API Key podría faltar o ser inválida).")
-            model_name = Prompt.ask("Ingresa el nombre del modelo OpenAI", default=default_model)
-    elif provider_name == "anthropic":
-        model_name = Prompt.ask("Ingresa el nombre del modelo Anthropic", default=AnthropicProvider().model)
-    elif provider_name == "gemini":
-        model_name = Prompt.ask("Ingresa el nombre del modelo Gemini (opcional, Enter para default)", default=GeminiProvider().model)
+    labels = {"ollama": "Ollama", "openai": "OpenAI", "anthropic": "Anthropic", "gemini": "Gemini"}
+    if provider_name == "auto":
+        from .providers.auto import POLICIES
+        model_name = Prompt.ask("Política de enrutamiento", choices=list(POLICIES),
+                                default=get_setting("auto", "policy", POLICIES[0]))
+    else:
+        with console.status(f"[yellow]Detectando modelos de {labels[provider_name]}...[/yellow]", spinner="dots"):
+            info = discovery.result(provider_name)
+        if info.available and not info.models and provider_name in ("ollama", "openai"):
+            console.print(f"No se detectaron modelos de {labels[provider_name]}.")
+        elif not info.available:
+            console.print(f"{labels[provider_name]}: {info.error or 'no disponible'}", style="yellow")
+        model_name = _ask_model(labels[provider_name], info.models, info.default_model)
 
     stream_chat = Confirm.ask("¿Activar streaming de tokens?", default=False)
     mcp_chat = False
@@ -205,14 +386,17 @@ def _select_chat_options():
 
 def start_default_tui():
     """Configures and starts the TUI session by default."""
+    from .discovery import ProviderDiscovery
+    # Sondear todos los proveedores mientras se dibuja el banner
+    discovery = ProviderDiscovery().start()
     console.print(Panel("[bold magenta]Bienvenido al Asistente de Chat CLI[/bold magenta]", title="ChatLLM CLI - TUI Mode", expand=False))
-    provider_name, model_name, stream_chat, mcp_chat = _select_chat_options()
+    provider_name, model_name, stream_chat, mcp_chat = _select_chat_options(discovery)
     
     selected_model_name = model_name
     display_model_name = model_name or "default"
 
     console.print(f"\nIniciando TUI con Proveedor: [bold]{provider_name}[/bold], Modelo: [bold]{display_model_name}[/bold], Stream: {stream_chat}, MCP: {mcp_chat}")
-    provider_instance = _get_provider_instance(provider_name, selected_model_name, stream_chat, mcp_chat)
+    provider_instance = _get_provider_instance(provider_name, selected_model_name, stream_chat, mcp_chat, discovery)
     _run_tui_session(provider_instance, selected_model_name or provider_instance.model, stream_chat)
 
 # --- Interactive Menu (Now for other utilities) --- 
@@ -236,8 +420,9 @@ def interactive_menu_logic(ctx: typer.Context):
         if action == "Limpiar Historial":
             limpiar_historial()
         elif action == "Exportar Historial":
-            export_dest = Prompt.ask("Nombre del archivo para exportar el historial", default="historial_exportado.txt")
-            exportar_historial_txt(export_dest)
+            export_dest = Prompt.ask("Nombre del archivo para exportar el historial (.txt, .md, .html, .jsonl o .csv)",
+                                     default="historial_exportado.txt")
+            _export(export_dest)
         elif action == "Salir":
             console.print("[bold blue]¡Hasta luego![/bold blue]")
             break
@@ -0,0 +1,221 @@
+"""
+Compactación de conversaciones largas con un resumen acumulado.
+
+Cuando el contexto activo supera `compaction.threshold` tokens (estimados), un
+hilo en segundo plano pide a un modelo barato (`compaction.model`, por defecto
+el Ollama local) que resuma los turnos más antiguos junto con el resumen previo.
+La conversación guarda el resultado en `Conversation.summary` y, desde el turno
+siguiente, los proveedores envían el resumen más los turnos recientes
+(`as_api_messages`). El turno en curso nunca espera al resumen.
+
+Los resúmenes se guardan en ~/.cache/chat_cli/compaction/summaries.jsonl, con
+la huella de los mensajes que cubren: al recargar la sesión (o restaurarla con
+`/loadhistory`) se reutilizan en lugar de recalcularse.
+"""
+
+import hashlib
+import json
+import threading
+from chat_cli.config import get_cache_dir, get_setting
+from chat_cli.usage import estimate_tokens
+
+TOKEN_THRESHOLD = 6000        # Tokens del contexto a partir de los cuales se compacta
+KEEP_RECENT_TOKENS = 2000     # Tokens de turnos recientes que siempre se envían completos
+DEFAULT_MODEL = "ollama"      # "proveedor[:modelo]" usado para resumir
+SUMMARY_PREFIX = "Resumen de la conversación hasta este punto:\n\n"
+SUMMARY_ACK = "Entendido. Continúo la conversación teniendo en cuenta ese resumen."
+SUMMARIZE_PROMPT = (
+    "Resume la siguiente conversación entre un usuario y un asistente para poder continuarla sin el texto "
+    "original. Conserva hechos, decisiones, nombres, código relevante y preguntas pendientes. Responde solo "
+    "con el resumen, en el idioma de la conversación.\n\n"
+)
+
+class CompactionError(Exception):
+    """El modelo de resumen no respondió o devolvió un error."""
+
+class Summary:
+    """Resumen de los primeros `count` mensajes del contexto activo."""
+    __slots__ = ("count", "digest", "text")
+
+    def __init__(self, count: int, digest: str, text: str):
+        self.count = count
+        self.digest = digest
+        self.text = text
+
+    def to_api(self):
+        # Par usuario/asistente: mantiene la alternancia de roles que exige Anthropic
+        return [{"role": "user", "content": SUMMARY_PREFIX + self.text},
+                {"role": "assistant", "content": SUMMARY_ACK}]
+
+    def __repr__(self):
+        return f"Summary({self.count}, {self.text[:40]!r})"
+
+def _feed(hasher, message):
+    hasher.update(f"{message.get('role')}\0{message.get('timestamp')}\0{message.get('content')}\0".encode("utf-8"))
+
+def digest_of(messages) -> str:
+    """Huella de una secuencia de mensajes (rol, timestamp y contenido)."""
+    hasher = hashlib.sha1()
+    for message in messages:
+        _feed(hasher, message)
+    return hasher.hexdigest()
+
+class SummaryStore:
+    """Resúmenes persistidos por huella, en un JSONL de solo añadido."""
+
+    def __init__(self, path=None):
+        if path is None:
+            directory = get_cache_dir() / "compaction"
+            directory.mkdir(parents=True, exist_ok=True)
+            path = directory / "summaries.jsonl"
+        self.path = path
+        self._entries = None  # Huella -> {"count", "text"}, cargado en el primer uso
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = {}
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                            self._entries[entry["digest"]] = {"count": entry["count"], "text": entry["text"]}
+                        except (ValueError, KeyError):
+                            continue  # Línea truncada por una escritura interrumpida
+            except OSError:
+                pass
+        return self._entries
+
+    def get(self, digest: str):
+        with self._lock:
+            return self._load().get(digest)
+
+    def put(self, digest: str, count: int, text: str):
+        with self._lock:
+            self._load()[digest] = {"count": count, "text": text}
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"digest": digest, "count": count, "text": text}, ensure_ascii=False) + "\n")
+            except OSError:
+                pass  # Sin caché en disco el resumen solo vive en esta sesión
+
+    def find(self, messages):
+        """Resumen guardado más largo que cubra un prefijo de `messages`, o None."""
+        with self._lock:
+            counts = {entry["count"] for entry in self._load().values()}
+        if not counts:
+            return None
+        hasher, best = hashlib.sha1(), None
+        for position, message in enumerate(messages, 1):
+            _feed(hasher, message)
+            if position in counts:
+                digest = hasher.hexdigest()
+                entry = self.get(digest)
+                if entry is not None:
+                    best = Summary(position, digest, entry["text"])
+        return best
+
+def _provider_summarizer(spec: str):
+    """Función (prompt) -> texto que usa un proveedor nuevo, sin historial, por resumen."""
+    from chat_cli.providers import create_provider
+    name, _, model = spec.partition(":")
+
+    def summarize(prompt):
+        provider = create_provider(name, model=model or None)
+        text = provider.send_message(prompt)
+        if getattr(provider, "last_error", None) or not (text or "").strip():
+            raise CompactionError(getattr(provider, "last_error", None) or "respuesta vacía")
+        return text.strip()
+    return summarize
+
+class Compactor:
+    def __init__(self, summarize=None, store: SummaryStore = None, threshold: int = None,
+                 keep_recent_tokens: int = None, model: str = None):
+        self.model = model or get_setting("compaction", "model", DEFAULT_MODEL)
+        self.summarize = summarize or _provider_summarizer(self.model)
+        self.store = store or SummaryStore()
+        self.threshold = int(threshold or get_setting("compaction", "threshold", TOKEN_THRESHOLD))
+        self.keep_recent_tokens = int(keep_recent_tokens or get_setting("compaction", "keep_recent_tokens",
+                                                                       KEEP_RECENT_TOKENS))
+        self.last_error = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def attach(self, conversation):
+        """Asigna a la conversación el resumen guardado que cubra más mensajes. Retorna el Summary o None."""
+        summary = self.store.find(conversation[:])
+        if summary is not None and (conversation.summary is None or summary.count > conversation.summary.count):
+            conversation.summary = summary
+        return conversation.summary
+
+    def plan(self, conversation):
+        """Índice hasta el que conviene resumir el contexto, o None si aún no hace falta."""
+        messages = conversation[:]
+        covered = conversation.summary.count if conversation.summary else 0
+        tokens = [estimate_tokens(message.get("content") or "") for message in messages]
+        context = sum(tokens[covered:]) + (estimate_tokens(conversation.summary.text) if covered else 0)
+        if context < self.threshold:
+            return None
+        # Conservar completos los turnos recientes y cortar justo antes de un mensaje del usuario
+        recent, cut = 0, len(messages)
+        while cut > covered and recent + tokens[cut - 1] <= self.keep_recent_tokens:
+            cut -= 1
+            recent += tokens[cut]
+        while covered < cut < len(messages) and messages[cut].get("role") != "user":
+            cut -= 1
+        return cut if cut > covered else None
+
+    def compact(self, conversation):
+        """Resume el contexto si supera el umbral (bloqueante). Retorna el Summary aplicado o None."""
+        cut = self.plan(conversation)
+        if cut is None:
+            return None
+        messages = conversation[:cut]
+        digest = digest_of(messages)
+        cached = self.store.get(digest)
+        if cached is not None:
+            text = cached["text"]
+        else:
+            previous = conversation.summary
+            start = previous.count if previous else 0
+            transcript = "\n\n".join(f"{message.get('role')}: {message.get('content')}" for message in messages[start:])
+            prompt = SUMMARIZE_PROMPT
+            if previous:
+                prompt += f"Resumen de la parte anterior:\n{previous.text}\n\nContinuación:\n"
+            text = self.summarize(prompt + transcript)
+            self.store.put(digest, cut, text)
+        # La conversación pudo cambiar mientras se resumía: aplicar solo si el prefijo sigue igual
+        if digest_of(conversation[:cut]) != digest:
+            return None
+        summary = Summary(cut, digest, text)
+        conversation.summary = summary
+        return summary
+
+    def _run(self, conversation):
+        try:
+            self.compact(conversation)
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)  # Se reintentará tras el próximo turno
+
+    def schedule(self, conversation) -> bool:
+        """Compacta en un hilo de fondo si no hay otra compactación en curso. Retorna si se lanzó."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._thread = threading.Thread(target=self._run, args=(conversation,), name="chat-cli-compaction",
+                                            daemon=True)
+            self._thread.start()
+            return True
+
+    def wait(self, timeout: float = None):
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+def get_compactor():
+    """Compactor según config.yaml, o None si `compaction.enabled` no está activo."""
+    if not get_setting("compaction", "enabled", False):
+        return None
+    return Compactor()
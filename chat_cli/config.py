@@ -1,40 +1,302 @@
-import yaml
+import copy
+import hashlib
+import json
 import os
+import re
 from pathlib import Path
 
 CONFIG_FILE_NAME = "config.yaml"
-# Por ahora, buscaremos el config.yaml en la raíz del proyecto.
-# Más adelante, podríamos buscar en ~/.config/chat_cli/config.yaml
+# Ubicación histórica: config.yaml en la raíz del proyecto (se sigue respetando como último recurso)
 CONFIG_FILE_PATH = Path(__file__).resolve().parent.parent / CONFIG_FILE_NAME
+CONFIG_ENV_VAR = "CHATCLI_CONFIG"   # Ruta explícita del archivo de configuración
+ENV_PREFIX = "CHATCLI_"             # CHATCLI_SECCION__CLAVE=valor sobrescribe config.yaml
+# Variables con el prefijo que no son claves de configuración
+RESERVED_ENV_VARS = (CONFIG_ENV_VAR,)
+# Claves con credenciales: nunca se copian a la caché compilada, se releen del YAML en cada carga
+SECRET_KEY_SUFFIXES = ("api_key", "api_keys", "token", "secret", "password")
 
 _config = None
+_config_stamp = None   # (ruta, mtime_ns, tamaño) del archivo cargado, o None si no había archivo
+_reload_listeners = []
+
+def get_config_paths():
+    """
+    Rutas candidatas en orden de prioridad: $CHATCLI_CONFIG, $XDG_CONFIG_HOME/chat_cli
+    (~/.config/chat_cli), cada directorio de $XDG_CONFIG_DIRS (/etc/xdg) y la raíz del proyecto.
+    """
+    paths = []
+    explicit = os.getenv(CONFIG_ENV_VAR)
+    if explicit:
+        paths.append(Path(explicit).expanduser())
+    config_home = os.getenv("XDG_CONFIG_HOME") or os.path.join(Path.home(), ".config")
+    paths.append(Path(config_home) / "chat_cli" / CONFIG_FILE_NAME)
+    for config_dir in (os.getenv("XDG_CONFIG_DIRS") or "/etc/xdg").split(os.pathsep):
+        if config_dir:
+            paths.append(Path(config_dir) / "chat_cli" / CONFIG_FILE_NAME)
+    paths.append(CONFIG_FILE_PATH)
+    return paths
+
+def find_config_file():
+    """Primer config.yaml existente según get_config_paths(), o None."""
+    for path in get_config_paths():
+        if path.is_file():
+            return path
+    return None
+
+def _stamp_of(path):
+    if path is None:
+        return None
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return (str(path), stat.st_mtime_ns, stat.st_size)
+
+def _compiled_cache_path(path) -> Path:
+    digest = hashlib.sha1(str(path).encode("utf-8")).hexdigest()[:16]
+    return get_cache_dir() / f"config-{digest}.json"
+
+def _parse_yaml(path):
+    # PyYAML solo se importa cuando la caché compilada no es válida
+    import yaml
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    with open(path, 'r') as f:
+        return yaml.load(f, Loader=loader) or {}
+
+def _is_secret_key(key) -> bool:
+    return isinstance(key, str) and key.lower().endswith(SECRET_KEY_SUFFIXES)
+
+def _has_secrets(data) -> bool:
+    if isinstance(data, dict):
+        return any(_is_secret_key(key) or _has_secrets(value) for key, value in data.items())
+    if isinstance(data, list):
+        return any(_has_secrets(item) for item in data)
+    return False
+
+def _split_secrets(data, path=()):
+    """
+    Copia de `data` sin las claves con credenciales y la lista de sus rutas
+    ([["providers", "openai", "api_key"], ...]). Las rutas son None si hay
+    credenciales dentro de listas, que no se pueden releer por ruta.
+    """
+    public, secrets = {}, []
+    for key, value in data.items():
+        if _is_secret_key(key):
+            secrets.append([*path, key])
+        elif isinstance(value, dict):
+            public[key], nested = _split_secrets(value, (*path, key))
+            if nested is None:
+                return public, None
+            secrets.extend(nested)
+        elif _has_secrets(value):
+            return public, None
+        else:
+            public[key] = value
+    return public, secrets
+
+_YAML_KEY_RE = re.compile(r"^( *)([A-Za-z0-9_.-]+):(?:[ \t]+(.*))?$")
+
+def _scalar_value(raw: str):
+    """Valor escalar simple de una línea YAML (sin comentario), o None si no lo es."""
+    raw = raw.strip()
+    if raw[:1] in ("'", '"'):
+        quote = raw[0]
+        end = raw.find(quote, 1)
+        while quote == "'" and end != -1 and raw[end + 1:end + 2] == "'":
+            end = raw.find(quote, end + 2)  # '' es una comilla escapada
+        rest = raw[end + 1:].strip() if end != -1 else "#"
+        if end == -1 or (rest and not rest.startswith("#")) or (quote == '"' and "\\" in raw[:end]):
+            return None
+        value = raw[1:end]
+        return value.replace("''", "'") if quote == "'" else value
+    value = raw.split(" #", 1)[0].strip()
+    if not value or value[0] in "{[&*!|>#%@`":
+        return None
+    return value
+
+def _read_secrets(path, secret_paths):
+    """
+    Valores de `secret_paths` leídos línea a línea de config.yaml (sin PyYAML).
+    Solo entiende claves en bloque con valores escalares; retorna None si alguno no se encuentra así.
+    """
+    wanted = {tuple(secret_path) for secret_path in secret_paths}
+    found, stack = {}, []  # stack: [(sangría, clave)] de los mapas abiertos
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.rstrip("\r\n")
+                match = _YAML_KEY_RE.match(line)
+                if not match:
+                    continue  # Comentarios, listas, líneas en blanco o de continuación
+                indent = len(match.group(1))
+                while stack and stack[-1][0] >= indent:
+                    stack.pop()
+                key_path = (*(key for _, key in stack), match.group(2))
+                stack.append((indent, match.group(2)))
+                if key_path in wanted:
+                    if key_path in found:
+                        return None  # Clave repetida: que decida PyYAML
+                    found[key_path] = _scalar_value(match.group(3) or "")
+    except OSError:
+        return None
+    if set(found) != wanted or None in found.values():
+        return None
+    return found
+
+def _write_compiled_cache(cache_path, path, stamp, data):
+    """
+    Guarda la config en JSON (sin código ejecutable al cargarla) con permisos 0600.
+    Las credenciales no se guardan: solo sus rutas, para releerlas del YAML con _read_secrets().
+    No se escribe si esa relectura no las reproduce o si hay valores que JSON no representa tal cual.
+    """
+    public, secret_paths = _split_secrets(data)
+    if secret_paths is None:
+        return
+    if secret_paths:
+        secrets = _read_secrets(path, secret_paths)
+        if secrets is None or any(_get_path(data, key_path) != value for key_path, value in secrets.items()):
+            return  # Credenciales en formato que el lector simple no entiende: se parsea el YAML cada vez
+    try:
+        raw = json.dumps({"stamp": list(stamp), "data": public, "secrets": secret_paths}, ensure_ascii=False)
+    except (TypeError, ValueError):
+        return
+    if json.loads(raw)["data"] != public:
+        return  # Claves no textuales, tuplas, fechas...: mejor parsear el YAML cada vez
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(raw)
+    os.replace(tmp_path, cache_path)
+
+def _get_path(data, key_path):
+    for key in key_path:
+        data = data[key]
+    return data
+
+def _read_cached(path, stamp):
+    """Config de la caché compilada con las credenciales releídas, o None si no sirve."""
+    cache_path = _compiled_cache_path(path)
+    with open(cache_path, "r", encoding="utf-8") as f:
+        cached = json.load(f)
+    if tuple(cached["stamp"]) != tuple(stamp) or not isinstance(cached["data"], dict):
+        return None
+    data = cached["data"]
+    if cached.get("secrets"):
+        secrets = _read_secrets(path, cached["secrets"])
+        if secrets is None:
+            return None
+        for key_path, value in secrets.items():
+            node = data
+            for key in key_path[:-1]:
+                node = node.setdefault(key, {})
+            node[key_path[-1]] = value
+    return data
+
+def _read_config_file(path, stamp):
+    """
+    Lee config.yaml usando la caché compilada (JSON en ~/.cache/chat_cli) si su
+    mtime y tamaño coinciden; si no, parsea el YAML y regenera la caché.
+    """
+    try:
+        cached = _read_cached(path, stamp)
+        if cached is not None:
+            return cached
+    except Exception:
+        pass
+    try:
+        data = _parse_yaml(path)
+    except Exception as e:
+        print(f"Error al leer {path}: {e}")
+        return {}  # Tratar como si no hubiera config válida
+    if not isinstance(data, dict):
+        return {}
+    try:
+        _write_compiled_cache(_compiled_cache_path(path), path, stamp, data)
+    except OSError:
+        pass
+    return data
+
+def _parse_env_value(value: str):
+    """Convierte el valor de una variable de entorno a bool/None/int/float cuando corresponde."""
+    lowered = value.strip().lower()
+    if lowered in ("true", "yes", "on"):
+        return True
+    if lowered in ("false", "no", "off"):
+        return False
+    if lowered in ("null", "none", "~"):
+        return None
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+def apply_env_overrides(config: dict, environ=None) -> dict:
+    """
+    Aplica las variables CHATCLI_*: `__` separa niveles y los nombres se pasan a
+    minúsculas. Ej: CHATCLI_PROVIDERS__OLLAMA__HOST=http://gpu:11434, CHATCLI_TUI__MAX_FPS=20.
+    """
+    environ = os.environ if environ is None else environ
+    for name, value in environ.items():
+        if not name.startswith(ENV_PREFIX) or name in RESERVED_ENV_VARS:
+            continue
+        keys = [part.lower() for part in name[len(ENV_PREFIX):].split("__") if part]
+        if not keys:
+            continue
+        node = config
+        for key in keys[:-1]:
+            if not isinstance(node.get(key), dict):
+                node[key] = {}
+            node = node[key]
+        node[keys[-1]] = _parse_env_value(value)
+    return config
+
+def _load_fresh():
+    path = find_config_file()
+    stamp = _stamp_of(path)
+    config = _read_config_file(path, stamp) if stamp else {}
+    # Copia: las sobrescrituras no deben alterar lo que guarda la caché compilada
+    return apply_env_overrides(copy.deepcopy(config)), stamp
 
 def load_config():
     """
-    Carga la configuración desde el archivo config.yaml si existe.
-    Retorna un diccionario con la configuración o None si el archivo no existe.
+    Carga la configuración (archivo + variables CHATCLI_*) y la conserva en memoria.
+    Retorna un diccionario, vacío si no hay archivo de configuración.
     """
-    global _config
+    global _config, _config_stamp
     if _config is not None: # Ya cargado
         return _config
+    _config, _config_stamp = _load_fresh()
+    return _config
+
+def add_reload_listener(callback):
+    """Registra `callback(anterior, nueva)` para cuando reload_config() detecte cambios."""
+    _reload_listeners.append(callback)
 
-    if CONFIG_FILE_PATH.exists():
+def remove_reload_listener(callback):
+    if callback in _reload_listeners:
+        _reload_listeners.remove(callback)
+
+def reload_config(force: bool = False) -> bool:
+    """
+    Vuelve a cargar la configuración si el archivo cambió (o apareció/desapareció).
+    Solo cuesta un stat() cuando no hay cambios. Retorna True si se recargó.
+    """
+    global _config, _config_stamp
+    if _config is None:
+        load_config()
+        return False
+    if not force and _stamp_of(find_config_file()) == _config_stamp:
+        return False
+    previous = _config
+    _config, _config_stamp = _load_fresh()
+    for callback in list(_reload_listeners):
         try:
-            with open(CONFIG_FILE_PATH, 'r') as f:
-                _config = yaml.safe_load(f)
-            if _config is None: # Archivo vacío o YAML inválido que resulta en None
-                _config = {}
-            return _config
-        except yaml.YAMLError as e:
-            print(f"Error al parsear {CONFIG_FILE_NAME}: {e}")
-            _config = {} # Tratar como si no hubiera config válida
-            return _config
-        except Exception as e:
-            print(f"Error al leer {CONFIG_FILE_NAME}: {e}")
-            _config = {}
-            return _config
-    _config = {} # Archivo no encontrado
-    return _config
+            callback(previous, _config)
+        except Exception:
+            pass
+    return True
 
 def get_provider_config(provider_name: str):
     """
@@ -60,9 +322,29 @@ def get_default_model(provider_name: str):
     provider_conf = get_provider_config(provider_name)
     return provider_conf.get("default_model")
 
+def get_cache_dir() -> Path:
+    """
+    Directorio de caché de la aplicación ($XDG_CACHE_HOME/chat_cli o ~/.cache/chat_cli).
+    Se crea si no existe.
+    """
+    base = os.getenv("XDG_CACHE_HOME") or os.path.join(Path.home(), ".cache")
+    cache_dir = Path(base) / "chat_cli"
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
+
+def get_setting(section: str, key: str, default=None):
+    """
+    Obtiene un valor de una sección general de config.yaml (fuera de "providers").
+    Ej: get_setting("connection", "keepalive_interval", 30)
+    """
+    config = load_config()
+    value = (config.get(section) or {}).get(key)
+    return default if value is None else value
+
 if __name__ == '__main__':
     # Para pruebas rápidas
     load_config()
+    print(f"Archivo de configuración: {find_config_file()}")
     print(f"Configuración cargada: {_config}")
     print(f"OpenAI API Key desde config: {get_api_key('openai')}")
     print(f"OpenAI Default Model desde config: {get_default_model('openai')}")
@@ -0,0 +1,156 @@
+"""
+Modelo único de la conversación, compartido por la TUI y el proveedor.
+
+La TUI crea una `Conversation` y la asigna como `provider.history`: el proveedor
+lee de ella el contexto que envía al modelo y la TUI la persiste en
+history.json, de modo que ambos ven siempre los mismos mensajes. Los mensajes
+son registros con `__slots__` (sin un dict por mensaje) y se añaden en el lugar.
+
+Los mensajes cargados de sesiones anteriores quedan archivados: se guardan con
+el resto pero no forman parte del contexto hasta que se restauran
+(`/loadhistory`). La interfaz de secuencia (len, iteración, índices) cubre solo
+el contexto activo, que es lo que esperan los proveedores.
+
+Con la compactación activa (chat_cli/compaction.py), `summary` resume los
+primeros mensajes del contexto y `as_api_messages` envía el resumen en su lugar.
+"""
+
+from datetime import datetime
+from chat_cli.history import load_history, save_history
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def now_timestamp() -> str:
+    return datetime.now().strftime(TIMESTAMP_FORMAT)
+
+class Message:
+    """Mensaje de la conversación. Admite msg["role"] y msg.get() como los dicts de antes."""
+    __slots__ = ("role", "content", "timestamp")
+
+    def __init__(self, role: str, content: str, timestamp: str = None):
+        self.role = role
+        self.content = content
+        self.timestamp = timestamp or now_timestamp()
+
+    @classmethod
+    def coerce(cls, message):
+        if isinstance(message, cls):
+            return message
+        return cls(message.get("role", "user"), message.get("content", ""), message.get("timestamp"))
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def __eq__(self, other):
+        if isinstance(other, Message):
+            return (self.role, self.content, self.timestamp) == (other.role, other.content, other.timestamp)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"Message({self.role!r}, {self.content[:40]!r}, {self.timestamp!r})"
+
+    def to_dict(self) -> dict:
+        return {"role": self.role, "content": self.content, "timestamp": self.timestamp}
+
+    def to_api(self) -> dict:
+        """Formato {"role", "content"} que esperan las APIs de chat."""
+        return {"role": self.role, "content": self.content}
+
+class Conversation:
+    __slots__ = ("messages", "start", "summary")
+
+    def __init__(self, messages=None, start: int = 0):
+        self.messages = [Message.coerce(message) for message in messages or []]
+        self.start = start  # Índice del primer mensaje del contexto activo (los anteriores están archivados)
+        self.summary = None  # compaction.Summary de los primeros mensajes del contexto, o None
+
+    @classmethod
+    def load(cls, filename, restore: bool = False):
+        """Conversación con los mensajes de `filename`, archivados salvo que `restore` sea True."""
+        try:
+            conversation = cls(load_history(filename) or [])
+        except (OSError, ValueError):
+            conversation = cls()
+        if not restore:
+            conversation.start = len(conversation.messages)
+        return conversation
+
+    def save(self, filename):
+        save_history(self.to_dicts(), filename)
+
+    # --- Contexto activo (interfaz de lista que usan los proveedores) ---
+
+    def __len__(self):
+        return len(self.messages) - self.start
+
+    def __bool__(self):
+        return len(self.messages) > self.start
+
+    def __iter__(self):
+        messages = self.messages
+        for index in range(self.start, len(messages)):
+            yield messages[index]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.messages[self.start:][index]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("índice fuera de la conversación")
+        return self.messages[self.start + index]
+
+    def __delitem__(self, index):
+        if not isinstance(index, slice) or index.step not in (None, 1):
+            raise TypeError("solo se admite borrar un tramo contiguo (conversation[i:])")
+        begin, end, _ = index.indices(len(self))
+        if self.summary is not None and begin < self.summary.count and begin < end:
+            self.summary = None  # Se borraron mensajes ya resumidos
+        del self.messages[self.start + begin:self.start + end]
+
+    def append(self, message):
+        """Añade un mensaje (Message o dict con role/content) en el lugar. Retorna el Message."""
+        message = Message.coerce(message)
+        self.messages.append(message)
+        return message
+
+    def add(self, role: str, content: str, timestamp: str = None):
+        message = Message(role, content, timestamp)
+        self.messages.append(message)
+        return message
+
+    def extend(self, messages):
+        self.messages.extend(Message.coerce(message) for message in messages)
+
+    def clear(self):
+        """Borra todos los mensajes, también los archivados."""
+        self.messages.clear()
+        self.start = 0
+        self.summary = None
+
+    def restore(self) -> int:
+        """Devuelve al contexto los mensajes archivados. Retorna cuántos se restauraron."""
+        restored, self.start = self.start, 0
+        if restored:
+            self.summary = None  # El contexto cambió de inicio
+        return restored
+
+    def to_dicts(self):
+        """Todos los mensajes (archivados incluidos) en el formato de history.json."""
+        return [message.to_dict() for message in self.messages]
+
+def as_api_messages(history):
+    """
+    Lista de {"role", "content"} a partir de una Conversation o de una lista de
+    dicts. Si la conversación tiene un resumen, reemplaza a los mensajes que cubre.
+    """
+    summary = getattr(history, "summary", None)
+    if summary is None or summary.count > len(history):
+        return [{"role": message["role"], "content": message["content"]} for message in history]
+    return summary.to_api() + [{"role": message["role"], "content": message["content"]}
+                               for message in history[summary.count:]]
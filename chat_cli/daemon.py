@@ -0,0 +1,270 @@
+"""
+Daemon local que mantiene calientes los clientes de los proveedores.
+
+`chat-cli daemon` arranca un proceso que conserva instancias de proveedores ya
+inicializadas (SDK importados, config leída, pools de conexiones abiertos y
+catálogos de modelos en caché) y atiende peticiones por un socket Unix. Los
+comandos `ask`, `chat` y la TUI detectan si el daemon está corriendo y, en ese
+caso, usan `RemoteProvider` como cliente ligero; si no, trabajan en proceso.
+
+Protocolo: una petición JSON por conexión, terminada en salto de línea. Las
+respuestas son líneas JSON: `{"t": "token"}` durante el streaming y un mensaje
+final `{"done": true, "text": ..., "usage": ..., "error": ...}`.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from chat_cli.config import get_setting, reload_config
+from chat_cli.conversation import as_api_messages
+from chat_cli.providers.pool import ProviderPool
+
+MAX_REQUEST_BYTES = 64 * 1024 * 1024
+CONNECT_TIMEOUT = 0.2
+
+def get_socket_path() -> str:
+    """Ruta del socket: daemon.socket en config.yaml, $XDG_RUNTIME_DIR o el directorio temporal."""
+    configured = get_setting("daemon", "socket")
+    if configured:
+        return os.path.expanduser(configured)
+    runtime_dir = os.getenv("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(runtime_dir, f"chat_cli-{os.getuid()}.sock")
+
+# --- Servidor ---
+
+class ProviderDaemon:
+    """Servidor asyncio que atiende peticiones de streaming sobre un socket Unix."""
+
+    def __init__(self, socket_path: str = None, provider_factory=None):
+        self.socket_path = socket_path or get_socket_path()
+        self.pool = ProviderPool(provider_factory)
+        self.started_at = time.time()
+        self.requests_served = 0
+        self._server = None
+        self._stopped = None
+
+    def session_provider(self, request):
+        return self.pool.checkout(request["provider"], request.get("model"), request.get("history"),
+                                  request.get("mcp", False))
+
+    async def handle(self, reader, writer):
+        try:
+            line = await reader.readline()
+            if not line:
+                return
+            request = json.loads(line)
+            # config.yaml cambió: las instancias nuevas deben leerla de nuevo
+            if reload_config():
+                self.pool.clear()
+            op = request.get("op", "stream")
+            if op == "ping":
+                await self._send(writer, {"ok": True, "pid": os.getpid(), "uptime": time.time() - self.started_at,
+                                          "requests": self.requests_served,
+                                          "providers": self.pool.loaded()})
+            elif op == "shutdown":
+                await self._send(writer, {"ok": True})
+                self._stopped.set()
+            elif op == "info":
+                template = await asyncio.to_thread(self.pool.get, request["provider"], request.get("model"))
+                await self._send(writer, {"provider": request["provider"], "model": template.model})
+            elif op == "models":
+                models = await asyncio.to_thread(self.pool.list_models, request["provider"])
+                await self._send(writer, {"models": models})
+            elif op == "send":
+                await self._handle_send(request, writer)
+            else:
+                await self._handle_stream(request, writer)
+        except Exception as e:
+            try:
+                await self._send(writer, {"done": True, "error": str(e), "text": f"[Daemon] Error: {e}"})
+            except Exception:
+                pass
+        finally:
+            writer.close()
+
+    async def _handle_send(self, request, writer):
+        provider = await asyncio.to_thread(self.session_provider, request)
+        text = await asyncio.to_thread(provider.send_message, request["prompt"])
+        self.requests_served += 1
+        await self._send(writer, {"done": True, "text": text, "usage": provider.last_usage,
+                                  "error": getattr(provider, "last_error", None),
+                                  "tool_calls": getattr(provider, "last_tool_calls", None)})
+
+    async def _handle_stream(self, request, writer):
+        from chat_cli.render import iterate_provider_stream
+        provider = await asyncio.to_thread(self.session_provider, request)
+        parts = []
+        async for token in iterate_provider_stream(provider, request["prompt"]):
+            parts.append(token)
+            message = {"t": token}
+            # Los proveedores entregan el error como fragmento: marcarlo para el cliente
+            if getattr(provider, "last_error", None):
+                message["error"] = provider.last_error
+            await self._send(writer, message)
+        self.requests_served += 1
+        await self._send(writer, {"done": True, "text": "".join(parts), "usage": provider.last_usage,
+                                  "error": getattr(provider, "last_error", None),
+                                  "tool_calls": getattr(provider, "last_tool_calls", None)})
+
+    @staticmethod
+    async def _send(writer, message):
+        writer.write(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+        await writer.drain()
+
+    async def serve(self, ready: threading.Event = None):
+        if os.path.exists(self.socket_path):
+            if is_daemon_running(self.socket_path):
+                raise RuntimeError(f"Ya hay un daemon escuchando en {self.socket_path}")
+            os.unlink(self.socket_path)  # Socket huérfano de una ejecución anterior
+        self._stopped = asyncio.Event()
+        # El socket nace con permisos 0600: no hay un instante en que otros usuarios puedan conectarse
+        previous_umask = os.umask(0o177)
+        try:
+            self._server = await asyncio.start_unix_server(self.handle, path=self.socket_path, limit=MAX_REQUEST_BYTES)
+        finally:
+            os.umask(previous_umask)
+        os.chmod(self.socket_path, 0o600)
+        for provider_name in get_setting("daemon", "preload", []) or []:
+            await asyncio.to_thread(self.pool.get, provider_name)
+        if ready:
+            ready.set()
+        try:
+            await self._stopped.wait()
+        finally:
+            self._server.close()
+            await self._server.wait_closed()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+def run_daemon(socket_path: str = None):
+    """Arranca el daemon en primer plano hasta recibir Ctrl+C o `chat-cli daemon --stop`."""
+    try:
+        asyncio.run(ProviderDaemon(socket_path).serve())
+    except KeyboardInterrupt:
+        pass
+
+# --- Cliente ---
+
+def _connect(socket_path: str, timeout: float = None):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    sock.connect(socket_path)
+    return sock
+
+def daemon_request(message: dict, socket_path: str = None, timeout: float = None):
+    """Envía una petición y retorna un iterador de los mensajes JSON de respuesta."""
+    sock = _connect(socket_path or get_socket_path(), timeout)
+    try:
+        sock.sendall(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+        with sock.makefile("rb") as stream:
+            for line in stream:
+                yield json.loads(line)
+    finally:
+        sock.close()
+
+def is_daemon_running(socket_path: str = None) -> bool:
+    """Comprueba si hay un daemon escuchando (sin coste si el socket no existe)."""
+    socket_path = socket_path or get_socket_path()
+    if not os.path.exists(socket_path):
+        return False
+    try:
+        sock = _connect(socket_path, CONNECT_TIMEOUT)
+        sock.close()
+        return True
+    except OSError:
+        return False
+
+def daemon_status(socket_path: str = None):
+    """Retorna la información de `ping` del daemon o None si no responde."""
+    try:
+        return next(daemon_request({"op": "ping"}, socket_path, timeout=2.0))
+    except (OSError, StopIteration, ValueError):
+        return None
+
+def stop_daemon(socket_path: str = None) -> bool:
+    try:
+        return bool(next(daemon_request({"op": "shutdown"}, socket_path, timeout=2.0)).get("ok"))
+    except (OSError, StopIteration, ValueError):
+        return False
+
+class RemoteProvider:
+    """
+    Cliente ligero con la misma interfaz que los proveedores (send_message,
+    stream_message, model, history, last_usage, last_error) que delega en el daemon.
+    """
+
+    def __init__(self, provider_name: str, model: str = None, mcp_enabled: bool = False, socket_path: str = None):
+        self.provider_name = provider_name
+        self.socket_path = socket_path or get_socket_path()
+        self.mcp_enabled = mcp_enabled
+        self.history = []
+        self.last_usage = None
+        self.last_error = None
+        self.last_tool_calls = []
+        # El daemon inicializa (o reutiliza) el proveedor y resuelve el modelo por defecto
+        info = next(daemon_request({"op": "info", "provider": provider_name, "model": model}, self.socket_path), {})
+        if info.get("error") or not info.get("model"):
+            raise ValueError(info.get("error") or "el daemon no respondió")
+        self.model = info["model"]
+
+    def set_mcp_enabled(self, enabled: bool):
+        self.mcp_enabled = enabled
+
+    def _request(self, op, prompt):
+        return {"op": op, "provider": self.provider_name, "model": self.model, "mcp": self.mcp_enabled,
+                "prompt": prompt, "history": as_api_messages(self.history)}
+
+    def _finish(self, prompt, message):
+        self.last_usage = message.get("usage")
+        self.last_error = message.get("error")
+        self.last_tool_calls = message.get("tool_calls") or []
+        if not self.last_error:
+            self.history.append({"role": "user", "content": prompt})
+            self.history.append({"role": "assistant", "content": message.get("text", "")})
+
+    def send_message(self, prompt):
+        self.last_usage = None
+        self.last_error = None
+        try:
+            for message in daemon_request(self._request("send", prompt), self.socket_path):
+                if message.get("done"):
+                    self._finish(prompt, message)
+                    return message.get("text", "")
+        except OSError as e:
+            self.last_error = str(e)
+            return f"[Daemon] Error: {e}"
+        self.last_error = "respuesta incompleta"
+        return "[Daemon] Error: respuesta incompleta"
+
+    def stream_message(self, prompt):
+        self.last_usage = None
+        self.last_error = None
+        try:
+            for message in daemon_request(self._request("stream", prompt), self.socket_path):
+                if "t" in message:
+                    if message.get("error"):
+                        self.last_error = message["error"]
+                    yield message["t"]
+                elif message.get("done"):
+                    already_reported = self.last_error is not None
+                    self._finish(prompt, message)
+                    # Error del propio daemon (p.ej. al inicializar el proveedor): aún no se emitió
+                    if self.last_error and not already_reported:
+                        yield message.get("text") or f"[Daemon] Error: {self.last_error}"
+                    return
+        except OSError as e:
+            self.last_error = str(e)
+            yield f"[Daemon] Error: {e}"
+
+def get_remote_provider(provider_name: str, model: str = None, mcp_enabled: bool = False):
+    """Retorna un RemoteProvider si el daemon está corriendo y habilitado (daemon.auto), o None."""
+    if not get_setting("daemon", "auto", True) or not is_daemon_running():
+        return None
+    try:
+        return RemoteProvider(provider_name, model=model, mcp_enabled=mcp_enabled)
+    except (OSError, ValueError):
+        return None  # El error se reportará al inicializar el proveedor en proceso
@@ -0,0 +1,121 @@
+"""
+Descubrimiento de proveedores en paralelo para el menú de inicio.
+
+Mientras se muestra el banner, un pool de hilos crea una instancia de cada
+proveedor (una sola vez), verifica credenciales y conexión con su `prewarm()` y
+obtiene su catálogo de modelos. El menú consulta los resultados a medida que
+llegan y la sesión reutiliza la instancia ya creada en lugar de construir otra.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+import requests
+from chat_cli.providers import create_provider, get_provider_class, get_provider_names
+
+# Proveedores cuyo cliente queda ligado al modelo al construirse (GenerativeModel de Gemini):
+# para otro modelo se crea una instancia nueva en lugar de cambiar `model`
+MODEL_BOUND_PROVIDERS = ("gemini",)
+# `auto` no es un backend: enruta entre los demás
+NOT_PROBED = ("auto",)
+
+class ProviderInfo:
+    """Resultado del sondeo de un proveedor."""
+    __slots__ = ("name", "instance", "default_model", "models", "available", "error", "elapsed")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.instance = None
+        self.default_model = None
+        self.models = []
+        self.available = False
+        self.error = None
+        self.elapsed = 0.0
+
+    def __repr__(self):
+        return f"ProviderInfo({self.name!r}, available={self.available}, models={len(self.models)})"
+
+def _short_error(error) -> str:
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return "sin conexión"
+    return (str(error).splitlines() or [type(error).__name__])[0][:80]
+
+def _list_models(instance):
+    if hasattr(instance, "list_models"):
+        return list(instance.list_models() or [])
+    if hasattr(instance, "list_local_models"):
+        return list(instance.list_local_models(verbose=False) or [])
+    return []
+
+def probe_provider(name: str, factory=None) -> ProviderInfo:
+    """Crea el proveedor, verifica credenciales/conexión y lista sus modelos. Nunca lanza excepciones."""
+    info = ProviderInfo(name)
+    start = time.perf_counter()
+    try:
+        info.instance = (factory or (lambda provider_name: create_provider(provider_name)))(name)
+        info.default_model = info.instance.model
+    except Exception as e:
+        info.error = _short_error(e)
+        # Sin instancia (p.ej. falta la API key) aún se puede sugerir el modelo por defecto
+        resolve = getattr(get_provider_class(name), "resolve_model", None)
+        info.default_model = resolve() if resolve else None
+        info.elapsed = time.perf_counter() - start
+        return info
+    try:
+        info.available = bool(info.instance.prewarm()) if hasattr(info.instance, "prewarm") else True
+        if not info.available:
+            info.error = "sin conexión o credenciales inválidas"
+    except Exception as e:
+        info.error = _short_error(e)
+    try:
+        info.models = _list_models(info.instance) if info.available else []
+    except Exception:
+        info.models = []
+    info.elapsed = time.perf_counter() - start
+    return info
+
+class ProviderDiscovery:
+    def __init__(self, names=None, factory=None):
+        self.names = [name for name in (names or get_provider_names()) if name not in NOT_PROBED]
+        self.factory = factory
+        self._executor = None
+        self._futures = {}
+        self._taken = set()
+
+    def start(self):
+        """Lanza todos los sondeos en paralelo y retorna inmediatamente."""
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(self.names)), thread_name_prefix="chat-cli-discovery")
+        self._futures = {name: self._executor.submit(probe_provider, name, self.factory) for name in self.names}
+        self._executor.shutdown(wait=False)
+        return self
+
+    def wait(self, timeout: float = None):
+        """Espera a que terminen los sondeos (como mucho `timeout` segundos). Retorna los ProviderInfo listos."""
+        wait(self._futures.values(), timeout=timeout)
+        return {name: future.result() for name, future in self._futures.items() if future.done()}
+
+    def result(self, name: str, timeout: float = None):
+        """ProviderInfo de `name` (esperando su sondeo), o None si no se sondeó."""
+        future = self._futures.get(name)
+        return future.result(timeout) if future else None
+
+    def take(self, name: str, model: str = None):
+        """
+        Instancia sondeada de `name` lista para la sesión, o None si no existe o no
+        sirve para `model`. Cada instancia se entrega una sola vez.
+        """
+        if name in self._taken:
+            return None
+        info = self.result(name)
+        if info is None or info.instance is None:
+            return None
+        instance = info.instance
+        if model and model != instance.model:
+            if name in MODEL_BOUND_PROVIDERS:
+                return None
+            instance.model = model
+        self._taken.add(name)
+        return instance
+
+    def provider_factory(self, name: str, model: str = None):
+        """Fábrica para AutoProvider: reutiliza la instancia sondeada o crea una nueva."""
+        return self.take(name, model) or create_provider(name, model=model)
@@ -0,0 +1,179 @@
+"""
+Exportación en streaming del historial a texto, Markdown, HTML, JSONL y CSV.
+
+history.json se lee de forma incremental (un mensaje a la vez, en bloques de
+64 KiB) y cada formato es un generador que produce fragmentos de texto, así que
+la memoria no depende del tamaño del historial. Los mensajes se pueden filtrar
+por rango de fechas, sesión y rol.
+
+Una sesión es un tramo de mensajes sin pausas mayores que `export.session_gap`
+minutos (30 por defecto); se numeran desde 1 en orden cronológico.
+"""
+
+import csv
+import html
+import io
+import json
+import os
+from datetime import datetime, timedelta
+from chat_cli.config import get_setting
+
+READ_CHUNK_SIZE = 64 * 1024
+SESSION_GAP_MINUTES = 30
+PROGRESS_EVERY = 1000   # Mensajes entre llamadas al callback de progreso
+
+def iter_history(filename, chunk_size: int = READ_CHUNK_SIZE):
+    """Mensajes de un history.json (arreglo JSON) uno a uno, sin cargar el archivo completo."""
+    decoder = json.JSONDecoder()
+    with open(filename, "r", encoding="utf-8") as f:
+        buffer, position, eof = "", 0, False
+        started = False
+        while True:
+            # Saltar espacios, el corchete inicial y las comas entre elementos
+            while position < len(buffer) and buffer[position] in " \t\r\n,[":
+                started = started or buffer[position] == "["
+                position += 1
+            if position < len(buffer) and buffer[position] == "]":
+                return
+            try:
+                if position >= len(buffer):
+                    raise ValueError("búfer vacío")
+                message, end = decoder.raw_decode(buffer, position)
+            except ValueError:
+                if eof:
+                    if buffer[position:].strip():
+                        raise ValueError(f"{filename}: JSON incompleto o inválido")
+                    return
+                # Objeto partido entre bloques: leer más
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            if not started:
+                raise ValueError(f"{filename}: se esperaba un arreglo JSON")
+            yield message
+            position = end
+
+def parse_timestamp(value):
+    """datetime de un timestamp del historial ("2025-05-01 10:00:00" o ISO 8601), o None."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+def filter_messages(messages, since: datetime = None, until: datetime = None, session: int = None,
+                    role: str = None):
+    """Filtra un iterable de mensajes sin materializarlo. Añade "session" a cada mensaje emitido."""
+    gap = timedelta(minutes=float(get_setting("export", "session_gap", SESSION_GAP_MINUTES)))
+    current_session, previous = 0, None
+    for message in messages:
+        moment = parse_timestamp(message.get("timestamp"))
+        if current_session == 0 or (moment and previous and moment - previous > gap):
+            current_session += 1
+        previous = moment or previous
+        if session is not None:
+            if current_session < session:
+                continue
+            if current_session > session:
+                return  # Las sesiones son consecutivas: no hay más mensajes de la pedida
+        if role and message.get("role") != role:
+            continue
+        if since and (moment is None or moment < since):
+            continue
+        if until and (moment is None or moment > until):
+            continue
+        yield {**message, "session": current_session}
+
+def write_txt(messages):
+    for message in messages:
+        yield f"[{message.get('timestamp')}] {message.get('role')}: {message.get('content')}\n"
+
+def write_markdown(messages):
+    yield "# Historial de chat\n"
+    session = None
+    for message in messages:
+        if message["session"] != session:
+            session = message["session"]
+            yield f"\n## Sesión {session}\n"
+        yield f"\n**{message.get('role')}** · {message.get('timestamp')}\n\n{message.get('content')}\n"
+
+def write_html(messages):
+    yield ("<!DOCTYPE html>\n<html lang=\"es\">\n<head><meta charset=\"utf-8\"><title>Historial de chat</title>\n"
+           "<style>body{font-family:sans-serif;max-width:50em;margin:auto}.message{margin:1em 0}"
+           ".role{font-weight:bold}.time{color:#777}pre{white-space:pre-wrap}</style>\n</head>\n<body>\n"
+           "<h1>Historial de chat</h1>\n")
+    session = None
+    for message in messages:
+        if message["session"] != session:
+            session = message["session"]
+            yield f"<h2>Sesión {session}</h2>\n"
+        role = html.escape(str(message.get("role")))
+        yield (f"<div class=\"message {role}\"><span class=\"role\">{role}</span> "
+               f"<span class=\"time\">{html.escape(str(message.get('timestamp')))}</span>"
+               f"<pre>{html.escape(str(message.get('content')))}</pre></div>\n")
+    yield "</body>\n</html>\n"
+
+def write_jsonl(messages):
+    for message in messages:
+        yield json.dumps(message, ensure_ascii=False) + "\n"
+
+def write_csv(messages):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["timestamp", "session", "role", "content"])
+    for message in messages:
+        writer.writerow([message.get("timestamp"), message["session"], message.get("role"), message.get("content")])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+FORMATS = {"txt": write_txt, "md": write_markdown, "html": write_html, "jsonl": write_jsonl, "csv": write_csv}
+EXTENSIONS = {".txt": "txt", ".md": "md", ".markdown": "md", ".html": "html", ".htm": "html",
+              ".jsonl": "jsonl", ".csv": "csv"}
+
+def format_for(destination, fmt: str = None) -> str:
+    """Formato indicado o deducido de la extensión del destino (txt si no se reconoce)."""
+    if fmt:
+        if fmt not in FORMATS:
+            raise ValueError(f"Formato no soportado: {fmt} (usa {', '.join(FORMATS)})")
+        return fmt
+    return EXTENSIONS.get(os.path.splitext(str(destination))[1].lower(), "txt")
+
+def export_history(source, destination, fmt: str = None, since: datetime = None, until: datetime = None,
+                   session: int = None, role: str = None, progress=None) -> int:
+    """
+    Exporta el historial `source` (ruta de history.json o iterable de mensajes) a
+    `destination`. `progress(n)` se llama cada PROGRESS_EVERY mensajes exportados.
+    Retorna el número de mensajes exportados.
+    """
+    writer = FORMATS[format_for(destination, fmt)]
+    messages = iter_history(source) if isinstance(source, (str, os.PathLike)) else source
+    count = 0
+
+    def counted(items):
+        nonlocal count
+        for item in items:
+            yield item
+            count += 1
+            if progress and count % PROGRESS_EVERY == 0:
+                progress(count)
+
+    # Admite también los Message de una Conversation
+    selected = counted(filter_messages((m.to_dict() if hasattr(m, "to_dict") else m for m in messages),
+                                       since, until, session, role))
+    tmp_path = f"{destination}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+            for piece in writer(selected):
+                f.write(piece)
+        os.replace(tmp_path, destination)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    if progress:
+        progress(count)
+    return count
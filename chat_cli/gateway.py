@@ -0,0 +1,437 @@
+"""
+Gateway HTTP compatible con la API de OpenAI: `chat-cli serve`.
+
+Expone `/v1/chat/completions` (con y sin streaming) y `/v1/models`, y enruta
+cada petición al proveedor correspondiente según el nombre del modelo. Corre
+sobre asyncio con un servidor HTTP/1.1 mínimo (keep-alive y respuestas
+chunked), de modo que no añade dependencias. Todos los clientes comparten las
+instancias de `ProviderPool`, los pools de conexiones de cada proveedor y una
+caché de respuestas con TTL; las peticiones idénticas simultáneas se resuelven
+con una sola llamada al proveedor.
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from chat_cli.config import get_setting, reload_config
+from chat_cli.providers import get_provider_class, get_provider_names
+from chat_cli.providers.pool import ProviderPool
+from chat_cli.render import iterate_provider_stream
+from chat_cli.usage import resolve_usage
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+DEFAULT_MAX_CONCURRENCY = 16   # Llamadas simultáneas a los proveedores
+DEFAULT_CACHE_TTL = 60.0       # Segundos que se reutiliza una respuesta idéntica (0 = sin caché)
+DEFAULT_CACHE_SIZE = 512
+MAX_BODY_BYTES = 32 * 1024 * 1024
+
+# Nombres de modelo que identifican al proveedor (expresiones al inicio del nombre); el resto va a Ollama.
+# Las familias o1/o3 solo como nombre completo o seguidas de "-" (o1-mini), no "o1x" ni "o3mini-local".
+MODEL_PATTERNS = tuple((re.compile(pattern), provider_name) for pattern, provider_name in (
+    (r"gpt-", "openai"), (r"o[13](?:-|$)", "openai"), (r"chatgpt-", "openai"),
+    (r"claude", "anthropic"),
+    (r"gemini", "gemini"),
+))
+
+# Campos de la petición que no afectan al texto generado
+IGNORED_FIELDS = ("model", "messages", "stream", "stream_options", "user")
+
+HTTP_REASONS = {200: "OK", 204: "No Content", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+                405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error",
+                502: "Bad Gateway"}
+
+class GatewayError(Exception):
+    def __init__(self, status: int, message: str, error_type: str = "invalid_request_error"):
+        super().__init__(message)
+        self.status = status
+        self.error_type = error_type
+
+    def payload(self):
+        return {"error": {"message": str(self), "type": self.error_type}}
+
+def route_model(model: str):
+    """
+    Retorna (proveedor, modelo) para un nombre de modelo. Acepta la forma explícita
+    "proveedor/modelo" (p.ej. "ollama/llama3") o deduce el proveedor por prefijo.
+    """
+    if not model:
+        raise GatewayError(400, "Falta el campo 'model'")
+    provider_name, _, rest = model.partition("/")
+    if rest and provider_name in get_provider_names():
+        return provider_name, rest
+    for pattern, provider_name in MODEL_PATTERNS:
+        if pattern.match(model):
+            return provider_name, model
+    return "ollama", model
+
+def _text_of(content) -> str:
+    """Contenido de un mensaje OpenAI: texto plano o lista de partes {"type": "text", ...}."""
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+def split_messages(provider_name: str, messages):
+    """
+    Convierte `messages` de OpenAI en (historial, prompt) para los proveedores, que
+    reciben el último mensaje del usuario como prompt. Ollama acepta mensajes de
+    sistema en el historial; para el resto se anteponen al prompt.
+    """
+    if not messages or not isinstance(messages, list):
+        raise GatewayError(400, "'messages' debe ser una lista no vacía")
+    system = [_text_of(m.get("content")) for m in messages if m.get("role") == "system"]
+    turns = [{"role": m.get("role"), "content": _text_of(m.get("content"))}
+             for m in messages if m.get("role") in ("user", "assistant")]
+    if not turns or turns[-1]["role"] != "user":
+        raise GatewayError(400, "El último mensaje debe ser del usuario")
+    history, prompt = turns[:-1], turns[-1]["content"]
+    if system:
+        if provider_name == "ollama":
+            history = [{"role": "system", "content": "\n\n".join(system)}] + history
+        else:
+            prompt = "\n\n".join(system + [prompt])
+    return history, prompt
+
+class ResponseCache:
+    """Caché LRU con expiración de respuestas completas, por hash de la petición."""
+
+    def __init__(self, ttl: float = DEFAULT_CACHE_TTL, max_entries: int = DEFAULT_CACHE_SIZE):
+        self.ttl = float(ttl)
+        self.max_entries = int(max_entries)
+        self.hits = 0
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def make_key(provider_name, model, history, prompt, params) -> str:
+        raw = json.dumps([provider_name, model, history, prompt, params], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        if self.ttl <= 0:
+            return None
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, value):
+        if self.ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+async def read_request(reader):
+    """Lee una petición HTTP/1.1. Retorna (método, ruta, headers, cuerpo) o None si el cliente cerró."""
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    try:
+        method, target, _ = request_line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise GatewayError(400, "Línea de petición inválida")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length") or 0)
+    if length > MAX_BODY_BYTES:
+        raise GatewayError(413, "Cuerpo demasiado grande")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target.split("?", 1)[0], headers, body
+
+class Gateway:
+    def __init__(self, pool: ProviderPool = None, cache: ResponseCache = None, max_concurrency: int = None,
+                 api_key: str = None):
+        self.pool = pool or ProviderPool()
+        self.cache = cache or ResponseCache(get_setting("gateway", "cache_ttl", DEFAULT_CACHE_TTL),
+                                            get_setting("gateway", "cache_size", DEFAULT_CACHE_SIZE))
+        self.max_concurrency = int(max_concurrency or get_setting("gateway", "max_concurrency", DEFAULT_MAX_CONCURRENCY))
+        self.api_key = api_key if api_key is not None else get_setting("gateway", "api_key")
+        self.upstream_calls = 0
+        self._semaphore = None
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="chat-cli-gateway")
+        self._inflight = {}
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    # --- Conexiones HTTP ---
+
+    async def handle_connection(self, reader, writer):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except GatewayError as e:
+                    await self._send_json(writer, e.status, e.payload(), keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                try:
+                    await self.dispatch(method, path, headers, body, writer, keep_alive)
+                except GatewayError as e:
+                    await self._send_json(writer, e.status, e.payload(), keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # El cliente cerró la conexión
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, path, headers, body, writer, keep_alive=True):
+        # config.yaml cambió: las instancias nuevas deben leerla de nuevo
+        if reload_config():
+            self.pool.clear()
+        if self.api_key and headers.get("authorization") != f"Bearer {self.api_key}":
+            raise GatewayError(401, "API key inválida", "authentication_error")
+        if path == "/v1/models":
+            if method != "GET":
+                raise GatewayError(405, "Método no permitido")
+            await self._send_json(writer, 200, await self.list_models(), keep_alive)
+        elif path == "/v1/chat/completions":
+            if method != "POST":
+                raise GatewayError(405, "Método no permitido")
+            try:
+                request = json.loads(body or b"{}")
+            except ValueError:
+                raise GatewayError(400, "JSON inválido")
+            if request.get("stream"):
+                await self.stream_completion(request, headers, writer, keep_alive)
+            else:
+                await self._send_json(writer, 200, await self.completion(request, headers), keep_alive)
+        else:
+            raise GatewayError(404, f"Ruta desconocida: {path}")
+
+    async def _send_json(self, writer, status, payload, keep_alive=True):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        writer.write(self._head(status, {"Content-Type": "application/json", "Content-Length": str(len(body))},
+                                keep_alive) + body)
+        await writer.drain()
+
+    @staticmethod
+    def _head(status, headers, keep_alive):
+        lines = [f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    # --- Endpoints ---
+
+    async def list_models(self):
+        async def provider_models(provider_name):
+            try:
+                return provider_name, await self._run(self.pool.list_models, provider_name)
+            except Exception:
+                return provider_name, []  # Proveedor sin configurar (p.ej. sin API key)
+        results = await asyncio.gather(*(provider_models(name) for name in get_provider_names()))
+        created = int(time.time())
+        return {"object": "list", "data": [
+            {"id": f"{provider_name}/{model}", "object": "model", "created": created, "owned_by": provider_name}
+            for provider_name, models in results for model in models
+        ]}
+
+    def _prepare(self, request, headers):
+        requested_model = request.get("model")
+        provider_name, model = route_model(requested_model)
+        history, prompt = split_messages(provider_name, request.get("messages"))
+        params = self._sampling_params(provider_name, request)
+        # Parámetros que cambian la respuesta forman parte de la clave de caché
+        key = None
+        if "no-cache" not in headers.get("cache-control", ""):
+            key = self.cache.make_key(provider_name, model, history, prompt, params)
+        return requested_model, provider_name, model, history, prompt, params, key
+
+    @staticmethod
+    def _sampling_params(provider_name, request):
+        """
+        Parámetros de muestreo de la petición que el proveedor sabe aplicar. Los que no
+        admite se rechazan con 400 en lugar de ignorarlos en silencio.
+        """
+        try:
+            supported = getattr(get_provider_class(provider_name), "SAMPLING_PARAMS", ())
+        except Exception as e:
+            raise GatewayError(502, f"No se pudo inicializar {provider_name}: {e}", "provider_error")
+        params, unsupported = {}, []
+        for name, value in request.items():
+            if name in IGNORED_FIELDS or value is None or (name == "n" and value == 1):
+                continue
+            if name in supported:
+                params[name] = value
+            else:
+                unsupported.append(name)
+        if unsupported:
+            raise GatewayError(400, f"Parámetros no soportados por {provider_name}: {', '.join(sorted(unsupported))}")
+        return params
+
+    async def _checkout(self, provider_name, model, history, params):
+        try:
+            provider = await self._run(self.pool.checkout, provider_name, model, history)
+        except Exception as e:
+            raise GatewayError(502, f"No se pudo inicializar {provider_name}: {e}", "provider_error")
+        if history and not hasattr(provider, "history"):
+            raise GatewayError(400, f"{provider_name} no admite conversaciones de varios turnos")
+        if hasattr(provider, "sampling"):
+            provider.sampling = dict(params)  # La copia del pool comparte el dict de la plantilla
+        return provider
+
+    async def _call_provider(self, provider_name, model, history, prompt, params):
+        async with self._semaphore:
+            provider = await self._checkout(provider_name, model, history, params)
+            self.upstream_calls += 1
+            text = await self._run(provider.send_message, prompt)
+        if provider.last_error:
+            raise GatewayError(502, provider.last_error, "upstream_error")
+        usage = resolve_usage(provider, prompt, text)
+        return {"text": text, "usage": usage}
+
+    async def completion(self, request, headers):
+        requested_model, provider_name, model, history, prompt, params, key = self._prepare(request, headers)
+        result = self.cache.get(key) if key else None
+        if result is None and key in self._inflight:
+            # Misma petición ya en curso: esperar su resultado en lugar de repetirla
+            result = await asyncio.shield(self._inflight[key])
+        if result is None:
+            future = asyncio.get_running_loop().create_future()
+            if key:
+                self._inflight[key] = future
+            try:
+                result = await self._call_provider(provider_name, model, history, prompt, params)
+                future.set_result(result)
+                if key:
+                    self.cache.put(key, result)
+            except Exception as e:
+                future.set_exception(e)
+                future.exception()  # Marcar como recuperada aunque nadie más la espere
+                raise
+            finally:
+                if key:
+                    self._inflight.pop(key, None)
+        return self._completion_payload(requested_model, result)
+
+    @staticmethod
+    def _completion_payload(model, result):
+        usage = result["usage"]
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": result["text"]},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": usage["prompt_tokens"], "completion_tokens": usage["completion_tokens"],
+                      "total_tokens": usage["prompt_tokens"] + usage["completion_tokens"]},
+        }
+
+    async def stream_completion(self, request, headers, writer, keep_alive=True):
+        requested_model, provider_name, model, history, prompt, params, key = self._prepare(request, headers)
+        include_usage = bool((request.get("stream_options") or {}).get("include_usage"))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+
+        def chunk(delta, finish_reason=None, usage=None):
+            payload = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                       "model": requested_model,
+                       "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if usage is None else []}
+            if usage is not None:
+                payload["usage"] = {"prompt_tokens": usage["prompt_tokens"],
+                                    "completion_tokens": usage["completion_tokens"],
+                                    "total_tokens": usage["prompt_tokens"] + usage["completion_tokens"]}
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+        async def send(data: str):
+            raw = data.encode("utf-8")
+            writer.write(f"{len(raw):x}\r\n".encode() + raw + b"\r\n")
+            await writer.drain()
+
+        cached = self.cache.get(key) if key else None
+        provider = None
+        failure = None
+        if cached is None:
+            await self._semaphore.acquire()
+        try:
+            if cached is None:
+                provider = await self._checkout(provider_name, model, history, params)
+            writer.write(self._head(200, {"Content-Type": "text/event-stream", "Cache-Control": "no-cache",
+                                          "Transfer-Encoding": "chunked"}, keep_alive))
+            await send(chunk({"role": "assistant", "content": ""}))
+            if cached is not None:
+                await send(chunk({"content": cached["text"]}))
+                result = cached
+            else:
+                parts = []
+                self.upstream_calls += 1
+                tokens = iterate_provider_stream(provider, prompt)
+                try:
+                    async for token in tokens:
+                        if provider.last_error:
+                            break
+                        parts.append(token)
+                        await send(chunk({"content": token}))
+                except ConnectionError:
+                    raise  # El cliente se desconectó: no hay a quién avisar
+                except Exception as e:
+                    failure = str(e) or type(e).__name__
+                finally:
+                    # Detiene el hilo lector aunque el cliente se haya ido a mitad de la respuesta
+                    await tokens.aclose()
+        finally:
+            if cached is None:
+                self._semaphore.release()
+        if provider is not None:
+            failure = failure or provider.last_error
+            if failure:
+                # Las cabeceras ya se enviaron: el error viaja como evento SSE
+                error = GatewayError(502, failure, "upstream_error")
+                await send(f"data: {json.dumps(error.payload(), ensure_ascii=False)}\n\n")
+                await send("data: [DONE]\n\n")
+                writer.write(b"0\r\n\r\n")
+                await writer.drain()
+                return
+            text = "".join(parts)
+            result = {"text": text, "usage": resolve_usage(provider, prompt, text)}
+            if key:
+                self.cache.put(key, result)
+        await send(chunk({}, "stop"))
+        if include_usage:
+            await send(chunk(None, usage=result["usage"]))
+        await send("data: [DONE]\n\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    # --- Servidor ---
+
+    async def serve(self, host: str = None, port: int = None, ready=None):
+        host = host or get_setting("gateway", "host", DEFAULT_HOST)
+        port = get_setting("gateway", "port", DEFAULT_PORT) if port is None else port
+        server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_BODY_BYTES)
+        self.port = server.sockets[0].getsockname()[1]
+        if ready:
+            ready.set()
+        async with server:
+            await server.serve_forever()
+
+def run_gateway(host: str = None, port: int = None):
+    """Arranca el gateway en primer plano hasta recibir Ctrl+C."""
+    try:
+        asyncio.run(Gateway().serve(host, port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,143 @@
+"""
+Modo headless para scripts: `chat-cli ask`.
+
+Envía un único prompt y escribe los tokens en bruto en stdout a medida que
+llegan. Este módulo no importa Textual ni Rich Markdown, y los proveedores se
+cargan de forma diferida, para que el costo del cliente sobre el TTFT del
+proveedor sea mínimo. Si `chat-cli daemon` está corriendo, el turno se delega
+en él y ni siquiera se importa el SDK del proveedor.
+"""
+
+import os
+import sys
+import time
+from chat_cli.daemon import get_remote_provider
+from chat_cli.providers import create_provider, get_provider_names
+
+# Códigos de salida de `chat-cli ask`
+EXIT_OK = 0
+EXIT_PROVIDER_ERROR = 1   # El proveedor devolvió un error (red, API, cuota...)
+EXIT_USAGE = 2            # Prompt vacío o proveedor desconocido
+EXIT_INIT_ERROR = 3       # No se pudo inicializar el proveedor (p.ej. falta la API key)
+EXIT_SCHEMA_ERROR = 4     # La respuesta no cumplió --json-schema tras los reintentos
+EXIT_INTERRUPTED = 130    # Ctrl+C
+
+FLUSH_INTERVAL = 0.05  # Segundos máximos que un token puede quedar en el buffer de stdout
+
+def read_prompt(args, stdin=None) -> str:
+    """
+    Construye el prompt a partir de los argumentos y/o stdin. Si ambos están
+    presentes (p.ej. `cat archivo | chat-cli ask "resume esto"`), la entrada
+    de stdin se añade después del texto de los argumentos.
+    """
+    stdin = stdin if stdin is not None else sys.stdin
+    prompt = " ".join(args or []).strip()
+    if stdin is not None and not stdin.isatty():
+        piped = stdin.read().strip()
+        if piped:
+            prompt = f"{prompt}\n\n{piped}" if prompt else piped
+    return prompt
+
+class StreamWriter:
+    """
+    Escritor con buffer para stdout binario. Vacía el buffer en cada salto de
+    línea o cuando pasa FLUSH_INTERVAL desde el último vaciado; en una terminal
+    interactiva vacía en cada token.
+    """
+
+    def __init__(self, stream=None, interactive: bool = None):
+        self.stream = stream or sys.stdout.buffer
+        self.interactive = interactive if interactive is not None else os.isatty(self.stream.fileno())
+        self._last_flush = time.monotonic()
+
+    def write(self, text: str):
+        self.stream.write(text.encode("utf-8", errors="replace"))
+        now = time.monotonic()
+        if self.interactive or "\n" in text or now - self._last_flush >= FLUSH_INTERVAL:
+            self.stream.flush()
+            self._last_flush = now
+
+    def close(self):
+        self.stream.flush()
+
+def _write_stream(provider, prompt, writer, err) -> int:
+    wrote_newline = True
+    for token in provider.stream_message(prompt):
+        # Los proveedores entregan el error como último fragmento; va a stderr
+        if getattr(provider, "last_error", None):
+            err.write(f"{token}\n")
+            return EXIT_PROVIDER_ERROR
+        writer.write(token)
+        wrote_newline = token.endswith("\n")
+    if not wrote_newline:
+        writer.write("\n")
+    return EXIT_OK
+
+def _write_structured(provider, prompt, schema, writer, err) -> int:
+    """
+    Escribe cada elemento validado como una línea JSON (JSONL). Si quedan reintentos,
+    un intento puede descartarse a medias: sus elementos esperan a que el documento
+    completo sea válido, para que la salida no mezcle dos generaciones. Sin
+    reintentos (structured.retries: 0) se escriben en cuanto se completan.
+    """
+    import json
+    from chat_cli.structured import StructuredOutputError, StructuredStream
+    structured = StructuredStream(provider, schema)
+    pending = [] if structured.retries else None
+    try:
+        for kind, value in structured.events(prompt):
+            if kind == "element" and pending is None:
+                writer.write(json.dumps(value, ensure_ascii=False) + "\n")
+            elif kind == "element":
+                pending.append(value)
+            elif kind == "retry":
+                err.write(f"Respuesta inválida ({value}); reintentando...\n")
+                pending.clear()
+    except StructuredOutputError as e:
+        err.write(f"{e}\n")
+        return EXIT_PROVIDER_ERROR if e.provider_error else EXIT_SCHEMA_ERROR
+    for value in pending or ():
+        writer.write(json.dumps(value, ensure_ascii=False) + "\n")
+    return EXIT_OK
+
+def run_ask(provider_name: str, model: str, prompt: str, out=None, err=None, provider=None, schema=None) -> int:
+    """
+    Ejecuta un turno en streaming y retorna el código de salida.
+    Los errores del proveedor se escriben en stderr, nunca en stdout.
+    Con `schema` (JSON Schema) la salida se valida mientras llega y se escribe
+    como JSONL: un elemento por línea si la raíz es un array, o el documento.
+    """
+    err = err or sys.stderr
+    if not prompt:
+        err.write("Error: prompt vacío. Pásalo como argumento o por stdin.\n")
+        return EXIT_USAGE
+    if provider is None:
+        if provider_name not in get_provider_names():
+            err.write(f"Error: proveedor '{provider_name}' no soportado.\n")
+            return EXIT_USAGE
+        # Con el daemon corriendo se evita importar el SDK y reconectar en cada llamada
+        provider = get_remote_provider(provider_name, model=model)
+    if provider is None:
+        try:
+            provider = create_provider(provider_name, model=model)
+        except Exception as e:
+            err.write(f"Error al inicializar el proveedor {provider_name}: {e}\n")
+            return EXIT_INIT_ERROR
+
+    writer = StreamWriter(out)
+    try:
+        if schema is not None:
+            return _write_structured(provider, prompt, schema, writer, err)
+        return _write_stream(provider, prompt, writer, err)
+    except KeyboardInterrupt:
+        return EXIT_INTERRUPTED
+    except BrokenPipeError:
+        # El consumidor cerró la tubería (p.ej. `| head`): no es un error.
+        # Redirigir stdout a /dev/null evita el aviso de Python al salir.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), writer.stream.fileno())
+        return EXIT_OK
+    finally:
+        try:
+            writer.close()
+        except (BrokenPipeError, ValueError):
+            pass
@@ -0,0 +1,281 @@
+"""
+Resaltado de sintaxis memoizado para bloques de código en Markdown.
+
+Rich vuelve a resaltar con Pygments cada bloque de código en cada repintado
+(flush del streaming, limpieza de pantalla, recarga de historial). Aquí los
+bloques *completos* se resaltan una sola vez y se guardan por hash de contenido,
+lexer y tema en una caché LRU en memoria, respaldada por una caché en disco que
+se reutiliza entre sesiones. Los bloques muy grandes se resaltan en un hilo de
+trabajo y se muestran como texto plano hasta que el resultado está listo.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from rich.markdown import CodeBlock, Markdown
+from rich.style import Style
+from rich.syntax import Syntax
+from rich.text import Span, Text
+from chat_cli.config import get_cache_dir, get_setting
+
+DEFAULT_CACHE_SIZE = 256      # Bloques resaltados en memoria
+DEFAULT_DISK_ENTRIES = 2000   # Bloques resaltados en disco
+DEFAULT_ASYNC_LINES = 400     # A partir de este tamaño se resalta en segundo plano
+
+def _text_to_data(text: Text) -> dict:
+    """Texto resaltado como datos JSON (los estilos como su definición en texto)."""
+    return {"plain": text.plain, "style": str(text.style), "end": text.end,
+            "spans": [[span.start, span.end, str(span.style)] for span in text.spans]}
+
+def _text_from_data(data: dict) -> Text:
+    text = Text(data["plain"], style=Style.parse(data["style"]), end=data["end"])
+    text.spans = [Span(start, end, Style.parse(style)) for start, end, style in data["spans"]]
+    return text
+
+class HighlightCache:
+    """Caché LRU (memoria + disco) de resultados de Syntax.highlight()."""
+
+    def __init__(self, max_entries: int = None, disk_dir=None, max_disk_entries: int = None, async_lines: int = None):
+        self.max_entries = int(max_entries or get_setting("tui", "highlight_cache_size", DEFAULT_CACHE_SIZE))
+        self.max_disk_entries = int(max_disk_entries or DEFAULT_DISK_ENTRIES)
+        self.async_lines = int(async_lines or get_setting("tui", "highlight_async_lines", DEFAULT_ASYNC_LINES))
+        self.disk_dir = disk_dir
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._segments = OrderedDict()  # Renders completos por (clave, ancho)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._listeners = []
+        self._disk_writes = 0
+
+    @staticmethod
+    def make_key(code: str, lexer_name: str, theme_name: str, line_range=None) -> str:
+        digest = hashlib.sha1(code.encode("utf-8", errors="surrogatepass"))
+        digest.update(f"\0{lexer_name}\0{theme_name}\0{line_range}".encode())
+        return digest.hexdigest()
+
+    def add_listener(self, callback):
+        """Registra `callback()` para cuando termine un resaltado en segundo plano (se llama desde otro hilo)."""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def get(self, key: str):
+        with self._lock:
+            text = self._entries.get(key)
+            if text is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return text
+        text = self._load_from_disk(key)
+        if text is not None:
+            self._store(key, text, persist=False)
+            self.hits += 1
+            return text
+        self.misses += 1
+        return None
+
+    def put(self, key: str, text: Text):
+        self._store(key, text, persist=True)
+
+    def get_segments(self, render_key):
+        """Segmentos ya renderizados de un bloque completo para un ancho dado."""
+        with self._lock:
+            segments = self._segments.get(render_key)
+            if segments is not None:
+                self._segments.move_to_end(render_key)
+            return segments
+
+    def put_segments(self, render_key, segments):
+        with self._lock:
+            self._segments[render_key] = segments
+            while len(self._segments) > self.max_entries:
+                self._segments.popitem(last=False)
+
+    def is_pending(self, key: str) -> bool:
+        with self._lock:
+            return key in self._pending
+
+    def submit(self, key: str, highlight):
+        """Resalta en segundo plano con `highlight()` y notifica a los listeners al terminar."""
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-cli-highlight")
+        self._executor.submit(self._run_job, key, highlight)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._segments.clear()
+
+    def _run_job(self, key, highlight):
+        try:
+            self.put(key, highlight())
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+        for callback in list(self._listeners):
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def _store(self, key, text, persist):
+        with self._lock:
+            self._entries[key] = text
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        if persist:
+            self._save_to_disk(key, text)
+
+    def _disk_path(self, key):
+        if self.disk_dir is None:
+            return None
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _load_from_disk(self, key):
+        path = self._disk_path(key)
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding="utf-8") as f:
+                return _text_from_data(json.load(f))
+        except Exception:
+            return None
+
+    def _save_to_disk(self, key, text):
+        path = self._disk_path(key)
+        if not path:
+            return
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(_text_to_data(text), f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception:
+            return
+        self._disk_writes += 1
+        if self._disk_writes % 50 == 0:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        try:
+            entries = sorted(os.scandir(self.disk_dir), key=lambda e: e.stat().st_mtime)
+        except OSError:
+            return
+        for entry in entries[:max(0, len(entries) - self.max_disk_entries)]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+_cache = None
+
+def get_highlight_cache() -> HighlightCache:
+    """Caché compartida por toda la aplicación (disco en ~/.cache/chat_cli/highlight)."""
+    global _cache
+    if _cache is None:
+        disk_dir = None
+        if get_setting("tui", "highlight_disk_cache", True):
+            try:
+                disk_dir = str(get_cache_dir() / "highlight")
+            except OSError:
+                disk_dir = None
+        _cache = HighlightCache(disk_dir=disk_dir)
+    return _cache
+
+class CachedSyntax(Syntax):
+    """Syntax que consulta la caché antes de resaltar. Solo guarda bloques completos."""
+
+    def __init__(self, code, lexer, *, theme_name: str, complete: bool = True, cache: HighlightCache = None, **kwargs):
+        super().__init__(code, lexer, theme=theme_name, **kwargs)
+        self.theme_name = theme_name
+        self.complete = complete
+        self.cache = cache or get_highlight_cache()
+        self.placeholder = False  # True si se mostró texto plano a la espera del resaltado
+
+    def cache_key(self, line_range=None) -> str:
+        lexer_name = self._lexer if isinstance(self._lexer, str) else type(self._lexer).__name__
+        return self.cache.make_key(self.code, lexer_name, self.theme_name, line_range)
+
+    def _plain(self, code):
+        return Text(code, style=self._theme.get_background_style())
+
+    def highlight(self, code, line_range=None) -> Text:
+        large = code.count("\n") + 1 >= self.cache.async_lines
+        if not self.complete:
+            # Bloque aún abierto durante el streaming: cambia en cada cuadro, no se cachea
+            self.placeholder = large
+            return self._plain(code) if large else super().highlight(code, line_range)
+        lexer_name = self._lexer if isinstance(self._lexer, str) else type(self._lexer).__name__
+        key = self.cache.make_key(code, lexer_name, self.theme_name, line_range)
+        text = self.cache.get(key)
+        if text is not None:
+            # Rich modifica el Text devuelto al renderizar; entregar una copia
+            return text.copy()
+        if large:
+            self.cache.submit(key, lambda: Syntax.highlight(self, code, line_range))
+            self.placeholder = True
+            return self._plain(code)
+        text = super().highlight(code, line_range)
+        self.cache.put(key, text.copy())
+        return text
+
+class CachedCodeBlock(CodeBlock):
+    """Bloque de código de Markdown que usa CachedSyntax y sabe si su cerca ``` está cerrada."""
+
+    @classmethod
+    def create(cls, markdown, token):
+        block = super().create(markdown, token)
+        block.complete = cls._is_complete(markdown, token)
+        return block
+
+    @staticmethod
+    def _is_complete(markdown, token) -> bool:
+        lines = getattr(markdown, "source_lines", None)
+        if lines is None or not token.map:
+            return True
+        end = token.map[1]
+        if token.type == "fence":
+            # Cerrado si la última línea del bloque es la cerca de cierre
+            closing = lines[end - 1].strip() if 0 < end <= len(lines) else ""
+            return end - token.map[0] >= 2 and closing.startswith(token.markup[:3])
+        # Bloque indentado: completo si hay contenido después de él
+        return end < len(lines)
+
+    def __rich_console__(self, console, options):
+        code = str(self.text).rstrip()
+        syntax = CachedSyntax(code, self.lexer_name, theme_name=self.theme, complete=self.complete,
+                              word_wrap=True, padding=1)
+        if not self.complete:
+            yield syntax
+            return
+        # Un bloque completo se renderiza igual para el mismo ancho: reutilizar los segmentos
+        render_key = (syntax.cache_key(), options.max_width, console.color_system)
+        segments = syntax.cache.get_segments(render_key)
+        if segments is None:
+            segments = list(console.render(syntax, options))
+            if not syntax.placeholder:
+                syntax.cache.put_segments(render_key, segments)
+        yield from segments
+
+class CachedMarkdown(Markdown):
+    """Markdown de Rich con resaltado de código memoizado."""
+
+    elements = {**Markdown.elements, "fence": CachedCodeBlock, "code_block": CachedCodeBlock}
+
+    def __init__(self, markup: str, *args, **kwargs):
+        super().__init__(markup, *args, **kwargs)
+        self.source_lines = markup.splitlines()
@@ -12,6 +12,49 @@ def load_history(filename):
     with open(filename, 'r', encoding='utf-8') as f:
         return json.load(f)
 
+def append_history(messages, filename):
+    """
+    Añade `messages` al final del arreglo JSON de `filename` sin reescribirlo: se
+    sobrescribe el corchete de cierre con los mensajes nuevos y un corchete nuevo.
+    El archivo sigue siendo legible con load_history.
+    """
+    messages = list(messages)
+    if not messages:
+        return
+    if not os.path.exists(filename) or os.path.getsize(filename) == 0:
+        save_history(messages, filename)
+        return
+    with open(filename, 'r+b') as f:
+        # Buscar el "]" final (hacia atrás, saltando espacios) y si el arreglo tiene elementos
+        position = f.seek(0, os.SEEK_END)
+        tail = b""
+        while position > 0 and not tail.rstrip():
+            step = min(4096, position)
+            position -= step
+            f.seek(position)
+            tail = f.read(step) + tail
+        stripped = tail.rstrip()
+        if not stripped.endswith(b"]"):
+            raise ValueError(f"{filename}: se esperaba un arreglo JSON")
+        close = position + len(stripped) - 1
+        before = stripped[:-1].rstrip()
+        empty = before.endswith(b"[") if before else None
+        if empty is None:
+            # La cola leída solo contenía el "]": mirar el carácter anterior en el archivo
+            start = close
+            while start > 0:
+                start -= 1
+                f.seek(start)
+                char = f.read(1)
+                if not char.isspace():
+                    empty = char == b"["
+                    break
+        body = ",\n".join("  " + json.dumps(message, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+                           for message in messages)
+        f.seek(close)
+        f.write((("\n" if empty else ",\n") + body + "\n]").encode('utf-8'))
+        f.truncate()
+
 def add_message(history, role, content):
     history.append({
         "role": role,
@@ -0,0 +1,265 @@
+"""
+Map-reduce sobre documentos más grandes que el contexto del modelo: `chat-cli map`.
+
+El archivo se lee con mmap y se parte en fragmentos de como mucho
+`chunk_tokens` tokens (estimados), cortando en párrafos, líneas o simplemente en
+espacios (`split`). Nunca se carga entero en memoria: cada fragmento se
+decodifica cuando le toca. El prompt de map se aplica a los fragmentos en
+paralelo (como mucho `parallel` peticiones a la vez) y los resultados se
+combinan con el prompt de reduce por niveles, en grupos que caben en el mismo
+presupuesto, hasta quedar uno.
+
+Cada resultado (de map y de reduce) se guarda al terminar en un JSONL en
+~/.cache/chat_cli/mapreduce/, indexado por la huella de su entrada: si la
+ejecución se interrumpe o falla un fragmento, repetir el comando solo procesa lo
+que falta.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import re
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from chat_cli.config import get_cache_dir, get_setting
+from chat_cli.usage import estimate_tokens
+
+CHUNK_TOKENS = 2000    # Tokens estimados por fragmento y por grupo de reduce (mapreduce.chunk_tokens)
+PARALLEL = 4           # Peticiones simultáneas al proveedor (mapreduce.parallel)
+SPLIT_MODES = ("paragraph", "line", "tokens")
+# Separadores de cada modo: el fragmento se corta justo después de uno de ellos
+_BOUNDARIES = {"paragraph": re.compile(rb"\n[ \t\r]*\n\s*"), "line": re.compile(rb"\n"), "tokens": re.compile(rb"\s+")}
+MAP_TEMPLATE = "{prompt}\n\n--- Fragmento {index} de {total} ---\n{text}"
+REDUCE_PROMPT = ("Combina los siguientes resultados parciales, obtenidos de fragmentos consecutivos de un mismo "
+                 "documento, en una única respuesta coherente, sin repetir información.")
+REDUCE_TEMPLATE = "{prompt}\n\nInstrucción original para cada fragmento: {map_prompt}\n\n{parts}"
+
+class MapReduceError(Exception):
+    """Algún fragmento o grupo no obtuvo respuesta; lo completado queda guardado para reintentar."""
+
+    def __init__(self, message: str, failures=None):
+        super().__init__(message)
+        self.failures = list(failures or [])
+
+# --- División del documento ---
+
+def _units(buffer, start, end, mode):
+    """Tramos (inicio, fin) de buffer[start:end] separados según `mode`."""
+    position = start
+    for match in _BOUNDARIES[mode].finditer(buffer, start, end):
+        if match.end() > position:
+            yield position, match.end()
+            position = match.end()
+    if position < end:
+        yield position, end
+
+def _decode(buffer, start, end) -> str:
+    return buffer[start:end].decode("utf-8", errors="replace")
+
+def split_chunks(buffer, mode: str = "paragraph", chunk_tokens: int = CHUNK_TOKENS):
+    """
+    Tramos (inicio, fin) de `buffer` (bytes o mmap) de como mucho `chunk_tokens`
+    tokens estimados, cortados en los separadores de `mode`. Un párrafo o línea
+    más grande que el presupuesto se corta en espacios.
+    """
+    if mode not in SPLIT_MODES:
+        raise ValueError(f"Modo de división desconocido: {mode}. Usa {', '.join(SPLIT_MODES)}")
+    chunk_start, chunk_end, tokens = None, None, 0
+
+    def pieces():
+        for start, end in _units(buffer, 0, len(buffer), mode):
+            size = estimate_tokens(_decode(buffer, start, end))
+            if size > chunk_tokens and mode != "tokens":
+                for piece in _units(buffer, start, end, "tokens"):
+                    yield piece[0], piece[1], estimate_tokens(_decode(buffer, *piece))
+            else:
+                yield start, end, size
+
+    for start, end, size in pieces():
+        if chunk_start is not None and tokens + size > chunk_tokens:
+            yield chunk_start, chunk_end
+            chunk_start, tokens = None, 0
+        if chunk_start is None:
+            chunk_start = start
+        chunk_end, tokens = end, tokens + size
+    if chunk_start is not None:
+        yield chunk_start, chunk_end
+
+def _group(parts, budget: int):
+    """Agrupa resultados consecutivos que caben en `budget` tokens (al menos dos por grupo)."""
+    groups, current, tokens = [], [], 0
+    for part in parts:
+        size = estimate_tokens(part)
+        if len(current) >= 2 and tokens + size > budget:
+            groups.append(current)
+            current, tokens = [], 0
+        current.append(part)
+        tokens += size
+    if current:
+        if len(current) == 1 and groups:
+            groups[-1].append(current[0])  # Un resultado suelto se combina con el grupo anterior
+        else:
+            groups.append(current)
+    return groups
+
+# --- Puntos de control ---
+
+def _digest(*parts) -> str:
+    hasher = hashlib.sha1()
+    for part in parts:
+        hasher.update(str(part).encode("utf-8", errors="replace") + b"\0")
+    return hasher.hexdigest()
+
+class Checkpoint:
+    """Resultados intermedios por huella de entrada, en un JSONL de solo añadido."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.results = {}
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Línea truncada por una interrupción
+                    self.results[entry["key"]] = entry["text"]
+        except OSError:
+            pass
+
+    def __len__(self):
+        return len(self.results)
+
+    def get(self, key):
+        return self.results.get(key)
+
+    def add(self, key: str, text: str, level: int):
+        with self._lock:
+            self.results[key] = text
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "level": level, "text": text}, ensure_ascii=False) + "\n")
+
+    def remove(self):
+        with self._lock:
+            self.results.clear()
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
+
+# --- Ejecución ---
+
+def _provider_completer(provider_name: str, model: str = None):
+    """Función (prompt) -> texto que usa un proveedor nuevo, sin historial, por petición."""
+    from chat_cli.providers import create_provider
+
+    def complete(prompt):
+        provider = create_provider(provider_name, model=model)
+        text = provider.send_message(prompt)
+        if getattr(provider, "last_error", None) or not (text or "").strip():
+            raise MapReduceError(getattr(provider, "last_error", None) or "respuesta vacía")
+        return text.strip()
+    return complete
+
+class MapReduceJob:
+    def __init__(self, path, map_prompt: str, reduce_prompt: str = None, provider_name: str = "ollama",
+                 model: str = None, split: str = "paragraph", chunk_tokens: int = None, parallel: int = None,
+                 checkpoint_path=None, complete=None, on_progress=None):
+        self.path = Path(path).expanduser().resolve()
+        self.map_prompt = map_prompt
+        self.reduce_prompt = reduce_prompt or REDUCE_PROMPT
+        self.split = split
+        self.chunk_tokens = int(chunk_tokens or get_setting("mapreduce", "chunk_tokens", CHUNK_TOKENS))
+        self.parallel = max(1, int(parallel or get_setting("mapreduce", "parallel", PARALLEL)))
+        self.complete = complete or _provider_completer(provider_name, model)
+        self.on_progress = on_progress or (lambda message: None)
+        if checkpoint_path is None:
+            job = _digest(self.path, provider_name, model, self.map_prompt, self.reduce_prompt)
+            checkpoint_path = get_cache_dir() / "mapreduce" / f"{job[:16]}.jsonl"
+        self.checkpoint = Checkpoint(checkpoint_path)
+        self.stats = {"chunks": 0, "cached": 0, "calls": 0, "levels": 0}
+        self._stats_lock = threading.Lock()
+
+    def _cached_call(self, key, prompt, level):
+        """Resultado guardado para `key` o, si no hay, la respuesta del modelo (que se guarda)."""
+        text = self.checkpoint.get(key)
+        if text is None:
+            text = self.complete(prompt)
+            self.checkpoint.add(key, text, level)
+            counter = "calls"
+        else:
+            counter = "cached"
+        with self._stats_lock:
+            self.stats[counter] += 1
+        return text
+
+    def _map(self, executor):
+        """Aplica el prompt de map a cada fragmento, con como mucho 2 × parallel tareas pendientes."""
+        if os.path.getsize(self.path) == 0:
+            return [], []
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            spans = list(split_chunks(buffer, self.split, self.chunk_tokens))
+            total = len(spans)
+            self.stats["chunks"] = total
+            results, failures, pending = [None] * total, [], {}
+            finished = 0
+
+            def collect(done):
+                nonlocal finished
+                for future in done:
+                    index = pending.pop(future)
+                    finished += 1
+                    try:
+                        results[index] = future.result()
+                    except Exception as e:
+                        failures.append((f"fragmento {index + 1}", str(e)))
+                    self.on_progress(f"map {finished}/{total}")
+
+            for index, (start, end) in enumerate(spans):
+                text = _decode(buffer, start, end)
+                key = _digest("map", self.map_prompt, text)
+                prompt = MAP_TEMPLATE.format(prompt=self.map_prompt, index=index + 1, total=total, text=text)
+                pending[executor.submit(self._cached_call, key, prompt, 0)] = index
+                if len(pending) >= self.parallel * 2:
+                    collect(wait(pending, return_when=FIRST_COMPLETED).done)
+            while pending:
+                collect(wait(pending, return_when=FIRST_COMPLETED).done)
+        return results, failures
+
+    def _reduce(self, executor, parts):
+        """Combina los resultados por niveles hasta quedar uno."""
+        level = 0
+        while len(parts) > 1:
+            level += 1
+            groups = _group(parts, self.chunk_tokens)
+            futures = []
+            for group in groups:
+                joined = "\n\n".join(f"--- Resultado {number} ---\n{part}" for number, part in enumerate(group, 1))
+                key = _digest("reduce", self.reduce_prompt, self.map_prompt, joined)
+                prompt = REDUCE_TEMPLATE.format(prompt=self.reduce_prompt, map_prompt=self.map_prompt, parts=joined)
+                futures.append(executor.submit(self._cached_call, key, prompt, level))
+            parts, failures = [], []
+            for number, future in enumerate(futures, 1):
+                try:
+                    parts.append(future.result())
+                except Exception as e:
+                    failures.append((f"reduce nivel {level}, grupo {number}", str(e)))
+            self.stats["levels"] = level
+            self.on_progress(f"reduce nivel {level}: {len(groups)} grupos")
+            if failures:
+                raise MapReduceError(f"Falló el reduce ({len(failures)} grupos); vuelve a ejecutar para reintentar",
+                                     failures)
+        return parts[0] if parts else ""
+
+    def run(self) -> str:
+        """Ejecuta el map y el reduce. Lanza MapReduceError si algo falló (lo completado queda guardado)."""
+        with ThreadPoolExecutor(max_workers=self.parallel, thread_name_prefix="chat-cli-map") as executor:
+            results, failures = self._map(executor)
+            if failures:
+                raise MapReduceError(f"Fallaron {len(failures)} de {len(results)} fragmentos; "
+                                     f"vuelve a ejecutar para procesar solo los que faltan", failures)
+            return self._reduce(executor, results)
@@ -0,0 +1,369 @@
+"""
+Cliente de Model Context Protocol (M.C.P) para ejecutar herramientas.
+
+Se conecta a servidores MCP locales, ya sea por stdio (un proceso hijo que habla
+JSON-RPC por líneas) o por HTTP (transporte "streamable HTTP"). Reúne sus
+herramientas para anunciarlas al modelo y ejecuta las llamadas `tool_use` de un
+mismo turno de forma concurrente con asyncio. Los resultados de herramientas
+idempotentes (anotadas `readOnlyHint`/`idempotentHint` o listadas en
+`mcp.cacheable_tools`) se guardan en una caché con TTL.
+
+Configuración en config.yaml:
+
+    mcp:
+      servers:
+        archivos: {command: ["npx", "-y", "@modelcontextprotocol/server-filesystem", "."]}
+        local: {url: "http://127.0.0.1:8765/mcp"}
+      cache_ttl: 300
+      timeout: 60
+"""
+
+import abc
+import asyncio
+import itertools
+import json
+import os
+import shlex
+import subprocess
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from chat_cli.config import get_setting
+
+MCP_PROTOCOL_VERSION = "2024-11-05"
+CLIENT_INFO = {"name": "chat-cli", "version": "0.1.0"}
+DEFAULT_TIMEOUT = 60.0     # Segundos máximos por petición a un servidor MCP
+DEFAULT_CACHE_TTL = 300.0  # Segundos que se reutiliza el resultado de una herramienta idempotente
+RETRY_DELAY = 30.0         # Segundos antes de reintentar un servidor que no conectó (se duplica en cada fallo)
+MAX_RETRY_DELAY = 600.0
+
+class MCPError(Exception):
+    """Error devuelto por un servidor MCP o fallo de comunicación con él."""
+
+class _MCPClient(abc.ABC):
+    """Operaciones comunes a ambos transportes (initialize, tools/list, tools/call)."""
+
+    def __init__(self, name: str, timeout: float = DEFAULT_TIMEOUT):
+        self.name = name
+        self.timeout = timeout
+        self.server_info = {}
+        self._ids = itertools.count(1)
+
+    @abc.abstractmethod
+    def request(self, method: str, params: dict = None) -> dict:
+        """Envía una petición JSON-RPC y retorna su `result`."""
+
+    @abc.abstractmethod
+    def notify(self, method: str, params: dict = None):
+        """Envía una notificación JSON-RPC (sin respuesta)."""
+
+    def initialize(self):
+        result = self.request("initialize", {
+            "protocolVersion": MCP_PROTOCOL_VERSION,
+            "capabilities": {},
+            "clientInfo": CLIENT_INFO,
+        })
+        self.server_info = result.get("serverInfo") or {}
+        self.notify("notifications/initialized")
+        return result
+
+    def list_tools(self):
+        tools, cursor = [], None
+        while True:
+            result = self.request("tools/list", {"cursor": cursor} if cursor else {})
+            tools.extend(result.get("tools") or [])
+            cursor = result.get("nextCursor")
+            if not cursor:
+                return tools
+
+    def call_tool(self, name: str, arguments: dict) -> dict:
+        return self.request("tools/call", {"name": name, "arguments": arguments or {}})
+
+    @staticmethod
+    def _message(method, params, request_id=None):
+        message = {"jsonrpc": "2.0", "method": method}
+        if request_id is not None:
+            message["id"] = request_id
+        if params is not None:
+            message["params"] = params
+        return message
+
+    @staticmethod
+    def _result_of(message):
+        if "error" in message:
+            error = message["error"] or {}
+            raise MCPError(error.get("message") or str(error))
+        return message.get("result") or {}
+
+class StdioMCPClient(_MCPClient):
+    """Servidor MCP como proceso hijo; admite varias peticiones en vuelo a la vez."""
+
+    def __init__(self, name: str, command, env: dict = None, cwd: str = None, timeout: float = DEFAULT_TIMEOUT):
+        super().__init__(name, timeout)
+        self.command = shlex.split(command) if isinstance(command, str) else list(command)
+        self.env = env or {}
+        self.cwd = cwd
+        self.process = None
+        self._pending = {}
+        self._write_lock = threading.Lock()
+
+    def start(self):
+        self.process = subprocess.Popen(
+            self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            env={**os.environ, **{k: str(v) for k, v in self.env.items()}}, cwd=self.cwd,
+        )
+        threading.Thread(target=self._read_loop, name=f"mcp-{self.name}", daemon=True).start()
+        self.initialize()
+        return self
+
+    def _send(self, message):
+        data = (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._write_lock:
+            self.process.stdin.write(data)
+            self.process.stdin.flush()
+
+    def _read_loop(self):
+        for line in self.process.stdout:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue  # Salida que no es JSON-RPC (logs del servidor)
+            if "method" in message:
+                # Petición del servidor (ping, roots/list...): no soportada por este cliente
+                if "id" in message:
+                    self._send({"jsonrpc": "2.0", "id": message["id"],
+                                "error": {"code": -32601, "message": "Method not found"}})
+                continue
+            future = self._pending.pop(message.get("id"), None)
+            if future is not None:
+                future.set_result(message)
+        # El proceso terminó: fallar las peticiones pendientes
+        for request_id in list(self._pending):
+            self._pending.pop(request_id).set_exception(MCPError(f"El servidor MCP '{self.name}' terminó"))
+
+    def request(self, method: str, params: dict = None) -> dict:
+        request_id = next(self._ids)
+        future = Future()
+        self._pending[request_id] = future
+        try:
+            self._send(self._message(method, params, request_id))
+            return self._result_of(future.result(timeout=self.timeout))
+        except TimeoutError:
+            raise MCPError(f"Tiempo de espera agotado en '{self.name}' ({method})")
+        except OSError as e:
+            raise MCPError(f"No se pudo comunicar con '{self.name}': {e}")
+        finally:
+            self._pending.pop(request_id, None)
+
+    def notify(self, method: str, params: dict = None):
+        self._send(self._message(method, params))
+
+    def close(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+class HTTPMCPClient(_MCPClient):
+    """Servidor MCP local por HTTP: JSON-RPC por POST con respuesta JSON o SSE."""
+
+    def __init__(self, name: str, url: str, headers: dict = None, timeout: float = DEFAULT_TIMEOUT):
+        super().__init__(name, timeout)
+        self.url = url
+        self.headers = {"Accept": "application/json, text/event-stream", "Content-Type": "application/json",
+                        **(headers or {})}
+        self.session_id = None
+
+    def start(self):
+        self.initialize()
+        return self
+
+    def _post(self, message):
+        from chat_cli.providers.connection import get_session
+        headers = dict(self.headers)
+        if self.session_id:
+            headers["Mcp-Session-Id"] = self.session_id
+        try:
+            response = get_session().post(self.url, json=message, headers=headers, timeout=self.timeout)
+            response.raise_for_status()
+        except Exception as e:
+            raise MCPError(f"No se pudo comunicar con '{self.name}': {e}")
+        self.session_id = response.headers.get("Mcp-Session-Id", self.session_id)
+        return response
+
+    def request(self, method: str, params: dict = None) -> dict:
+        request_id = next(self._ids)
+        response = self._post(self._message(method, params, request_id))
+        if response.headers.get("Content-Type", "").startswith("text/event-stream"):
+            for line in response.text.splitlines():
+                if line.startswith("data:"):
+                    message = json.loads(line[5:])
+                    if message.get("id") == request_id:
+                        return self._result_of(message)
+            raise MCPError(f"'{self.name}' no respondió a {method}")
+        return self._result_of(response.json())
+
+    def notify(self, method: str, params: dict = None):
+        self._post(self._message(method, params))
+
+    def close(self):
+        pass
+
+def _tool_result_content(result: dict):
+    """Convierte el contenido de un resultado MCP a bloques de tool_result de Anthropic."""
+    blocks = []
+    for item in result.get("content") or []:
+        kind = item.get("type")
+        if kind == "text":
+            blocks.append({"type": "text", "text": item.get("text", "")})
+        elif kind == "image":
+            blocks.append({"type": "image", "source": {"type": "base64", "media_type": item.get("mimeType"),
+                                                      "data": item.get("data")}})
+        else:
+            blocks.append({"type": "text", "text": json.dumps(item, ensure_ascii=False)})
+    return blocks or [{"type": "text", "text": ""}]
+
+class MCPManager:
+    """Conjunto de servidores MCP con sus herramientas, ejecución concurrente y caché de resultados."""
+
+    def __init__(self, servers: dict = None, cache_ttl: float = None, cacheable_tools=None, timeout: float = None):
+        self.servers = dict(servers or {})
+        self.cache_ttl = float(cache_ttl if cache_ttl is not None else DEFAULT_CACHE_TTL)
+        self.cacheable_tools = set(cacheable_tools or [])
+        self.timeout = float(timeout or DEFAULT_TIMEOUT)
+        self.clients = {}
+        self.errors = {}   # Servidor -> mensaje de error de conexión
+        self._retry = {}   # Servidor que falló -> (fallos seguidos, instante a partir del cual reintentar)
+        self._tools = {}   # Nombre expuesto al modelo -> (cliente, definición MCP)
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def add_server(self, name: str, conf: dict):
+        with self._lock:
+            self.servers.setdefault(name, conf)
+
+    def _connect_one(self, name, conf):
+        if conf.get("url"):
+            client = HTTPMCPClient(name, conf["url"], conf.get("headers"), self.timeout)
+        else:
+            client = StdioMCPClient(name, conf["command"], conf.get("env"), conf.get("cwd"), self.timeout)
+        client.start()
+        return client, client.list_tools()
+
+    def connect(self, retry_failed: bool = False):
+        """
+        Conecta en paralelo los servidores aún no conectados. Los que fallaron se
+        reintentan tras una espera creciente, o ya mismo con `retry_failed` (/mcp on).
+        Retorna el número de herramientas.
+        """
+        now = time.monotonic()
+        with self._lock:
+            pending = {name: conf for name, conf in self.servers.items() if name not in self.clients
+                       and (retry_failed or self._retry.get(name, (0, now))[1] <= now)}
+        if pending:
+            with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+                futures = {name: executor.submit(self._connect_one, name, conf) for name, conf in pending.items()}
+            for name, future in futures.items():
+                try:
+                    client, tools = future.result()
+                except Exception as e:
+                    with self._lock:
+                        self.errors[name] = str(e)
+                        failures = self._retry.get(name, (0, now))[0] + 1
+                        self._retry[name] = (failures, time.monotonic() + min(RETRY_DELAY * 2 ** (failures - 1),
+                                                                             MAX_RETRY_DELAY))
+                    continue
+                with self._lock:
+                    self.errors.pop(name, None)
+                    self._retry.pop(name, None)
+                    self.clients[name] = client
+                    for tool in tools:
+                        exposed = tool["name"] if tool["name"] not in self._tools else f"{name}__{tool['name']}"
+                        self._tools[exposed] = (client, tool)
+        return len(self._tools)
+
+    def tools(self):
+        return {name: tool for name, (_, tool) in self._tools.items()}
+
+    def anthropic_tools(self):
+        """Definiciones de herramientas en el formato de la API de mensajes de Anthropic."""
+        return [{
+            "name": name,
+            "description": tool.get("description") or "",
+            "input_schema": tool.get("inputSchema") or {"type": "object", "properties": {}},
+        } for name, (_, tool) in self._tools.items()]
+
+    def is_cacheable(self, name: str) -> bool:
+        if name in self.cacheable_tools:
+            return True
+        annotations = (self._tools.get(name, (None, {}))[1].get("annotations") or {})
+        return bool(annotations.get("readOnlyHint") or annotations.get("idempotentHint"))
+
+    def call_tool(self, name: str, arguments: dict, call_id: str = None) -> dict:
+        """
+        Ejecuta una herramienta y retorna un dict con id, name, server, content
+        (bloques para tool_result), is_error, elapsed (segundos) y cached.
+        """
+        start = time.perf_counter()
+        entry = self._tools.get(name)
+        record = {"id": call_id, "name": name, "server": entry[0].name if entry else None, "cached": False}
+        if entry is None:
+            return {**record, "content": [{"type": "text", "text": f"Herramienta desconocida: {name}"}],
+                    "is_error": True, "elapsed": 0.0}
+        client, tool = entry
+        cache_key = None
+        if self.cache_ttl > 0 and self.is_cacheable(name):
+            cache_key = (name, json.dumps(arguments or {}, sort_keys=True, ensure_ascii=False))
+            cached = self._cache.get(cache_key)
+            if cached and time.monotonic() - cached[0] < self.cache_ttl:
+                return {**record, **cached[1], "cached": True, "elapsed": time.perf_counter() - start}
+        try:
+            result = client.call_tool(tool["name"], arguments)
+            outcome = {"content": _tool_result_content(result), "is_error": bool(result.get("isError"))}
+        except MCPError as e:
+            outcome = {"content": [{"type": "text", "text": f"Error de MCP: {e}"}], "is_error": True}
+        if cache_key and not outcome["is_error"]:
+            self._cache[cache_key] = (time.monotonic(), outcome)
+        return {**record, **outcome, "elapsed": time.perf_counter() - start}
+
+    async def acall_tools(self, calls):
+        """Ejecuta concurrentemente los bloques tool_use ({"id", "name", "input"}) de un turno."""
+        return await asyncio.gather(*(
+            asyncio.to_thread(self.call_tool, call["name"], call.get("input") or {}, call.get("id"))
+            for call in calls
+        ))
+
+    def call_tools(self, calls):
+        """Versión síncrona de acall_tools para los proveedores (que corren en un hilo de trabajo)."""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.acall_tools(calls))
+        # Ya hay un event loop en este hilo: no se puede bloquear en él con asyncio.run
+        with ThreadPoolExecutor(max_workers=max(1, len(calls))) as executor:
+            return list(executor.map(
+                lambda call: self.call_tool(call["name"], call.get("input") or {}, call.get("id")), calls))
+
+    def close(self):
+        for client in self.clients.values():
+            client.close()
+        self.clients.clear()
+        self._tools.clear()
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_mcp_manager() -> MCPManager:
+    """Gestor compartido por todo el proceso, configurado desde la sección "mcp" de config.yaml."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = MCPManager(
+                servers=get_setting("mcp", "servers", {}),
+                cache_ttl=get_setting("mcp", "cache_ttl", DEFAULT_CACHE_TTL),
+                cacheable_tools=get_setting("mcp", "cacheable_tools", []),
+                timeout=get_setting("mcp", "timeout", DEFAULT_TIMEOUT),
+            )
+        return _manager
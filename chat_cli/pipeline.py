@@ -0,0 +1,94 @@
+"""
+Cola de prompts por pestaña (pipelining).
+
+Mientras una pestaña responde, los prompts que se envían no se rechazan: quedan
+en su cola, visibles como pendientes, y se despachan en orden en cuanto termina
+el turno en curso. Hasta entonces se pueden editar o cancelar con /queue. Un
+prompt marcado como independiente (empieza por `&`) no espera: se envía en
+paralelo con una copia del contexto actual y su intercambio se añade a la
+conversación después del turno en curso.
+"""
+
+import time
+
+INDEPENDENT_PREFIX = "&"
+WAIT_HISTORY = 20  # Esperas recientes con las que se calcula la media de la barra de estado
+
+def parse_prompt(text: str):
+    """(texto, independiente): el prefijo `&` marca un prompt que no depende de la respuesta en curso."""
+    if text.startswith(INDEPENDENT_PREFIX):
+        return text[len(INDEPENDENT_PREFIX):].strip(), True
+    return text, False
+
+class PendingPrompt:
+    """Prompt en cola. `number` lo identifica en /queue; `entry` es su mensaje pendiente en la transcripción."""
+    __slots__ = ("number", "text", "queued_at", "entry")
+
+    def __init__(self, number: int, text: str):
+        self.number = number
+        self.text = text
+        self.queued_at = time.monotonic()
+        self.entry = None
+
+    def waited(self, now: float = None) -> float:
+        return (now if now is not None else time.monotonic()) - self.queued_at
+
+    def __repr__(self):
+        return f"PendingPrompt({self.number}, {self.text[:40]!r})"
+
+class PromptQueue:
+    def __init__(self):
+        self._items = []
+        self._next_number = 1
+        self.waits = []  # Segundos que esperaron los últimos prompts despachados
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(list(self._items))
+
+    def push(self, text: str) -> PendingPrompt:
+        item = PendingPrompt(self._next_number, text)
+        self._next_number += 1
+        self._items.append(item)
+        return item
+
+    def pop(self):
+        """Siguiente prompt a despachar (el más antiguo), o None si la cola está vacía."""
+        if not self._items:
+            return None
+        item = self._items.pop(0)
+        self.waits.append(item.waited())
+        del self.waits[:-WAIT_HISTORY]
+        return item
+
+    def get(self, number: int):
+        return next((item for item in self._items if item.number == number), None)
+
+    def edit(self, number: int, text: str):
+        """Cambia el texto de un prompt aún no despachado. Retorna el PendingPrompt o None."""
+        item = self.get(number)
+        if item is not None:
+            item.text = text
+        return item
+
+    def cancel(self, number: int):
+        """Quita un prompt de la cola. Retorna el PendingPrompt cancelado o None."""
+        item = self.get(number)
+        if item is not None:
+            self._items.remove(item)
+        return item
+
+    def clear(self):
+        """Cancela todos los prompts pendientes y los retorna."""
+        items, self._items = self._items, []
+        return items
+
+    def oldest_wait(self) -> float:
+        """Segundos que lleva esperando el prompt más antiguo (0 si la cola está vacía)."""
+        return self._items[0].waited() if self._items else 0.0
+
+    def average_wait(self) -> float:
+        """Espera media de los prompts despachados recientemente."""
+        return sum(self.waits) / len(self.waits) if self.waits else 0.0
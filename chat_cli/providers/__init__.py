@@ -1,7 +1,33 @@
-from .openai import *
-from .ollama import *
-from .gemini import *
-from .anthropic import *
+import importlib
+
+# Los SDK de los proveedores (openai, google-generativeai, ollama) tardan cientos de
+# milisegundos en importarse, así que cada proveedor se carga solo cuando se usa.
+_PROVIDERS = {
+    "ollama": ("ollama", "OllamaProvider"),
+    "openai": ("openai", "OpenAIProvider"),
+    "gemini": ("gemini", "GeminiProvider"),
+    "anthropic": ("anthropic", "AnthropicProvider"),
+    "auto": ("auto", "AutoProvider"),  # Enruta cada turno al mejor de los anteriores
+}
+_CLASS_TO_PROVIDER = {class_name: name for name, (_, class_name) in _PROVIDERS.items()}
 
 def get_provider_names():
-    return ["ollama", "openai", "gemini", "anthropic"]
+    return ["ollama", "openai", "gemini", "anthropic", "auto"]
+
+def get_provider_class(provider_name: str):
+    """Importa y retorna la clase del proveedor indicado."""
+    if provider_name not in _PROVIDERS:
+        raise ValueError(f"Proveedor '{provider_name}' no soportado.")
+    module_name, class_name = _PROVIDERS[provider_name]
+    module = importlib.import_module(f".{module_name}", __name__)
+    return getattr(module, class_name)
+
+def create_provider(provider_name: str, model: str = None, **kwargs):
+    """Crea una instancia del proveedor (kwargs extra, p.ej. mcp_enabled, se pasan al constructor)."""
+    return get_provider_class(provider_name)(model=model, **kwargs)
+
+def __getattr__(name):
+    # Compatibilidad con `from chat_cli.providers import OpenAIProvider`
+    if name in _CLASS_TO_PROVIDER:
+        return get_provider_class(_CLASS_TO_PROVIDER[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
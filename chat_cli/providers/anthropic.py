@@ -14,14 +14,19 @@ import json
 import requests
 from typing import Dict, List, Any, Generator, Optional, Union
 from chat_cli.config import get_api_key as config_get_api_key, get_default_model as config_get_default_model
+from chat_cli.providers.connection import get_session
+from chat_cli.conversation import as_api_messages
 
 # Constantes para la API de Anthropic
 ANTHROPIC_API_URL = "https://api.anthropic.com/v1/messages"
+ANTHROPIC_MODELS_URL = "https://api.anthropic.com/v1/models"
 DEFAULT_MODEL = "claude-3-opus-20240229"
 
 # Constantes para Model Context Protocol (M.C.P)
-MCP_ENABLED = False  # Por defecto desactivado hasta configuración completa
-MCP_VERSION = "0.1.0"  # Versión del protocolo implementada
+MCP_ENABLED = False  # Por defecto desactivado; se activa con --mcp o /mcp on
+MAX_TOOL_ROUNDS = 8  # Rondas máximas de herramientas por turno antes de dar la respuesta
+# Parámetros de muestreo (nombres de OpenAI) admitidos en `sampling` y su campo en la API de Anthropic
+SAMPLING_PARAMS = {"temperature": "temperature", "top_p": "top_p", "max_tokens": "max_tokens", "stop": "stop_sequences"}
 
 class AnthropicProvider:
     """
@@ -30,7 +35,8 @@ class AnthropicProvider:
     Permite interactuar con modelos como Claude y utilizar las capacidades
     del Model Context Protocol para acceder a recursos externos y herramientas.
     """
-    
+    SAMPLING_PARAMS = SAMPLING_PARAMS
+
     def __init__(self, api_key: str = None, model: str = None, mcp_enabled: bool = MCP_ENABLED):
         """
         Inicializa el proveedor de Anthropic.
@@ -56,53 +62,133 @@ class AnthropicProvider:
 
         self.model = _resolved_model
         self.history = []
+        self.last_usage = None  # Tokens informados por la API en la última llamada
+        self.last_error = None  # Mensaje del último error (None si la llamada tuvo éxito)
         self.mcp_enabled = mcp_enabled
-        self.mcp_servers = []  # Lista de servidores MCP conectados
+        self.mcp_servers = []  # Servidores MCP añadidos con add_mcp_server (además de los de config.yaml)
+        self.last_tool_calls = []  # Herramientas ejecutadas en el último turno (con su duración)
+        self.sampling = {}  # Parámetros de muestreo de cada petición (ver SAMPLING_PARAMS)
+    
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "x-api-key": self.api_key,
+            "anthropic-version": "2023-06-01",
+            "content-type": "application/json"
+        }
+    
+    def _tool_manager(self):
+        """
+        Gestor MCP con las herramientas disponibles, o None si MCP está desactivado
+        o ningún servidor expone herramientas. Los servidores añadidos con
+        add_mcp_server() se suman a los de la sección "mcp" de config.yaml.
+        """
+        if not self.mcp_enabled:
+            return None
+        from chat_cli.mcp import get_mcp_manager
+        manager = get_mcp_manager()
+        for server in self.mcp_servers:
+            manager.add_server(server["url"], {"url": server["url"]})
+        return manager if manager.connect() else None
+    
+    def _request_data(self, messages: List[Dict[str, Any]], manager, stream: bool = False,
+                      final_round: bool = False) -> Dict[str, Any]:
+        data = {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": 1024
+        }
+        for key, value in self.sampling.items():
+            if key in SAMPLING_PARAMS:
+                data[SAMPLING_PARAMS[key]] = [value] if key == "stop" and isinstance(value, str) else value
+        if stream:
+            data["stream"] = True
+        # Anunciar las herramientas de los servidores MCP conectados
+        if manager:
+            data["tools"] = manager.anthropic_tools()
+            # Última ronda permitida: las herramientas siguen declaradas (el historial tiene
+            # bloques tool_use) pero el modelo debe contestar con texto
+            if final_round:
+                data["tool_choice"] = {"type": "none"}
+        return data
+
+    @staticmethod
+    def _tool_rounds_exhausted():
+        return RuntimeError(f"el modelo siguió pidiendo herramientas tras {MAX_TOOL_ROUNDS} rondas sin dar una respuesta")
+    
+    def _run_tool_calls(self, manager, content: List[Dict[str, Any]], messages: List[Dict[str, Any]]) -> None:
+        """
+        Ejecuta concurrentemente los bloques tool_use de una respuesta y añade a
+        `messages` el turno del asistente y los tool_result correspondientes.
+        """
+        calls = [block for block in content if block.get("type") == "tool_use"]
+        results = manager.call_tools(calls)
+        self.last_tool_calls.extend(results)
+        messages.append({"role": "assistant", "content": content})
+        messages.append({"role": "user", "content": [{
+            "type": "tool_result",
+            "tool_use_id": result["id"],
+            "content": result["content"],
+            "is_error": result["is_error"]
+        } for result in results]})
+    
+    def _add_usage(self, usage: Dict[str, Any]) -> None:
+        """Acumula en `last_usage` los tokens de cada ronda de un turno con herramientas."""
+        if not usage:
+            return
+        total = self.last_usage or {"prompt_tokens": 0, "completion_tokens": 0}
+        self.last_usage = {
+            "prompt_tokens": (total["prompt_tokens"] or 0) + (usage.get("prompt_tokens") or 0),
+            "completion_tokens": (total["completion_tokens"] or 0) + (usage.get("completion_tokens") or 0)
+        }
     
     def send_message(self, prompt: str) -> str:
         """
         Envía un mensaje al modelo de Anthropic y devuelve la respuesta.
         
+        Con MCP activado, ejecuta las herramientas que pida el modelo (varias por
+        turno en paralelo) y reenvía sus resultados hasta obtener la respuesta final.
+        
         Args:
             prompt: Texto del mensaje a enviar.
             
         Returns:
             Respuesta del modelo como texto.
         """
+        self.last_usage = None
+        self.last_error = None
+        self.last_tool_calls = []
         try:
             # Preparar mensajes con historial
             messages = self._prepare_messages(prompt)
+            manager = self._tool_manager()
             
-            # Configurar parámetros de la solicitud
-            data = {
-                "model": self.model,
-                "messages": messages,
-                "max_tokens": 1024
-            }
-            
-            # Añadir configuración MCP si está habilitado
-            if self.mcp_enabled:
-                data["mcp_config"] = self._get_mcp_config()
-            
-            # Realizar la solicitud a la API
-            headers = {
-                "x-api-key": self.api_key,
-                "anthropic-version": "2023-06-01",
-                "content-type": "application/json"
-            }
-            
-            response = requests.post(
-                ANTHROPIC_API_URL,
-                headers=headers,
-                json=data
-            )
-            
-            # Verificar respuesta
-            response.raise_for_status()
-            result = response.json()
+            for round_number in range(MAX_TOOL_ROUNDS + 1):
+                final_round = round_number == MAX_TOOL_ROUNDS
+                response = get_session().post(
+                    ANTHROPIC_API_URL,
+                    headers=self._headers(),
+                    json=self._request_data(messages, manager, final_round=final_round)
+                )
+                
+                # Verificar respuesta
+                response.raise_for_status()
+                result = response.json()
+                
+                usage = result.get("usage") or {}
+                self._add_usage({
+                    "prompt_tokens": usage.get("input_tokens"),
+                    "completion_tokens": usage.get("output_tokens")
+                } if usage else None)
+                
+                blocks = result.get("content") or []
+                if not (manager and result.get("stop_reason") == "tool_use"):
+                    break
+                if final_round:
+                    raise self._tool_rounds_exhausted()
+                self._run_tool_calls(manager, blocks, messages)
             
-            # Extraer contenido de la respuesta
-            content = result.get("content", [{}])[0].get("text", "")
+            # Extraer el texto de la respuesta final
+            content = "".join(block.get("text", "") for block in blocks if block.get("type", "text") == "text")
             
             # Guardar en historial
             self.history.append({"role": "assistant", "content": content})
@@ -110,82 +196,156 @@ class AnthropicProvider:
             return content
             
         except Exception as e:
+            self.last_error = str(e)
             return f"[Anthropic] Error: {e}"
     
     def stream_message(self, prompt: str) -> Generator[str, None, None]:
         """
         Envía un mensaje al modelo de Anthropic y devuelve la respuesta en streaming.
         
+        Con MCP activado, tras cada ronda que termina en tool_use se ejecutan las
+        herramientas y se abre un nuevo stream con sus resultados.
+        
         Args:
             prompt: Texto del mensaje a enviar.
             
         Yields:
             Fragmentos de texto de la respuesta del modelo.
         """
+        self.last_usage = None
+        self.last_error = None
+        self.last_tool_calls = []
         try:
             # Preparar mensajes con historial
             messages = self._prepare_messages(prompt)
+            manager = self._tool_manager()
             
-            # Configurar parámetros de la solicitud
-            data = {
-                "model": self.model,
-                "messages": messages,
-                "max_tokens": 1024,
-                "stream": True
-            }
-            
-            # Añadir configuración MCP si está habilitado
-            if self.mcp_enabled:
-                data["mcp_config"] = self._get_mcp_config()
-            
-            # Realizar la solicitud a la API
-            headers = {
-                "x-api-key": self.api_key,
-                "anthropic-version": "2023-06-01",
-                "content-type": "application/json"
-            }
-            
-            response = requests.post(
-                ANTHROPIC_API_URL,
-                headers=headers,
-                json=data,
-                stream=True
-            )
-            
-            # Verificar respuesta
-            response.raise_for_status()
-            
-            # Procesar respuesta en streaming
             full_response = ""
-            for line in response.iter_lines():
-                if not line:
-                    continue
-                    
-                # Eliminar el prefijo "data: " y decodificar
-                if line.startswith(b"data: "):
-                    line = line[6:]
-                    
-                # Ignorar el mensaje [DONE]
-                if line == b"[DONE]":
+            for round_number in range(MAX_TOOL_ROUNDS + 1):
+                final_round = round_number == MAX_TOOL_ROUNDS
+                total_usage, self.last_usage = self.last_usage, None
+                # `with` devuelve la conexión al pool aunque el consumidor cierre el generador a mitad
+                with get_session().post(
+                    ANTHROPIC_API_URL,
+                    headers=self._headers(),
+                    json=self._request_data(messages, manager, stream=True, final_round=final_round),
+                    stream=True
+                ) as response:
+                    # Verificar respuesta
+                    response.raise_for_status()
+
+                    # Procesar respuesta en streaming
+                    for delta in self._iter_stream_text(response.iter_lines()):
+                        full_response += delta
+                        yield delta
+                round_usage, self.last_usage = self.last_usage, total_usage
+                self._add_usage(round_usage)
+                
+                if not (manager and self._stream_stop_reason == "tool_use"):
                     break
-                    
-                try:
-                    data = json.loads(line)
-                    if "content" in data and data["content"]:
-                        delta = data["content"][0].get("text", "")
-                        if delta:
-                            full_response += delta
-                            yield delta
-                except Exception as e:
-                    yield f"[Error parsing stream: {e}]"
+                if final_round:
+                    raise self._tool_rounds_exhausted()
+                self._run_tool_calls(manager, self._stream_content(), messages)
             
             # Guardar respuesta completa en historial
             if full_response:
                 self.history.append({"role": "assistant", "content": full_response})
                 
         except Exception as e:
+            self.last_error = str(e)
             yield f"[Anthropic] Error en streaming: {e}"
     
+    def _iter_stream_text(self, lines) -> Generator[str, None, None]:
+        """
+        Procesa las líneas SSE de la API de mensajes y produce los fragmentos de texto.
+        
+        Registra en `last_usage` los tokens de entrada (evento message_start) y
+        de salida (evento message_delta). Los bloques de contenido (texto y
+        tool_use, con su entrada JSON parcial) quedan disponibles en
+        `_stream_content()` y el motivo de fin en `_stream_stop_reason`.
+        
+        Args:
+            lines: Iterable de líneas en bytes (p.ej. response.iter_lines()).
+            
+        Yields:
+            Fragmentos de texto de la respuesta.
+        """
+        usage = {}
+        self._stream_blocks = {}
+        self._stream_stop_reason = None
+        for line in lines:
+            if not line or line.startswith(b"event:"):
+                continue
+                
+            # Eliminar el prefijo "data: " y decodificar
+            if line.startswith(b"data: "):
+                line = line[6:]
+                
+            # Ignorar el mensaje [DONE]
+            if line == b"[DONE]":
+                break
+                
+            try:
+                data = json.loads(line)
+            except Exception as e:
+                yield f"[Error parsing stream: {e}]"
+                continue
+            
+            event_type = data.get("type")
+            if event_type == "content_block_start":
+                self._stream_blocks[data.get("index", len(self._stream_blocks))] = dict(data.get("content_block") or {})
+            elif event_type == "content_block_delta":
+                delta = data.get("delta", {})
+                block = self._stream_blocks.setdefault(data.get("index", 0), {"type": "text", "text": ""})
+                if delta.get("type") == "input_json_delta":
+                    block["partial_json"] = block.get("partial_json", "") + delta.get("partial_json", "")
+                    continue
+                text = delta.get("text", "")
+                if text:
+                    block["text"] = block.get("text", "") + text
+                    yield text
+            elif event_type == "message_start":
+                input_tokens = data.get("message", {}).get("usage", {}).get("input_tokens")
+                if input_tokens is not None:
+                    usage["prompt_tokens"] = input_tokens
+            elif event_type == "message_delta":
+                self._stream_stop_reason = data.get("delta", {}).get("stop_reason") or self._stream_stop_reason
+                output_tokens = data.get("usage", {}).get("output_tokens")
+                if output_tokens is not None:
+                    usage["completion_tokens"] = output_tokens
+            elif "content" in data and data["content"]:
+                delta = data["content"][0].get("text", "")
+                if delta:
+                    yield delta
+        if usage:
+            self.last_usage = usage
+    
+    def _stream_content(self) -> List[Dict[str, Any]]:
+        """Bloques de contenido del último stream, con la entrada de cada tool_use ya decodificada."""
+        content = []
+        for _, block in sorted(self._stream_blocks.items()):
+            block = dict(block)
+            if block.get("type") == "tool_use":
+                partial = block.pop("partial_json", "")
+                block["input"] = json.loads(partial) if partial else block.get("input") or {}
+            content.append(block)
+        return content
+    
+    def prewarm(self) -> bool:
+        """
+        Abre la conexión TLS con la API (vía la sesión compartida) y verifica
+        la API key con una petición ligera al listado de modelos.
+        
+        Returns:
+            True si la API respondió correctamente.
+        """
+        headers = {
+            "x-api-key": self.api_key or "",
+            "anthropic-version": "2023-06-01"
+        }
+        response = get_session().get(ANTHROPIC_MODELS_URL, headers=headers, params={"limit": 1}, timeout=10)
+        return response.ok
+    
     def _prepare_messages(self, prompt: str) -> List[Dict[str, str]]:
         """
         Prepara los mensajes para enviar a la API, incluyendo el historial.
@@ -199,9 +359,9 @@ class AnthropicProvider:
         # Añadir mensaje del usuario al historial
         self.history.append({"role": "user", "content": prompt})
         
-        # Convertir historial al formato esperado por la API
+        # Convertir historial al formato esperado por la API (con el resumen, si lo hay)
         messages = []
-        for msg in self.history:
+        for msg in as_api_messages(self.history):
             role = msg["role"]
             # Anthropic usa "assistant" y "user" como roles
             if role not in ["assistant", "user"]:
@@ -214,27 +374,6 @@ class AnthropicProvider:
         
         return messages
     
-    def _get_mcp_config(self) -> Dict[str, Any]:
-        """
-        Obtiene la configuración para Model Context Protocol.
-        
-        Returns:
-            Diccionario con la configuración MCP.
-        """
-        # Configuración básica de MCP
-        config = {
-            "version": MCP_VERSION,
-            "enabled": self.mcp_enabled,
-            "servers": self.mcp_servers,
-            "capabilities": {
-                "tools": True,
-                "resources": True,
-                "prompts": True
-            }
-        }
-        
-        return config
-    
     def set_mcp_enabled(self, enabled: bool) -> None:
         """
         Activa o desactiva el soporte para Model Context Protocol.
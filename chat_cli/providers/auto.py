@@ -0,0 +1,353 @@
+"""
+Proveedor `auto`: elige en cada turno el backend (proveedor:modelo) más adecuado.
+
+Por cada candidato se mantienen medias móviles exponenciales (EWMA) del tiempo
+hasta el primer token (TTFT), del rendimiento en tokens/s y de la tasa de
+errores, guardadas en ~/.cache/chat_cli/routing.json entre ejecuciones. Las
+estadísticas antiguas se refrescan en segundo plano con sondas ligeras (el
+`prewarm()` de cada proveedor). Cada turno se envía al mejor candidato según la
+política configurada y, si falla antes del primer token, al siguiente.
+
+config.yaml:
+
+    auto:
+      candidates: ["ollama:llama3", "openai:gpt-4o-mini", "anthropic"]
+      policy: fastest          # fastest | cheapest | local_first
+      latency_slo: 2.0         # TTFT máximo (s) para cheapest y local_first
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from chat_cli.config import get_cache_dir, get_setting
+from chat_cli.providers import create_provider
+from chat_cli.usage import FREE_PROVIDERS, estimate_tokens, get_model_price
+
+POLICIES = ("fastest", "cheapest", "local_first")
+DEFAULT_CANDIDATES = ["ollama", "openai", "gemini", "anthropic"]
+DEFAULT_POLICY = "fastest"
+LATENCY_SLO = 2.0           # Segundos de TTFT aceptables para cheapest/local_first
+MAX_ERROR_RATE = 0.5        # Candidatos con más errores se consideran degradados
+EWMA_ALPHA = 0.3
+PROBE_INTERVAL = 300.0      # Segundos tras los que las estadísticas se refrescan con una sonda
+UNKNOWN_LATENCY = 3.0       # TTFT supuesto para candidatos sin mediciones
+REFERENCE_TOKENS = 200      # Largo de respuesta con el que se compara el rendimiento
+MAX_ATTEMPTS = 2            # Backends a intentar por turno si el primero falla
+
+def _ewma(previous, sample, alpha):
+    return sample if previous is None else (1 - alpha) * previous + alpha * sample
+
+class RoutingStats:
+    """Estadísticas EWMA por backend ("proveedor:modelo"), persistidas en JSON."""
+
+    def __init__(self, path=None, alpha: float = EWMA_ALPHA):
+        self.path = str(path) if path else str(get_cache_dir() / "routing.json")
+        self.alpha = alpha
+        self.backends = {}
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.backends = json.load(f).get("backends", {})
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    def get(self, key: str) -> dict:
+        return dict(self.backends.get(key) or {})
+
+    def _entry(self, key):
+        return self.backends.setdefault(key, {"ttft": None, "throughput": None, "error_rate": 0.0,
+                                              "probe_latency": None, "samples": 0, "updated": 0.0})
+
+    def record_turn(self, key: str, ok: bool, ttft: float = None, throughput: float = None):
+        with self._lock:
+            entry = self._entry(key)
+            entry["error_rate"] = _ewma(entry["error_rate"] if entry["samples"] else None, 0.0 if ok else 1.0,
+                                        self.alpha)
+            if ok and ttft is not None:
+                entry["ttft"] = _ewma(entry["ttft"], ttft, self.alpha)
+            if ok and throughput:
+                entry["throughput"] = _ewma(entry["throughput"], throughput, self.alpha)
+            entry["samples"] += 1
+            entry["updated"] = time.time()
+
+    def record_probe(self, key: str, ok: bool, latency: float = None):
+        with self._lock:
+            entry = self._entry(key)
+            # Una sonda pesa menos que un turno real, pero permite que un backend degradado se recupere
+            entry["error_rate"] = _ewma(entry["error_rate"], 0.0 if ok else 1.0, self.alpha / 2)
+            if ok and latency is not None:
+                entry["probe_latency"] = _ewma(entry["probe_latency"], latency, self.alpha)
+            entry["updated"] = time.time()
+
+    def save(self):
+        with self._lock:
+            data = json.dumps({"version": 1, "backends": self.backends}, indent=2)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass  # Las estadísticas son una optimización: nunca deben interrumpir el chat
+
+class Route:
+    """Decisión de enrutamiento de un turno."""
+    __slots__ = ("key", "provider_name", "model", "reason")
+
+    def __init__(self, key: str, provider_name: str, model: str, reason: str):
+        self.key = key
+        self.provider_name = provider_name
+        self.model = model
+        self.reason = reason
+
+    def __repr__(self):
+        return f"Route({self.key!r}, {self.reason!r})"
+
+def _describe(stats: dict) -> str:
+    parts = []
+    if stats.get("ttft") is not None:
+        parts.append(f"TTFT {stats['ttft']:.2f} s")
+    elif stats.get("probe_latency") is not None:
+        parts.append(f"sonda {stats['probe_latency']:.2f} s")
+    else:
+        parts.append("sin mediciones")
+    if stats.get("throughput"):
+        parts.append(f"{stats['throughput']:.0f} tok/s")
+    parts.append(f"errores {stats.get('error_rate') or 0:.0%}")
+    return " · ".join(parts)
+
+class AutoProvider:
+    def __init__(self, model: str = None, policy: str = None, candidates=None, stats: RoutingStats = None,
+                 provider_factory=None):
+        # `-p auto -m local_first`: el "modelo" de auto es la política
+        policy = policy or (model if model in POLICIES else None) or get_setting("auto", "policy", DEFAULT_POLICY)
+        if policy not in POLICIES:
+            raise ValueError(f"Política de enrutamiento desconocida: {policy} (usa {', '.join(POLICIES)})")
+        self.policy = policy
+        self.latency_slo = float(get_setting("auto", "latency_slo", LATENCY_SLO))
+        self.max_error_rate = float(get_setting("auto", "max_error_rate", MAX_ERROR_RATE))
+        self.probe_interval = float(get_setting("auto", "probe_interval", PROBE_INTERVAL))
+        self.max_attempts = int(get_setting("auto", "max_attempts", MAX_ATTEMPTS))
+        self.stats = stats or RoutingStats(alpha=float(get_setting("auto", "alpha", EWMA_ALPHA)))
+        self.provider_factory = provider_factory or (lambda name, model: create_provider(name, model=model))
+        self.candidates = []  # [(proveedor, modelo o None)]
+        for entry in candidates or get_setting("auto", "candidates", DEFAULT_CANDIDATES):
+            name, _, candidate_model = str(entry).partition(":")
+            self.candidates.append((name, candidate_model or None))
+        self.history = []
+        self.last_usage = None
+        self.last_error = None
+        self.last_tool_calls = []
+        self.route = None          # Route del último turno
+        self.unavailable = {}      # Clave -> motivo (p.ej. falta la API key)
+        self._backends = {}        # Clave -> instancia del proveedor
+        self._backends_lock = threading.Lock()
+
+    @property
+    def model(self) -> str:
+        return self.route.key if self.route else f"auto ({self.policy})"
+
+    @property
+    def provider_name(self):
+        # Para la contabilidad de uso: el proveedor que respondió el último turno
+        return self.route.provider_name if self.route else "auto"
+
+    # --- Backends ---
+
+    def _key(self, name, model):
+        return f"{name}:{model}" if model else name
+
+    def _backend(self, name, model):
+        """Instancia (creada una vez) del candidato, o None si no se puede inicializar."""
+        with self._backends_lock:
+            key = self._key(name, model)
+            if key in self.unavailable:
+                return None
+            if key not in self._backends:
+                try:
+                    instance = self.provider_factory(name, model)
+                except Exception as e:
+                    self.unavailable[key] = str(e)
+                    return None
+                self._backends[key] = instance
+            return self._backends[key]
+
+    def _resolved_key(self, name, model):
+        """Clave con el modelo por defecto resuelto si el candidato ya fue inicializado."""
+        instance = self._backends.get(self._key(name, model))
+        return self._key(name, model or getattr(instance, "model", None))
+
+    def probe_stale(self, force: bool = False) -> bool:
+        """Sondea en paralelo los candidatos sin datos recientes. Retorna si alguno respondió."""
+        now = time.time()
+
+        def probe(candidate):
+            backend = self._backend(*candidate)
+            if backend is None or not hasattr(backend, "prewarm"):
+                return False
+            key = self._resolved_key(*candidate)
+            if not force and now - self.stats.get(key).get("updated", 0) < self.probe_interval:
+                return True
+            start = time.perf_counter()
+            try:
+                ok = bool(backend.prewarm())
+            except Exception:
+                ok = False
+            self.stats.record_probe(key, ok, time.perf_counter() - start)
+            return ok
+
+        with ThreadPoolExecutor(max_workers=max(1, len(self.candidates))) as executor:
+            results = list(executor.map(probe, self.candidates))
+        self.stats.save()
+        return any(results)
+
+    def prewarm(self) -> bool:
+        # Lo llama el ConnectionWarmer al iniciar y en cada keep-alive: solo sondea lo que caducó
+        return self.probe_stale()
+
+    # --- Enrutamiento ---
+
+    def _expected_latency(self, stats: dict) -> float:
+        """Segundos estimados para una respuesta de REFERENCE_TOKENS, penalizados por la tasa de errores."""
+        ttft = stats.get("ttft")
+        if ttft is None:
+            ttft = stats.get("probe_latency")
+        if ttft is None:
+            ttft = UNKNOWN_LATENCY
+        total = ttft + (REFERENCE_TOKENS / stats["throughput"] if stats.get("throughput") else 0.0)
+        return total / max(1.0 - (stats.get("error_rate") or 0.0), 0.05)
+
+    def _ttft(self, stats: dict) -> float:
+        for field in ("ttft", "probe_latency"):
+            if stats.get(field) is not None:
+                return stats[field]
+        return UNKNOWN_LATENCY
+
+    def rank(self):
+        """Candidatos disponibles de mejor a peor: [(Route, backend)]."""
+        options = []
+        for name, model in self.candidates:
+            backend = self._backend(name, model)
+            if backend is None:
+                continue
+            resolved_model = model or getattr(backend, "model", None)
+            key = self._key(name, resolved_model)
+            options.append((key, name, resolved_model, backend, self.stats.get(key)))
+        if not options:
+            return []
+        healthy = [option for option in options if (option[4].get("error_rate") or 0.0) <= self.max_error_rate]
+        pool = healthy or options
+
+        def by_latency(option):
+            return self._expected_latency(option[4])
+
+        def price(option):
+            entry = get_model_price(option[1], option[2])
+            return float("inf") if entry is None else entry[0] + entry[1]
+
+        within_slo = [option for option in pool if self._ttft(option[4]) <= self.latency_slo]
+        if self.policy == "cheapest" and within_slo:
+            ordered = sorted(within_slo, key=lambda option: (price(option), by_latency(option)))
+            reason = "más barato dentro del SLO"
+        elif self.policy == "local_first" and [o for o in within_slo if o[1] in FREE_PROVIDERS]:
+            local = [option for option in within_slo if option[1] in FREE_PROVIDERS]
+            ordered = sorted(local, key=by_latency)
+            reason = "local dentro del SLO"
+        else:
+            ordered = sorted(pool, key=by_latency)
+            reason = "más rápido" if self.policy == "fastest" else f"más rápido (ninguno cumple {self.policy})"
+        if not healthy:
+            reason += ", todos degradados"
+        # El resto de candidatos queda como respaldo, del más rápido al más lento
+        ordered += sorted((option for option in options if option not in ordered), key=by_latency)
+        routes = []
+        for position, (key, name, resolved_model, backend, stats) in enumerate(ordered):
+            label = reason if position == 0 else "respaldo"
+            routes.append((Route(key, name, resolved_model, f"{label}: {_describe(stats)}"), backend))
+        return routes
+
+    def _prepare(self, backend):
+        backend.history = self.history  # Todos comparten la misma conversación
+        self.last_usage = None
+        self.last_error = None
+        self.last_tool_calls = []
+
+    def _finish(self, route, backend, ok, ttft, elapsed, text):
+        self.last_usage = getattr(backend, "last_usage", None)
+        self.last_tool_calls = getattr(backend, "last_tool_calls", None) or []
+        throughput = None
+        if ok and text:
+            tokens = (self.last_usage or {}).get("completion_tokens") or estimate_tokens(text)
+            generation = elapsed - (ttft or 0.0)
+            throughput = tokens / generation if generation > 0 else None
+        self.stats.record_turn(route.key, ok, ttft, throughput)
+        self.stats.save()
+
+    def _no_backend(self):
+        detail = "; ".join(f"{key}: {reason}" for key, reason in self.unavailable.items())
+        self.last_error = "Ningún candidato disponible" + (f" ({detail})" if detail else "")
+        return f"[Auto] Error: {self.last_error}"
+
+    def send_message(self, prompt):
+        routes = self.rank()[:max(1, self.max_attempts)]
+        if not routes:
+            return self._no_backend()
+        start_len = len(self.history)
+        for attempt, (route, backend) in enumerate(routes):
+            self.route = route
+            self._prepare(backend)
+            start = time.perf_counter()
+            try:
+                response = backend.send_message(prompt)
+                error = getattr(backend, "last_error", None)
+            except Exception as e:
+                response, error = f"[{route.provider_name}] Error: {e}", str(e)
+            elapsed = time.perf_counter() - start
+            # Sin streaming no hay primer token: el TTFT observado es el tiempo total de la respuesta
+            self._finish(route, backend, error is None, elapsed if error is None else None, elapsed,
+                         response if error is None else "")
+            if error is None or attempt == len(routes) - 1:
+                self.last_error = error
+                return response
+            del self.history[start_len:]  # Descartar lo que dejó el intento fallido
+
+    def stream_message(self, prompt):
+        routes = self.rank()[:max(1, self.max_attempts)]
+        if not routes:
+            yield self._no_backend()
+            return
+        start_len = len(self.history)
+        for attempt, (route, backend) in enumerate(routes):
+            self.route = route
+            self._prepare(backend)
+            last = attempt == len(routes) - 1
+            start = time.perf_counter()
+            ttft, parts, error = None, [], None
+            try:
+                for token in backend.stream_message(prompt):
+                    error = getattr(backend, "last_error", None)
+                    if error and not parts and not last:
+                        break  # Falló antes del primer token: probar el siguiente candidato
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    parts.append(token)
+                    yield token
+                error = error or getattr(backend, "last_error", None)
+            except Exception as e:
+                error = str(e)
+                if parts or last:
+                    self._finish(route, backend, False, None, 0.0, "")
+                    raise
+            self._finish(route, backend, error is None, ttft, time.perf_counter() - start,
+                         "".join(parts) if error is None else "")
+            if error is None or parts or last:
+                self.last_error = error
+                return
+            del self.history[start_len:]
+
+    def set_mcp_enabled(self, enabled: bool):
+        for backend in self._backends.values():
+            if hasattr(backend, "set_mcp_enabled"):
+                backend.set_mcp_enabled(enabled)
@@ -0,0 +1,378 @@
+"""
+Grabación y reproducción del tráfico HTTP de los proveedores ("cassettes").
+
+Con `cassette.path` configurado (o CHATCLI_CASSETTE__PATH), cada petición que
+pasa por la sesión compartida de `requests` (Anthropic, Ollama) o por el cliente
+httpx de OpenAI y de la librería `ollama` se guarda en un archivo JSONL: método,
+URL y cuerpo de la petición, estado y cabeceras de la respuesta, y los bytes
+recibidos con el instante (desde el envío) en que llegó cada fragmento.
+
+En modo reproducción las mismas peticiones se responden desde el archivo sin
+red, respetando los tiempos grabados (`speed: 1`), acelerándolos (`speed: 10`)
+o de forma instantánea (`speed: 0`). Así los benchmarks de renderizado e
+historial usan streams reales y repetibles sin API keys ni servidores.
+
+No se guardan las cabeceras de la petición (llevan las API keys).
+"""
+
+import base64
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from chat_cli.config import get_setting
+
+CASSETTE_VERSION = 1
+MODES = ("record", "replay")
+# Cabeceras que describen la codificación en tránsito: `requests` graba los bytes ya decodificados
+TRANSPORT_HEADERS = ("content-encoding", "transfer-encoding", "content-length", "connection")
+
+def _normalize_body(body):
+    """Cuerpo de la petición comparable entre ejecuciones (JSON con claves ordenadas si se puede)."""
+    if body is None or body == b"" or body == "":
+        return None
+    if isinstance(body, bytes):
+        try:
+            body = body.decode("utf-8")
+        except UnicodeDecodeError:
+            return base64.b64encode(body).decode("ascii")
+    try:
+        return json.loads(body)
+    except (TypeError, ValueError):
+        return body
+
+def _request_key(method: str, url: str):
+    # Solo la ruta: una grabación contra localhost:11434 sirve aunque cambie el host configurado
+    return f"{method.upper()} {urlsplit(url).path}"
+
+class Cassette:
+    """
+    Archivo de interacciones grabadas.
+
+    `mode` es "record" o "replay"; por defecto se reproduce si el archivo ya
+    existe y se graba si no. `speed` divide los tiempos grabados (0 = sin esperas).
+    """
+
+    def __init__(self, path, mode: str = None, speed: float = 1.0):
+        self.path = os.fspath(path)
+        self.mode = mode or ("replay" if os.path.exists(self.path) else "record")
+        if self.mode not in MODES:
+            raise ValueError(f"Modo de cassette desconocido: {self.mode!r} (usa {', '.join(MODES)})")
+        self.speed = float(speed or 0)
+        self.interactions = []
+        self._by_key = {}
+        self._cursor = {}
+        self._lock = threading.Lock()
+        if self.replaying:
+            self._load()
+        else:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            with open(self.path, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"version": CASSETTE_VERSION}) + "\n")
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def _load(self):
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # Línea truncada por una grabación interrumpida
+                if "request" not in entry:
+                    continue  # Cabecera del archivo
+                self.interactions.append(entry)
+                key = _request_key(entry["request"]["method"], entry["request"]["url"])
+                self._by_key.setdefault(key, []).append(entry)
+
+    def record(self, method: str, url: str, body, status: int, reason, headers, chunks):
+        """Añade una interacción al archivo. `chunks` es una lista de (segundos desde el envío, bytes)."""
+        entry = {
+            "request": {"method": method.upper(), "url": url, "body": _normalize_body(body)},
+            "status": status,
+            "reason": reason,
+            "headers": dict(headers),
+            "chunks": [[round(offset, 6), base64.b64encode(data).decode("ascii")] for offset, data in chunks],
+        }
+        with self._lock:
+            self.interactions.append(entry)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def match(self, method: str, url: str, body):
+        """
+        Interacción grabada para la petición, o None. Entre las grabadas para el
+        mismo método y ruta se prefiere la siguiente con el mismo cuerpo; si
+        ninguna coincide se usa la siguiente en orden (volviendo al principio al
+        agotarlas, para poder repetir un benchmark).
+        """
+        key = _request_key(method, url)
+        candidates = self._by_key.get(key)
+        if not candidates:
+            return None
+        body = _normalize_body(body)
+        with self._lock:
+            start = self._cursor.get(key, 0)
+            order = [(start + step) % len(candidates) for step in range(len(candidates))]
+            index = next((i for i in order if candidates[i]["request"]["body"] == body), order[0])
+            self._cursor[key] = index + 1
+        return candidates[index]
+
+    def iter_chunks(self, interaction):
+        """Bytes de la respuesta grabada, esperando entre fragmentos según `speed`."""
+        start = time.perf_counter()
+        for offset, data in interaction["chunks"]:
+            if self.speed > 0:
+                delay = start + offset / self.speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            yield base64.b64decode(data)
+
+    def requests_adapter(self, **kwargs):
+        return CassetteAdapter(self, **kwargs)
+
+    def httpx_transport(self):
+        return _httpx_transport_class()(self)
+
+    def __repr__(self):
+        return f"Cassette({self.path!r}, mode={self.mode!r}, interactions={len(self.interactions)})"
+
+# --- requests (Anthropic, Ollama) ---
+
+class _RecordingRaw:
+    """Envuelve la respuesta de urllib3 y anota cada fragmento que lee `requests`."""
+
+    def __init__(self, raw, start: float, on_done):
+        self._raw = raw
+        self._start = start
+        self._on_done = on_done
+        self._chunks = []
+
+    def _add(self, data):
+        if data:
+            self._chunks.append((time.perf_counter() - self._start, data))
+        return data
+
+    def _finish(self):
+        on_done, self._on_done = self._on_done, None
+        if on_done:
+            on_done(self._chunks)
+
+    def stream(self, amt=2 ** 16, decode_content=None):
+        try:
+            for data in self._raw.stream(amt, decode_content=decode_content):
+                yield self._add(data)
+        finally:
+            self._finish()
+
+    def read(self, amt=None, decode_content=None, **kwargs):
+        data = self._add(self._raw.read(amt, decode_content=decode_content, **kwargs))
+        if amt is None or not data:
+            self._finish()
+        return data
+
+    def close(self):
+        self._finish()
+        self._raw.close()
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+class _ReplayRaw:
+    """Sustituto de la respuesta de urllib3 que entrega los fragmentos grabados."""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self.closed = False
+
+    def stream(self, amt=None, decode_content=None):
+        yield from self._chunks
+
+    def read(self, amt=None, decode_content=None, **kwargs):
+        return b"".join(self._chunks)
+
+    def release_conn(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+class CassetteAdapter(HTTPAdapter):
+    """Adaptador de `requests` que graba o reproduce según el cassette."""
+
+    def __init__(self, cassette: Cassette, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette = cassette
+
+    def send(self, request, stream=False, **kwargs):
+        if self.cassette.replaying:
+            interaction = self.cassette.match(request.method, request.url, request.body)
+            if interaction is None:
+                raise requests.ConnectionError(f"Sin grabación para {_request_key(request.method, request.url)} "
+                                               f"en {self.cassette.path}", request=request)
+            response = requests.Response()
+            response.status_code = interaction["status"]
+            response.reason = interaction.get("reason")
+            response.headers = CaseInsensitiveDict(interaction["headers"])
+            response.encoding = get_encoding_from_headers(response.headers)
+            response.raw = _ReplayRaw(self.cassette.iter_chunks(interaction))
+            response.url = request.url
+            response.request = request
+            response.connection = self
+            return response
+        start = time.perf_counter()
+        response = super().send(request, stream=stream, **kwargs)
+        headers = {name: value for name, value in response.headers.items() if name.lower() not in TRANSPORT_HEADERS}
+
+        def on_done(chunks):
+            self.cassette.record(request.method, request.url, request.body, response.status_code,
+                                 response.reason, headers, chunks)
+        response.raw = _RecordingRaw(response.raw, start, on_done)
+        return response
+
+# --- httpx (OpenAI y la librería ollama) ---
+
+_transport_class = None
+
+def _httpx_transport_class():
+    """Define el transporte httpx en el primer uso (httpx solo se importa si hay cassette)."""
+    global _transport_class
+    if _transport_class is not None:
+        return _transport_class
+    import httpx
+
+    class _ReplayStream(httpx.SyncByteStream):
+        def __init__(self, chunks):
+            self._chunks = chunks
+
+        def __iter__(self):
+            yield from self._chunks
+
+    class _RecordingStream(httpx.SyncByteStream):
+        def __init__(self, response, start, on_done):
+            self._response = response
+            self._start = start
+            self._on_done = on_done
+            self._chunks = []
+
+        def __iter__(self):
+            for data in self._response.stream:
+                if data:
+                    self._chunks.append((time.perf_counter() - self._start, data))
+                yield data
+
+        def close(self):
+            self._response.close()
+            on_done, self._on_done = self._on_done, None
+            if on_done:
+                on_done(self._chunks)
+
+    class CassetteTransport(httpx.BaseTransport):
+        """Transporte httpx que graba o reproduce según el cassette."""
+
+        def __init__(self, cassette: Cassette):
+            self.cassette = cassette
+            self._transport = None
+
+        def handle_request(self, request):
+            body = request.read()
+            if self.cassette.replaying:
+                interaction = self.cassette.match(request.method, str(request.url), body)
+                if interaction is None:
+                    raise httpx.ConnectError(f"Sin grabación para {_request_key(request.method, str(request.url))} "
+                                             f"en {self.cassette.path}", request=request)
+                return httpx.Response(interaction["status"], headers=interaction["headers"],
+                                      stream=_ReplayStream(self.cassette.iter_chunks(interaction)), request=request)
+            if self._transport is None:
+                self._transport = httpx.HTTPTransport()
+            start = time.perf_counter()
+            response = self._transport.handle_request(request)
+            # httpx graba los bytes tal como llegan: se conservan las cabeceras de codificación
+
+            def on_done(chunks):
+                self.cassette.record(request.method, str(request.url), body, response.status_code,
+                                     response.reason_phrase, response.headers, chunks)
+            return httpx.Response(response.status_code, headers=response.headers.raw,
+                                  stream=_RecordingStream(response, start, on_done), request=request,
+                                  extensions=response.extensions)
+
+        def close(self):
+            if self._transport is not None:
+                self._transport.close()
+
+    _transport_class = CassetteTransport
+    return _transport_class
+
+# --- Cassette activo ---
+
+_active = None
+_resolved = False
+_active_lock = threading.Lock()
+
+def get_cassette():
+    """Cassette configurado en `cassette.path` (se abre una vez por proceso), o None."""
+    global _active, _resolved
+    if not _resolved:
+        with _active_lock:
+            if not _resolved:
+                path = get_setting("cassette", "path")
+                if path:
+                    _active = Cassette(os.path.expanduser(str(path)), mode=get_setting("cassette", "mode"),
+                                       speed=get_setting("cassette", "speed", 1.0))
+                _resolved = True
+    return _active
+
+def _reset_clients():
+    # Sesión y clientes compartidos se crearon con (o sin) el cassette anterior
+    import sys
+    from chat_cli.providers import connection
+    with connection._session_lock:
+        connection._session = None
+    for name in ("chat_cli.providers.openai", "chat_cli.providers.ollama"):
+        module = sys.modules.get(name)
+        if module is not None:
+            with module._clients_lock:
+                module._clients.clear()
+
+def set_cassette(cassette):
+    """
+    Activa `cassette` para los clientes HTTP que se creen a partir de ahora. Con
+    None se vuelve a lo que indique config.yaml.
+    """
+    global _active, _resolved
+    with _active_lock:
+        _active, _resolved = cassette, cassette is not None
+    _reset_clients()
+    return cassette
+
+class use_cassette:
+    """
+    Context manager para tests y benchmarks:
+
+        with use_cassette("anthropic.jsonl", speed=0):
+            provider = create_provider("anthropic")
+            text = "".join(provider.stream_message("hola"))
+    """
+
+    def __init__(self, path, mode: str = None, speed: float = 1.0):
+        self.cassette = Cassette(path, mode=mode, speed=speed)
+        self._previous = None
+
+    def __enter__(self):
+        self._previous = (_active, _resolved)
+        return set_cassette(self.cassette)
+
+    def __exit__(self, *exc_info):
+        global _resolved
+        previous, resolved = self._previous
+        set_cassette(previous)
+        _resolved = resolved
+        return False
@@ -0,0 +1,98 @@
+"""
+Gestión de conexiones compartidas para los proveedores.
+
+Centraliza una única sesión HTTP con pool de conexiones (reutilizada por
+Anthropic y Ollama, grabada o reproducida si hay un cassette activo) y el precalentamiento de conexiones: en cuanto se crea un
+proveedor, un hilo en segundo plano abre y verifica la conexión con su API
+(DNS, TCP y TLS) y la mantiene viva con una sonda barata mientras está ociosa.
+"""
+
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from chat_cli.config import get_setting
+from chat_cli.providers.cassette import get_cassette
+
+DEFAULT_KEEPALIVE_INTERVAL = 30.0  # segundos entre sondas de keep-alive
+POOL_MAXSIZE = 16
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session() -> requests.Session:
+    """Retorna la sesión HTTP compartida (se crea en el primer uso)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                # El gateway (`chat-cli serve`) puede necesitar más conexiones simultáneas por host
+                pool_maxsize = int(get_setting("connection", "pool_maxsize", POOL_MAXSIZE))
+                cassette = get_cassette()
+                if cassette is not None:
+                    adapter = cassette.requests_adapter(pool_connections=8, pool_maxsize=pool_maxsize)
+                else:
+                    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_maxsize)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+class ConnectionWarmer:
+    """
+    Hilo daemon que llama a `provider.prewarm()` al iniciar y luego cada
+    `interval` segundos para que la conexión no se cierre por inactividad.
+    """
+
+    def __init__(self, provider, interval: float = DEFAULT_KEEPALIVE_INTERVAL):
+        self.provider = provider
+        self.interval = interval
+        self.ready = threading.Event()
+        self.ok = None  # Resultado de la última sonda (None = aún no ejecutada)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="chat-cli-prewarm", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def wait(self, timeout: float = None) -> bool:
+        """Espera a que termine la primera sonda. Retorna si la conexión quedó verificada."""
+        self.ready.wait(timeout)
+        return bool(self.ok)
+
+    def _probe(self):
+        try:
+            self.ok = bool(self.provider.prewarm())
+        except Exception:
+            self.ok = False
+
+    def _run(self):
+        self._probe()
+        self.ready.set()
+        if not self.interval or self.interval <= 0:
+            return
+        while not self._stop.wait(self.interval):
+            self._probe()
+
+def start_prewarm(provider):
+    """
+    Inicia el precalentamiento en segundo plano si el proveedor lo soporta
+    y no está desactivado en config.yaml (connection.prewarm: false).
+    Retorna el ConnectionWarmer o None.
+    """
+    if not hasattr(provider, "prewarm") or not get_setting("connection", "prewarm", True):
+        return None
+    interval = float(get_setting("connection", "keepalive_interval", DEFAULT_KEEPALIVE_INTERVAL))
+    warmer = ConnectionWarmer(provider, interval=interval).start()
+    provider.connection_warmer = warmer
+    return warmer
+
+def stop_prewarm(provider):
+    """Detiene el keep-alive de un proveedor que deja de usarse (pestaña cerrada, reemplazado, salida)."""
+    warmer = getattr(provider, "connection_warmer", None)
+    if warmer is not None:
+        warmer.stop()
@@ -1,12 +1,40 @@
-# Integración inicial para Gemini
-# NOTA: Sustituir la lógica de ejemplo por la integración real con la API de Gemini de Google
+# Integración con la API de Gemini de Google (google-generativeai)
 import os
+import threading
 import google.generativeai as genai
 from google.api_core import exceptions as google_exceptions
 from google.auth import exceptions as auth_exceptions # Import for specific auth errors
-from chat_cli.config import get_api_key as config_get_api_key, get_default_model as config_get_default_model
+from google.generativeai.types import generation_types
+from chat_cli.config import get_api_key as config_get_api_key, get_default_model as config_get_default_model, get_provider_config
+
+DEFAULT_GEMINI_MODEL = "gemini-pro"
+DEFAULT_MAX_HISTORY = 20  # Mensajes previos (10 turnos) que se envían en cada llamada
+# Parámetros de muestreo (nombres de OpenAI) admitidos en `sampling` y su campo en generation_config
+SAMPLING_PARAMS = {"temperature": "temperature", "top_p": "top_p", "max_tokens": "max_output_tokens",
+                   "stop": "stop_sequences"}
+
+# Clientes compartidos por (API key, modelo): genai.configure y GenerativeModel solo se
+# ejecutan la primera vez, no en cada instancia (p.ej. las del daemon o del gateway).
+_clients = {}
+_clients_lock = threading.Lock()
+_configured_key = None
+
+def _get_client(api_key, model):
+    global _configured_key
+    with _clients_lock:
+        client = _clients.get((api_key, model))
+        if client is None:
+            # genai.configure es global al proceso: solo repetirlo si cambia la clave
+            if _configured_key != api_key:
+                genai.configure(api_key=api_key)
+                _configured_key = api_key
+            client = genai.GenerativeModel(model)
+            _clients[(api_key, model)] = client
+        return client
 
 class GeminiProvider:
+    SAMPLING_PARAMS = SAMPLING_PARAMS
+
     def __init__(self, api_key: str = None, model: str = None):
         _resolved_api_key = api_key
         if not _resolved_api_key:
@@ -15,43 +43,171 @@ class GeminiProvider:
             _resolved_api_key = os.getenv('GEMINI_API_KEY')
 
         self.api_key = _resolved_api_key
-
-        _resolved_model = model
-        if not _resolved_model:
-            _resolved_model = config_get_default_model('gemini')
-        if not _resolved_model and "GEMINI_DEFAULT_MODEL" in os.environ: # Check env for default model
-            _resolved_model = os.environ["GEMINI_DEFAULT_MODEL"]
-        if not _resolved_model: # Fallback to a common default if still not found
-            _resolved_model = "gemini-pro"
-        
-        self.model = _resolved_model
+        self.model = self.resolve_model(model)
+        self.history = []
+        self.last_usage = None # Tokens informados por la API (usage_metadata) en la última llamada
+        self.last_error = None  # Mensaje del último error (None si la llamada tuvo éxito)
+        self.max_history = int(get_provider_config('gemini').get("max_history", DEFAULT_MAX_HISTORY))
+        self.sampling = {}  # Parámetros de muestreo de cada petición (ver SAMPLING_PARAMS)
 
         if not self.api_key:
             raise ValueError("Gemini API key is missing. Please set it in the config, as an environment variable (GEMINI_API_KEY), or pass it directly.")
 
         try:
-            genai.configure(api_key=self.api_key)
-            self.client = genai.GenerativeModel(self.model)
+            self.client = _get_client(self.api_key, self.model)
         except auth_exceptions.DefaultCredentialsError as e:
             raise ValueError(f"Gemini API key is invalid or not configured properly: {e}")
         except Exception as e: # Catch other potential configuration errors
             raise ValueError(f"Failed to initialize Gemini client (model: {self.model}): {e}")
 
+    @staticmethod
+    def resolve_model(model: str = None) -> str:
+        """Modelo a usar: el indicado, el de config.yaml, GEMINI_DEFAULT_MODEL o el predeterminado."""
+        _resolved_model = model
+        if not _resolved_model:
+            _resolved_model = config_get_default_model('gemini')
+        if not _resolved_model and "GEMINI_DEFAULT_MODEL" in os.environ: # Check env for default model
+            _resolved_model = os.environ["GEMINI_DEFAULT_MODEL"]
+        if not _resolved_model: # Fallback to a common default if still not found
+            _resolved_model = DEFAULT_GEMINI_MODEL
+        return _resolved_model
+
+    def prewarm(self):
+        # Abre el canal con la API y verifica clave/modelo con una consulta de metadatos
+        name = self.model if self.model.startswith("models/") else f"models/{self.model}"
+        genai.get_model(name)
+        return True
+
+    @staticmethod
+    def _usage_from(response):
+        metadata = getattr(response, "usage_metadata", None)
+        if not metadata or not getattr(metadata, "total_token_count", 0):
+            return None
+        return {
+            "prompt_tokens": metadata.prompt_token_count,
+            "completion_tokens": metadata.candidates_token_count,
+        }
+
+    @staticmethod
+    def _candidate(response):
+        candidates = getattr(response, "candidates", None)
+        return candidates[0] if candidates else None
+
+    @classmethod
+    def _text_of(cls, response) -> str:
+        """
+        Texto de una respuesta o fragmento leyendo sus partes directamente: `.text`
+        lanza ValueError cuando un fragmento no trae texto (p.ej. una parte
+        bloqueada por los filtros de seguridad) y cortaría el streaming.
+        """
+        content = getattr(cls._candidate(response), "content", None)
+        return "".join(getattr(part, "text", "") or "" for part in (getattr(content, "parts", None) or []))
+
+    @staticmethod
+    def _finish_reason(candidate):
+        reason = getattr(candidate, "finish_reason", None)
+        return getattr(reason, "name", None) or "sin contenido"
+
+    def _chat_session(self):
+        """Sesión de chat con los últimos `max_history` mensajes del historial."""
+        recent = self.history[-self.max_history:] if self.max_history > 0 else []
+        # La conversación enviada a Gemini debe empezar con un mensaje del usuario
+        while recent and recent[0]["role"] != "user":
+            recent = recent[1:]
+        return self.client.start_chat(history=[
+            {"role": "model" if msg["role"] == "assistant" else "user", "parts": [msg["content"]]}
+            for msg in recent if msg.get("content")
+        ])
+
+    def _generation_options(self):
+        """kwargs de send_message con los parámetros de muestreo (vacío si no hay ninguno)."""
+        config = {}
+        for key, value in self.sampling.items():
+            if key in SAMPLING_PARAMS:
+                config[SAMPLING_PARAMS[key]] = [value] if key == "stop" and isinstance(value, str) else value
+        return {"generation_config": config} if config else {}
+
+    def _remember(self, prompt, text):
+        self.history.append({"role": "user", "content": prompt})
+        self.history.append({"role": "assistant", "content": text})
+
+    def _blocked(self, reason):
+        self.last_error = f"respuesta bloqueada ({reason})"
+        return f"[Gemini Error]: La respuesta fue bloqueada por los filtros de seguridad ({reason})."
+
     def send_message(self, prompt):
+        self.last_usage = None
+        self.last_error = None
         try:
-            response = self.client.generate_content(prompt)
-            return response.text
+            response = self._chat_session().send_message(prompt, **self._generation_options())
+            self.last_usage = self._usage_from(response)
+            text = self._text_of(response)
+            if not text:
+                return self._blocked(self._finish_reason(self._candidate(response)))
+            self._remember(prompt, text)
+            return text
+        except generation_types.BlockedPromptException as e:
+            return self._blocked(e)
+        except generation_types.StopCandidateException as e:
+            return self._blocked(self._finish_reason(e.args[0] if e.args else None))
         except google_exceptions.GoogleAPIError as e:
+            self.last_error = str(e)
             return f"[Gemini API Error]: {e}"
         except Exception as e: # Catch other unexpected errors
+            self.last_error = str(e)
             return f"[Gemini Error]: An unexpected error occurred: {e}"
 
     def stream_message(self, prompt):
+        self.last_usage = None
+        self.last_error = None
+        parts = []
         try:
-            response = self.client.generate_content(prompt, stream=True)
+            response = self._chat_session().send_message(prompt, stream=True, **self._generation_options())
+            chunk = None
             for chunk in response:
-                yield chunk.text
+                # usage_metadata llega acumulado; el último fragmento trae el total
+                self.last_usage = self._usage_from(chunk) or self.last_usage
+                text = self._text_of(chunk)
+                if text:
+                    parts.append(text)
+                    yield text
+            if not parts:
+                yield self._blocked(self._finish_reason(self._candidate(chunk)))
+                return
+            self._remember(prompt, "".join(parts))
+        except generation_types.BlockedPromptException as e:
+            yield self._blocked(e)
+        except google_exceptions.GoogleAPIError as e:
+            self.last_error = str(e)
+            yield f"[Gemini API Error]: {e}"
+        except Exception as e: # Catch other unexpected errors
+            self.last_error = str(e)
+            yield f"[Gemini Error]: An unexpected error occurred during streaming: {e}"
+
+    async def astream_message(self, prompt):
+        """Versión asíncrona nativa de stream_message (generate_content_async), sin hilos auxiliares."""
+        self.last_usage = None
+        self.last_error = None
+        parts = []
+        try:
+            response = await self._chat_session().send_message_async(prompt, stream=True,
+                                                                     **self._generation_options())
+            chunk = None
+            async for chunk in response:
+                self.last_usage = self._usage_from(chunk) or self.last_usage
+                text = self._text_of(chunk)
+                if text:
+                    parts.append(text)
+                    yield text
+            if not parts:
+                yield self._blocked(self._finish_reason(self._candidate(chunk)))
+                return
+            self._remember(prompt, "".join(parts))
+        except generation_types.BlockedPromptException as e:
+            yield self._blocked(e)
         except google_exceptions.GoogleAPIError as e:
+            self.last_error = str(e)
             yield f"[Gemini API Error]: {e}"
         except Exception as e: # Catch other unexpected errors
+            self.last_error = str(e)
             yield f"[Gemini Error]: An unexpected error occurred during streaming: {e}"
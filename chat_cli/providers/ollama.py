@@ -1,15 +1,74 @@
-try:
-    import ollama
-except ImportError:
-    ollama = None
 import requests
 import json
+import os
 import subprocess
-from chat_cli.config import get_default_model as config_get_default_model
+import threading
+from chat_cli.config import get_default_model as config_get_default_model, get_provider_config
+from chat_cli.providers.cassette import get_cassette
+from chat_cli.providers.connection import get_session
+from chat_cli.conversation import as_api_messages
 
 DEFAULT_OLLAMA_MODEL = "llama2"
+DEFAULT_OLLAMA_HOST = "http://localhost:11434"
+DEFAULT_KEEP_ALIVE = "30m"
+# Claves de config.yaml (providers.ollama) que se envían tal cual dentro de "options"
+OLLAMA_OPTION_KEYS = ("num_ctx", "num_thread", "num_gpu")
+# Parámetros de muestreo (nombres de OpenAI) admitidos en `sampling` y su opción de Ollama
+SAMPLING_PARAMS = {"temperature": "temperature", "top_p": "top_p", "max_tokens": "num_predict", "stop": "stop",
+                   "seed": "seed", "presence_penalty": "presence_penalty", "frequency_penalty": "frequency_penalty"}
+
+_ollama_lib = None
+# Clientes de la librería ollama compartidos por host (y por tanto su pool de conexiones)
+_clients = {}
+_clients_lock = threading.Lock()
+
+def _load_ollama():
+    """
+    Importa la librería opcional `ollama` bajo demanda (su import tarda ~0.4 s y el
+    streaming no la necesita). Retorna el módulo o None si no está instalada.
+    """
+    global _ollama_lib
+    if _ollama_lib is None:
+        try:
+            import ollama
+            _ollama_lib = ollama
+        except ImportError:
+            _ollama_lib = False
+    return _ollama_lib or None
+
+def _get_client(ollama, host):
+    with _clients_lock:
+        client = _clients.get(host)
+        if client is None:
+            cassette = get_cassette()
+            if cassette is not None:
+                client = ollama.Client(host=host, transport=cassette.httpx_transport())
+            else:
+                client = ollama.Client(host=host)
+            _clients[host] = client
+        return client
+
+def _resolve_host(provider_conf):
+    host = (provider_conf.get("host") or os.getenv("OLLAMA_HOST") or DEFAULT_OLLAMA_HOST).rstrip("/")
+    return host if host.startswith("http") else f"http://{host}"
+
+def embed(texts, model: str):
+    """
+    Embeddings de `texts` con un modelo local de Ollama (/api/embed), en una sola
+    petición. Retorna una lista de vectores (listas de floats) en el mismo orden.
+    """
+    provider_conf = get_provider_config('ollama')
+    payload = {"model": model, "input": list(texts)}
+    keep_alive = provider_conf.get("keep_alive", DEFAULT_KEEP_ALIVE)
+    if keep_alive is not None:
+        payload["keep_alive"] = keep_alive
+    resp = get_session().post(f"{_resolve_host(provider_conf)}/api/embed", json=payload, timeout=120)
+    resp.raise_for_status()
+    return resp.json()["embeddings"]
 
 class OllamaProvider:
+    SAMPLING_PARAMS = SAMPLING_PARAMS
+
     def __init__(self, model: str = None):
         _resolved_model = model
         if not _resolved_model:
@@ -19,27 +78,85 @@ class OllamaProvider:
         
         self.model = _resolved_model
         self.history = []
+        self.last_usage = None  # Tokens informados por Ollama (prompt_eval_count/eval_count)
+        self.last_error = None  # Mensaje del último error (None si la llamada tuvo éxito)
+        self.response_schema = None  # JSON Schema para salida estructurada (campo `format`)
+        self.sampling = {}  # Parámetros de muestreo de cada petición (ver SAMPLING_PARAMS)
+
+        # Controles de rendimiento específicos de Ollama (config.yaml -> providers.ollama)
+        provider_conf = get_provider_config('ollama')
+        self.base_url = _resolve_host(provider_conf)
+        self.keep_alive = provider_conf.get("keep_alive", DEFAULT_KEEP_ALIVE)
+        self.options = dict(provider_conf.get("options") or {})
+        for key in OLLAMA_OPTION_KEYS:
+            if provider_conf.get(key) is not None:
+                self.options[key] = provider_conf[key]
+        self._client = None  # Cliente de la librería ollama, creado en el primer uso
+
+    def _request_options(self):
+        """options configuradas más los parámetros de muestreo de la petición."""
+        options = dict(self.options)
+        for key, value in self.sampling.items():
+            if key in SAMPLING_PARAMS:
+                options[SAMPLING_PARAMS[key]] = value
+        return options
+
+    def _build_payload(self, **extra):
+        """Construye el cuerpo de /api/chat con keep_alive y options configurados."""
+        payload = {"model": self.model, "messages": as_api_messages(self.history)}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        options = self._request_options()
+        if options:
+            payload["options"] = options
+        if self.response_schema:
+            payload["format"] = self.response_schema
+        payload.update(extra)
+        return payload
+
+    @staticmethod
+    def _usage_from(data):
+        """Extrae prompt_eval_count/eval_count de una respuesta (dict o ChatResponse)."""
+        prompt_tokens = data.get("prompt_eval_count")
+        completion_tokens = data.get("eval_count")
+        if prompt_tokens is None and completion_tokens is None:
+            return None
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens}
 
     def send_message(self, prompt):
+        self.last_usage = None
+        self.last_error = None
         # Añadir el mensaje del usuario al historial
         self.history.append({"role": "user", "content": prompt})
         # Si la librería está instalada, usarla
+        ollama = _load_ollama()
         if ollama:
             try:
-                response = ollama.chat(model=self.model, messages=self.history)
+                if self._client is None:
+                    self._client = _get_client(ollama, self.base_url)
+                response = self._client.chat(
+                    model=self.model,
+                    messages=as_api_messages(self.history),
+                    options=self._request_options() or None,
+                    keep_alive=self.keep_alive,
+                    format=self.response_schema,
+                )
                 content = response['message']['content']
+                self.last_usage = self._usage_from(response)
                 # Añadir respuesta al historial
                 self.history.append({"role": "assistant", "content": content})
                 return content
             except Exception as e:
+                self.last_error = str(e)
                 return f"[Ollama] Error: {e}"
         # Si no, intentar vía HTTP local
         try:
-            url = "http://localhost:11434/api/chat"
-            payload = {"model": self.model, "messages": self.history}
-            resp = requests.post(url, json=payload)
+            url = f"{self.base_url}/api/chat"
+            payload = self._build_payload()
+            resp = get_session().post(url, json=payload)
             resp.raise_for_status()
             data = resp.json()
+            self.last_usage = self._usage_from(data)
             # Extraer contenido de la respuesta
             if 'message' in data and isinstance(data['message'], dict):
                 content = data['message'].get('content')
@@ -57,61 +174,118 @@ class OllamaProvider:
             self.history.append({"role": "assistant", "content": content})
             return content
         except Exception as e:
+            self.last_error = str(e)
             return f"[Ollama] Error HTTP: {e}"
 
     def stream_message(self, prompt):
+        self.last_usage = None
+        self.last_error = None
         # Añadir el mensaje del usuario al historial
         self.history.append({"role": "user", "content": prompt})
-        url = "http://localhost:11434/api/chat"
-        payload = {"model": self.model, "messages": self.history, "stream": True}
+        url = f"{self.base_url}/api/chat"
+        payload = self._build_payload(stream=True)
         full_response = ""
         try:
-            with requests.post(url, json=payload, stream=True) as resp:
+            with get_session().post(url, json=payload, stream=True) as resp:
                 resp.raise_for_status()
-                for raw in resp.iter_lines(decode_unicode=False):
-                    if not raw:
-                        continue
-                    # raw es bytes, decodificar manualmente
-                    line_str = raw.decode("utf-8", errors="ignore").strip()
-                    # Manejar prefijo SSE 'data:'
-                    if line_str.startswith("data:"):
-                        line_str = line_str[len("data:"):].strip()
-                    if not line_str:
-                        continue
-                    try:
-                        data = json.loads(line_str)
-                    except json.JSONDecodeError:
-                        continue
-                    # Extraer contenido
-                    content = None
-                    choices = data.get("choices")
-                    if choices and isinstance(choices, list):
-                        choice = choices[0]
-                        delta = choice.get("delta")
-                        if isinstance(delta, dict) and "content" in delta:
-                            content = delta["content"]
-                        elif "message" in choice and "content" in choice["message"]:
-                            content = choice["message"]["content"]
-                    else:
-                        content = data.get("content") or data.get("message", {}).get("content")
-                    if content:
-                        full_response += content
-                        yield content
+                for content in self._iter_stream_text(resp.iter_lines(decode_unicode=False)):
+                    full_response += content
+                    yield content
             # Añadir respuesta al historial si existe
             if full_response:
                 self.history.append({"role": "assistant", "content": full_response})
         except Exception as e:
+            self.last_error = str(e)
             yield f"[Ollama] Error HTTP streaming: {e}"
 
+    def _iter_stream_text(self, lines):
+        """
+        Procesa las líneas NDJSON (o SSE compatible con OpenAI) del streaming y
+        produce los fragmentos de texto. El último objeto (done: true) trae los
+        contadores de tokens, que se guardan en `last_usage`.
+        """
+        for raw in lines:
+            if not raw:
+                continue
+            # raw es bytes, decodificar manualmente
+            line_str = raw.decode("utf-8", errors="ignore").strip()
+            # Manejar prefijo SSE 'data:'
+            if line_str.startswith("data:"):
+                line_str = line_str[len("data:"):].strip()
+            if not line_str:
+                continue
+            try:
+                data = json.loads(line_str)
+            except json.JSONDecodeError:
+                continue
+            if data.get("done"):
+                self.last_usage = self._usage_from(data) or self.last_usage
+            # Extraer contenido
+            content = None
+            choices = data.get("choices")
+            if choices and isinstance(choices, list):
+                choice = choices[0]
+                delta = choice.get("delta")
+                if isinstance(delta, dict) and "content" in delta:
+                    content = delta["content"]
+                elif "message" in choice and "content" in choice["message"]:
+                    content = choice["message"]["content"]
+            else:
+                content = data.get("content") or data.get("message", {}).get("content")
+            if content:
+                yield content
+
+    def warm_up(self, timeout: float = 120.0):
+        """
+        Carga el modelo en memoria sin generar texto (petición /api/generate sin prompt).
+        Pensado para ejecutarse en segundo plano; nunca lanza excepciones.
+        Retorna True si Ollama confirmó la carga.
+        """
+        payload = {"model": self.model}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        if self.options:
+            payload["options"] = self.options
+        try:
+            resp = get_session().post(f"{self.base_url}/api/generate", json=payload, timeout=timeout)
+            resp.raise_for_status()
+            return bool(resp.json().get("done", True))
+        except Exception:
+            return False
+
+    def prewarm(self):
+        """Abre la conexión con el servidor Ollama con una sonda barata (/api/version)."""
+        resp = get_session().get(f"{self.base_url}/api/version", timeout=5)
+        return resp.ok
+
+    def list_running_models(self):
+        """
+        Lista los modelos residentes en memoria (equivalente a `ollama ps`).
+        Retorna una lista de dicts con name, size, size_vram y expires_at.
+        """
+        resp = get_session().get(f"{self.base_url}/api/ps", timeout=5)
+        resp.raise_for_status()
+        models = []
+        for entry in resp.json().get("models", []):
+            models.append({
+                "name": entry.get("name") or entry.get("model"),
+                "size": entry.get("size", 0),
+                "size_vram": entry.get("size_vram", 0),
+                "expires_at": entry.get("expires_at"),
+            })
+        return models
+
     @staticmethod
-    def list_local_models():
-        """Lists locally available Ollama models."""
+    def list_local_models(verbose: bool = True):
+        """Lists locally available Ollama models (verbose=False silences the error messages)."""
+        log = print if verbose else (lambda *args: None)
+        ollama = _load_ollama()
         if ollama:
             try:
                 models = ollama.list()
                 return [model['name'] for model in models.get('models', [])]
             except Exception as e:
-                print(f"[Ollama] Error using ollama library to list models: {e}. Falling back to CLI.")
+                log(f"[Ollama] Error using ollama library to list models: {e}. Falling back to CLI.")
         
         # Fallback to CLI if library not available or fails
         try:
@@ -125,11 +299,11 @@ class OllamaProvider:
                         model_names.append(parts[0])
             return model_names
         except FileNotFoundError:
-            print("[Ollama] Error: 'ollama' command not found. Make sure Ollama is installed and in your PATH.")
+            log("[Ollama] Error: 'ollama' command not found. Make sure Ollama is installed and in your PATH.")
             return []
         except subprocess.CalledProcessError as e:
-            print(f"[Ollama] Error executing 'ollama list': {e.stderr}")
+            log(f"[Ollama] Error executing 'ollama list': {e.stderr}")
             return []
         except Exception as e:
-            print(f"[Ollama] An unexpected error occurred while listing models: {e}")
+            log(f"[Ollama] An unexpected error occurred while listing models: {e}")
             return []
@@ -1,8 +1,37 @@
 import openai
 import os
+import re
+import threading
 from chat_cli.config import get_api_key as config_get_api_key, get_default_model as config_get_default_model
+from chat_cli.conversation import as_api_messages
+from chat_cli.providers.cassette import get_cassette
+
+# Sampling parameters accepted in `sampling` (OpenAI names, passed through unchanged)
+SAMPLING_PARAMS = ("temperature", "top_p", "max_tokens", "stop", "seed", "presence_penalty", "frequency_penalty")
+
+# Clientes compartidos por API key: todas las instancias reutilizan el mismo pool
+# de conexiones, de modo que la conexión precalentada es la que usa la sesión.
+_clients = {}
+_clients_lock = threading.Lock()
+
+def _get_client(api_key=None):
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            kwargs = {"api_key": api_key} if api_key else {}
+            cassette = get_cassette()
+            if cassette is not None:
+                import httpx
+                kwargs["http_client"] = httpx.Client(transport=cassette.httpx_transport())
+                if cassette.replaying and not api_key and not os.getenv("OPENAI_API_KEY"):
+                    kwargs["api_key"] = "cassette"  # La reproducción no necesita credenciales
+            client = openai.OpenAI(**kwargs)
+            _clients[api_key] = client
+        return client
 
 class OpenAIProvider:
+    SAMPLING_PARAMS = SAMPLING_PARAMS
+
     def __init__(self, api_key: str = None, model: str = None):
         # Determine API Key
         _api_key = api_key  # API key passed to constructor takes precedence
@@ -25,15 +54,20 @@ class OpenAIProvider:
             _model = "gpt-3.5-turbo" # Default fallback
 
         self.model = _model
+        self.history = [] # Conversation sent with every request (earlier turns as context)
+        self.sampling = {} # Sampling parameters for the requests (see SAMPLING_PARAMS)
+        self.last_usage = None # Token usage reported by the API for the last call
+        self.last_error = None # Error message of the last call (None on success)
+        self.response_schema = None # JSON Schema for structured output (response_format)
         self.client = None # Initialize client as None
         if self.api_key:
-            self.client = openai.OpenAI(api_key=self.api_key)
+            self.client = _get_client(self.api_key)
         else:
             # Attempt to initialize without explicit API key, relying on environment variables
             # or other OpenAI library mechanisms.
             try:
-                self.client = openai.OpenAI()
-            except openai.AuthenticationError:
+                self.client = _get_client()
+            except openai.OpenAIError:
                  # If this fails, self.client remains None. send_message/stream_message will fail later.
                  # list_models will return an empty list.
                  pass
@@ -81,34 +115,91 @@ class OpenAIProvider:
             return []
 
 
+    def prewarm(self):
+        """Opens the HTTPS connection and verifies key/model with a tiny request."""
+        if not self.client:
+            return False
+        self.client.models.retrieve(self.model)
+        return True
+
+    @staticmethod
+    def _usage_from(usage):
+        if not usage:
+            return None
+        return {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens}
+
+    def _structured_options(self):
+        """response_format for the configured schema (the API only accepts an object at the root)."""
+        schema = self.response_schema
+        if not schema or schema.get("type") != "object":
+            return {}
+        # The API only accepts names matching ^[a-zA-Z0-9_-]{1,64}$; a schema title may have spaces or accents
+        name = re.sub(r"[^a-zA-Z0-9_-]+", "_", str(schema.get("title") or "")).strip("_")[:64] or "response"
+        return {"response_format": {"type": "json_schema", "json_schema": {"name": name, "schema": schema}}}
+
+    def _request_options(self):
+        options = {key: value for key, value in self.sampling.items() if key in SAMPLING_PARAMS}
+        options.update(self._structured_options())
+        return options
+
     def send_message(self, prompt):
+        self.last_usage = None
+        self.last_error = None
         if not self.client:
+            self.last_error = "Client not initialized"
             return "[OpenAI] Error: Client not initialized. API key might be missing or invalid."
+        self.history.append({"role": "user", "content": prompt})
         try:
             response = self.client.chat.completions.create(
                 model=self.model,
-                messages=[{"role": "user", "content": prompt}]
+                messages=as_api_messages(self.history),
+                **self._request_options()
             )
-            return response.choices[0].message.content
+            self.last_usage = self._usage_from(getattr(response, "usage", None))
+            content = response.choices[0].message.content
+            self.history.append({"role": "assistant", "content": content})
+            return content
         except openai.APIError as e: # More specific error handling
+            self.last_error = str(e)
             return f"[OpenAI] API Error: {e}"
         except Exception as e: # Catch-all for other issues
+            self.last_error = str(e)
             return f"[OpenAI] Error: {e}"
 
     def stream_message(self, prompt):
+        self.last_usage = None
+        self.last_error = None
         if not self.client:
+            self.last_error = "Client not initialized"
             yield "[OpenAI] Error: Client not initialized. API key might be missing or invalid."
             return
+        self.history.append({"role": "user", "content": prompt})
+        parts = []
         try:
             response = self.client.chat.completions.create(
                 model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                stream=True
+                messages=as_api_messages(self.history),
+                stream=True,
+                stream_options={"include_usage": True},
+                **self._request_options()
             )
-            for chunk in response:
-                if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
-                    yield chunk.choices[0].delta.content
+            try:
+                for chunk in response:
+                    # The final chunk carries usage and no choices
+                    if getattr(chunk, "usage", None):
+                        self.last_usage = self._usage_from(chunk.usage)
+                    if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                        parts.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+            finally:
+                # Closing the response aborts the generation when the consumer stops early
+                if hasattr(response, "close"):
+                    response.close()
+            if parts:
+                self.history.append({"role": "assistant", "content": "".join(parts)})
         except openai.APIError as e: # More specific error handling
+            self.last_error = str(e)
             yield f"[OpenAI] API Error: {e}"
         except Exception as e: # Catch-all for other issues
+            self.last_error = str(e)
             yield f"[OpenAI] Error: {e}"
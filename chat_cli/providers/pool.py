@@ -0,0 +1,85 @@
+"""
+Pool de instancias de proveedores compartidas entre peticiones concurrentes.
+
+Lo usan el daemon (`chat-cli daemon`) y el gateway HTTP (`chat-cli serve`): se
+inicializa una instancia por proveedor/modelo (SDK importado, cliente creado,
+conexión precalentada) y cada petición trabaja sobre una copia superficial con
+su propio historial, de modo que comparten clientes y pools de conexiones pero
+no el estado de la conversación.
+"""
+
+import copy
+import threading
+import time
+from chat_cli.providers import create_provider
+
+MODELS_CACHE_TTL = 300.0   # Segundos que se reutiliza un catálogo de modelos
+
+class ProviderPool:
+    def __init__(self, provider_factory=None, prewarm: bool = True):
+        self.provider_factory = provider_factory
+        self.prewarm = prewarm
+        self._templates = {}
+        self._lock = threading.Lock()
+        self._models_cache = {}
+
+    def _create(self, provider_name, model, mcp):
+        if self.provider_factory:
+            return self.provider_factory(provider_name, model)
+        kwargs = {"mcp_enabled": True} if mcp else {}
+        instance = create_provider(provider_name, model=model, **kwargs)
+        if self.prewarm:
+            from chat_cli.providers.connection import start_prewarm
+            start_prewarm(instance)
+        return instance
+
+    def get(self, provider_name: str, model: str = None, mcp: bool = False):
+        """Instancia inicializada (una por proveedor/modelo) que sirve de plantilla para cada petición."""
+        key = (provider_name, model, bool(mcp))
+        with self._lock:
+            template = self._templates.get(key)
+            if template is None:
+                template = self._create(provider_name, model, mcp)
+                self._templates[key] = template
+                # El modelo por defecto resuelto también identifica a esta instancia
+                self._templates.setdefault((provider_name, template.model, bool(mcp)), template)
+            return template
+
+    def checkout(self, provider_name: str, model: str = None, history=None, mcp: bool = False):
+        """Copia de la plantilla lista para atender una petición con el historial dado."""
+        template = self.get(provider_name, model, mcp)
+        instance = copy.copy(template)
+        if hasattr(template, "history"):
+            instance.history = list(history or [])
+        instance.last_usage = None
+        instance.last_error = None
+        return instance
+
+    def clear(self):
+        """Descarta las instancias y catálogos (p.ej. tras recargar config.yaml)."""
+        from chat_cli.providers.connection import stop_prewarm
+        with self._lock:
+            for template in set(self._templates.values()):
+                stop_prewarm(template)
+            self._templates.clear()
+            self._models_cache.clear()
+
+    def loaded(self):
+        """Lista "proveedor:modelo" de las instancias ya inicializadas."""
+        with self._lock:
+            return sorted({f"{name}:{template.model}" for (name, _, _), template in self._templates.items()})
+
+    def list_models(self, provider_name: str):
+        """Catálogo de modelos del proveedor, cacheado durante MODELS_CACHE_TTL."""
+        cached = self._models_cache.get(provider_name)
+        if cached and time.time() - cached[0] < MODELS_CACHE_TTL:
+            return cached[1]
+        template = self.get(provider_name)
+        if hasattr(template, "list_models"):
+            models = template.list_models()
+        elif hasattr(template, "list_local_models"):
+            models = template.list_local_models()
+        else:
+            models = [template.model]
+        self._models_cache[provider_name] = (time.time(), models)
+        return models
@@ -0,0 +1,164 @@
+"""
+Memoria semántica de conversaciones anteriores para `/recall` en la TUI.
+
+Cada intercambio (mensaje del usuario + respuesta del asistente) de history.json
+se convierte en un embedding con un modelo local de Ollama (recall.model, por
+defecto nomic-embed-text). Los vectores normalizados se guardan como una matriz
+float32 en ~/.cache/chat_cli/recall/vectors.f32, que se lee con mmap, y los
+textos en entries.jsonl. Solo se calculan embeddings de los intercambios nuevos.
+La búsqueda es por similitud coseno; usa NumPy si está instalado.
+"""
+
+import hashlib
+import json
+import math
+import mmap
+import threading
+from array import array
+from operator import mul
+from pathlib import Path
+from chat_cli.config import get_cache_dir, get_setting
+
+FORMAT_VERSION = 1
+EMBED_MODEL = "nomic-embed-text"
+TOP_K = 3           # Intercambios recuperados por consulta
+MIN_SCORE = 0.3     # Similitud coseno mínima para considerar relevante un intercambio
+BATCH_SIZE = 32     # Textos por petición de embeddings
+
+_numpy = None
+
+def _load_numpy():
+    """NumPy es opcional: acelera la búsqueda con un producto matriz-vector."""
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = False
+    return _numpy or None
+
+def _normalize(vector):
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+def exchanges_of(history):
+    """Intercambios usuario/asistente del historial: [(clave, texto, timestamp)]."""
+    exchanges = []
+    for question, answer in zip(history, history[1:]):
+        if question.get("role") != "user" or answer.get("role") != "assistant":
+            continue
+        text = f"Usuario: {question.get('content', '')}\nAsistente: {answer.get('content', '')}"
+        key = hashlib.sha1(f"{question.get('timestamp')}\0{text}".encode("utf-8")).hexdigest()
+        exchanges.append((key, text, question.get("timestamp")))
+    return exchanges
+
+class RecallIndex:
+    def __init__(self, directory=None, model: str = None, embed=None):
+        self.directory = Path(directory) if directory else get_cache_dir() / "recall"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.model = model or get_setting("recall", "model", EMBED_MODEL)
+        self._embed = embed
+        self.meta_path = self.directory / "meta.json"
+        self.vectors_path = self.directory / "vectors.f32"
+        self.entries_path = self.directory / "entries.jsonl"
+        self.dim = None
+        self.entries = []   # [{"key", "text", "timestamp"}], una por fila de la matriz
+        self._keys = set()
+        self._lock = threading.Lock()
+        self._load()
+
+    def embed(self, texts):
+        if self._embed is not None:
+            return self._embed(texts)
+        from chat_cli.providers.ollama import embed
+        return embed(texts, self.model)
+
+    def _reset(self):
+        for path in (self.vectors_path, self.entries_path):
+            path.unlink(missing_ok=True)
+        self.dim, self.entries, self._keys = None, [], set()
+        self.meta_path.write_text(json.dumps({"version": FORMAT_VERSION, "model": self.model, "dim": None}))
+
+    def _load(self):
+        try:
+            meta = json.loads(self.meta_path.read_text())
+        except (OSError, ValueError):
+            meta = {}
+        if meta.get("version") != FORMAT_VERSION or meta.get("model") != self.model:
+            self._reset()  # Otro modelo de embeddings: los vectores no son comparables
+            return
+        self.dim = meta.get("dim")
+        if not self.dim:
+            return
+        try:
+            with open(self.entries_path, encoding="utf-8") as f:
+                entries = [json.loads(line) for line in f if line.strip()]
+        except (OSError, ValueError):
+            entries = []
+        # Si una escritura se interrumpió, conservar solo las filas completas en ambos archivos
+        size = self.vectors_path.stat().st_size if self.vectors_path.exists() else 0
+        rows = min(len(entries), size // (4 * self.dim))
+        if rows != len(entries) or rows * 4 * self.dim != size:
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(rows * 4 * self.dim)
+            with open(self.entries_path, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries[:rows])
+        self.entries = entries[:rows]
+        self._keys = {entry["key"] for entry in self.entries}
+
+    def sync(self, history) -> int:
+        """Calcula y añade los embeddings de los intercambios aún no indexados. Retorna cuántos se añadieron."""
+        with self._lock:
+            pending = [exchange for exchange in exchanges_of(history) if exchange[0] not in self._keys]
+            for start in range(0, len(pending), BATCH_SIZE):
+                batch = pending[start:start + BATCH_SIZE]
+                vectors = [_normalize(vector) for vector in self.embed([text for _, text, _ in batch])]
+                if self.dim is None:
+                    self.dim = len(vectors[0])
+                    self.meta_path.write_text(json.dumps({"version": FORMAT_VERSION, "model": self.model,
+                                                          "dim": self.dim}))
+                with open(self.vectors_path, "ab") as f:
+                    for vector in vectors:
+                        array("f", vector).tofile(f)
+                with open(self.entries_path, "a", encoding="utf-8") as f:
+                    for key, text, timestamp in batch:
+                        entry = {"key": key, "text": text, "timestamp": timestamp}
+                        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                        self.entries.append(entry)
+                        self._keys.add(key)
+            return len(pending)
+
+    def _scores(self, query_vector):
+        """Similitud coseno de la consulta con cada fila (los vectores ya están normalizados)."""
+        with open(self.vectors_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            rows = len(self.entries)
+            numpy = _load_numpy()
+            if numpy is not None:
+                matrix = numpy.frombuffer(buffer, dtype=numpy.float32, count=rows * self.dim).reshape(rows, self.dim)
+                scores = (matrix @ numpy.asarray(query_vector, dtype=numpy.float32)).tolist()
+                del matrix  # Liberar la vista antes de cerrar el mmap
+                return scores
+            view = memoryview(buffer).cast("f")
+            try:
+                return [sum(map(mul, query_vector, view[row * self.dim:(row + 1) * self.dim])) for row in range(rows)]
+            finally:
+                view.release()
+
+    def search(self, query: str, top_k: int = None, min_score: float = None):
+        """Intercambios más similares a `query`: [{"text", "timestamp", "score"}] de mayor a menor."""
+        top_k = top_k or int(get_setting("recall", "top_k", TOP_K))
+        min_score = float(get_setting("recall", "min_score", MIN_SCORE) if min_score is None else min_score)
+        with self._lock:
+            if not self.entries:
+                return []
+            query_vector = _normalize(self.embed([query])[0])
+            scores = self._scores(query_vector)
+        best = sorted(range(len(scores)), key=scores.__getitem__, reverse=True)[:top_k]
+        return [{"text": self.entries[row]["text"], "timestamp": self.entries[row]["timestamp"], "score": scores[row]}
+                for row in best if scores[row] >= min_score]
+
+def format_recalled(results) -> str:
+    """Texto a anteponer al siguiente prompt con los intercambios recuperados."""
+    sections = [f"[{result['timestamp']}]\n{result['text']}" for result in results]
+    return "Intercambios de conversaciones anteriores que pueden ser relevantes:\n\n" + "\n\n".join(sections)
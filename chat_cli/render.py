@@ -0,0 +1,223 @@
+"""
+Planificador de repintado para respuestas en streaming.
+
+La lectura de red (el generador síncrono `stream_message` del proveedor) corre en
+un hilo aparte, o en una tarea del event loop si el proveedor ofrece streaming
+asíncrono nativo, y entrega los tokens a través de una cola asyncio acotada; así un
+repintado lento nunca detiene la lectura del socket. El planificador agrupa todos
+los tokens pendientes en, como máximo, un repintado por cuadro según un límite de
+FPS configurable, y reduce la frecuencia automáticamente cuando repintar cuesta
+más que el presupuesto del cuadro (terminales lentas o sesiones SSH).
+"""
+
+import asyncio
+import os
+import threading
+import time
+from chat_cli.config import get_setting
+
+DEFAULT_MAX_FPS = 30
+DEFAULT_SSH_MAX_FPS = 12  # Límite por defecto cuando se detecta una sesión SSH
+DEFAULT_MIN_FPS = 4
+DEFAULT_QUEUE_SIZE = 256
+
+_ITEM, _END, _ERROR = range(3)
+
+class ThreadedReader:
+    """
+    Consume un iterable síncrono en un hilo y deposita sus elementos en una cola
+    asyncio acotada. La cola aplica contrapresión al hilo lector; al detenerse,
+    el hilo abandona la iteración en el siguiente elemento y cierra el generador
+    (lo que libera la conexión HTTP subyacente).
+    """
+
+    def __init__(self, make_iterator, maxsize: int = DEFAULT_QUEUE_SIZE):
+        self.make_iterator = make_iterator
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self._stop = threading.Event()
+        self._loop = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        threading.Thread(target=self._produce, name="chat-cli-reader", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        # Liberar espacio por si el productor está bloqueado en queue.put()
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+    def _put(self, item):
+        if self._stop.is_set():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self.queue.put(item), self._loop).result()
+        except RuntimeError:  # El event loop ya se cerró (p.ej. al salir de la TUI)
+            self._stop.set()
+
+    def _produce(self):
+        iterator = None
+        try:
+            iterator = iter(self.make_iterator())
+            for value in iterator:
+                if self._stop.is_set():
+                    break
+                self._put((_ITEM, value))
+            self._put((_END, None))
+        except BaseException as e:  # Propagar el error al consumidor
+            self._put((_ERROR, e))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close:
+                close()
+
+class AsyncReader:
+    """
+    Equivalente a ThreadedReader para iteradores asíncronos nativos (p.ej.
+    `GeminiProvider.astream_message`): una tarea del event loop deposita los
+    elementos en la misma cola acotada, sin hilos auxiliares.
+    """
+
+    def __init__(self, make_iterator, maxsize: int = DEFAULT_QUEUE_SIZE):
+        self.make_iterator = make_iterator
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._produce())
+        return self
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+    async def _produce(self):
+        iterator = self.make_iterator()
+        try:
+            async for value in iterator:
+                await self.queue.put((_ITEM, value))
+            await self.queue.put((_END, None))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:  # Propagar el error al consumidor
+            await self.queue.put((_ERROR, e))
+        finally:
+            aclose = getattr(iterator, "aclose", None)
+            if aclose:
+                await aclose()
+
+async def iterate_in_thread(make_iterator, maxsize: int = DEFAULT_QUEUE_SIZE):
+    """Versión iterador asíncrono de ThreadedReader: `async for x in iterate_in_thread(...)`."""
+    reader = ThreadedReader(make_iterator, maxsize).start()
+    try:
+        while True:
+            kind, value = await reader.queue.get()
+            if kind == _END:
+                return
+            if kind == _ERROR:
+                raise value
+            yield value
+    finally:
+        reader.stop()
+
+async def iterate_provider_stream(provider, prompt: str, maxsize: int = DEFAULT_QUEUE_SIZE):
+    """Tokens de un proveedor: su `astream_message` nativo si lo tiene, o `stream_message` en un hilo."""
+    if hasattr(provider, "astream_message"):
+        async for token in provider.astream_message(prompt):
+            yield token
+        return
+    async for token in iterate_in_thread(lambda: provider.stream_message(prompt), maxsize):
+        yield token
+
+def _default_max_fps():
+    return DEFAULT_SSH_MAX_FPS if os.getenv("SSH_CONNECTION") or os.getenv("SSH_TTY") else DEFAULT_MAX_FPS
+
+class RenderScheduler:
+    """
+    Agrupa tokens y repinta como máximo una vez por cuadro.
+
+    El intervalo entre cuadros parte de 1/max_fps y se alarga (hasta 1/min_fps)
+    cuando el costo medido del repintado más el retraso del event loop superan
+    el presupuesto del cuadro; vuelve a acortarse cuando la terminal se recupera.
+    """
+
+    def __init__(self, max_fps: float = None, min_fps: float = None, queue_size: int = None):
+        self.max_fps = float(max_fps or get_setting("tui", "max_fps", _default_max_fps()))
+        self.min_fps = float(min_fps or get_setting("tui", "min_fps", DEFAULT_MIN_FPS))
+        self.min_fps = min(self.min_fps, self.max_fps)
+        self.queue_size = int(queue_size or get_setting("tui", "queue_size", DEFAULT_QUEUE_SIZE))
+        self.frame_interval = 1.0 / self.max_fps
+        self.frames = 0
+        self.tokens = 0
+        self._render_cost = 0.0  # EWMA del costo de un cuadro (segundos)
+
+    def _adapt(self, cost: float):
+        self._render_cost = cost if not self.frames else 0.8 * self._render_cost + 0.2 * cost
+        # Dejar al menos la mitad del cuadro libre para el event loop y la lectura de teclado
+        target = max(1.0 / self.max_fps, 2.0 * self._render_cost)
+        self.frame_interval = min(target, 1.0 / self.min_fps)
+
+    async def run(self, make_iterator, on_frame, on_token=None, asynchronous: bool = False) -> str:
+        """
+        Consume `make_iterator()` (p.ej. `lambda: provider.stream_message(prompt)`),
+        llama a `on_token(token)` por cada token y a `on_frame(texto_completo)` como
+        máximo una vez por cuadro, más un cuadro final. Retorna el texto completo.
+        Con `asynchronous=True`, `make_iterator()` retorna un iterador asíncrono.
+        """
+        parts = []
+        pending = False
+        finished = False
+        last_frame = time.perf_counter()
+        reader = (AsyncReader if asynchronous else ThreadedReader)(make_iterator, self.queue_size).start()
+
+        def frame(now, lag=0.0):
+            nonlocal pending, last_frame
+            on_frame("".join(parts))
+            done = time.perf_counter()
+            self._adapt((done - now) + lag)
+            self.frames += 1
+            pending = False
+            last_frame = done
+
+        try:
+            while not finished:
+                # Con tokens pendientes, esperar solo hasta el próximo cuadro
+                timeout = None
+                if pending:
+                    timeout = max(0.0, last_frame + self.frame_interval - time.perf_counter())
+                try:
+                    item = await asyncio.wait_for(reader.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    # El retraso respecto al cuadro previsto mide la congestión del event loop
+                    now = time.perf_counter()
+                    frame(now, max(0.0, now - (last_frame + self.frame_interval)))
+                    await asyncio.sleep(0)
+                    continue
+                # Coalescer todo lo que ya esté en la cola
+                items = [item]
+                while not reader.queue.empty():
+                    items.append(reader.queue.get_nowait())
+                for kind, value in items:
+                    if kind == _END:
+                        finished = True
+                        break
+                    if kind == _ERROR:
+                        raise value
+                    self.tokens += 1
+                    parts.append(value)
+                    pending = True
+                    if on_token:
+                        on_token(value)
+                now = time.perf_counter()
+                if pending and now - last_frame >= self.frame_interval:
+                    frame(now)
+                    # Ceder al event loop para que Textual pinte el cuadro
+                    await asyncio.sleep(0)
+        finally:
+            reader.stop()
+        if pending or not self.frames:
+            frame(time.perf_counter())
+        return "".join(parts)
@@ -0,0 +1,116 @@
+"""
+Modo REPL ligero (`chat-cli repl`) para conexiones lentas y sesiones SSH.
+
+No carga Textual: lee el prompt con la consola de Rich y muestra la respuesta en
+una región `rich.Live` que se repinta como máximo `repl.max_fps` veces por segundo
+(el RenderScheduler agrupa los tokens entre cuadros y baja la frecuencia si la
+terminal no da abasto). Al terminar, la región se reemplaza por el Markdown
+final. Cada turno se añade a history.json sin reescribir el archivo completo.
+"""
+
+import asyncio
+from rich.console import Console
+from chat_cli.compaction import get_compactor
+from chat_cli.config import get_setting
+from chat_cli.conversation import Conversation, now_timestamp
+from chat_cli.history import append_history
+from chat_cli.render import RenderScheduler
+from chat_cli.usage import UsageTracker, provider_name_of
+
+HIST_FILE = "history.json"
+EXIT_COMMANDS = ("exit", "salir", "/exit", "/salir")
+
+class Repl:
+    def __init__(self, provider, model: str = None, stream: bool = True, console: Console = None,
+                 history_file: str = HIST_FILE):
+        self.provider = provider
+        self.model = model or getattr(provider, "model", None)
+        self.stream = stream and hasattr(provider, "stream_message")
+        self.console = console or Console()
+        self.history_file = history_file
+        # Igual que la TUI: las sesiones anteriores quedan archivadas fuera del contexto
+        self.conversation = Conversation.load(history_file)
+        provider.history = self.conversation
+        self.usage = UsageTracker()
+        self.max_fps = get_setting("repl", "max_fps", None)
+        self.compactor = get_compactor()
+
+    def _markdown(self, text: str):
+        from chat_cli.highlight import CachedMarkdown
+        return CachedMarkdown(text)
+
+    def _stream_response(self, prompt: str) -> str:
+        from rich.live import Live
+        from rich.text import Text
+        scheduler = RenderScheduler(max_fps=self.max_fps)
+        # auto_refresh=False: solo se repinta cuando el planificador entrega un cuadro
+        with Live(Text("…", style="dim"), console=self.console, auto_refresh=False, transient=True,
+                  vertical_overflow="crop") as live:
+            response = asyncio.run(scheduler.run(
+                lambda: self.provider.stream_message(prompt),
+                lambda text: live.update(self._markdown(text), refresh=True)))
+        self.console.print(self._markdown(response))
+        return response
+
+    def _send(self, prompt: str) -> str:
+        with self.console.status("[yellow]Pensando...[/yellow]", spinner="dots"):
+            response = self.provider.send_message(prompt)
+        self.console.print(self._markdown(response))
+        return response
+
+    def _record_turn(self, start: int, text: str, user_timestamp: str, response: str = None):
+        """Deja el turno en la conversación (como en la TUI) y lo añade a history.json."""
+        del self.conversation[start:]
+        added = [self.conversation.add("user", text, user_timestamp)]
+        if response is not None:
+            added.append(self.conversation.add("assistant", response, now_timestamp()))
+        try:
+            append_history((message.to_dict() for message in added), self.history_file)
+        except (OSError, ValueError) as e:
+            self.console.print(f"No se pudo guardar el historial: {e}", style="red")
+        if self.compactor:
+            self.compactor.schedule(self.conversation)
+
+    def turn(self, text: str):
+        """Envía un mensaje y muestra la respuesta. Retorna la respuesta o None si falló."""
+        start, user_timestamp = len(self.conversation), now_timestamp()
+        label = provider_name_of(self.provider).capitalize()
+        self.console.print(f"[bold]{label}[/bold] [dim]{self.model}[/dim]")
+        try:
+            response = self._stream_response(text) if self.stream else self._send(text)
+        except KeyboardInterrupt:
+            self.console.print("[dim]Respuesta interrumpida.[/dim]")
+            self._record_turn(start, text, user_timestamp)
+            return None
+        except Exception as e:
+            self.console.print(f"Error en el proveedor: {e}", style="red")
+            self._record_turn(start, text, user_timestamp)
+            return None
+        self._record_turn(start, text, user_timestamp, response)
+        route = getattr(self.provider, "route", None)
+        if route:
+            self.console.print(f"[dim]auto → {route.key} ({route.reason})[/dim]")
+        self.usage.record_turn(provider_name_of(self.provider), route.model if route else self.model,
+                               self.provider, text, response)
+        return response
+
+    def run(self):
+        self.console.print(f"Chat con [bold]{provider_name_of(self.provider).capitalize()}[/bold] "
+                           f"([bold]{self.model}[/bold]). Escribe 'salir' o pulsa Ctrl+D para terminar.",
+                           style="green")
+        while True:
+            try:
+                text = self.console.input("[cyan]Tú ›[/cyan] ").strip()
+            except (EOFError, KeyboardInterrupt):
+                self.console.print()
+                break
+            if not text:
+                continue
+            if text.lower() in EXIT_COMMANDS:
+                break
+            self.turn(text)
+        session = self.usage.session
+        if session["turns"]:
+            self.console.print(f"[dim]{session['turns']} turnos · "
+                               f"{session['prompt_tokens'] + session['completion_tokens']} tokens · "
+                               f"${session['cost']:.4f}[/dim]")
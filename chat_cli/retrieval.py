@@ -0,0 +1,240 @@
+"""
+Índice local de documentos para `/attach` (TUI) y `chat-cli index`.
+
+Divide los archivos de texto de un directorio en fragmentos de líneas, construye
+un índice invertido (término -> {fragmento: frecuencia}) guardado en
+~/.cache/chat_cli/index y lo actualiza de forma incremental según el mtime y el
+tamaño de cada archivo. Las consultas se puntúan con BM25 recorriendo solo las
+listas de los términos de la consulta, y los mejores fragmentos se insertan en
+el prompt sin superar un presupuesto de tokens.
+"""
+
+import hashlib
+import heapq
+import json
+import math
+import os
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+from pathlib import Path
+from chat_cli.config import get_cache_dir, get_setting
+from chat_cli.usage import estimate_tokens
+
+INDEX_VERSION = 2
+CHUNK_CHARS = 1500          # Tamaño aproximado de cada fragmento (se corta en límites de línea)
+MAX_FILE_SIZE = 1_000_000   # Archivos más grandes no se indexan
+TOP_K = 8                   # Fragmentos candidatos por consulta
+TOKEN_BUDGET = 3000         # Tokens máximos de contexto insertados en el prompt
+PARALLEL_THRESHOLD = 64     # Archivos a procesar a partir de los cuales se usa un pool de procesos
+BM25_K1 = 1.2
+BM25_B = 0.75
+SKIP_DIRS = {".git", ".hg", ".svn", "node_modules", "__pycache__", ".venv", "venv", ".tox",
+             ".mypy_cache", ".pytest_cache", "dist", "build"}
+
+_TOKEN_RE = re.compile(r"[^\W_]+")
+
+def tokenize(text: str):
+    """Términos en minúsculas; separa snake_case y descarta términos de un carácter."""
+    return [term for term in _TOKEN_RE.findall(text.lower()) if len(term) > 1]
+
+def chunk_text(text: str, chunk_chars: int = CHUNK_CHARS):
+    """Divide un texto en fragmentos de líneas completas. Retorna [(línea_inicial, texto)]."""
+    chunks, current, size, start = [], [], 0, 1
+    for number, line in enumerate(text.splitlines(keepends=True), 1):
+        if current and size + len(line) > chunk_chars:
+            chunks.append((start, "".join(current)))
+            current, size, start = [], 0, number
+        current.append(line)
+        size += len(line)
+    if current and "".join(current).strip():
+        chunks.append((start, "".join(current)))
+    return chunks
+
+def _process_file(job):
+    """Lee y fragmenta un archivo (se ejecuta en los procesos del pool). Retorna (ruta, fragmentos|None)."""
+    path, rel, chunk_chars, max_file_size = job
+    try:
+        if os.path.getsize(path) > max_file_size:
+            return rel, None
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return rel, None
+    if b"\0" in data[:8192]:
+        return rel, None  # Binario
+    text = data.decode("utf-8", errors="replace")
+    chunks = []
+    for line, chunk in chunk_text(text, chunk_chars):
+        terms = tokenize(chunk)
+        chunks.append((line, chunk, dict(Counter(terms)), len(terms)))
+    return rel, chunks
+
+def default_index_path(root) -> Path:
+    digest = hashlib.sha1(str(Path(root).resolve()).encode("utf-8")).hexdigest()[:16]
+    index_dir = get_cache_dir() / "index"
+    index_dir.mkdir(parents=True, exist_ok=True)
+    return index_dir / f"{digest}.json"
+
+class DocumentIndex:
+    def __init__(self, root, index_path=None):
+        self.root = Path(root).resolve()
+        self.index_path = Path(index_path) if index_path else default_index_path(self.root)
+        self.chunk_chars = int(get_setting("retrieval", "chunk_chars", CHUNK_CHARS))
+        self.max_file_size = int(get_setting("retrieval", "max_file_size", MAX_FILE_SIZE))
+        self.files = {}      # Ruta relativa -> (mtime_ns, tamaño, [ids de fragmentos])
+        self.chunks = {}     # Id -> (ruta relativa, línea inicial, texto, número de términos)
+        self.postings = {}   # Término -> {id de fragmento: frecuencia}
+        self.total_length = 0
+        self._next_id = 0
+
+    @classmethod
+    def load(cls, root, index_path=None):
+        """Índice guardado para `root` (o uno vacío si no existe, es de otra versión o está dañado)."""
+        index = cls(root, index_path)
+        try:
+            with open(index.index_path, encoding="utf-8") as f:
+                state = json.load(f)
+            if state["version"] == INDEX_VERSION and state["root"] == str(index.root) \
+                    and state["chunk_chars"] == index.chunk_chars:
+                # JSON solo admite claves de texto: los ids de fragmento se guardan como listas
+                files = {rel: (mtime, size, ids) for rel, (mtime, size, ids) in state["files"].items()}
+                chunks = {chunk_id: (rel, line, text, length) for chunk_id, rel, line, text, length in state["chunks"]}
+                postings = {term: dict(entries) for term, entries in state["postings"].items()}
+                index.files, index.chunks, index.postings = files, chunks, postings
+                index.total_length, index._next_id = state["total_length"], state["next_id"]
+        except Exception:
+            pass  # Índice ausente o corrupto: se reconstruye
+        return index
+
+    def save(self):
+        state = {"version": INDEX_VERSION, "root": str(self.root), "chunk_chars": self.chunk_chars,
+                 "files": self.files, "chunks": [(chunk_id, *chunk) for chunk_id, chunk in self.chunks.items()],
+                 "postings": {term: list(entries.items()) for term, entries in self.postings.items()},
+                 "total_length": self.total_length, "next_id": self._next_id}
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, self.index_path)
+        except OSError:
+            pass  # El índice en disco es una caché: si no se puede guardar, se reconstruye la próxima vez
+
+    def _scan(self):
+        """Archivos del directorio: {ruta relativa: (mtime_ns, tamaño)}, omitiendo ocultos y SKIP_DIRS."""
+        found = {}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS and not d.startswith(".")]
+            for name in filenames:
+                if name.startswith("."):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                found[os.path.relpath(path, self.root)] = (stat.st_mtime_ns, stat.st_size)
+        return found
+
+    def _remove_file(self, rel):
+        for chunk_id in self.files.pop(rel, (0, 0, []))[2]:
+            _, _, text, length = self.chunks.pop(chunk_id)
+            self.total_length -= length
+            for term in set(tokenize(text)):
+                postings = self.postings.get(term)
+                if postings is not None:
+                    postings.pop(chunk_id, None)
+                    if not postings:
+                        del self.postings[term]
+
+    def _add_file(self, rel, stamp, chunks):
+        ids = []
+        for line, text, frequencies, length in chunks or []:
+            chunk_id = self._next_id
+            self._next_id += 1
+            ids.append(chunk_id)
+            self.chunks[chunk_id] = (rel, line, text, length)
+            self.total_length += length
+            for term, frequency in frequencies.items():
+                self.postings.setdefault(term, {})[chunk_id] = frequency
+        # También se recuerdan los archivos omitidos (binarios, grandes) para no releerlos
+        self.files[rel] = (stamp[0], stamp[1], ids)
+
+    def update(self, workers: int = None):
+        """
+        Indexa los archivos nuevos o modificados y quita los eliminados. Con muchos
+        archivos pendientes, la lectura y tokenización se reparte en un pool de procesos.
+        Retorna un dict con files, added, updated, removed y chunks.
+        """
+        found = self._scan()
+        changed = [rel for rel, stamp in found.items() if self.files.get(rel, (None, None))[:2] != stamp]
+        removed = [rel for rel in self.files if rel not in found]
+        stats = {"files": len(found), "added": sum(rel not in self.files for rel in changed),
+                 "updated": sum(rel in self.files for rel in changed), "removed": len(removed)}
+        for rel in removed + changed:
+            self._remove_file(rel)
+        jobs = [(str(self.root / rel), rel, self.chunk_chars, self.max_file_size) for rel in changed]
+        workers = workers or int(get_setting("retrieval", "workers", 0)) or os.cpu_count() or 1
+        if len(jobs) >= PARALLEL_THRESHOLD and workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(_process_file, jobs, chunksize=max(1, len(jobs) // (workers * 8))))
+        else:
+            results = [_process_file(job) for job in jobs]
+        for rel, chunks in results:
+            self._add_file(rel, found[rel], chunks)
+        if changed or removed:
+            self.save()
+        stats["chunks"] = len(self.chunks)
+        return stats
+
+    def search(self, query: str, top_k: int = TOP_K):
+        """Mejores fragmentos según BM25: [{"path", "line", "text", "score"}] de mayor a menor puntaje."""
+        total = len(self.chunks)
+        if not total:
+            return []
+        average_length = self.total_length / total or 1.0
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            df = len(postings)
+            idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+            for chunk_id, frequency in postings.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.chunks[chunk_id][3] / average_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        results = []
+        for chunk_id, score in heapq.nlargest(top_k, scores.items(), key=itemgetter(1)):
+            rel, line, text, _ = self.chunks[chunk_id]
+            results.append({"path": rel, "line": line, "text": text, "score": score})
+        return results
+
+    def build_context(self, query: str, token_budget: int = None, top_k: int = None) -> str:
+        """Fragmentos relevantes formateados para el prompt, sin superar `token_budget` tokens."""
+        token_budget = token_budget or int(get_setting("retrieval", "token_budget", TOKEN_BUDGET))
+        top_k = top_k or int(get_setting("retrieval", "top_k", TOP_K))
+        sections, used = [], 0
+        for result in self.search(query, top_k):
+            section = f"--- {result['path']}:{result['line']} ---\n{result['text'].rstrip()}\n"
+            tokens = estimate_tokens(section)
+            if used + tokens > token_budget:
+                continue  # Puede caber un fragmento menos relevante pero más corto
+            sections.append(section)
+            used += tokens
+        return "\n".join(sections)
+
+    def augment_prompt(self, prompt: str, token_budget: int = None) -> str:
+        """Prompt con los fragmentos relevantes del directorio adjunto delante (o sin cambios si no hay)."""
+        context = self.build_context(prompt, token_budget)
+        if not context:
+            return prompt
+        return (f"Fragmentos de archivos de {self.root} que pueden ser relevantes:\n\n{context}\n"
+                f"Usando ese contexto cuando corresponda, responde:\n{prompt}")
+
+def open_index(root, workers: int = None):
+    """Carga el índice de `root` y lo pone al día. Retorna (índice, estadísticas de update())."""
+    if not Path(root).is_dir():
+        raise ValueError(f"No es un directorio: {root}")
+    index = DocumentIndex.load(root)
+    return index, index.update(workers)
@@ -0,0 +1,483 @@
+"""
+Salida JSON estructurada con validación incremental (`--json-schema`).
+
+La respuesta se analiza con un parser JSON incremental a medida que llega. En
+cuanto el documento parcial incumple el esquema de forma segura, se cierra el
+stream del proveedor y se reintenta. Así se detecta un tipo equivocado, una
+clave no permitida, demasiados elementos o un texto fuera del `enum` sin
+esperar (ni pagar) el resto de la respuesta. Si la raíz es un array, cada
+elemento se entrega validado en cuanto se cierra.
+
+Los proveedores que lo soportan reciben el esquema como salida estructurada
+nativa (`format` en Ollama, `response_format` en OpenAI). Con todos se añade
+al prompt una instrucción con el esquema.
+
+Se admite un subconjunto de JSON Schema: type, enum, const, properties,
+required, additionalProperties, items, minItems/maxItems, minLength/maxLength,
+pattern, minimum/maximum, exclusiveMinimum/exclusiveMaximum y
+anyOf/oneOf/allOf (estos últimos solo se comprueban al cerrarse cada valor).
+"""
+
+import json
+import os
+import re
+from chat_cli.config import get_setting
+
+RETRIES = 2  # Reintentos tras una respuesta inválida (structured.retries)
+INSTRUCTION = ("Responde únicamente con un documento JSON válido, sin texto adicional ni bloques de código, "
+               "que cumpla este JSON Schema:\n")
+RETRY_NOTE = "\n\nTu respuesta anterior no era válida ({error}). Responde de nuevo solo con el JSON."
+
+_WHITESPACE = " \t\r\n"
+_STRING_CHUNK = re.compile(r'[^"\\]*')
+_NUMBER_CHARS = frozenset("0123456789+-.eE")
+_LITERAL_CHARS = frozenset("truefalsn")
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+# Tipos JSON que puede tener un valor según su primer carácter
+_START_TYPES = {"{": ("object",), "[": ("array",), '"': ("string",), "t": ("boolean",), "f": ("boolean",),
+                "n": ("null",)}
+_NUMBER_TYPES = ("number", "integer")
+
+class SchemaViolation(ValueError):
+    """El documento (parcial o completo) no es JSON válido o no cumple el esquema."""
+
+    def __init__(self, message: str, path: str = "$"):
+        super().__init__(f"{path}: {message}")
+        self.path = path
+
+class StructuredOutputError(Exception):
+    """No se obtuvo un documento válido: error del proveedor o reintentos agotados."""
+
+    def __init__(self, message: str, errors=None, provider_error: bool = False):
+        super().__init__(message)
+        self.errors = list(errors or [])
+        self.provider_error = provider_error
+
+def load_schema(spec: str) -> dict:
+    """Esquema desde una ruta a un archivo JSON o desde el propio JSON en línea."""
+    path = os.path.expanduser(spec)
+    try:
+        if os.path.isfile(path):
+            with open(path, encoding="utf-8") as f:
+                schema = json.load(f)
+        else:
+            schema = json.loads(spec)
+    except ValueError as e:
+        raise ValueError(f"Esquema JSON inválido: {e}") from None
+    if not isinstance(schema, dict):
+        raise ValueError("El esquema JSON debe ser un objeto")
+    return schema
+
+# --- Validación ---
+
+def _json_type(value) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, int):
+        return "integer"
+    if isinstance(value, float):
+        return "integer" if value.is_integer() else "number"
+    if isinstance(value, str):
+        return "string"
+    if isinstance(value, list):
+        return "array"
+    return "object"
+
+def _allowed_types(schema):
+    """Tipos permitidos por `schema` (conjunto), o None si no restringe el tipo."""
+    types = schema.get("type")
+    if types is None:
+        return None
+    types = {types} if isinstance(types, str) else set(types)
+    if "number" in types:
+        types.add("integer")
+    return types
+
+def _property_schema(schema, key, path):
+    properties = schema.get("properties") or {}
+    if key in properties:
+        return properties[key]
+    additional = schema.get("additionalProperties", True)
+    if additional is False:
+        raise SchemaViolation(f"propiedad no permitida {key!r}", path)
+    return additional if isinstance(additional, dict) else {}
+
+def _items_schema(schema):
+    items = schema.get("items")
+    return items if isinstance(items, dict) else {}
+
+def _check_node(value, schema, path):
+    """Valida `value` contra `schema` sin descender a sus hijos (salvo en anyOf/oneOf/allOf)."""
+    if not schema:
+        return
+    kind = _json_type(value)
+    allowed = _allowed_types(schema)
+    if allowed is not None and kind not in allowed:
+        raise SchemaViolation(f"se esperaba {'/'.join(sorted(allowed))}, llegó {kind}", path)
+    if "enum" in schema and value not in schema["enum"]:
+        raise SchemaViolation(f"{value!r} no está en {schema['enum']!r}", path)
+    if "const" in schema and value != schema["const"]:
+        raise SchemaViolation(f"se esperaba {schema['const']!r}", path)
+    if kind == "string":
+        if len(value) < schema.get("minLength", 0):
+            raise SchemaViolation(f"texto más corto que {schema['minLength']}", path)
+        if "maxLength" in schema and len(value) > schema["maxLength"]:
+            raise SchemaViolation(f"texto más largo que {schema['maxLength']}", path)
+        if "pattern" in schema and not re.search(schema["pattern"], value):
+            raise SchemaViolation(f"no coincide con {schema['pattern']!r}", path)
+    elif kind in _NUMBER_TYPES:
+        if "minimum" in schema and value < schema["minimum"]:
+            raise SchemaViolation(f"{value} es menor que {schema['minimum']}", path)
+        if "maximum" in schema and value > schema["maximum"]:
+            raise SchemaViolation(f"{value} es mayor que {schema['maximum']}", path)
+        if "exclusiveMinimum" in schema and value <= schema["exclusiveMinimum"]:
+            raise SchemaViolation(f"{value} no es mayor que {schema['exclusiveMinimum']}", path)
+        if "exclusiveMaximum" in schema and value >= schema["exclusiveMaximum"]:
+            raise SchemaViolation(f"{value} no es menor que {schema['exclusiveMaximum']}", path)
+    elif kind == "array":
+        if len(value) < schema.get("minItems", 0):
+            raise SchemaViolation(f"menos de {schema['minItems']} elementos", path)
+        if "maxItems" in schema and len(value) > schema["maxItems"]:
+            raise SchemaViolation(f"más de {schema['maxItems']} elementos", path)
+    elif kind == "object":
+        missing = [key for key in schema.get("required") or () if key not in value]
+        if missing:
+            raise SchemaViolation(f"faltan las propiedades requeridas {missing!r}", path)
+        if schema.get("additionalProperties", True) is False:
+            for key in value:
+                _property_schema(schema, key, path)
+    if "allOf" in schema:
+        for option in schema["allOf"]:
+            validate(value, option, path)
+    for combinator, accepts in (("anyOf", lambda passed: passed >= 1), ("oneOf", lambda passed: passed == 1)):
+        if combinator in schema:
+            passed = 0
+            for option in schema[combinator]:
+                try:
+                    validate(value, option, path)
+                    passed += 1
+                except SchemaViolation:
+                    pass
+            if not accepts(passed):
+                raise SchemaViolation(f"no cumple {combinator}", path)
+
+def validate(value, schema, path: str = "$"):
+    """Valida un documento completo. Lanza SchemaViolation con la ruta del primer error."""
+    _check_node(value, schema, path)
+    if isinstance(value, list):
+        items = _items_schema(schema)
+        for index, item in enumerate(value):
+            validate(item, items, f"{path}[{index}]")
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            validate(item, _property_schema(schema, key, path), f"{path}.{key}")
+
+# --- Parser incremental ---
+
+class _Frame:
+    """Objeto o array abierto en la pila del parser."""
+    __slots__ = ("kind", "schema", "path", "value", "key", "expect")
+
+    def __init__(self, kind, schema, path, value):
+        self.kind = kind
+        self.schema = schema
+        self.path = path
+        self.value = value
+        self.key = None
+        self.expect = "first"   # first, key, colon, value, next
+
+class IncrementalParser:
+    """
+    Parser JSON que recibe el texto por fragmentos y valida contra `schema` en
+    cuanto es posible. `feed()` retorna los valores que se completaron con ese
+    fragmento: los elementos de la raíz si es un array, o el documento si no.
+    Ignora el texto previo a la raíz (p.ej. una valla ```json) y el posterior.
+    """
+
+    def __init__(self, schema: dict = None):
+        self.schema = schema or {}
+        self.done = False
+        self.value = None
+        self.started = False
+        self._stack = []
+        self._state = None          # None (entre tokens), string, escape, unicode, number, literal
+        self._is_key = False
+        self._raw = []              # Texto crudo del escalar en curso (con los escapes tal cual)
+        self._decoded = []          # Texto decodificado del string en curso, para validarlo a medias
+        self._unicode = ""
+        self._scalar_schema = None
+        self._scalar_path = "$"
+        allowed = _allowed_types(self.schema)
+        # Caracteres con los que puede empezar la raíz; antes de ella se ignora el texto
+        self._root_starts = "".join(char for char, types in _START_TYPES.items()
+                                    if allowed is None or allowed & set(types))
+        if allowed is None or allowed & set(_NUMBER_TYPES):
+            self._root_starts += "-0123456789"
+        if allowed is None:
+            self._root_starts = "{["
+
+    # Contexto del valor siguiente
+
+    def _child(self):
+        """(esquema, ruta) del valor que empieza ahora."""
+        if not self._stack:
+            return self.schema, "$"
+        frame = self._stack[-1]
+        if frame.kind == "object":
+            return _property_schema(frame.schema, frame.key, frame.path), f"{frame.path}.{frame.key}"
+        index = len(frame.value)
+        if "maxItems" in frame.schema and index >= frame.schema["maxItems"]:
+            raise SchemaViolation(f"más de {frame.schema['maxItems']} elementos", frame.path)
+        return _items_schema(frame.schema), f"{frame.path}[{index}]"
+
+    def _start_value(self, char):
+        schema, path = self._child()
+        types = _START_TYPES.get(char) or (_NUMBER_TYPES if char in "-0123456789" else None)
+        if types is None:
+            raise SchemaViolation(f"JSON inválido: carácter inesperado {char!r}", path)
+        allowed = _allowed_types(schema)
+        if allowed is not None and not allowed & set(types):
+            raise SchemaViolation(f"se esperaba {'/'.join(sorted(allowed))}, llegó {types[0]}", path)
+        self.started = True
+        if char in "{[":
+            self._stack.append(_Frame("object" if char == "{" else "array", schema, path,
+                                      {} if char == "{" else []))
+            return
+        self._scalar_schema, self._scalar_path = schema, path
+        if char == '"':
+            self._state, self._is_key = "string", False
+            self._raw, self._decoded = [], []
+        else:
+            self._state = "number" if types is _NUMBER_TYPES else "literal"
+            self._raw = [char]
+
+    def _finish_value(self, value, schema, path, out):
+        _check_node(value, schema, path)
+        if not self._stack:
+            self.done, self.value = True, value
+            if not isinstance(value, list):
+                out.append(value)
+            return
+        frame = self._stack[-1]
+        if frame.kind == "object":
+            frame.value[frame.key] = value
+        else:
+            frame.value.append(value)
+            if len(self._stack) == 1:
+                out.append(value)  # Elemento de la raíz completo y validado
+        frame.expect = "next"
+
+    def _finish_scalar(self, out):
+        state, raw = self._state, "".join(self._raw)
+        self._state = None
+        try:
+            value = json.loads(f'"{raw}"' if state == "string" else raw)
+        except ValueError:
+            raise SchemaViolation(f"JSON inválido: {raw[:20]!r}", self._scalar_path) from None
+        if state == "string" and self._is_key:
+            frame = self._stack[-1]
+            _property_schema(frame.schema, value, frame.path)
+            frame.key, frame.expect = value, "colon"
+            return
+        self._finish_value(value, self._scalar_schema, self._scalar_path, out)
+
+    def _check_partial_string(self):
+        """Descarta pronto un string que ya no puede cumplir maxLength, enum o const."""
+        schema = self._scalar_schema
+        if self._is_key or not schema:
+            return
+        if "maxLength" in schema and sum(map(len, self._decoded)) > schema["maxLength"]:
+            raise SchemaViolation(f"texto más largo que {schema['maxLength']}", self._scalar_path)
+        options = schema.get("enum") if "enum" in schema else ([schema["const"]] if "const" in schema else None)
+        if options is not None:
+            text = "".join(self._decoded)
+            if not any(isinstance(option, str) and option.startswith(text) for option in options):
+                raise SchemaViolation(f"{text!r}… no puede estar en {options!r}", self._scalar_path)
+
+    def feed(self, text: str):
+        """Procesa un fragmento. Retorna la lista de valores completados; lanza SchemaViolation."""
+        out = []
+        i, length = 0, len(text)
+        while i < length and not self.done:
+            state = self._state
+            if state == "string":
+                match = _STRING_CHUNK.match(text, i)
+                chunk = match.group()
+                if chunk:
+                    self._raw.append(chunk)
+                    self._decoded.append(chunk)
+                    self._check_partial_string()
+                i = match.end()
+                if i < length:
+                    if text[i] == '"':
+                        self._finish_scalar(out)
+                    else:
+                        self._raw.append("\\")
+                        self._state = "escape"
+                    i += 1
+                continue
+            char = text[i]
+            if state == "escape":
+                self._raw.append(char)
+                if char == "u":
+                    self._state, self._unicode = "unicode", ""
+                elif char in _ESCAPES:
+                    self._decoded.append(_ESCAPES[char])
+                    self._state = "string"
+                    self._check_partial_string()
+                else:
+                    raise SchemaViolation(f"JSON inválido: escape \\{char}", self._scalar_path)
+                i += 1
+                continue
+            if state == "unicode":
+                self._raw.append(char)
+                self._unicode += char
+                if len(self._unicode) == 4:
+                    try:
+                        self._decoded.append(chr(int(self._unicode, 16)))
+                    except ValueError:
+                        raise SchemaViolation(f"JSON inválido: \\u{self._unicode}", self._scalar_path) from None
+                    self._state = "string"
+                    self._check_partial_string()
+                i += 1
+                continue
+            if state in ("number", "literal"):
+                if char in (_NUMBER_CHARS if state == "number" else _LITERAL_CHARS):
+                    self._raw.append(char)
+                    i += 1
+                    continue
+                self._finish_scalar(out)
+                continue  # El carácter delimitador se procesa a continuación
+            if char in _WHITESPACE:
+                i += 1
+                continue
+            if not self._stack:
+                if char in self._root_starts:
+                    self._start_value(char)
+                i += 1  # Texto previo a la raíz (o el propio inicio de la raíz)
+                continue
+            frame = self._stack[-1]
+            expect = frame.expect
+            if frame.kind == "object":
+                if char == "}" and expect in ("first", "next"):
+                    self._close(out)
+                elif char == '"' and expect in ("first", "key"):
+                    self._state, self._is_key = "string", True
+                    self._raw, self._decoded = [], []
+                elif char == ":" and expect == "colon":
+                    frame.expect = "value"
+                elif char == "," and expect == "next":
+                    frame.expect = "key"
+                elif expect == "value":
+                    self._start_value(char)
+                else:
+                    raise SchemaViolation(f"JSON inválido: carácter inesperado {char!r}", frame.path)
+            else:
+                if char == "]" and expect in ("first", "next"):
+                    self._close(out)
+                elif char == "," and expect == "next":
+                    frame.expect = "value"
+                elif expect in ("first", "value"):
+                    self._start_value(char)
+                else:
+                    raise SchemaViolation(f"JSON inválido: carácter inesperado {char!r}", frame.path)
+            i += 1
+        return out
+
+    def _close(self, out):
+        frame = self._stack.pop()
+        self._finish_value(frame.value, frame.schema, frame.path, out)
+
+    def close(self):
+        """Fin del stream: completa un número pendiente en la raíz o lanza SchemaViolation si falta JSON."""
+        out = []
+        if self._state in ("number", "literal"):
+            self._finish_scalar(out)
+        if not self.done:
+            path = self._stack[-1].path if self._stack else self._scalar_path
+            raise SchemaViolation("JSON incompleto" if self.started else "la respuesta no contiene JSON", path)
+        return out
+
+# --- Turnos con salida estructurada ---
+
+def schema_instruction(schema: dict) -> str:
+    return INSTRUCTION + json.dumps(schema, ensure_ascii=False)
+
+def apply_schema(provider, schema) -> bool:
+    """Pide salida estructurada nativa si el proveedor la soporta (atributo `response_schema`)."""
+    if not hasattr(provider, "response_schema"):
+        return False
+    provider.response_schema = schema
+    return True
+
+class StructuredStream:
+    """
+    Turno en streaming validado contra `schema`, con reintentos automáticos.
+
+    `events(prompt)` produce ("text", fragmento), ("element", valor validado) y
+    ("retry", SchemaViolation). Al detectar una violación se cierra el stream del
+    proveedor (cancelando la generación) y se vuelve a pedir. Un "retry" invalida
+    los elementos entregados hasta entonces: el nuevo intento los vuelve a
+    producir desde el primero, y solo los del último intento forman `value`.
+    """
+
+    def __init__(self, provider, schema: dict, retries: int = None):
+        self.provider = provider
+        self.schema = schema
+        self.retries = int(get_setting("structured", "retries", RETRIES)) if retries is None else retries
+        self.native = apply_schema(provider, schema)
+        self.value = None
+        self.attempts = 0
+        self.errors = []
+
+    def _reset_history(self, start):
+        history = getattr(self.provider, "history", None)
+        if start is not None and history is not None and len(history) > start:
+            del history[start:]
+
+    def events(self, prompt: str):
+        prompt = f"{prompt}\n\n{schema_instruction(self.schema)}"
+        history = getattr(self.provider, "history", None)
+        start = len(history) if history is not None else None
+        for attempt in range(self.retries + 1):
+            self.attempts = attempt + 1
+            parser = IncrementalParser(self.schema)
+            note = RETRY_NOTE.format(error=self.errors[-1]) if self.errors else ""
+            stream = self.provider.stream_message(prompt + note)
+            try:
+                for token in stream:
+                    # Los proveedores entregan el error como último fragmento
+                    if getattr(self.provider, "last_error", None):
+                        raise StructuredOutputError(token, self.errors, provider_error=True)
+                    yield "text", token
+                    for element in parser.feed(token):
+                        yield "element", element
+                for element in parser.close():
+                    yield "element", element
+                self.value = parser.value
+                return
+            except SchemaViolation as e:
+                self.errors.append(e)
+                stream.close()  # Cancela la generación: el resto de la respuesta no sirve
+                self._reset_history(start)
+                if attempt < self.retries:
+                    yield "retry", e
+            finally:
+                stream.close()
+        raise StructuredOutputError(f"La respuesta no cumple el esquema tras {self.attempts} intentos: "
+                                    f"{self.errors[-1]}", self.errors)
+
+    def elements(self, prompt: str):
+        for kind, value in self.events(prompt):
+            if kind == "element":
+                yield value
+
+    def text(self, prompt: str):
+        """Solo el texto (para la TUI), con una nota visible en cada reintento."""
+        for kind, value in self.events(prompt):
+            if kind == "text":
+                yield value
+            elif kind == "retry":
+                yield f"\n\n> Reintento {self.attempts + 1}: {value}\n\n"
@@ -0,0 +1,156 @@
+"""
+Pestañas de conversación de la TUI.
+
+Cada pestaña tiene su propio proveedor, modelo, historial y respuesta en curso.
+Las peticiones de varias pestañas corren a la vez en el event loop de Textual
+(cada lectura de red en su hilo) y comparten los pools de conexiones de los
+proveedores. La app solo monta los widgets de la pestaña visible: las demás
+guardan su transcripción como texto (`TranscriptEntry`) y, mientras responden,
+acumulan la respuesta sin repintar; la barra de pestañas muestra su progreso y
+cuántos mensajes nuevos tienen sin leer.
+"""
+
+import os
+import time
+from chat_cli.compaction import get_compactor
+from chat_cli.conversation import Conversation
+from chat_cli.pipeline import PromptQueue
+from chat_cli.render import RenderScheduler
+from chat_cli.usage import estimate_tokens, provider_name_of
+
+HIST_FILE = "history.json"
+TPS_WINDOW = 1.0  # Segundos de la ventana en la que se calculan los tokens por segundo
+
+def history_file_for(number: int) -> str:
+    """history.json para la primera pestaña; history-<n>.json para las demás."""
+    if number <= 1:
+        return HIST_FILE
+    base, extension = os.path.splitext(HIST_FILE)
+    return f"{base}-{number}{extension}"
+
+class TranscriptEntry:
+    """
+    Mensaje mostrado en una pestaña. `kind` es user, llm, info, error o help;
+    `widget` es el Static montado, o None si la pestaña no está visible.
+    """
+    __slots__ = ("kind", "content", "title", "widget")
+
+    def __init__(self, kind: str, content, title: str):
+        self.kind = kind
+        self.content = content
+        self.title = title
+        self.widget = None
+
+    def __repr__(self):
+        return f"TranscriptEntry({self.kind!r}, {str(self.content)[:40]!r})"
+
+class ChatTab:
+    def __init__(self, number: int, provider, model: str, stream: bool = False, conversation: Conversation = None,
+                 history_file: str = None):
+        self.number = number
+        self.provider = provider
+        self.model = model
+        # Proveedor y modelo con los que recrearlo (pestaña nueva, config recargada). No se deducen
+        # de `provider_name`/`model`: los de `auto` pasan a ser los del backend elegido en cada turno
+        self.provider_key = provider_name_of(provider)
+        self.model_key = getattr(provider, "policy", None) or model
+        self.stream = stream
+        self.history_file = history_file or history_file_for(number)
+        # El proveedor usa la conversación de la pestaña como su historial (contexto del modelo)
+        self.conversation = conversation if conversation is not None else \
+            Conversation(getattr(provider, "history", None) or [])
+        if hasattr(provider, "history"):
+            provider.history = self.conversation
+        self.mcp_enabled = getattr(provider, "mcp_enabled", False)
+        self.attached_index = None    # Índice del directorio adjunto con /attach
+        self.recalled_context = None  # Intercambios recuperados con /recall para el próximo prompt
+        self.schema = None            # JSON Schema de las respuestas (--json-schema o /schema)
+        self.compactor = get_compactor()
+        self.transcript = []
+        self.unread = 0
+        self.busy = False
+        self.turn_start = 0         # Largo de la conversación al empezar el turno en curso
+        self.queue = PromptQueue()  # Prompts enviados mientras la pestaña respondía
+        self.parallel = 0           # Turnos independientes (&) en curso
+        self.deferred_turns = []    # Turnos independientes terminados que esperan al turno en curso
+        self.token_count = 0        # Tokens informados de los turnos de esta pestaña
+        self.live_tokens = 0        # Estimación local del turno en curso (0 si no hay)
+        self.tokens_per_second = 0.0
+
+    @property
+    def provider_name(self) -> str:
+        return provider_name_of(self.provider)
+
+    def add(self, kind: str, content, title: str, visible: bool = True) -> TranscriptEntry:
+        """Añade un mensaje a la transcripción; si la pestaña no está a la vista cuenta como no leído."""
+        entry = TranscriptEntry(kind, content, title)
+        self.transcript.append(entry)
+        if not visible and kind != "user":
+            self.unread += 1
+        return entry
+
+    def discard(self, entry: TranscriptEntry):
+        if entry in self.transcript:
+            self.transcript.remove(entry)
+
+    def release_widgets(self):
+        """La pestaña deja de estar a la vista: sus widgets se desmontan y solo queda el texto."""
+        for entry in self.transcript:
+            entry.widget = None
+
+    def label(self, active: bool = False) -> str:
+        """Etiqueta (BBCode de Rich) para la barra de pestañas, con progreso y no leídos."""
+        text = f"{self.number}:{self.provider_name}/{self.model}"
+        if self.busy or self.parallel:
+            text += f" [yellow]⟳ {self.live_tokens} tok[/]"
+            if self.queue:
+                text += f" [yellow]+{len(self.queue)}[/]"
+        elif self.unread:
+            text += f" [bold magenta]●{self.unread}[/]"
+        return f"[reverse bold] {text} [/]" if active else f"[#9E9E9E] {text} [/]"
+
+    async def stream_response(self, prompt: str, on_frame, make_iterator=None) -> str:
+        """
+        Transmite la respuesta de `prompt` con el RenderScheduler y retorna el texto
+        completo. `on_frame(texto)` se llama como máximo una vez por cuadro; la
+        estimación de tokens (`live_tokens`) y los TPS se actualizan por token.
+        `make_iterator` reemplaza al stream del proveedor (p.ej. uno validado).
+        """
+        provider = self.provider
+        last_window = time.time()
+        tokens_in_window = 0
+
+        def on_token(token):
+            nonlocal last_window, tokens_in_window, own_tokens
+            estimate = estimate_tokens(token)
+            self.live_tokens += estimate
+            own_tokens += estimate
+            tokens_in_window += estimate
+            now = time.time()
+            if now - last_window >= TPS_WINDOW:
+                self.tokens_per_second = tokens_in_window / (now - last_window)
+                last_window, tokens_in_window = now, 0
+
+        own_tokens = 0  # Los turnos independientes suman su estimación en paralelo a la del turno en curso
+        scheduler = RenderScheduler()
+        try:
+            # La lectura de red corre en un hilo (o de forma asíncrona nativa si el proveedor lo soporta)
+            if make_iterator is not None:
+                response = await scheduler.run(make_iterator, on_frame, on_token)
+            elif hasattr(provider, "astream_message"):
+                response = await scheduler.run(lambda: provider.astream_message(prompt), on_frame, on_token,
+                                               asynchronous=True)
+            else:
+                response = await scheduler.run(lambda: provider.stream_message(prompt), on_frame, on_token)
+        finally:
+            self.live_tokens -= own_tokens
+        return response
+
+    def finish_turn(self, turn_usage, elapsed: float = None):
+        """Suma el uso real informado del turno y calcula los TPS finales."""
+        self.token_count += turn_usage["prompt_tokens"] + turn_usage["completion_tokens"]
+        if elapsed:
+            self.tokens_per_second = turn_usage["completion_tokens"] / elapsed
+
+    def __repr__(self):
+        return f"ChatTab({self.number}, {self.provider_name!r}, {self.model!r}, busy={self.busy})"
@@ -5,19 +5,43 @@ from textual.binding import Binding
 from rich.panel import Panel
 from rich.align import Align
 from rich.markdown import Markdown
+from rich.table import Table
 import asyncio
+import json
 import os
 import time
 from datetime import datetime
-from .history import load_history, save_history, clear_history, export_history_txt
+from .history import clear_history
+from .conversation import Conversation, now_timestamp
+from .tabs import HIST_FILE, ChatTab, history_file_for
+from .pipeline import parse_prompt
+from .usage import UsageTracker, provider_name_of
+from .daemon import RemoteProvider
+from .highlight import CachedMarkdown, get_highlight_cache
+from .config import add_reload_listener, get_setting, reload_config, remove_reload_listener
+from .structured import StructuredStream, apply_schema, load_schema
 from textual.reactive import reactive
 
-# Archivo de historial por defecto
-HIST_FILE = "history.json"
+# Archivo de exportación por defecto (history.json de la primera pestaña viene de tabs.py)
 EXPORT_FILE = "historial.txt"
+INFO_TITLE = "[bold grey]Info[/]"
+
+# Segundos entre comprobaciones de cambios en config.yaml (tui.config_watch_interval)
+CONFIG_WATCH_INTERVAL = 2.0
+# Segundos entre refrescos de la barra de estado mientras hay prompts en cola
+QUEUE_REFRESH_INTERVAL = 1.0
 
 # Constantes para Model Context Protocol
-MCP_ENABLED = False  # Activar cuando se implemente completamente
+MCP_ENABLED = False  # Valor por defecto si el proveedor no indica mcp_enabled
+
+def _format_bytes(num_bytes):
+    """Formatea un tamaño en bytes de forma legible (p.ej. 4.1 GB)."""
+    size = float(num_bytes or 0)
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}" if unit != "B" else f"{int(size)} B"
+        size /= 1024
+    return f"{size:.1f} TB"
 
 class ChatApp(App):
     """Textual-based TUI para Chat CLI con historial, atajos y mejoras visuales."""
@@ -50,6 +74,11 @@ class ChatApp(App):
     ScrollableContainer#messages_panel {
         background: black;
     }
+    Static#tab_bar {
+        background: black;
+        height: 1;
+        padding: 0 1;
+    }
     Static#status_text {
         background: black;
         color: grey;       /* Default text to grey for labels */
@@ -70,29 +99,6 @@ class ChatApp(App):
     Static.llm_message Markdown { /* Default text color for markdown inside LLM panels */
         color: white;
     }
-    Static.llm_message Markdown code_block { /* Markdown code blocks */
-        background: rgb(35,35,40);
-        color: #AFEEEE; /* PaleTurquoise */
-        padding: 1 2;
-        border: round rgb(60,60,60);
-    }
-    Static.llm_message Markdown code { /* Inline code */
-        background: rgb(50,50,50);
-        color: #AFEEEE; /* PaleTurquoise */
-        padding: 0 1;
-    }
-    Static.llm_message Markdown b, Static.llm_message Markdown strong { /* Bold text */
-        color: #FFFFE0; /* LightYellow */
-        text-style: bold;
-    }
-    Static.llm_message Markdown a { /* Links */
-        color: #ADD8E6; /* LightBlue */
-        text-style: underline;
-    }
-    Static.llm_message Markdown h1, Static.llm_message Markdown h2, Static.llm_message Markdown h3 {
-        text-style: bold;
-        color: #ADD8E6; /* LightBlue for headings */
-    }
     Static.info_message Panel {
         border: round grey;
     }
@@ -110,46 +116,99 @@ class ChatApp(App):
         Binding("ctrl+e", "exportar_historial", "Exportar historial"),
         Binding("ctrl+c", "limpiar_pantalla", "Limpiar pantalla"),
         Binding("ctrl+h", "mostrar_ayuda", "Mostrar ayuda"),
+        Binding("ctrl+t", "nueva_pestana", "Nueva pestaña"),
+        Binding("ctrl+pagedown", "pestana_siguiente", "Pestaña siguiente", show=False),
+        Binding("ctrl+pageup", "pestana_anterior", "Pestaña anterior", show=False),
         Binding("ctrl+q", "salir", "Salir")
     ]
 
     # Reactive attributes auto-update UI
     status_text: str = reactive("")
-    history: list = reactive([])
-    token_count: int = reactive(0)
-    tokens_per_second: float = reactive(0.0)
 
-    def __init__(self, provider, model, stream=False):
+    def __init__(self, provider, model, stream=False, schema=None):
         """Inicializa la aplicación TUI con el proveedor y modelo seleccionados."""
         super().__init__()
-        # Evitar que watch_history se ejecute durante inicialización
+        # Evitar que los watchers reactivos actualicen widgets durante la inicialización
         self._initializing = True
-        self.provider = provider
-        self.model = model
-        self.stream = stream
-        # reactive history will load on mount
-        self.token_count = 0
-        self.tokens_per_second = 0.0
-        self.start_time = 0.0
-        self.last_token_time = 0.0
+        # Cada pestaña tiene su proveedor, modelo y conversación; la primera usa history.json
+        self.tabs = [ChatTab(1, provider, model, stream)]
+        self.tab = self.tabs[0]  # Pestaña visible
+        self.tab.schema = schema
+        self._next_tab_number = 2
         self.last_activity = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self.mcp_enabled = MCP_ENABLED
+        self.recall_index = None    # Memoria de conversaciones anteriores (/recall), creada al usarse
+        self.recall_error = None    # Último fallo al indexar en segundo plano (se muestra en la barra de estado)
+        # Contabilidad de tokens/costo por sesión y por día (todas las pestañas)
+        self.usage = UsageTracker()
         # Prepare initial status (para asignar tras montaje)
-        self._initial_status_text = f"Modelo: {model} | Tokens: 0 | TPS: 0.0 | Streaming: {'Activado' if stream else 'Desactivado'} | MCP: {'Activado' if self.mcp_enabled else 'Desactivado'}"
+        self._initial_status_text = f"Modelo: {model} | Tokens: 0 | TPS: 0.0 | Streaming: {'Activado' if stream else 'Desactivado'} | MCP: {'Activado' if self.tab.mcp_enabled else 'Desactivado'}"
+
+    # Atajos a la pestaña visible
+    @property
+    def provider(self):
+        return self.tab.provider
+
+    @property
+    def model(self):
+        return self.tab.model
+
+    @property
+    def stream(self):
+        return self.tab.stream
+
+    @property
+    def conversation(self):
+        return self.tab.conversation
+
+    @property
+    def history(self):
+        """Contexto activo de la conversación (compatibilidad con el antiguo atributo reactivo)."""
+        return self.tab.conversation
 
     def load_and_show_history(self):
-        """Carga el historial desde archivo y lo muestra en la TUI al iniciar."""
-        # Carga reactiva de historial; la UI se actualizará en watch_history
-        try:
-            self.history = load_history(HIST_FILE)
-            if not self.history: # Ensure history is not None if file was empty/corrupt
-                self.history = []
-        except Exception:
-            self.history = []
+        """Carga history.json al iniciar: los chats anteriores quedan archivados hasta /loadhistory."""
+        conversation = self.tabs[0].conversation
+        loaded = Conversation.load(HIST_FILE)
+        conversation.messages[:0] = loaded.messages
+        conversation.start += len(loaded.messages)
+
+    async def _restore_history(self):
+        """/loadhistory: devuelve los chats anteriores al contexto que recibe el modelo."""
+        tab = self.tab
+        restored = tab.conversation.restore()
+        if not restored:
+            message = "No hay mensajes anteriores por restaurar."
+        elif getattr(tab.provider, "history", None) is tab.conversation:
+            message = f"{restored} mensajes anteriores restaurados en el contexto del modelo."
+        else:
+            # El proveedor no envía la conversación: solo vuelven a la transcripción guardada
+            message = (f"{restored} mensajes anteriores restaurados en el historial; "
+                       f"{tab.provider_name} no los recibe como contexto.")
+        if restored and tab.compactor:
+            summary = tab.compactor.attach(tab.conversation)
+            if summary:
+                message += f" Se reutiliza el resumen guardado de los primeros {summary.count} mensajes."
+            tab.compactor.schedule(tab.conversation)
+        self._post(tab, "info", message)
+
+    def _record_turn(self, tab, start, text, user_timestamp, response=None):
+        """
+        Deja el turno en la conversación tal como lo escribió el usuario: descarta lo
+        que haya añadido el proveedor (el prompt con adjuntos, o nada si no guarda
+        historial) y añade el par usuario/asistente con sus marcas de tiempo.
+        """
+        del tab.conversation[start:]
+        tab.conversation.add("user", text, user_timestamp)
+        if response is not None:
+            tab.conversation.add("assistant", response, now_timestamp())
+        tab.conversation.save(tab.history_file)
+        if tab.compactor:
+            tab.compactor.schedule(tab.conversation)
 
     def compose(self) -> ComposeResult:
         """Define la estructura de la interfaz de usuario."""
         yield Header()
+        yield Static("", id="tab_bar")
         yield ScrollableContainer(id="messages_panel")
         yield Input(placeholder="Escribe un mensaje... (Ctrl+H para ayuda)", id="input_panel")
         yield Footer()
@@ -163,19 +222,197 @@ class ChatApp(App):
         widgets_to_remove = list(panel.children)
         for widget in widgets_to_remove:
             widget.remove()
-        # Mensaje de bienvenida
-        panel.mount(Static(Align(Panel(
-            "Chat limpio. Escribe /loadhistory para ver chats anteriores.", title="[bold grey]Info[/]"
-        ), align="center"), classes="info_message")) # Added class for styling
         # Set initial status_text
         self.status_text = self._initial_status_text
         # Load history after UI listo
         self.load_and_show_history()
+        # Repintar mensajes cuando termine un resaltado de código en segundo plano
+        get_highlight_cache().add_listener(self._on_highlight_ready)
+        # Aplicar cambios de config.yaml sin reiniciar
+        add_reload_listener(self._on_config_reloaded)
+        interval = float(get_setting("tui", "config_watch_interval", CONFIG_WATCH_INTERVAL))
+        if interval > 0:
+            self.set_interval(interval, reload_config)
+        # Las esperas de la cola avanzan aunque no lleguen tokens
+        self.set_interval(QUEUE_REFRESH_INTERVAL, self._refresh_queue_status)
+        # Precargar el modelo en segundo plano (p.ej. Ollama) mientras el usuario escribe
+        self._warm_up(self.tab)
         # Montaje completado
         self._initializing = False
+        # Mensaje de bienvenida
+        self._post(self.tab, "info", "Chat limpio. Escribe /loadhistory para ver chats anteriores.")
+        self._update_tab_bar()
+
+    def _refresh_queue_status(self):
+        if self.tab.queue:
+            self._update_status_bar()
+
+    def _warm_up(self, tab):
+        if hasattr(tab.provider, "warm_up"):
+            self.run_worker(tab.provider.warm_up, thread=True, group="warm_up", exit_on_error=False)
+
+    # --- Transcripción de las pestañas ---
+
+    def _panel(self):
+        return self.query_one("#messages_panel", ScrollableContainer)
+
+    def _widget_for(self, entry):
+        if entry.kind == "llm":
+            widget = Static(classes="llm_message")
+            self._update_llm_widget(widget, entry.content, entry.title)
+            return widget
+        align = "left" if entry.kind == "user" else "center"
+        return Static(Align(Panel(entry.content, title=entry.title), align=align), classes=f"{entry.kind}_message")
+
+    def _post(self, tab, kind, content, title=INFO_TITLE):
+        """
+        Añade un mensaje a la transcripción de `tab`. Solo se crea su widget si la
+        pestaña está a la vista; si no, cuenta como no leído en la barra de pestañas.
+        """
+        visible = tab is self.tab
+        entry = tab.add(kind, content, title, visible=visible)
+        if visible:
+            entry.widget = self._widget_for(entry)
+            panel = self._panel()
+            panel.mount(entry.widget)
+            panel.scroll_end(animate=False)
+        else:
+            self._update_tab_bar()
+        return entry
+
+    def _update_entry(self, entry, content, title=None, kind=None):
+        """Cambia un mensaje ya publicado; se repinta solo si su widget está montado."""
+        entry.content = content
+        entry.title = title or entry.title
+        entry.kind = kind or entry.kind
+        widget = entry.widget
+        if widget is None:
+            return
+        if entry.kind == "llm":
+            self._update_llm_widget(widget, content, entry.title)
+        else:
+            widget.update(Align(Panel(content, title=entry.title), align="center"))
+            widget.set_classes(f"{entry.kind}_message")
+
+    def _remove_entry(self, tab, entry):
+        tab.discard(entry)
+        if entry.widget is not None:
+            entry.widget.remove()
+            entry.widget = None
+
+    # --- Pestañas ---
+
+    def _update_tab_bar(self):
+        if self._initializing:
+            return
+        try:
+            bar = self.query_one("#tab_bar", Static)
+        except Exception:
+            return
+        # Con una sola pestaña la barra no ocupa espacio
+        bar.display = len(self.tabs) > 1
+        bar.update(" ".join(tab.label(active=tab is self.tab) for tab in self.tabs))
+
+    async def _show_tab(self, tab):
+        """
+        Muestra `tab`: los widgets de la pestaña anterior se desmontan (solo queda
+        su transcripción en texto) y se montan los de la nueva.
+        """
+        panel = self._panel()
+        if tab is not self.tab:
+            self.tab.release_widgets()
+            await panel.remove_children()
+            self.tab = tab
+            widgets = []
+            for entry in tab.transcript:
+                entry.widget = self._widget_for(entry)
+                widgets.append(entry.widget)
+            if widgets:
+                await panel.mount_all(widgets)
+        tab.unread = 0
+        panel.scroll_end(animate=False)
+        self._update_tab_bar()
+        self._update_status_bar()
+
+    async def _new_tab(self, name=None, model=None):
+        """Abre una pestaña con su propio proveedor (por defecto, el mismo proveedor y modelo de la visible)."""
+        from .providers import create_provider
+        current = self.tab
+        name = (name or current.provider_key).lower()
+        if model is None and name == current.provider_key:
+            model = current.model_key
+        kwargs = {"mcp_enabled": False} if name == "anthropic" else {}
+        try:
+            provider = await asyncio.to_thread(create_provider, name, model, **kwargs)
+        except Exception as e:
+            self._post(current, "error", f"No se pudo abrir la pestaña con {name}: {e}", "[bold red]Error[/]")
+            return None
+        number = self._next_tab_number
+        self._next_tab_number += 1
+        # Como la primera pestaña, los chats anteriores de su archivo quedan archivados hasta /loadhistory
+        history_file = history_file_for(number)
+        tab = ChatTab(number, provider, getattr(provider, "model", None) or model, stream=current.stream,
+                      conversation=Conversation.load(history_file), history_file=history_file)
+        self.tabs.append(tab)
+        await self._show_tab(tab)
+        self._post(tab, "info", f"Pestaña {number}: {name} ({tab.model}). Historial en {history_file}.")
+        self._warm_up(tab)
+        return tab
+
+    async def _close_tab(self, tab=None):
+        tab = tab or self.tab
+        if len(self.tabs) == 1:
+            self._post(tab, "info", "No se puede cerrar la única pestaña. Usa Ctrl+Q para salir.")
+            return
+        # Una respuesta en curso se cancela; lo ya recibido no se guarda
+        self.workers.cancel_group(self, f"tab-{tab.number}")
+        position = self.tabs.index(tab)
+        self.tabs.remove(tab)
+        if tab is self.tab:
+            await self._show_tab(self.tabs[min(position, len(self.tabs) - 1)])
+        tab.release_widgets()
+        from .providers.connection import stop_prewarm
+        # Su proveedor ya no se usa: que deje de sondear la API cada pocos segundos
+        stop_prewarm(tab.provider)
+        self._update_tab_bar()
+
+    async def _cycle_tab(self, step):
+        position = self.tabs.index(self.tab)
+        await self._show_tab(self.tabs[(position + step) % len(self.tabs)])
+
+    async def _tab_command(self, args):
+        """/tab [new [proveedor] [modelo] | close | <n>]: abre, cierra o cambia de pestaña."""
+        if not args:
+            lines = [f"{'›' if tab is self.tab else ' '} {tab.number}: {tab.provider_name} ({tab.model})"
+                     f"{' — respondiendo' if tab.busy else ''}{f' — {len(tab.queue)} en cola' if tab.queue else ''}"
+                     f"{f' — {tab.unread} sin leer' if tab.unread else ''}"
+                     for tab in self.tabs]
+            self._post(self.tab, "info", "\n".join(lines) +
+                       "\n\nUso: /tab new [proveedor] [modelo], /tab <n>, /tab close", "[bold grey]Pestañas[/]")
+        elif args[0].lower() in ("new", "nueva"):
+            await self._new_tab(*args[1:3])
+        elif args[0].lower() in ("close", "cerrar"):
+            await self._close_tab()
+        else:
+            tab = next((tab for tab in self.tabs if str(tab.number) == args[0]), None)
+            if tab is None:
+                self._post(self.tab, "info", f"No existe la pestaña {args[0]}. Escribe /tab para verlas.")
+            else:
+                await self._show_tab(tab)
+
+    async def action_nueva_pestana(self):
+        await self._new_tab()
+
+    async def action_pestana_siguiente(self):
+        await self._cycle_tab(1)
+
+    async def action_pestana_anterior(self):
+        await self._cycle_tab(-1)
+
+    # --- Turnos ---
 
     async def on_input_submitted(self, event: Input.Submitted) -> None:
-        """Gestiona el envío de mensajes y la respuesta del modelo."""
+        """Gestiona el envío de mensajes: el turno corre en un worker de la pestaña visible."""
         text = event.value.strip()
         if not text:
             return
@@ -185,138 +422,188 @@ class ChatApp(App):
             await self._process_command(text)
             event.input.value = ""
             return
-            
-        # Guardar usuario en historial; UI se actualiza en watch_history
-        self.last_activity = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self.history = self.history + [{"role": "user", "content": text, "timestamp": self.last_activity}]
-        save_history(self.history, HIST_FILE)
+
+        tab = self.tab
+        event.input.value = ""
+        text, independent = parse_prompt(text)
+        if not text:
+            return
+        if tab.busy and independent:
+            # No depende de la respuesta en curso: se envía ya, en paralelo
+            self.run_worker(self._run_independent_turn(tab, text), group=f"tab-{tab.number}", exit_on_error=False)
+        elif tab.busy:
+            # Una petición en curso por pestaña: el prompt espera su turno en la cola
+            pending = tab.queue.push(text)
+            pending.entry = self._post(tab, "user", text, self._pending_title(pending))
+            self._update_tab_bar()
+            self._update_status_bar()
+        else:
+            self._start_turn(tab, text)
+
+    def _start_turn(self, tab, text):
+        tab.busy = True
+        tab.turn_start = len(tab.conversation)
+        self._update_tab_bar()
+        # No se espera al turno: las demás pestañas (y la interfaz) siguen respondiendo
+        self.run_worker(self._run_turn(tab, text), group=f"tab-{tab.number}", exit_on_error=False)
+
+    @staticmethod
+    def _pending_title(pending):
+        return f"[#9E9E9E]Tú — en cola #{pending.number} (/queue para editar o cancelar)[/]"
+
+    def _dispatch_next(self, tab):
+        """Terminado un turno, despacha el siguiente prompt de la cola de `tab`."""
+        if tab not in self.tabs:
+            return  # Pestaña cerrada: su cola se descarta
+        pending = tab.queue.pop()
+        if pending is None:
+            return
+        if pending.entry is not None:
+            self._remove_entry(tab, pending.entry)
+        self._start_turn(tab, pending.text)
+
+    async def _run_independent_turn(self, tab, text):
+        """Turno `&` en paralelo al turno en curso, con otra instancia del proveedor y una copia del contexto."""
+        from .providers import create_provider
+        kwargs = {"mcp_enabled": tab.mcp_enabled} if tab.provider_key == "anthropic" else {}
+        try:
+            provider = await asyncio.to_thread(create_provider, tab.provider_key, tab.model_key, **kwargs)
+        except Exception as e:
+            self._post(tab, "error", f"No se pudo enviar en paralelo ({e}); el prompt queda en cola.",
+                       "[bold red]Error[/]")
+            pending = tab.queue.push(text)
+            pending.entry = self._post(tab, "user", text, self._pending_title(pending))
+            if not tab.busy:
+                self._dispatch_next(tab)
+            return
+        if hasattr(provider, "history"):
+            # Solo los intercambios completos: el turno en curso aún no tiene respuesta
+            provider.history = Conversation(tab.conversation[:tab.turn_start] if tab.busy else list(tab.conversation))
+        tab.parallel += 1
+        self._update_tab_bar()
+        await self._run_turn(tab, text, provider)
+
+    async def _run_turn(self, tab, text, provider=None):
+        """
+        Envía `text` con el proveedor de `tab` y muestra la respuesta en su transcripción.
+        Con `provider` (turno independiente) el turno no ocupa la pestaña ni su cola.
+        """
+        independent = provider is not None
+        provider = provider or tab.provider
+        # El turno se registra en la conversación al terminar; el proveedor añade el suyo mientras tanto
+        self.last_activity = now_timestamp()
+        user_timestamp = self.last_activity
+        turn_start = len(tab.conversation)
         # Mostrar mensaje del usuario inmediatamente
-        panel = self.query_one("#messages_panel", ScrollableContainer)
         # Using Rich BBCode for title color as CSS targeting panel titles is unreliable
-        user_widget = Static(Align(Panel(text, title=f"[bold #00FFFF]Tú[/] [{self.last_activity}]"), align="left"), classes="user_message")
-        await panel.mount(user_widget)
-        panel.scroll_end(animate=False)
-        event.input.value = ""
-        
-        # Actualizar última actividad
-        self.last_activity = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        # Montar respuesta del modelo en streaming o no
+        self._post(tab, "user", text, f"[bold #00FFFF]Tú[/] [{self.last_activity}]")
+        thinking = None
         try:
+            # Con un directorio adjunto, el prompt lleva delante los fragmentos relevantes
+            prompt = text
+            if tab.attached_index is not None:
+                prompt = await asyncio.to_thread(tab.attached_index.augment_prompt, text)
+            if tab.recalled_context:
+                prompt = f"{tab.recalled_context}\n\n{prompt}"
+                tab.recalled_context = None
             # Mostrar indicador de "pensando..."
-            thinking_widget = Static(Align(Panel(
-                "Pensando...", 
-                title="[bold grey]Estado[/]" # Styled title
-            ), align="center"), classes="info_message") # Added class
-            panel = self.query_one("#messages_panel", ScrollableContainer)
-            await panel.mount(thinking_widget)
-            panel.scroll_end(animate=False)
-            
-            if self.stream and hasattr(self.provider, "stream_message"):
-                # Eliminar indicador de pensando
-                thinking_widget.remove()
-                
-                # Crear widget para respuesta en streaming
-                timestamp = datetime.now().strftime("%H:%M:%S")
-                # Using Rich BBCode for title color
-                resp_widget = Static(Align(Panel(
-                    "", 
-                    title=f"[bold #ADD8E6]LLM[/] [{timestamp}]" # LightBlue for LLM title
-                ), align="right"), classes="llm_message")
-                await panel.mount(resp_widget)
-                
-                # Iniciar conteo de tokens por segundo
-                self.start_time = time.time()
-                self.last_token_time = self.start_time
-                tokens_in_window = 0
-                time_window = 1.0  # Ventana de 1 segundo para calcular TPS
-                
-                # Procesar tokens en streaming
-                full_response = ""
-                batch_tokens = []
-                flush_interval = 0.2  # segundos
-                last_flush = time.time()
-                for token in self.provider.stream_message(text):
-                    current_time = time.time()
-                    self.token_count += 1
-                    tokens_in_window += 1
-                    
-                    # Calcular tokens por segundo en la ventana actual
-                    elapsed = current_time - self.last_token_time
-                    if elapsed >= time_window:
-                        self.tokens_per_second = tokens_in_window / elapsed
-                        self.last_token_time = current_time
-                        tokens_in_window = 0
-                    
-                    full_response += token
-                    batch_tokens.append(token)
-                    # Flush si alcanza tamaño o intervalo
-                    if len(batch_tokens) >= 5 or (current_time - last_flush) >= flush_interval:
-                        from rich.markdown import Markdown
-                        resp_widget.update(Align(Panel(
-                            Markdown(full_response), # Markdown content
-                            title=f"[bold #ADD8E6]LLM[/] [{timestamp}]" # Keep title styled
-                        ), align="right"))
-                        panel.scroll_end(animate=False)
+            thinking = self._post(tab, "info", "Pensando...", "[bold grey]Estado[/]")
+
+            # Con un esquema JSON la respuesta se valida mientras llega (siempre en streaming)
+            structured = StructuredStream(provider, tab.schema) if tab.schema is not None else None
+            if (tab.stream or structured) and hasattr(provider, "stream_message"):
+                self._remove_entry(tab, thinking)
+                thinking = None
+                # LightBlue para el título del LLM
+                reply = self._post(tab, "llm", "", f"[bold #ADD8E6]LLM[/] [{datetime.now().strftime('%H:%M:%S')}]")
+                posted_visible = reply.widget is not None
+
+                def on_frame(partial_response):
+                    # En segundo plano solo se guarda el texto: no hay widget que repintar
+                    self._update_entry(reply, partial_response)
+                    if tab is self.tab:
+                        self._panel().scroll_end(animate=False)
                         self._update_status_bar()
-                        batch_tokens.clear()
-                        last_flush = current_time
-                    await asyncio.sleep(0)
-                
-                # Calcular TPS final
-                total_time = time.time() - self.start_time
-                if total_time > 0:
-                    self.tokens_per_second = len(full_response) / total_time
-                
-                # Flush final de tokens restantes
-                if batch_tokens:
-                    from rich.markdown import Markdown
-                    resp_widget.update(Align(Panel(
-                        Markdown(full_response), # Markdown content
-                        title=f"[bold #ADD8E6]LLM[/] [{timestamp}]" # Keep title styled
-                    ), align="right"))
-                    panel.scroll_end(animate=False)
-                
-                # Guardar asistente en historial; UI se actualiza en watch_history
-                ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                self.history = self.history + [{"role": "assistant", "content": full_response, "timestamp": ts}]
-                save_history(self.history, HIST_FILE)
+                    else:
+                        self._update_tab_bar()
+
+                start = time.time()
+                make_iterator = None
+                if structured:
+                    make_iterator = lambda: structured.text(prompt)
+                elif independent:
+                    make_iterator = lambda: provider.stream_message(prompt)
+                response = await tab.stream_response(prompt, on_frame, make_iterator)
+                elapsed = time.time() - start
+                if structured:
+                    response = f"```json\n{json.dumps(structured.value, indent=2, ensure_ascii=False)}\n```"
+                    self._update_entry(reply, response)
+                if posted_visible and tab is not self.tab:
+                    tab.unread += 1  # Terminó mientras el usuario estaba en otra pestaña
             else:
-                # Obtener respuesta completa
-                response = self.provider.send_message(text)
-                
-                # Eliminar indicador de pensando
-                thinking_widget.remove()
-                
-                # Guardar asistente en historial; UI se actualiza en watch_history
-                self.token_count += len(response.split())
-                self._update_status_bar()
-                ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                # Render assistant message directly, now with Markdown for consistency
-                assistant_widget = Static(Align(Panel(
-                    Markdown(response), # Render as Markdown
-                    title=f"[bold #ADD8E6]LLM[/] [{ts}]"
-                ), align="right"), classes="llm_message")
-                await panel.mount(assistant_widget)
-                panel.scroll_end(animate=False)
-
-                self.history = self.history + [{"role": "assistant", "content": response, "timestamp": ts}]
-                save_history(self.history, HIST_FILE)
+                # Obtener respuesta completa (en un hilo para no bloquear la UI)
+                response = await asyncio.to_thread(provider.send_message, prompt)
+                elapsed = None
+                self._remove_entry(tab, thinking)
+                thinking = None
+                self._post(tab, "llm", response, f"[bold #ADD8E6]LLM[/] [{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}]")
+
+            # Registrar uso real del turno (reemplaza la estimación en vivo) y TPS final
+            turn_usage = self.usage.record_turn(provider_name_of(provider), self._turn_model(tab), provider, prompt, response)
+            tab.finish_turn(turn_usage, elapsed)
+            self._finish_turn_record(tab, independent, turn_start, text, user_timestamp, response)
+            self._schedule_recall_sync(tab)
+            self._show_tool_calls(tab, provider)
         except Exception as e:
             # Manejar errores
-            if 'thinking_widget' in locals():
-                thinking_widget.remove()
-            error_msg = f"[Error] {e}"
-            panel = self.query_one("#messages_panel", ScrollableContainer)
-            await panel.mount(Static(Align(Panel(
-                error_msg, 
-                title="[bold red]Error[/]" # Styled title
-            ), align="center"), classes="error_message"))
-            panel.scroll_end(animate=False)
+            if thinking is not None:
+                self._remove_entry(tab, thinking)
+            self._finish_turn_record(tab, independent, turn_start, text, user_timestamp)
+            self._post(tab, "error", f"[Error] {e}", "[bold red]Error[/]")
+        finally:
+            if independent:
+                tab.parallel -= 1
+            else:
+                tab.busy = False
+                # Los turnos independientes que terminaron mientras tanto van después de este
+                for deferred in tab.deferred_turns:
+                    self._record_turn(tab, len(tab.conversation), *deferred)
+                tab.deferred_turns.clear()
+                self._dispatch_next(tab)
+            self._update_tab_bar()
+            if tab is self.tab:
+                self._update_status_bar()
+
+    def _finish_turn_record(self, tab, independent, start, text, user_timestamp, response=None):
+        if not independent:
+            self._record_turn(tab, start, text, user_timestamp, response)
+        elif tab.busy:
+            # No se intercala con el turno en curso, que aún no se ha registrado
+            tab.deferred_turns.append((text, user_timestamp, response))
+        else:
+            self._record_turn(tab, len(tab.conversation), text, user_timestamp, response)
+
+    def _update_llm_widget(self, widget, markdown_text, title):
+        """Renderiza una respuesta del modelo; el código resaltado se reutiliza desde la caché."""
+        widget.markdown_source = markdown_text
+        widget.panel_title = title
+        widget.update(Align(Panel(CachedMarkdown(markdown_text), title=title), align="right"))
+
+    def _on_highlight_ready(self):
+        """Un bloque grande terminó de resaltarse en segundo plano (llamado desde otro hilo)."""
+        try:
+            self.call_from_thread(self._refresh_llm_widgets)
+        except RuntimeError:
+            pass  # La app ya no está corriendo
+
+    def _refresh_llm_widgets(self):
+        for widget in self.query(".llm_message"):
+            source = getattr(widget, "markdown_source", None)
+            if source is not None:
+                self._update_llm_widget(widget, source, widget.panel_title)
 
     async def _process_command(self, text):
         """Procesa comandos especiales que comienzan con /."""
-        panel = self.query_one("#messages_panel", ScrollableContainer)
         command = text.lower().strip()
         
         if command in ("/help", "/ayuda"):
@@ -325,141 +612,412 @@ class ChatApp(App):
             await self.action_limpiar_pantalla()
         elif command in ("/clearhistory", "/limpiarhistorial"):
             await self.action_limpiar_historial()
-        elif command in ("/export", "/exportar"):
-            await self.action_exportar_historial()
+        elif command.split()[0] in ("/export", "/exportar"):
+            await self.action_exportar_historial(*command.split()[1:2])
         elif command.startswith("/loadhistory") or command.startswith("/cargarhistorial"):
-            self.load_and_show_history()
+            await self._restore_history()
             self._update_status_bar()
+        elif command.startswith("/attach") or command.startswith("/adjuntar"):
+            await self._attach_directory(text.split(maxsplit=1)[1:])
+        elif command.startswith("/recall") or command.startswith("/recordar"):
+            await self._recall(text.split(maxsplit=1)[1:])
         elif command.startswith("/mcp"):
-            mcp_info_title = "[bold grey]Info MCP[/]"
-            if " on" in command or " activar" in command:
-                self.mcp_enabled = True
-                await panel.mount(Static(Align(Panel(
-                    "Model Context Protocol activado", 
-                    title=mcp_info_title
-                ), align="center"), classes="info_message"))
-            elif " off" in command or " desactivar" in command:
-                self.mcp_enabled = False
-                await panel.mount(Static(Align(Panel(
-                    "Model Context Protocol desactivado", 
-                    title=mcp_info_title
-                ), align="center"), classes="info_message"))
-            else:
-                await panel.mount(Static(Align(Panel(
-                    "Uso: /mcp on|off o /mcp activar|desactivar", 
-                    title=mcp_info_title
-                ), align="center"), classes="info_message"))
-            self._update_status_bar()
+            await self._set_mcp(command)
+        elif command.startswith("/ollama"):
+            await self._show_ollama_status(command)
+        elif command.split()[0] in ("/tab", "/tabs", "/pestana", "/pestaña"):
+            await self._tab_command(text.split()[1:])
+        elif command.split()[0] in ("/queue", "/cola"):
+            self._queue_command(text.split(maxsplit=2)[1:])
+        elif command.split()[0] in ("/schema", "/esquema"):
+            self._set_schema(text.split(maxsplit=1)[1:])
         else:
-            await panel.mount(Static(Align(Panel(
-                f"Comando desconocido: {text}. Escribe /help para ver los comandos disponibles.", 
-                title="[bold grey]Info[/]"
-            ), align="center"), classes="info_message"))
-        panel.scroll_end(animate=False)
+            self._post(self.tab, "info", f"Comando desconocido: {text}. Escribe /help para ver los comandos disponibles.")
         
+    async def _attach_directory(self, args):
+        """Indexa un directorio (/attach <dir>) para añadir sus fragmentos relevantes a cada prompt."""
+        from .retrieval import open_index
+        tab = self.tab
+        title = "[bold grey]Adjuntos[/]"
+        if not args:
+            message = "Uso: /attach <directorio> o /attach off"
+            if tab.attached_index is not None:
+                message += f"\nAdjunto actual: {tab.attached_index.root}"
+        elif args[0].strip().lower() in ("off", "ninguno"):
+            tab.attached_index = None
+            message = "Directorio adjunto retirado."
+        else:
+            start = time.perf_counter()
+            try:
+                tab.attached_index, stats = await asyncio.to_thread(open_index, os.path.expanduser(args[0].strip()))
+                message = (f"Adjuntado {tab.attached_index.root}: {stats['files']} archivos, {stats['chunks']} fragmentos "
+                           f"({stats['added'] + stats['updated']} indexados en {time.perf_counter() - start:.2f} s).")
+            except (OSError, ValueError) as e:
+                message = f"[red]No se pudo indexar: {e}[/]"
+        self._post(tab, "info", message, title)
+
+    def _get_recall_index(self):
+        if self.recall_index is None:
+            from .recall import RecallIndex
+            self.recall_index = RecallIndex()
+        return self.recall_index
+
+    def _schedule_recall_sync(self, tab):
+        """Indexa en segundo plano el intercambio recién guardado (recall.auto)."""
+        if get_setting("recall", "auto", False):
+            self.run_worker(lambda: self._sync_recall(tab), thread=True, group="recall", exit_on_error=False)
+
+    def _sync_recall(self, tab):
+        try:
+            self._get_recall_index().sync(list(tab.conversation.messages))
+        except Exception as e:
+            # Sin servidor o modelo de embeddings: se reintentará en el próximo turno
+            self.call_from_thread(self._set_recall_error, tab, f"{type(e).__name__}: {e}")
+        else:
+            if self.recall_error:
+                self.call_from_thread(self._set_recall_error, tab, None)
+
+    def _set_recall_error(self, tab, error):
+        if error and not self.recall_error:
+            # Solo se avisa del primer fallo; mientras persista queda indicado en la barra de estado
+            self._post(tab, "info", f"[red]No se pudo indexar el intercambio en la memoria (/recall): {error}[/]",
+                       "[bold grey]Recordar[/]")
+        self.recall_error = error
+        self._update_status_bar()
+
+    async def _recall(self, args):
+        """Busca intercambios anteriores similares (/recall <consulta>) y los añade al próximo prompt."""
+        tab = self.tab
+        title = "[bold grey]Recordar[/]"
+        if not args:
+            self._post(tab, "info", "Uso: /recall <consulta>", title)
+            return
+        try:
+            index = await asyncio.to_thread(self._get_recall_index)
+            await asyncio.to_thread(index.sync, list(tab.conversation.messages))
+            results = await asyncio.to_thread(index.search, args[0])
+        except Exception as e:
+            self._post(tab, "info", f"[red]No se pudo consultar la memoria (¿está Ollama corriendo con el modelo de "
+                                    f"embeddings?): {e}[/]", title)
+            return
+        if not results:
+            message = "No se encontraron intercambios anteriores relevantes."
+        else:
+            from .recall import format_recalled
+            tab.recalled_context = format_recalled(results)
+            lines = [f"[{result['timestamp']}] ({result['score']:.2f}) {result['text'].splitlines()[0][:100]}" for result in results]
+            message = "Se añadirán al próximo mensaje:\n" + "\n".join(lines)
+        self._post(tab, "info", message, title)
+
+    async def _set_mcp(self, command):
+        """Activa/desactiva MCP en el proveedor (/mcp on|off) y muestra las herramientas disponibles."""
+        tab = self.tab
+        title = "[bold grey]Info MCP[/]"
+        args = command.split()[1:]
+        if args not in (["on"], ["activar"], ["off"], ["desactivar"]):
+            message = "Uso: /mcp on|off o /mcp activar|desactivar"
+        elif not hasattr(tab.provider, "set_mcp_enabled"):
+            message = "Model Context Protocol solo está disponible con el proveedor Anthropic."
+        else:
+            tab.mcp_enabled = args[0] in ("on", "activar")
+            tab.provider.set_mcp_enabled(tab.mcp_enabled)
+            message = f"Model Context Protocol {'activado' if tab.mcp_enabled else 'desactivado'}"
+            if tab.mcp_enabled and not isinstance(tab.provider, RemoteProvider):
+                # Conectar ahora los servidores para no demorar el primer turno
+                from chat_cli.mcp import get_mcp_manager
+                manager = get_mcp_manager()
+                tools = await asyncio.to_thread(manager.connect, True)  # Reintenta también los que fallaron
+                message += f"\nHerramientas disponibles: {tools} ({len(manager.clients)} servidores)"
+                for name, error in manager.errors.items():
+                    message += f"\n[red]{name}: {error}[/]"
+        self._post(tab, "info", message, title)
+        self._update_status_bar()
+
+    def _queue_command(self, args):
+        """/queue [edit <n> <texto> | cancel <n>|all]: muestra, edita o cancela los prompts en cola."""
+        tab = self.tab
+        title = "[bold grey]Cola[/]"
+        action = args[0].lower() if args else None
+        if action is None:
+            if not tab.queue:
+                message = "No hay prompts en cola."
+            else:
+                message = "\n".join(f"#{item.number} ({item.waited():.0f} s): {item.text[:60]}" for item in tab.queue)
+            message += ("\n\nUso: /queue edit <n> <texto>, /queue cancel <n>|all. "
+                        "Empieza un prompt con & para enviarlo en paralelo sin esperar.")
+            self._post(tab, "info", message, title)
+            return
+        target = args[1].split(maxsplit=1) if len(args) > 1 else []
+        if action in ("cancel", "cancelar") and target and target[0].lower() in ("all", "todo", "todos"):
+            cancelled = tab.queue.clear()
+        elif action in ("cancel", "cancelar") and target and target[0].lstrip("#").isdigit():
+            cancelled = [item for item in [tab.queue.cancel(int(target[0].lstrip("#")))] if item is not None]
+        elif action in ("edit", "editar") and len(target) == 2 and target[0].lstrip("#").isdigit():
+            item = tab.queue.edit(int(target[0].lstrip("#")), target[1].strip())
+            if item is None:
+                self._post(tab, "info", f"No hay ningún prompt #{target[0].lstrip('#')} en cola.", title)
+            elif item.entry is not None:
+                self._update_entry(item.entry, item.text)
+            return
+        else:
+            self._post(tab, "info", "Uso: /queue, /queue edit <n> <texto>, /queue cancel <n>|all", title)
+            return
+        for item in cancelled:
+            if item.entry is not None:
+                self._remove_entry(tab, item.entry)
+        self._post(tab, "info", f"Prompts cancelados: {len(cancelled)}.", title)
+        self._update_tab_bar()
+        self._update_status_bar()
+
+    def _set_schema(self, args):
+        """/schema <archivo>|off: valida las respuestas de la pestaña contra un JSON Schema."""
+        tab = self.tab
+        title = "[bold grey]Esquema JSON[/]"
+        if not args:
+            state = "activado" if tab.schema is not None else "desactivado"
+            self._post(tab, "info", f"Esquema JSON {state}. Uso: /schema <archivo|JSON> o /schema off", title)
+            return
+        if args[0].strip().lower() in ("off", "desactivar"):
+            tab.schema = None
+            apply_schema(tab.provider, None)
+            self._post(tab, "info", "Esquema JSON desactivado.", title)
+            return
+        try:
+            tab.schema = load_schema(args[0].strip())
+        except (OSError, ValueError) as e:
+            self._post(tab, "error", f"[Error] {e}", "[bold red]Error[/]")
+            return
+        self._post(tab, "info", "Las respuestas de esta pestaña se validarán contra el esquema "
+                   "(se reintenta automáticamente si no lo cumplen).", title)
+
+    def _show_tool_calls(self, tab, provider):
+        """Muestra las herramientas MCP que ejecutó el último turno con su duración."""
+        calls = getattr(provider, "last_tool_calls", None)
+        if not calls:
+            return
+        table = Table(box=None, show_header=True, header_style="bold")
+        table.add_column("Herramienta")
+        table.add_column("Servidor")
+        table.add_column("Tiempo", justify="right")
+        table.add_column("Estado")
+        for call in calls:
+            status = "[red]error[/]" if call.get("is_error") else "[green]ok[/]"
+            if call.get("cached"):
+                status += " (caché)"
+            table.add_row(call.get("name") or "", call.get("server") or "", f"{call.get('elapsed', 0) * 1000:.0f} ms", status)
+        self._post(tab, "info", table, "[bold grey]Herramientas MCP[/]")
+
+    async def _show_ollama_status(self, command):
+        """Muestra los modelos cargados en Ollama y su uso de memoria (/ollama ps)."""
+        tab = self.tab
+        title = "[bold grey]Ollama[/]"
+        if command.split()[1:] != ["ps"]:
+            self._post(tab, "info", "Uso: /ollama ps", title)
+            return
+        if not hasattr(tab.provider, "list_running_models"):
+            self._post(tab, "info", "El comando /ollama solo está disponible con el proveedor Ollama.", title)
+            return
+        try:
+            models = await asyncio.to_thread(tab.provider.list_running_models)
+        except Exception as e:
+            self._post(tab, "error", f"No se pudo consultar Ollama: {e}", "[bold red]Error[/]")
+            return
+        if not models:
+            self._post(tab, "info", "No hay modelos cargados en memoria.", title)
+            return
+        table = Table(box=None, header_style="bold")
+        table.add_column("Modelo")
+        table.add_column("Memoria", justify="right")
+        table.add_column("VRAM", justify="right")
+        table.add_column("Expira")
+        for model in models:
+            table.add_row(
+                model["name"] or "?",
+                _format_bytes(model["size"]),
+                _format_bytes(model["size_vram"]),
+                str(model["expires_at"] or "-"),
+            )
+        self._post(tab, "info", table, title)
+
+    def _turn_model(self, tab=None):
+        """Modelo que respondió el último turno (con el proveedor `auto`, el elegido por el enrutador)."""
+        tab = tab or self.tab
+        route = getattr(tab.provider, "route", None)
+        return route.model if route else tab.model
+
     def _update_status_bar(self):
-        """Actualiza la barra de estado con información actualizada usando Rich BBCode."""
+        """Actualiza la barra de estado de la pestaña visible usando Rich BBCode."""
+        tab = self.tab
         dim_color = "#9E9E9E"  # Grey for labels
         value_color = "#D0D0D0" # Light grey for values
         separator = f"[{dim_color}]|[/]"
 
-        model_str = f"[{dim_color}]Modelo:[/] [{value_color}]{self.model}[/]"
-        tokens_str = f"[{dim_color}]Tokens:[/] [{value_color}]{self.token_count}[/]"
-        tps_str = f"[{dim_color}]TPS:[/] [{value_color}]{self.tokens_per_second:.1f}[/]"
+        model_str = f"[{dim_color}]Modelo:[/] [{value_color}]{tab.model}[/]"
+        route = getattr(tab.provider, "route", None)
+        if route:
+            # Proveedor `auto`: backend elegido para el último turno y por qué
+            model_str = (f"[{dim_color}]Auto:[/] [{value_color}]{route.key}[/] "
+                         f"[{dim_color}]({route.reason})[/]")
+        # El conteo en vivo del turno en curso es una estimación local que se reemplaza por el uso real al terminar
+        live_tokens = sum(other.live_tokens for other in self.tabs)
+        tokens_str = (
+            f"[{dim_color}]Tokens:[/] [{value_color}]{tab.token_count + tab.live_tokens} (${self.usage.session['cost']:.4f})[/] "
+            f"[{dim_color}]Hoy:[/] [{value_color}]{self.usage.today_tokens + live_tokens} (${self.usage.today['cost']:.4f})[/]"
+        )
+        tps_str = f"[{dim_color}]TPS:[/] [{value_color}]{tab.tokens_per_second:.1f}[/]"
+
+        queue_str = ""
+        if tab.queue or tab.parallel:
+            # Profundidad de la cola, espera del más antiguo y media de los últimos despachados
+            queue_str = (f" {separator} [{dim_color}]Cola:[/] [yellow]{len(tab.queue)}[/] "
+                         f"[{dim_color}](espera {tab.queue.oldest_wait():.0f} s, media {tab.queue.average_wait():.0f} s"
+                         f"{f', {tab.parallel} en paralelo' if tab.parallel else ''})[/]")
 
-        stream_status_text = "Activado" if self.stream else "Desactivado"
-        stream_color = "green" if self.stream else "red"
+        stream_status_text = "Activado" if tab.stream else "Desactivado"
+        stream_color = "green" if tab.stream else "red"
         stream_str = f"[{dim_color}]Streaming:[/] [{stream_color}]{stream_status_text}[/]"
 
-        mcp_status_text = "Activado" if self.mcp_enabled else "Desactivado"
-        mcp_color = "green" if self.mcp_enabled else "red"
+        mcp_status_text = "Activado" if tab.mcp_enabled else "Desactivado"
+        mcp_color = "green" if tab.mcp_enabled else "red"
         mcp_str = f"[{dim_color}]MCP:[/] [{mcp_color}]{mcp_status_text}[/]"
 
-        self.status_text = f"{model_str} {separator} {tokens_str} {separator} {tps_str} {separator} {stream_str} {separator} {mcp_str}"
+        recall_str = f" {separator} [{dim_color}]Memoria:[/] [red]sin indexar[/]" if self.recall_error else ""
+
+        self.status_text = (f"{model_str} {separator} {tokens_str} {separator} {tps_str}{queue_str} {separator} "
+                            f"{stream_str} {separator} {mcp_str}{recall_str}")
 
     async def action_limpiar_historial(self):
-        """Limpia el historial de la sesión y del archivo."""
-        clear_history(HIST_FILE)
-        # Reset reactive properties
-        self.history = []
-        self.token_count = 0
+        """Limpia el historial de la pestaña visible, en memoria y en su archivo."""
+        tab = self.tab
+        clear_history(tab.history_file)
+        tab.conversation.clear()
+        tab.token_count = 0
         self._update_status_bar()
         
-        panel = self.query_one("#messages_panel", ScrollableContainer)
         # Eliminar todos los widgets hijos (en lugar de clear())
-        widgets_to_remove = list(panel.children)
-        for widget in widgets_to_remove:
-            widget.remove()
-            
-        panel.mount(Static(Align(Panel(
-            "Historial limpiado correctamente.", 
-            title="[bold grey]Info[/]"
-        ), align="center"), classes="info_message"))
-        panel.scroll_end(animate=False)
+        tab.transcript.clear()
+        await self._panel().remove_children()
+        self._post(tab, "info", "Historial limpiado correctamente.")
         
     async def action_limpiar_pantalla(self):
         """Limpia la pantalla sin borrar el historial guardado."""
-        panel = self.query_one("#messages_panel", ScrollableContainer)
-        
-        # Eliminar todos los widgets hijos (en lugar de clear())
-        widgets_to_remove = list(panel.children)
-        for widget in widgets_to_remove:
-            widget.remove()
-            
-        panel.mount(Static(Align(Panel(
-            "Pantalla limpiada. El historial sigue guardado.", 
-            title="[bold grey]Info[/]"
-        ), align="center"), classes="info_message"))
-        panel.scroll_end(animate=False)
+        tab = self.tab
+        tab.transcript.clear()
+        await self._panel().remove_children()
+        self._post(tab, "info", "Pantalla limpiada. El historial sigue guardado.")
         
-    async def action_exportar_historial(self):
-        """Exporta el historial a un archivo de texto plano."""
+    async def action_exportar_historial(self, fmt: str = None):
+        """Exporta el historial (txt, md, html, jsonl o csv) en segundo plano, mostrando el progreso."""
+        from .export import FORMATS
+        tab = self.tab
+        if fmt is not None and fmt not in FORMATS:
+            self._post(tab, "info", f"Formato no soportado: {fmt}. Usa /export [{'|'.join(FORMATS)}]")
+            return
+        # historial.txt para la primera pestaña; historial-<n>.txt para las demás
+        base = os.path.splitext(EXPORT_FILE)[0] + (f"-{tab.number}" if tab.number > 1 else "")
+        destination = f"{base}.{fmt or 'txt'}"
+        status = self._post(tab, "info", f"Exportando a {destination}...")
+        self.run_worker(self._export_history(tab, destination, fmt, status), group="export", exit_on_error=False)
+
+    async def _export_history(self, tab, destination, fmt, status):
+        from .export import export_history
+
+        def progress(count):
+            # Llamado desde el hilo de exportación
+            self.call_from_thread(self._update_entry, status, f"Exportando a {destination}... {count} mensajes")
+
+        # Se lee el historial en streaming; la conversación en memoria solo si aún no se guardó
+        source = tab.history_file if os.path.exists(tab.history_file) else list(tab.conversation.messages)
         try:
-            export_history_txt(self.history, EXPORT_FILE)
-            panel = self.query_one("#messages_panel", ScrollableContainer)
-            panel.mount(Static(Align(Panel(
-                f"Historial exportado a {EXPORT_FILE}", 
-                title="[bold grey]Info[/]"
-            ), align="center"), classes="info_message"))
-            panel.scroll_end(animate=False)
+            count = await asyncio.to_thread(export_history, source, destination, fmt, progress=progress)
+            self._update_entry(status, f"Historial exportado a {destination} ({count} mensajes)")
         except Exception as e:
-            panel = self.query_one("#messages_panel", ScrollableContainer)
-            panel.mount(Static(Align(Panel(
-                f"Error al exportar: {e}", 
-                title="[bold red]Error[/]"
-            ), align="center"), classes="error_message"))
-            panel.scroll_end(animate=False)
-            
+            self._update_entry(status, f"Error al exportar: {e}", "[bold red]Error[/]", "error")
+
     async def action_mostrar_ayuda(self):
         """Muestra información de ayuda sobre comandos y atajos."""
-        panel = self.query_one("#messages_panel", ScrollableContainer)
         help_text = """
         [bold]ATAJOS DE TECLADO:[/bold]
         - Ctrl+L: Limpiar historial (borra todo el historial guardado).
         - Ctrl+C: Limpiar pantalla (mantiene el historial guardado).
         - Ctrl+E: Exportar historial a texto plano.
         - Ctrl+H: Mostrar esta ayuda.
+        - Ctrl+T: Nueva pestaña (mismo proveedor y modelo).
+        - Ctrl+RePág / Ctrl+AvPág: Pestaña anterior / siguiente.
         - Ctrl+Q: Salir de la aplicación.
 
         [bold]COMANDOS (escribir en el campo de texto):[/bold]
         - /help o /ayuda: Muestra esta ayuda.
         - /clear o /limpiar: Limpia la pantalla.
         - /clearhistory o /limpiarhistorial: Borra todo el historial.
-        - /export o /exportar: Exporta el historial a texto.
-        - /loadhistory o /cargarhistorial: Carga chats anteriores guardados.
-        - /mcp on|off: Activa/desactiva Model Context Protocol (experimental).
+        - /export [txt|md|html|jsonl|csv]: Exporta el historial (por defecto a texto).
+        - /loadhistory o /cargarhistorial: Restaura los chats anteriores en el contexto del modelo.
+        - /attach <dir>|off: Añade a cada prompt los fragmentos relevantes de un directorio.
+        - /recall <consulta>: Recupera intercambios de chats anteriores para el próximo mensaje.
+        - /mcp on|off: Activa/desactiva las herramientas de los servidores MCP (Anthropic).
+        - /ollama ps: Muestra los modelos cargados en Ollama y su memoria.
+        - /tab: Lista las pestañas. /tab new [proveedor] [modelo], /tab <n>, /tab close.
+          Cada pestaña conversa por separado y puede esperar su respuesta mientras usas otra.
+        - /queue: Prompts enviados mientras la pestaña responde (se despachan en orden al terminar).
+          /queue edit <n> <texto>, /queue cancel <n>|all. Empieza un prompt con & para enviarlo en paralelo.
+        - /schema <archivo>|off: Pide respuestas JSON que cumplan un JSON Schema (validadas mientras llegan).
         """
         # Help panel uses its own class for specific border color
-        panel.mount(Static(Align(Panel(
-            help_text, 
-            title="[bold #00FFFF]Ayuda[/]" # Cyan for Help title, matches border
-        ), align="center"), classes="help_message"))
-        panel.scroll_end(animate=False)
+        self._post(self.tab, "help", help_text, "[bold #00FFFF]Ayuda[/]")  # Cyan for Help title, matches border
         
     def action_salir(self):
         """Sale de la aplicación TUI."""
         self.exit()
 
+    def on_unmount(self) -> None:
+        get_highlight_cache().remove_listener(self._on_highlight_ready)
+        remove_reload_listener(self._on_config_reloaded)
+        from .providers.connection import stop_prewarm
+        for tab in self.tabs:
+            stop_prewarm(tab.provider)
+
+    def _on_config_reloaded(self, previous, config):
+        """
+        Aplica una config.yaml modificada. Los ajustes que se leen en cada uso (precios,
+        FPS, etc.) ya toman efecto; si cambió la sección de un proveedor en uso, se
+        recrea en cada pestaña conservando su historial (en segundo plano, sin congelar la interfaz).
+        """
+        self.run_worker(self._recreate_providers(previous, config), group="config-reload", exit_on_error=False)
+
+    async def _recreate_providers(self, previous, config):
+        """Recrea los proveedores cuya sección cambió y los sustituye en sus pestañas."""
+        from .providers import create_provider, get_provider_names
+        from .providers.connection import start_prewarm, stop_prewarm
+        section = lambda conf, name: ((conf or {}).get("providers") or {}).get(name)
+        message = "Configuración recargada."
+        updated = []
+        for tab in list(self.tabs):
+            name = tab.provider_key
+            # Un proveedor remoto (daemon) no se recrea: la config la aplica el daemon
+            if name not in get_provider_names() or section(previous, name) == section(config, name) or \
+                    not type(tab.provider).__module__.startswith("chat_cli.providers"):
+                continue
+            kwargs = {"mcp_enabled": tab.mcp_enabled} if name == "anthropic" else {}
+            old_provider = tab.provider
+            try:
+                # Crear el cliente (SDKs de Gemini/OpenAI) lleva cientos de ms: fuera del bucle de eventos
+                provider = await asyncio.to_thread(create_provider, name, model=tab.model_key, **kwargs)
+            except Exception as e:
+                message = f"Configuración recargada, pero no se pudo recrear el proveedor: {e}"
+                break
+            if tab not in self.tabs or tab.provider is not old_provider:
+                continue  # La pestaña se cerró o cambió de proveedor mientras tanto
+            if hasattr(provider, "history"):
+                provider.history = tab.conversation
+            # El keep-alive del proveedor anterior no debe seguir sondeando una instancia descartada
+            stop_prewarm(old_provider)
+            tab.provider = provider
+            start_prewarm(provider)
+            if name not in updated:
+                updated.append(name)
+            message = f"Configuración recargada; proveedor {', '.join(updated)} actualizado."
+        self._post(self.tab, "info", message)
+
     def watch_status_text(self, new_text: str) -> None:
         # Omitir antes de completar montaje
         if getattr(self, '_initializing', True):
@@ -469,12 +1027,6 @@ class ChatApp(App):
         except Exception:
             return
 
-    def watch_history(self, new_history: list) -> None:
-        # No-op: History rendering is handled by on_input_submitted and load_and_show_history
-        # If we want reactive history display, this is where it would go.
-        if self._initializing: # Avoid updates during setup
-            return
-
         # Example of how reactive history display could work (currently not fully used for messages):
         # panel = self.query_one("#messages_panel", ScrollableContainer)
         # for child in panel.children: # Clear existing messages if redrawing all
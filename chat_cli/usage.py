@@ -0,0 +1,194 @@
+"""
+Contabilidad de tokens y costo por turno.
+
+Los proveedores exponen en `last_usage` los tokens reales que informa cada API
+(`usage` de OpenAI/Anthropic, `usage_metadata` de Gemini, `prompt_eval_count`/
+`eval_count` de Ollama). Cuando faltan, se estiman con un tokenizador local
+estilo BPE con caché. Cada turno se registra en `usage.jsonl` para poder sumar
+totales por sesión y por día y generar el reporte de `chat-cli usage`.
+"""
+
+import json
+import os
+import re
+from datetime import date, datetime
+from functools import lru_cache
+from chat_cli.config import load_config
+
+USAGE_FILE = "usage.jsonl"
+
+# Precios en USD por millón de tokens (entrada, salida). Se busca el prefijo más largo
+# que coincida con el nombre del modelo; config.yaml puede añadir o sobrescribir
+# entradas en la sección "prices" (ej: prices: {gpt-4o: {input: 2.5, output: 10}}).
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4": (30.00, 60.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "claude-3-opus": (15.00, 75.00),
+    "claude-3-5-sonnet": (3.00, 15.00),
+    "claude-3-sonnet": (3.00, 15.00),
+    "claude-3-5-haiku": (0.80, 4.00),
+    "claude-3-haiku": (0.25, 1.25),
+    "gemini-1.5-pro": (1.25, 5.00),
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-pro": (0.50, 1.50),
+}
+# Proveedores locales sin costo por token
+FREE_PROVIDERS = ("ollama",)
+
+# Pre-tokenización similar a la de los tokenizadores BPE de GPT: contracciones,
+# palabras con espacio inicial, números, puntuación y bloques de espacios.
+_PRETOKEN_RE = re.compile(r"'(?:s|t|re|ve|m|ll|d)| ?[^\W\d_]+| ?\d{1,3}| ?[^\s\w]+|\s+(?!\S)|\s+")
+
+@lru_cache(maxsize=65536)
+def _piece_tokens(piece: str) -> int:
+    """Aproxima cuántos tokens BPE ocupa un fragmento pre-tokenizado."""
+    stripped = piece.lstrip(" ")
+    if not stripped:
+        return 1
+    if stripped.isascii():
+        # Las palabras frecuentes cortas suelen ser un solo token; las largas se
+        # parten en subpalabras de ~4 caracteres.
+        return 1 if len(stripped) <= 4 else (len(stripped) + 3) // 4
+    # Texto no ASCII (acentos, CJK, emojis) se fragmenta bastante más
+    return max(1, (len(stripped.encode("utf-8")) + 2) // 3)
+
+def estimate_tokens(text: str) -> int:
+    """Estima el número de tokens de un texto sin depender de un tokenizador externo."""
+    if not text:
+        return 0
+    return sum(_piece_tokens(piece) for piece in _PRETOKEN_RE.findall(text))
+
+def provider_name_of(provider) -> str:
+    """Nombre corto del proveedor ("openai", "ollama", ...) a partir de su instancia."""
+    return getattr(provider, "provider_name", None) or type(provider).__name__.replace("Provider", "").lower()
+
+def get_model_price(provider_name: str, model: str):
+    """Retorna (precio_entrada, precio_salida) en USD por millón de tokens, o None si se desconoce."""
+    if provider_name in FREE_PROVIDERS:
+        return (0.0, 0.0)
+    overrides = load_config().get("prices") or {}
+    if model in overrides:
+        entry = overrides[model]
+        return (float(entry.get("input", 0)), float(entry.get("output", 0)))
+    prices = dict(MODEL_PRICES)
+    for name, entry in overrides.items():
+        prices[name] = (float(entry.get("input", 0)), float(entry.get("output", 0)))
+    matches = [name for name in prices if model and model.startswith(name)]
+    if not matches:
+        return None
+    return prices[max(matches, key=len)]
+
+def compute_cost(provider_name: str, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Costo en USD de un turno (0.0 si el modelo no está en la tabla de precios)."""
+    price = get_model_price(provider_name, model)
+    if price is None:
+        return 0.0
+    return (prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000
+
+def resolve_usage(provider, prompt: str, completion: str):
+    """
+    Combina el uso informado por el proveedor (`provider.last_usage`) con la estimación
+    local para los campos que falten. Retorna un dict con prompt_tokens,
+    completion_tokens y estimated (True si algún valor fue estimado).
+    """
+    reported = getattr(provider, "last_usage", None) or {}
+    prompt_tokens = reported.get("prompt_tokens")
+    completion_tokens = reported.get("completion_tokens")
+    estimated = False
+    if prompt_tokens is None:
+        # Lo enviado incluye el historial que el proveedor reenvía en cada turno
+        history = getattr(provider, "history", None)
+        if history:
+            prompt_tokens = sum(estimate_tokens(msg["content"]) for msg in history if msg.get("content"))
+            if completion and history[-1].get("content") == completion:
+                prompt_tokens -= estimate_tokens(completion)
+        else:
+            prompt_tokens = estimate_tokens(prompt)
+        estimated = True
+    if completion_tokens is None:
+        completion_tokens = estimate_tokens(completion)
+        estimated = True
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "estimated": estimated}
+
+class UsageTracker:
+    """Acumula tokens y costo por sesión y por día, persistiendo cada turno en un JSONL."""
+
+    def __init__(self, log_file: str = USAGE_FILE):
+        self.log_file = log_file
+        self.session = {"prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0, "turns": 0}
+        self.today = self._load_today_totals()
+
+    @property
+    def session_tokens(self) -> int:
+        return self.session["prompt_tokens"] + self.session["completion_tokens"]
+
+    @property
+    def today_tokens(self) -> int:
+        return self.today["prompt_tokens"] + self.today["completion_tokens"]
+
+    def record_turn(self, provider_name: str, model: str, provider, prompt: str, completion: str):
+        """Registra un turno completo y retorna el dict de uso con su costo."""
+        usage = resolve_usage(provider, prompt, completion)
+        usage["cost"] = compute_cost(provider_name, model, usage["prompt_tokens"], usage["completion_tokens"])
+        entry = {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "provider": provider_name,
+            "model": model,
+            **usage,
+        }
+        for totals in (self.session, self.today):
+            totals["prompt_tokens"] += usage["prompt_tokens"]
+            totals["completion_tokens"] += usage["completion_tokens"]
+            totals["cost"] += usage["cost"]
+            totals["turns"] += 1
+        try:
+            with open(self.log_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except OSError:
+            pass  # La contabilidad nunca debe interrumpir el chat
+        return usage
+
+    def _load_today_totals(self):
+        totals = {"prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0, "turns": 0}
+        prefix = date.today().isoformat()
+        for entry in iter_usage_log(self.log_file):
+            if entry.get("timestamp", "").startswith(prefix):
+                totals["prompt_tokens"] += entry.get("prompt_tokens", 0)
+                totals["completion_tokens"] += entry.get("completion_tokens", 0)
+                totals["cost"] += entry.get("cost", 0.0)
+                totals["turns"] += 1
+        return totals
+
+def iter_usage_log(log_file: str = USAGE_FILE):
+    """Itera las entradas del registro de uso, ignorando líneas corruptas."""
+    if not os.path.exists(log_file):
+        return
+    with open(log_file, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+def usage_report(log_file: str = USAGE_FILE, days: int = 7):
+    """
+    Agrega el registro por día y modelo para los últimos `days` días.
+    Retorna una lista de dicts ordenada por fecha descendente.
+    """
+    cutoff = date.fromordinal(date.today().toordinal() - days + 1).isoformat() if days > 0 else ""
+    rows = {}
+    for entry in iter_usage_log(log_file):
+        day = entry.get("timestamp", "")[:10]
+        if day < cutoff:
+            continue
+        key = (day, entry.get("provider", "?"), entry.get("model", "?"))
+        row = rows.setdefault(key, {"day": day, "provider": key[1], "model": key[2],
+                                    "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0, "turns": 0})
+        row["prompt_tokens"] += entry.get("prompt_tokens", 0)
+        row["completion_tokens"] += entry.get("completion_tokens", 0)
+        row["cost"] += entry.get("cost", 0.0)
+        row["turns"] += 1
+    return sorted(rows.values(), key=lambda r: (r["day"], r["provider"], r["model"]), reverse=True)
@@ -0,0 +1,68 @@
+"""
+Servidor MCP mínimo para las pruebas: habla JSON-RPC por stdio (o se usa
+`handle_message` desde un servidor HTTP) y atiende cada tools/call en su propio
+hilo, como un servidor real que admite peticiones concurrentes.
+"""
+
+import json
+import sys
+import threading
+import time
+
+TOOLS = [
+    {"name": "lookup", "description": "Busca una clave (tarda `delay` segundos).",
+     "inputSchema": {"type": "object", "properties": {"key": {"type": "string"}, "delay": {"type": "number"}}},
+     "annotations": {"readOnlyHint": True}},
+    {"name": "counter", "description": "Incrementa un contador.",
+     "inputSchema": {"type": "object", "properties": {}}},
+    {"name": "fail", "description": "Siempre falla.", "inputSchema": {"type": "object", "properties": {}}},
+]
+
+_count = 0
+_count_lock = threading.Lock()
+
+def handle_message(message):
+    """Respuesta JSON-RPC para `message`, o None si es una notificación."""
+    global _count
+    method = message.get("method")
+    if "id" not in message:
+        return None
+    if method == "initialize":
+        result = {"protocolVersion": "2024-11-05", "capabilities": {"tools": {}},
+                  "serverInfo": {"name": "stub", "version": "1.0"}}
+    elif method == "tools/list":
+        result = {"tools": TOOLS}
+    elif method == "tools/call":
+        name = message["params"]["name"]
+        arguments = message["params"].get("arguments") or {}
+        if name == "lookup":
+            time.sleep(arguments.get("delay", 0))
+            result = {"content": [{"type": "text", "text": f"valor de {arguments.get('key')}"}]}
+        elif name == "counter":
+            with _count_lock:
+                _count += 1
+                result = {"content": [{"type": "text", "text": str(_count)}]}
+        elif name == "fail":
+            result = {"content": [{"type": "text", "text": "falló"}], "isError": True}
+        else:
+            return {"jsonrpc": "2.0", "id": message["id"], "error": {"code": -32602, "message": f"Unknown tool {name}"}}
+    else:
+        return {"jsonrpc": "2.0", "id": message["id"], "error": {"code": -32601, "message": "Method not found"}}
+    return {"jsonrpc": "2.0", "id": message["id"], "result": result}
+
+def main():
+    write_lock = threading.Lock()
+
+    def respond(message):
+        response = handle_message(message)
+        if response is not None:
+            with write_lock:
+                sys.stdout.write(json.dumps(response) + "\n")
+                sys.stdout.flush()
+
+    for line in sys.stdin:
+        message = json.loads(line)
+        threading.Thread(target=respond, args=(message,), daemon=True).start()
+
+if __name__ == "__main__":
+    main()
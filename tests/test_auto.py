@@ -0,0 +1,102 @@
+import pytest
+from chat_cli.providers.auto import AutoProvider, RoutingStats
+
+class FakeBackend:
+    def __init__(self, model, tokens=("hola", " mundo"), error=None):
+        self.model = model
+        self.tokens = tokens
+        self.error = error
+        self.history = []
+        self.last_usage = None
+        self.last_error = None
+
+    def prewarm(self):
+        return self.error is None
+
+    def stream_message(self, prompt):
+        self.last_error = None
+        self.history.append({"role": "user", "content": prompt})
+        if self.error:
+            self.last_error = self.error
+            yield f"[Fake] Error: {self.error}"
+            return
+        yield from self.tokens
+        self.history.append({"role": "assistant", "content": "".join(self.tokens)})
+
+    def send_message(self, prompt):
+        return "".join(self.stream_message(prompt))
+
+@pytest.fixture(autouse=True)
+def no_config(monkeypatch):
+    monkeypatch.setattr("chat_cli.config.load_config", lambda: {})
+
+def _auto(tmp_path, backends, policy="fastest", stats=None):
+    stats = stats or RoutingStats(tmp_path / "routing.json")
+    return AutoProvider(policy=policy, candidates=list(backends), stats=stats,
+                        provider_factory=lambda name, model: backends[f"{name}:{model}"])
+
+def test_auto_routes_to_fastest_and_persists_stats(tmp_path):
+    stats = RoutingStats(tmp_path / "routing.json")
+    stats.record_turn("ollama:lento", True, ttft=4.0, throughput=10)
+    stats.record_turn("openai:gpt-4o-mini", True, ttft=0.3, throughput=80)
+    backends = {"ollama:lento": FakeBackend("lento"), "openai:gpt-4o-mini": FakeBackend("gpt-4o-mini")}
+    auto = _auto(tmp_path, backends, stats=stats)
+
+    assert "".join(auto.stream_message("hola")) == "hola mundo"
+    assert auto.route.key == "openai:gpt-4o-mini" and auto.provider_name == "openai"
+    assert "más rápido" in auto.route.reason
+    assert [m["role"] for m in auto.history] == ["user", "assistant"]
+    reloaded = RoutingStats(tmp_path / "routing.json")
+    assert reloaded.get("openai:gpt-4o-mini")["samples"] == 2
+
+def test_auto_fails_over_before_first_token(tmp_path):
+    backends = {"ollama:caido": FakeBackend("caido", error="connection refused"),
+                "openai:gpt-4o-mini": FakeBackend("gpt-4o-mini")}
+    auto = _auto(tmp_path, backends)
+    auto.stats.record_turn("ollama:caido", True, ttft=0.1)  # Parecía el más rápido
+
+    assert "".join(auto.stream_message("hola")) == "hola mundo"
+    assert auto.last_error is None and auto.route.key == "openai:gpt-4o-mini"
+    assert [m["role"] for m in auto.history] == ["user", "assistant"]  # Sin restos del intento fallido
+    assert auto.stats.get("ollama:caido")["error_rate"] > 0
+
+    # Con un solo candidato disponible, el error llega al usuario
+    auto.max_attempts = 1
+    auto.stats.record_turn("openai:gpt-4o-mini", False)
+    auto.stats.record_turn("openai:gpt-4o-mini", False)
+    auto.stats.record_turn("openai:gpt-4o-mini", False)
+    auto.stats.record_turn("ollama:caido", True, ttft=0.1)
+    response = auto.send_message("otra")
+    assert response.startswith("[Fake] Error") and auto.last_error == "connection refused"
+
+def test_auto_policies_and_degraded_backends(tmp_path):
+    backends = {"ollama:local": FakeBackend("local"), "openai:gpt-4o-mini": FakeBackend("gpt-4o-mini"),
+                "anthropic:claude-3-opus": FakeBackend("claude-3-opus")}
+    stats = RoutingStats(tmp_path / "routing.json")
+    stats.record_turn("ollama:local", True, ttft=1.5, throughput=20)
+    stats.record_turn("openai:gpt-4o-mini", True, ttft=0.5, throughput=60)
+    stats.record_turn("anthropic:claude-3-opus", True, ttft=0.2, throughput=90)
+
+    assert _auto(tmp_path, backends, "fastest", stats).rank()[0][0].key == "anthropic:claude-3-opus"
+    assert _auto(tmp_path, backends, "cheapest", stats).rank()[0][0].key == "ollama:local"
+    assert _auto(tmp_path, backends, "local_first", stats).rank()[0][0].key == "ollama:local"
+
+    # Fuera del SLO, local_first recurre al más rápido
+    stats.record_turn("ollama:local", True, ttft=9.0)
+    stats.record_turn("ollama:local", True, ttft=9.0)
+    stats.record_turn("ollama:local", True, ttft=9.0)
+    assert _auto(tmp_path, backends, "local_first", stats).rank()[0][0].key == "anthropic:claude-3-opus"
+
+    # Un backend con muchos errores queda detrás de los sanos
+    for _ in range(5):
+        stats.record_turn("anthropic:claude-3-opus", False)
+    ranked = [route.key for route, _ in _auto(tmp_path, backends, "fastest", stats).rank()]
+    assert ranked[-1] == "anthropic:claude-3-opus"
+
+def test_auto_probes_refresh_stale_stats(tmp_path):
+    backends = {"ollama:local": FakeBackend("local"), "openai:gpt-4o-mini": FakeBackend("gpt-4o-mini", error="401")}
+    auto = _auto(tmp_path, backends)
+    assert auto.prewarm()
+    assert auto.stats.get("ollama:local")["probe_latency"] is not None
+    assert auto.stats.get("openai:gpt-4o-mini")["error_rate"] > 0
+    assert "sonda" in auto.rank()[0][0].reason
@@ -0,0 +1,47 @@
+import importlib.util
+import json
+from pathlib import Path
+
+RUNNER = Path(__file__).resolve().parent.parent / "benchmarks" / "run.py"
+
+def _load_runner():
+    spec = importlib.util.spec_from_file_location("bench_run", RUNNER)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def test_benchmark_smoke_run_writes_results(tmp_path):
+    runner = _load_runner()
+    output = tmp_path / "results.json"
+    assert runner.main(["--smoke", "-k", "payload", "--output", str(output)]) == 0
+    report = json.loads(output.read_text())
+    assert set(report["results"]) == {name for name in runner.CASES if "payload" in name}
+    assert report["environment"]["python"]
+
+def test_benchmark_compare_flags_regressions(tmp_path):
+    runner = _load_runner()
+    baseline = {"results": {"a": {"median": 1.0}, "b": {"median": 1.0}, "solo_base": {"median": 1.0}}}
+    results = {"a": {"median": 1.1}, "b": {"median": 1.3}, "nuevo": {"median": 5.0}}
+    rows = {row[0]: row for row in runner.compare(results, baseline, threshold=0.15)}
+    assert set(rows) == {"a", "b"}
+    assert not rows["a"][4] and rows["b"][4]
+
+    baseline_path = tmp_path / "baseline.json"
+    baseline_path.write_text(json.dumps({"results": {"payload.anthropic_prepare_messages[100]": {"median": 1e-9}}}))
+    assert runner.main(["--smoke", "-k", "anthropic_prepare_messages[[]100", "--output", str(tmp_path / "r.json"),
+                        "--compare", str(baseline_path)]) == 1
+
+def test_benchmark_replays_recorded_cassettes(tmp_path, monkeypatch):
+    from chat_cli.providers.cassette import Cassette
+    monkeypatch.setattr("chat_cli.config.load_config", lambda: {})
+    cassettes = tmp_path / "cassettes"
+    lines = [json.dumps({"message": {"content": word}, "done": False}).encode() + b"\n" for word in ("Hola ", "mundo")]
+    lines.append(json.dumps({"done": True, "prompt_eval_count": 3, "eval_count": 2}).encode() + b"\n")
+    Cassette(cassettes / "ollama.jsonl", mode="record").record(
+        "POST", "http://localhost:11434/api/chat", json.dumps({"model": "llama-test", "messages": []}),
+        200, "OK", {"Content-Type": "application/x-ndjson"}, [(0.01 * i, line) for i, line in enumerate(lines)])
+
+    runner = _load_runner()
+    output = tmp_path / "results.json"
+    assert runner.main(["--smoke", "-k", "replay", "--cassettes", str(cassettes), "--output", str(output)]) == 0
+    assert set(json.loads(output.read_text())["results"]) == {"replay.ollama.stream", "replay.ollama.repl_turn"}
@@ -0,0 +1,97 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from chat_cli.providers.cassette import Cassette, use_cassette
+
+TOKENS = ["Hola", ", ", "esto ", "es ", "un ", "stream"]
+DELAY = 0.04  # Segundos entre fragmentos del servidor
+
+@pytest.fixture
+def stream_server(monkeypatch):
+    """Servidor local que emite /api/chat de Ollama (NDJSON) y chat/completions de OpenAI (SSE) con pausas."""
+    requests_seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            requests_seen.append(self.path)
+            if self.path == "/api/chat":
+                lines = [json.dumps({"message": {"content": token}, "done": False}) + "\n" for token in TOKENS]
+                lines.append(json.dumps({"done": True, "prompt_eval_count": 7, "eval_count": 6}) + "\n")
+                content_type = "application/x-ndjson"
+            else:
+                chunk = {"id": "c1", "object": "chat.completion.chunk", "created": 0, "model": payload["model"]}
+                lines = [f"data: {json.dumps(dict(chunk, choices=[{'index': 0, 'delta': {'content': token}}]))}\n\n"
+                         for token in TOKENS]
+                usage = {"prompt_tokens": 7, "completion_tokens": 6, "total_tokens": 13}
+                lines.append(f"data: {json.dumps(dict(chunk, choices=[], usage=usage))}\n\n")
+                lines.append("data: [DONE]\n\n")
+                content_type = "text/event-stream"
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for line in lines:
+                data = line.encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+                time.sleep(DELAY)
+            self.wfile.write(b"0\r\n\r\n")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+    conf = {"providers": {"ollama": {"host": url, "default_model": "llama-test"}}}
+    monkeypatch.setattr("chat_cli.config.load_config", lambda: conf)
+    monkeypatch.setenv("OPENAI_BASE_URL", f"{url}/v1")
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    yield requests_seen
+    server.shutdown()
+    server.server_close()
+
+def _stream(provider_name, prompt):
+    from chat_cli.providers import create_provider
+    provider = create_provider(provider_name)
+    start = time.perf_counter()
+    text = "".join(provider.stream_message(prompt))
+    return text, time.perf_counter() - start, provider
+
+@pytest.mark.parametrize("provider_name", ["ollama", "openai"])
+def test_record_then_replay_without_server(tmp_path, stream_server, provider_name):
+    path = tmp_path / f"{provider_name}.jsonl"
+    with use_cassette(path) as cassette:
+        assert cassette.mode == "record"
+        recorded, recorded_elapsed, _ = _stream(provider_name, "hola")
+    assert recorded == "".join(TOKENS) and len(stream_server) == 1
+    interaction = Cassette(path).interactions[0]
+    assert interaction["request"]["body"]["messages"][-1]["content"] == "hola"
+    offsets = [offset for offset, _ in interaction["chunks"]]
+    assert offsets == sorted(offsets) and offsets[-1] >= DELAY * len(TOKENS) * 0.8
+
+    # Instantánea: mismos tokens y usage, sin tocar el servidor y sin esperas
+    with use_cassette(path, speed=0) as cassette:
+        assert cassette.mode == "replay"
+        text, elapsed, provider = _stream(provider_name, "hola")
+    assert text == recorded and provider.last_error is None
+    assert provider.last_usage == {"prompt_tokens": 7, "completion_tokens": 6}
+    assert len(stream_server) == 1 and elapsed < recorded_elapsed / 2
+
+    # Velocidad original: se respetan los tiempos entre fragmentos
+    with use_cassette(path, speed=1):
+        text, elapsed, _ = _stream(provider_name, "otra pregunta")
+    assert text == recorded and elapsed >= offsets[-1] * 0.9
+
+def test_replay_without_recording_reports_connection_error(tmp_path, stream_server):
+    path = tmp_path / "empty.jsonl"
+    path.write_text('{"version": 1}\n')
+    with use_cassette(path, mode="replay", speed=0):
+        text, _, provider = _stream("ollama", "hola")
+    assert provider.last_error and "Sin grabación para POST /api/chat" in provider.last_error
+    assert stream_server == []
@@ -0,0 +1,78 @@
+import pytest
+from chat_cli.compaction import Compactor, SummaryStore, SUMMARY_PREFIX
+from chat_cli.conversation import Conversation, as_api_messages
+
+@pytest.fixture(autouse=True)
+def no_config(monkeypatch):
+    monkeypatch.setattr("chat_cli.config.load_config", lambda: {})
+
+def _conversation(turns):
+    conversation = Conversation()
+    for i in range(turns):
+        conversation.add("user", f"pregunta {i} " + "palabra " * 50, f"2025-05-01 10:{i:02d}:00")
+        conversation.add("assistant", f"respuesta {i} " + "texto " * 50, f"2025-05-01 10:{i:02d}:30")
+    return conversation
+
+def test_compaction_summarizes_old_turns_and_reuses_stored_summary(tmp_path):
+    prompts = []
+
+    def summarize(prompt):
+        prompts.append(prompt)
+        return f"resumen {len(prompts)}"
+
+    store_path = tmp_path / "summaries.jsonl"
+    compactor = Compactor(summarize, SummaryStore(store_path), threshold=500, keep_recent_tokens=200)
+    conversation = _conversation(10)
+    summary = compactor.compact(conversation)
+    assert summary is not None and 0 < summary.count < len(conversation)
+    assert "pregunta 0" in prompts[0]
+
+    messages = as_api_messages(conversation)
+    assert messages[0] == {"role": "user", "content": SUMMARY_PREFIX + "resumen 1"}
+    assert messages[1]["role"] == "assistant" and messages[2]["role"] == "user"
+    assert len(messages) == len(conversation) - summary.count + 2
+
+    # Más turnos: el nuevo resumen parte del anterior en lugar de releer todo
+    for i in range(10, 16):
+        conversation.add("user", f"pregunta {i} " + "palabra " * 50, f"2025-05-01 11:{i:02d}:00")
+        conversation.add("assistant", "ok " * 50, f"2025-05-01 11:{i:02d}:30")
+    second = compactor.compact(conversation)
+    assert second.count > summary.count and "resumen 1" in prompts[1] and "pregunta 0" not in prompts[1]
+
+    # Una sesión nueva con los mismos mensajes reutiliza el resumen guardado sin llamar al modelo
+    reloaded = Conversation(conversation.to_dicts())
+    fresh = Compactor(lambda prompt: pytest.fail("no debería resumir"), SummaryStore(store_path),
+                      threshold=500, keep_recent_tokens=200)
+    assert fresh.attach(reloaded).text == "resumen 2"
+    assert fresh.compact(reloaded) is None  # El contexto restante ya está bajo el umbral
+
+def test_compaction_runs_in_background_and_resets_on_edits(tmp_path):
+    compactor = Compactor(lambda prompt: "resumen", SummaryStore(tmp_path / "s.jsonl"),
+                          threshold=500, keep_recent_tokens=200)
+    conversation = _conversation(10)
+    assert compactor.schedule(conversation)
+    compactor.wait(5)
+    assert conversation.summary is not None and compactor.last_error is None
+
+    del conversation[conversation.summary.count:]  # Borrar solo lo reciente conserva el resumen
+    assert conversation.summary is not None
+    del conversation[0:]
+    assert conversation.summary is None
+
+    # Un error del modelo de resumen no interrumpe nada: queda en last_error
+    failing = Compactor(lambda prompt: 1 / 0, SummaryStore(tmp_path / "f.jsonl"), threshold=500,
+                        keep_recent_tokens=200)
+    failing.schedule(_conversation(10))
+    failing.wait(5)
+    assert "division" in failing.last_error
+
+def test_anthropic_sends_summary_instead_of_old_turns(tmp_path):
+    from chat_cli.providers.anthropic import AnthropicProvider
+    provider = AnthropicProvider(api_key="test")
+    provider.history = _conversation(10)
+    Compactor(lambda prompt: "resumen", SummaryStore(tmp_path / "s.jsonl"), threshold=500,
+              keep_recent_tokens=200).compact(provider.history)
+    messages = provider._prepare_messages("nueva")
+    assert messages[0]["content"].endswith("resumen")
+    assert messages[-1] == {"role": "user", "content": "nueva"}
+    assert not any("pregunta 0 " in message["content"] for message in messages)
@@ -0,0 +1,87 @@
+import os
+import pytest
+from chat_cli import config
+
+@pytest.fixture
+def isolated_config(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path / "xdg"))
+    monkeypatch.setenv("XDG_CONFIG_DIRS", str(tmp_path / "etc"))
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.delenv("CHATCLI_CONFIG", raising=False)
+    monkeypatch.setattr(config, "CONFIG_FILE_PATH", tmp_path / "proyecto" / "config.yaml")
+    monkeypatch.setattr(config, "_config", None)
+    monkeypatch.setattr(config, "_config_stamp", None)
+    monkeypatch.setattr(config, "_reload_listeners", [])
+    for name in [name for name in os.environ if name.startswith(config.ENV_PREFIX)]:
+        monkeypatch.delenv(name)
+    return tmp_path
+
+def _write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    return path
+
+def test_search_order_prefers_explicit_then_xdg(isolated_config, monkeypatch):
+    _write(isolated_config / "proyecto" / "config.yaml", "tui: {max_fps: 1}")
+    assert config.find_config_file() == isolated_config / "proyecto" / "config.yaml"
+    user_file = _write(isolated_config / "xdg" / "chat_cli" / "config.yaml", "tui: {max_fps: 2}")
+    assert config.find_config_file() == user_file
+    explicit = _write(isolated_config / "otro.yaml", "tui: {max_fps: 3}")
+    monkeypatch.setenv("CHATCLI_CONFIG", str(explicit))
+    assert config.find_config_file() == explicit
+    assert config.get_setting("tui", "max_fps") == 3
+
+def test_compiled_cache_skips_yaml_parsing(isolated_config, monkeypatch):
+    _write(isolated_config / "xdg" / "chat_cli" / "config.yaml", "providers: {ollama: {default_model: llama3}}")
+    assert config.get_default_model("ollama") == "llama3"
+
+    def fail(path):
+        raise AssertionError("no debería parsear el YAML")
+    monkeypatch.setattr(config, "_parse_yaml", fail)
+    monkeypatch.setattr(config, "_config", None)
+    assert config.get_default_model("ollama") == "llama3"
+    (cache_file,) = (isolated_config / "cache" / "chat_cli").glob("config-*.json")
+    assert os.stat(cache_file).st_mode & 0o777 == 0o600
+
+def test_compiled_cache_never_stores_secrets(isolated_config, monkeypatch):
+    _write(isolated_config / "xdg" / "chat_cli" / "config.yaml",
+           "openai_api_key: 'sk-uno'  # Como en el README\n"
+           "providers:\n  openai:\n    api_key: \"sk-dos\"\n    timeout: 30\ngateway: {port: 9000}\n")
+    assert config.get_setting("gateway", "port") == 9000
+    assert config.get_api_key("openai") == "sk-dos"
+    (cache_file,) = (isolated_config / "cache" / "chat_cli").glob("config-*.json")
+    assert "sk-" not in cache_file.read_text()
+
+    # La caché se usa igualmente: solo las credenciales se releen del archivo, sin PyYAML
+    def fail(path):
+        raise AssertionError("no debería parsear el YAML")
+    monkeypatch.setattr(config, "_parse_yaml", fail)
+    monkeypatch.setattr(config, "_config", None)
+    assert config.load_config() == {"openai_api_key": "sk-uno", "gateway": {"port": 9000},
+                                    "providers": {"openai": {"api_key": "sk-dos", "timeout": 30}}}
+
+def test_secrets_the_simple_reader_cannot_reproduce_skip_the_cache(isolated_config):
+    # En una línea de estilo flujo la credencial no se puede releer sin PyYAML
+    _write(isolated_config / "xdg" / "chat_cli" / "config.yaml", "providers: {openai: {api_key: sk-secreto}}\n")
+    assert config.get_api_key("openai") == "sk-secreto"
+    assert not list((isolated_config / "cache" / "chat_cli").glob("config-*"))
+
+def test_env_overrides_are_nested_and_typed(isolated_config, monkeypatch):
+    _write(isolated_config / "xdg" / "chat_cli" / "config.yaml", "providers: {ollama: {host: 'http://a:1', num_ctx: 2048}}")
+    monkeypatch.setenv("CHATCLI_PROVIDERS__OLLAMA__NUM_CTX", "8192")
+    monkeypatch.setenv("CHATCLI_CONNECTION__PREWARM", "false")
+    monkeypatch.setenv("CHATCLI_TUI__MAX_FPS", "12.5")
+    assert config.get_provider_config("ollama") == {"host": "http://a:1", "num_ctx": 8192}
+    assert config.get_setting("connection", "prewarm", True) is False
+    assert config.get_setting("tui", "max_fps") == 12.5
+
+def test_reload_config_detects_changes_and_notifies(isolated_config):
+    path = _write(isolated_config / "xdg" / "chat_cli" / "config.yaml", "ask: {provider: ollama}")
+    assert config.get_setting("ask", "provider") == "ollama"
+    assert not config.reload_config()
+    changes = []
+    config.add_reload_listener(lambda previous, new: changes.append((previous["ask"], new["ask"])))
+    path.write_text("ask: {provider: anthropic}  # cambio\n")
+    assert config.reload_config()
+    assert config.get_setting("ask", "provider") == "anthropic"
+    assert changes == [({"provider": "ollama"}, {"provider": "anthropic"})]
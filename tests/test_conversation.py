@@ -0,0 +1,44 @@
+import json
+from chat_cli.conversation import Conversation, Message, as_api_messages
+from chat_cli.providers.anthropic import AnthropicProvider
+from chat_cli.providers.ollama import OllamaProvider
+
+def test_message_uses_slots_and_behaves_like_the_old_dicts():
+    message = Message("user", "hola", "2025-05-01 10:00:00")
+    assert not hasattr(message, "__dict__")
+    assert message["role"] == "user" and message.get("content") == "hola" and message.get("otro", 1) == 1
+    assert message.to_dict() == {"role": "user", "content": "hola", "timestamp": "2025-05-01 10:00:00"}
+    assert Message.coerce({"role": "assistant", "content": "x"}).timestamp
+
+def test_archived_messages_are_saved_but_not_in_context(tmp_path):
+    path = tmp_path / "history.json"
+    path.write_text(json.dumps([{"role": "user", "content": "viejo", "timestamp": "t0"},
+                                {"role": "assistant", "content": "respuesta vieja", "timestamp": "t1"}]))
+    conversation = Conversation.load(path)
+    assert len(conversation) == 0 and not conversation and list(conversation) == []
+    conversation.append({"role": "user", "content": "nuevo"})
+    conversation.add("assistant", "ok", "t3")
+    assert [m["content"] for m in conversation] == ["nuevo", "ok"] and conversation[-1].timestamp == "t3"
+    conversation.save(path)
+    assert [m["content"] for m in json.loads(path.read_text())] == ["viejo", "respuesta vieja", "nuevo", "ok"]
+    assert conversation.restore() == 2 and len(conversation) == 4
+    del conversation[3:]
+    assert as_api_messages(conversation)[-1] == {"role": "user", "content": "nuevo"}
+
+def test_providers_share_the_conversation_in_place(monkeypatch):
+    monkeypatch.setattr("chat_cli.config.load_config", lambda: {})
+    conversation = Conversation([{"role": "user", "content": "antes", "timestamp": "t0"},
+                                 {"role": "assistant", "content": "sí", "timestamp": "t1"}])
+    ollama = OllamaProvider(model="llama3")
+    ollama.history = conversation
+    payload = ollama._build_payload()
+    assert payload["messages"] == [{"role": "user", "content": "antes"}, {"role": "assistant", "content": "sí"}]
+    json.dumps(payload)  # Serializable tal cual para la API
+
+    anthropic = AnthropicProvider(api_key="test")
+    anthropic.history = conversation
+    messages = anthropic._prepare_messages("¿y ahora?")
+    assert messages[-1] == {"role": "user", "content": "¿y ahora?"}
+    # El proveedor añadió el prompt a la misma conversación, sin copiarla
+    assert anthropic.history is conversation and conversation[-1].content == "¿y ahora?"
+    assert len(conversation.messages) == 3
@@ -0,0 +1,78 @@
+import asyncio
+import io
+import os
+import threading
+from chat_cli import daemon, headless
+
+class EchoProvider:
+    def __init__(self, model):
+        self.model = model or "eco-1"
+        self.history = []
+        self.last_usage = None
+        self.last_error = None
+
+    def send_message(self, prompt):
+        self.history.append({"role": "user", "content": prompt})
+        self.last_usage = {"prompt_tokens": len(self.history), "completion_tokens": 1}
+        return f"turnos previos: {len(self.history) - 1}"
+
+    def stream_message(self, prompt):
+        self.history.append({"role": "user", "content": prompt})
+        if prompt == "falla":
+            self.last_error = "sin conexión"
+            yield "[Eco] Error: sin conexión"
+            return
+        for word in ["eco: ", prompt]:
+            yield word
+        self.last_usage = {"prompt_tokens": 3, "completion_tokens": 2}
+
+def _start_daemon(tmp_path):
+    created = []
+
+    def factory(provider_name, model):
+        created.append((provider_name, model))
+        return EchoProvider(model)
+
+    server = daemon.ProviderDaemon(str(tmp_path / "d.sock"), provider_factory=factory)
+    ready = threading.Event()
+    threading.Thread(target=lambda: asyncio.run(server.serve(ready)), daemon=True).start()
+    assert ready.wait(5)
+    return server, created
+
+def test_remote_provider_streams_and_keeps_history(tmp_path):
+    server, created = _start_daemon(tmp_path)
+    remote = daemon.RemoteProvider("ollama", socket_path=server.socket_path)
+    assert remote.model == "eco-1"
+    assert "".join(remote.stream_message("hola")) == "eco: hola"
+    assert remote.last_usage == {"prompt_tokens": 3, "completion_tokens": 2}
+    # El historial viaja en cada petición; la plantilla del daemon no lo acumula
+    assert remote.send_message("otra") == "turnos previos: 2"
+    assert len(remote.history) == 4
+    assert server.pool.get("ollama").history == []
+    assert created == [("ollama", None)]
+    assert daemon.stop_daemon(server.socket_path)
+
+def test_remote_provider_flags_errors_for_ask(tmp_path):
+    server, _ = _start_daemon(tmp_path)
+    remote = daemon.RemoteProvider("ollama", socket_path=server.socket_path)
+    out, err = io.BytesIO(), io.StringIO()
+    out.fileno = lambda: 1
+    assert headless.run_ask("ollama", None, "falla", out=out, err=err, provider=remote) == headless.EXIT_PROVIDER_ERROR
+    assert out.getvalue() == b""
+    assert "sin conexión" in err.getvalue()
+    assert remote.history == []
+    daemon.stop_daemon(server.socket_path)
+
+def test_status_and_fallback_without_daemon(tmp_path, monkeypatch):
+    socket_path = str(tmp_path / "ausente.sock")
+    monkeypatch.setattr(daemon, "get_socket_path", lambda: socket_path)
+    assert not daemon.is_daemon_running()
+    assert daemon.daemon_status(socket_path) is None
+    assert daemon.get_remote_provider("ollama") is None
+
+def test_socket_is_created_private(tmp_path, monkeypatch):
+    # Sin el chmod posterior el socket ya nace 0600 (umask restrictiva durante el bind)
+    monkeypatch.setattr(daemon.os, "chmod", lambda *args: None)
+    server, _ = _start_daemon(tmp_path)
+    assert os.stat(server.socket_path).st_mode & 0o777 == 0o600
+    daemon.stop_daemon(server.socket_path)
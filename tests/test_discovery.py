@@ -0,0 +1,53 @@
+import threading
+import pytest
+from chat_cli.discovery import ProviderDiscovery
+
+class FakeProvider:
+    barrier = None
+
+    def __init__(self, name, ok=True):
+        self.model = f"{name}-default"
+        self.ok = ok
+
+    def prewarm(self):
+        if self.barrier:
+            self.barrier.wait(5)  # Solo pasa si los sondeos corren a la vez
+        return self.ok
+
+    def list_models(self):
+        return [self.model, "otro"]
+
+@pytest.fixture(autouse=True)
+def no_config(monkeypatch):
+    monkeypatch.setattr("chat_cli.config.load_config", lambda: {})
+
+def _factory(created):
+    def factory(name):
+        created.append(name)
+        if name == "gemini":
+            raise ValueError("Gemini API key is missing.\nDetalles largos")
+        return FakeProvider(name, ok=name != "openai")
+    return factory
+
+def test_discovery_probes_providers_concurrently():
+    created = []
+    FakeProvider.barrier = threading.Barrier(2)
+    try:
+        discovery = ProviderDiscovery(["ollama", "openai", "gemini", "auto"], _factory(created)).start()
+        results = discovery.wait(10)
+    finally:
+        FakeProvider.barrier = None
+    assert sorted(results) == ["gemini", "ollama", "openai"]  # `auto` no se sondea
+    assert results["ollama"].available and results["ollama"].models == ["ollama-default", "otro"]
+    assert not results["openai"].available and results["openai"].models == []
+    assert results["gemini"].error == "Gemini API key is missing."
+    assert results["gemini"].default_model  # Modelo por defecto aunque no haya instancia
+
+def test_discovery_hands_each_instance_to_the_session_once():
+    created = []
+    discovery = ProviderDiscovery(["ollama", "gemini"], _factory(created)).start()
+    instance = discovery.take("ollama", "otro")
+    assert instance is discovery.result("ollama").instance and instance.model == "otro"
+    assert discovery.take("ollama") is None
+    assert discovery.take("gemini") is None
+    assert created.count("ollama") == 1
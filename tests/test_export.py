@@ -0,0 +1,78 @@
+import csv
+import json
+import tracemalloc
+from datetime import datetime
+import pytest
+from chat_cli.export import export_history, filter_messages, iter_history
+
+MESSAGES = [
+    {"role": "user", "content": "hola <b>", "timestamp": "2025-05-01 10:00:00"},
+    {"role": "assistant", "content": "¿qué tal?\nlínea 2", "timestamp": "2025-05-01 10:00:05"},
+    {"role": "user", "content": "otra sesión, con \"comillas\"", "timestamp": "2025-05-02T09:00:00"},
+    {"role": "assistant", "content": "ok", "timestamp": "2025-05-02T09:01:00"},
+]
+
+@pytest.fixture
+def history_file(tmp_path, monkeypatch):
+    monkeypatch.setattr("chat_cli.config.load_config", lambda: {})
+    path = tmp_path / "history.json"
+    path.write_text(json.dumps(MESSAGES, ensure_ascii=False, indent=2), encoding="utf-8")
+    return path
+
+def test_iter_history_reads_incrementally_across_chunks(history_file, tmp_path):
+    assert list(iter_history(history_file, chunk_size=7)) == MESSAGES
+    empty = tmp_path / "vacio.json"
+    empty.write_text("[]")
+    assert list(iter_history(empty)) == []
+    broken = tmp_path / "roto.json"
+    broken.write_text('[{"role": "user", "content": "sin cerrar"')
+    with pytest.raises(ValueError):
+        list(iter_history(broken, chunk_size=8))
+
+def test_filters_by_date_session_and_role(history_file):
+    def contents(**filters):
+        return [m["content"] for m in filter_messages(iter_history(history_file), **filters)]
+    assert contents(session=2) == ["otra sesión, con \"comillas\"", "ok"]
+    assert contents(role="assistant") == ["¿qué tal?\nlínea 2", "ok"]
+    assert contents(since=datetime(2025, 5, 2), role="user") == ["otra sesión, con \"comillas\""]
+    assert contents(until=datetime(2025, 5, 1, 10, 0, 1)) == ["hola <b>"]
+
+def test_each_format_round_trips_the_content(history_file, tmp_path):
+    assert export_history(history_file, tmp_path / "h.jsonl") == 4
+    lines = (tmp_path / "h.jsonl").read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["session"] for line in lines] == [1, 1, 2, 2]
+
+    export_history(history_file, tmp_path / "h.csv")
+    with open(tmp_path / "h.csv", newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["content"] for row in rows] == [m["content"] for m in MESSAGES]
+
+    export_history(history_file, tmp_path / "h.html", role="user")
+    page = (tmp_path / "h.html").read_text(encoding="utf-8")
+    assert "hola &lt;b&gt;" in page and "<h2>Sesión 2</h2>" in page and "qué tal" not in page
+
+    export_history(history_file, tmp_path / "h.md")
+    assert "## Sesión 1" in (tmp_path / "h.md").read_text(encoding="utf-8")
+
+    export_history(history_file, tmp_path / "salida", fmt="txt")
+    assert (tmp_path / "salida").read_text(encoding="utf-8").startswith("[2025-05-01 10:00:00] user: hola <b>\n")
+
+def test_large_export_uses_bounded_memory(tmp_path, monkeypatch):
+    monkeypatch.setattr("chat_cli.config.load_config", lambda: {})
+    path = tmp_path / "grande.json"
+    count = 20_000
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[\n")
+        for i in range(count):
+            message = {"role": "user" if i % 2 == 0 else "assistant", "content": f"mensaje {i} " + "x" * 300,
+                       "timestamp": "2025-05-01 10:00:00"}
+            f.write(("," if i else "") + json.dumps(message) + "\n")
+        f.write("]\n")
+    progress = []
+    tracemalloc.start()
+    exported = export_history(path, tmp_path / "grande.csv", progress=progress.append)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert exported == count and progress[-1] == count and len(progress) == count // 1000 + 1
+    # El archivo ocupa ~7 MB; la exportación no debe cargarlo entero
+    assert path.stat().st_size > 6_000_000 and peak < 1_000_000
@@ -0,0 +1,200 @@
+import asyncio
+import http.client
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from chat_cli import gateway
+from chat_cli.providers.pool import ProviderPool
+
+UPSTREAM_DELAY = 0.05
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    calls = 0
+
+    def do_POST(self):
+        type(self).calls += 1
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(UPSTREAM_DELAY)
+        answer = f"eco: {body['messages'][-1]['content']} ({len(body['messages'])} msgs)"
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            for word in answer.split(" "):
+                self.wfile.write(json.dumps({"message": {"content": word + " "}, "done": False}).encode() + b"\n")
+            self.wfile.write(json.dumps({"done": True, "prompt_eval_count": 5, "eval_count": 3}).encode() + b"\n")
+            return
+        data = json.dumps({"model": body["model"], "message": {"role": "assistant", "content": answer},
+                           "done": True, "prompt_eval_count": 5, "eval_count": 3}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    last_body = None
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        type(self).last_body = body
+        data = json.dumps({"id": "x", "object": "chat.completion", "created": 0, "model": body["model"],
+                           "choices": [{"index": 0, "finish_reason": "stop",
+                                        "message": {"role": "assistant", "content": f"openai: {body['model']}"}}],
+                           "usage": {"prompt_tokens": 7, "completion_tokens": 2, "total_tokens": 9}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+class FakeUpstream(ThreadingHTTPServer):
+    request_queue_size = 128  # El backlog por defecto (5) descarta conexiones bajo carga
+
+def _start_http(handler):
+    server = FakeUpstream(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    return server
+
+@pytest.fixture
+def running_gateway(monkeypatch):
+    upstream = _start_http(FakeOllamaHandler)
+    openai_upstream = _start_http(FakeOpenAIHandler)
+    FakeOllamaHandler.calls = 0
+    monkeypatch.setenv("OLLAMA_HOST", f"http://127.0.0.1:{upstream.server_port}")
+    monkeypatch.setenv("OPENAI_BASE_URL", f"http://127.0.0.1:{openai_upstream.server_port}/v1")
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-prueba")
+    # Los clientes de OpenAI se comparten por API key: uno nuevo para el puerto de esta prueba
+    monkeypatch.setattr("chat_cli.providers.openai._clients", {})
+    server = gateway.Gateway(ProviderPool(prewarm=False), gateway.ResponseCache(ttl=60), max_concurrency=16, api_key="")
+    ready = threading.Event()
+    threading.Thread(target=lambda: asyncio.run(server.serve("127.0.0.1", 0, ready)), daemon=True).start()
+    assert ready.wait(5)
+    yield server
+    upstream.shutdown()
+    openai_upstream.shutdown()
+
+def _post(port, payload, conn=None):
+    conn = conn or http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    conn.request("POST", "/v1/chat/completions", json.dumps(payload), {"Content-Type": "application/json"})
+    response = conn.getresponse()
+    return response.status, response.read()
+
+def test_route_model():
+    assert gateway.route_model("gpt-4o") == ("openai", "gpt-4o")
+    assert gateway.route_model("claude-3-5-sonnet") == ("anthropic", "claude-3-5-sonnet")
+    assert gateway.route_model("gemini-1.5-flash") == ("gemini", "gemini-1.5-flash")
+    assert gateway.route_model("llama3:8b") == ("ollama", "llama3:8b")
+    assert gateway.route_model("ollama/gpt-oss") == ("ollama", "gpt-oss")
+    assert gateway.route_model("o1") == ("openai", "o1")
+    assert gateway.route_model("o3-mini") == ("openai", "o3-mini")
+    # Etiquetas locales que solo empiezan por o1/o3 siguen yendo a Ollama
+    assert gateway.route_model("o1x:7b") == ("ollama", "o1x:7b")
+    assert gateway.route_model("o3mini") == ("ollama", "o3mini")
+
+def test_completion_passes_history_and_reuses_keepalive_connection(running_gateway):
+    conn = http.client.HTTPConnection("127.0.0.1", running_gateway.port, timeout=10)
+    messages = [{"role": "system", "content": "breve"}, {"role": "user", "content": "a"},
+                {"role": "assistant", "content": "b"}, {"role": "user", "content": "hola"}]
+    for _ in range(2):
+        status, body = _post(running_gateway.port, {"model": "llama2", "messages": messages}, conn)
+        assert status == 200
+        result = json.loads(body)
+        assert result["choices"][0]["message"]["content"] == "eco: hola (4 msgs)"
+        assert result["usage"] == {"prompt_tokens": 5, "completion_tokens": 3, "total_tokens": 8}
+    # La segunda respuesta sale de la caché
+    assert FakeOllamaHandler.calls == 1
+
+def test_streaming_completion(running_gateway):
+    conn = http.client.HTTPConnection("127.0.0.1", running_gateway.port, timeout=10)
+    payload = {"model": "ollama/llama2", "stream": True, "stream_options": {"include_usage": True},
+               "messages": [{"role": "user", "content": "hola"}]}
+    conn.request("POST", "/v1/chat/completions", json.dumps(payload), {"Cache-Control": "no-cache"})
+    response = conn.getresponse()
+    assert response.status == 200
+    assert response.getheader("Content-Type") == "text/event-stream"
+    events = [line[6:] for line in response.read().decode().splitlines() if line.startswith("data: ")]
+    assert events[-1] == "[DONE]"
+    chunks = [json.loads(e) for e in events[:-1]]
+    text = "".join(c["choices"][0]["delta"].get("content", "") for c in chunks if c["choices"])
+    assert text.strip() == "eco: hola (1 msgs)"
+    assert chunks[-1]["usage"]["total_tokens"] == 8
+
+def test_streaming_reports_provider_exceptions_and_ends_the_stream(running_gateway, monkeypatch):
+    def broken(self, prompt):
+        yield "parcial "
+        raise RuntimeError("se cortó")
+    monkeypatch.setattr("chat_cli.providers.ollama.OllamaProvider.stream_message", broken)
+    conn = http.client.HTTPConnection("127.0.0.1", running_gateway.port, timeout=10)
+    payload = {"model": "llama2", "stream": True, "messages": [{"role": "user", "content": "falla"}]}
+    for _ in range(2):  # La conexión sigue utilizable después del error
+        conn.request("POST", "/v1/chat/completions", json.dumps(payload))
+        response = conn.getresponse()
+        assert response.status == 200
+        events = [line[6:] for line in response.read().decode().splitlines() if line.startswith("data: ")]
+        assert events[-1] == "[DONE]"
+        assert json.loads(events[-2])["error"]["message"] == "se cortó"
+
+def test_routes_gpt_models_to_openai(running_gateway):
+    status, body = _post(running_gateway.port, {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "hola"}]})
+    assert status == 200
+    assert json.loads(body)["choices"][0]["message"]["content"] == "openai: gpt-4o-mini"
+
+def test_openai_receives_history_and_sampling_params(running_gateway):
+    messages = [{"role": "user", "content": "a"}, {"role": "assistant", "content": "b"},
+                {"role": "user", "content": "hola"}]
+    status, _ = _post(running_gateway.port, {"model": "gpt-4o-mini", "messages": messages, "temperature": 0.2,
+                                             "max_tokens": 50, "n": 1, "user": "u1"})
+    assert status == 200
+    body = FakeOpenAIHandler.last_body
+    assert body["messages"] == messages
+    assert body["temperature"] == 0.2 and body["max_tokens"] == 50 and "user" not in body
+    # La plantilla del pool no se queda con los parámetros de la petición
+    assert running_gateway.pool.get("openai", "gpt-4o-mini").sampling == {}
+
+def test_unsupported_params_are_rejected(running_gateway):
+    status, body = _post(running_gateway.port, {"model": "llama2", "messages": [{"role": "user", "content": "hola"}],
+                                                "logit_bias": {"1": 5}, "n": 3})
+    assert status == 400
+    assert "logit_bias" in json.loads(body)["error"]["message"]
+
+def test_errors_use_openai_format(running_gateway):
+    status, body = _post(running_gateway.port, {"model": "llama2", "messages": []})
+    assert status == 400
+    assert "error" in json.loads(body)
+    conn = http.client.HTTPConnection("127.0.0.1", running_gateway.port, timeout=10)
+    conn.request("GET", "/v1/nada")
+    assert conn.getresponse().status == 404
+
+def test_load_concurrent_clients(running_gateway):
+    clients = 64
+
+    def one(i):
+        return _post(running_gateway.port, {"model": "llama2", "messages": [{"role": "user", "content": f"p{i}"}]})
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        results = list(executor.map(one, range(clients)))
+    elapsed = time.perf_counter() - start
+    assert all(status == 200 for status, _ in results)
+    assert {json.loads(body)["choices"][0]["message"]["content"] for _, body in results} == \
+        {f"eco: p{i} (1 msgs)" for i in range(clients)}
+    # Con 16 llamadas en paralelo debe tardar muy por debajo de la ejecución en serie
+    assert elapsed < clients * UPSTREAM_DELAY / 2
+
+    # Peticiones idénticas simultáneas: una sola llamada al proveedor
+    calls_before = FakeOllamaHandler.calls
+    with ThreadPoolExecutor(max_workers=20) as executor:
+        same = list(executor.map(lambda _: _post(running_gateway.port, {"model": "llama2", "messages": [
+            {"role": "user", "content": "igual"}]}), range(20)))
+    assert all(status == 200 for status, _ in same)
+    assert FakeOllamaHandler.calls - calls_before == 1
@@ -0,0 +1,64 @@
+import io
+import json
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from chat_cli import headless
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        for word in ["eco: ", body["messages"][-1]["content"]]:
+            self.wfile.write(json.dumps({"message": {"role": "assistant", "content": word}, "done": False}).encode() + b"\n")
+        self.wfile.write(json.dumps({"message": {"content": ""}, "done": True, "prompt_eval_count": 3, "eval_count": 2}).encode() + b"\n")
+
+    def log_message(self, *args):
+        pass
+
+def _start_fake_ollama():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOllamaHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+class FakeStdin(io.StringIO):
+    def isatty(self):
+        return False
+
+def test_read_prompt_combines_args_and_stdin():
+    assert headless.read_prompt(["resume", "esto"], FakeStdin("contenido")) == "resume esto\n\ncontenido"
+    assert headless.read_prompt([], FakeStdin("")) == ""
+
+def test_run_ask_streams_to_stdout(monkeypatch):
+    server = _start_fake_ollama()
+    monkeypatch.setenv("OLLAMA_HOST", f"http://127.0.0.1:{server.server_port}")
+    out, err = io.BytesIO(), io.StringIO()
+    out.fileno = lambda: 1
+    code = headless.run_ask("ollama", "llama2", "hola", out=out, err=err)
+    server.shutdown()
+    assert code == headless.EXIT_OK
+    assert out.getvalue() == "eco: hola\n".encode()
+    assert err.getvalue() == ""
+
+def test_run_ask_reports_provider_errors_on_stderr(monkeypatch):
+    monkeypatch.setenv("OLLAMA_HOST", "http://127.0.0.1:9")  # Puerto cerrado
+    out, err = io.BytesIO(), io.StringIO()
+    out.fileno = lambda: 1
+    code = headless.run_ask("ollama", "llama2", "hola", out=out, err=err)
+    assert code == headless.EXIT_PROVIDER_ERROR
+    assert out.getvalue() == b""
+    assert "[Ollama]" in err.getvalue()
+
+def test_run_ask_rejects_empty_prompt_and_unknown_provider():
+    err = io.StringIO()
+    assert headless.run_ask("ollama", None, "", err=err) == headless.EXIT_USAGE
+    assert headless.run_ask("noexiste", None, "hola", err=err) == headless.EXIT_USAGE
+
+def test_cli_import_does_not_load_textual_or_sdks():
+    code = ("import sys, chat_cli.cli; "
+            "print([m for m in ('textual', 'rich.markdown', 'openai', 'ollama', 'google.generativeai') if m in sys.modules])")
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,65 @@
+import io
+import json
+import os
+import tempfile
+import threading
+from rich.console import Console
+from rich.markdown import Markdown
+from chat_cli import highlight
+from chat_cli.highlight import CachedMarkdown, HighlightCache
+
+def _render(renderable):
+    console = Console(file=io.StringIO(), width=80, force_terminal=True, color_system="truecolor")
+    console.print(renderable)
+    return console.file.getvalue()
+
+def _use_cache(monkeypatch, cache):
+    monkeypatch.setattr(highlight, "_cache", cache)
+
+def test_completed_blocks_are_highlighted_once(monkeypatch):
+    cache = HighlightCache(max_entries=8)
+    _use_cache(monkeypatch, cache)
+    md = "Texto\n\n```python\ndef f(x):\n    return x\n```\n"
+    first = _render(CachedMarkdown(md))
+    second = _render(CachedMarkdown(md))
+    assert first == second == _render(Markdown(md))
+    assert cache.misses == 1
+    assert len(cache._entries) == 1
+
+def test_open_block_during_streaming_is_not_cached(monkeypatch):
+    cache = HighlightCache(max_entries=8)
+    _use_cache(monkeypatch, cache)
+    _render(CachedMarkdown("```python\ndef f(x):\n"))
+    assert len(cache._entries) == 0
+
+def test_lru_limit_is_respected(monkeypatch):
+    cache = HighlightCache(max_entries=2)
+    _use_cache(monkeypatch, cache)
+    for i in range(5):
+        _render(CachedMarkdown(f"```python\nx = {i}\n```\n"))
+    assert len(cache._entries) == 2
+
+def test_large_block_is_highlighted_in_background(monkeypatch):
+    cache = HighlightCache(max_entries=8, async_lines=50)
+    _use_cache(monkeypatch, cache)
+    ready = threading.Event()
+    cache.add_listener(ready.set)
+    md = "```python\n" + "x = 1\n" * 200 + "```\n"
+    _render(CachedMarkdown(md))
+    assert ready.wait(timeout=10)
+    assert _render(CachedMarkdown(md)) == _render(Markdown(md))
+
+def test_disk_cache_is_reused_across_sessions(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmp:
+        md = "```python\nprint('hola')\n```\n"
+        _use_cache(monkeypatch, HighlightCache(disk_dir=tmp))
+        _render(CachedMarkdown(md))
+        fresh = HighlightCache(disk_dir=tmp)
+        _use_cache(monkeypatch, fresh)
+        assert _render(CachedMarkdown(md)) == _render(Markdown(md))
+        assert fresh.hits == 1 and fresh.misses == 0
+        # Solo datos: nada que se ejecute al cargar la caché
+        files = os.listdir(tmp)
+        assert files and all(name.endswith(".json") for name in files)
+        with open(os.path.join(tmp, files[0]), encoding="utf-8") as f:
+            assert "print" in json.load(f)["plain"]
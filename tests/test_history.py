@@ -46,3 +46,15 @@ def test_export_history_txt():
         assert '[2025-05-02T08:01:00] bot: respuesta' in lines[1]
     finally:
         os.remove(fname)
+
+def test_append_history_extends_array_in_place(tmp_path):
+    fname = tmp_path / "history.json"
+    first = {'role': 'user', 'content': 'hola', 'timestamp': 't1'}
+    second = {'role': 'assistant', 'content': 'línea 1\n"línea 2"', 'timestamp': 't2'}
+    history.append_history([first], fname)  # Archivo inexistente
+    history.append_history([second, first], fname)
+    assert history.load_history(fname) == [first, second, first]
+
+    history.clear_history(fname)  # "[]"
+    history.append_history([second], fname)
+    assert history.load_history(fname) == [second]
@@ -0,0 +1,79 @@
+import threading
+import time
+import pytest
+from chat_cli.mapreduce import MapReduceError, MapReduceJob, _group, split_chunks
+from chat_cli.usage import estimate_tokens
+
+def _document(paragraphs=12, words=40):
+    return "\n\n".join(" ".join(f"p{number}w{index}" for index in range(words)) for number in range(paragraphs)) + "\n"
+
+class FakeModel:
+    """Responde con un resumen corto por prompt, midiendo cuántas llamadas corren a la vez."""
+
+    def __init__(self, fail_on=None, delay=0.01):
+        self.fail_on = fail_on
+        self.delay = delay
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, prompt):
+        with self._lock:
+            self.calls.append(prompt)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+            if self.fail_on and self.fail_on in prompt:
+                raise MapReduceError("sin conexión")
+            if "--- Fragmento" in prompt:
+                # Resultados largos: el reduce necesita más de un nivel
+                return "map:" + prompt.split("--- Fragmento ")[1].split(" ")[0] + "\n" + "detalle " * 40
+            return "reduce(" + ",".join(line for line in prompt.splitlines() if line.startswith(("map:", "reduce("))) + ")"
+        finally:
+            with self._lock:
+                self.active -= 1
+
+@pytest.mark.parametrize("mode", ["paragraph", "line", "tokens"])
+def test_split_chunks_respects_budget_and_covers_document(mode):
+    data = _document().encode()
+    spans = list(split_chunks(data, mode, chunk_tokens=150))
+    assert spans[0][0] == 0 and spans[-1][1] == len(data)
+    assert all(previous[1] == following[0] for previous, following in zip(spans, spans[1:]))
+    assert all(estimate_tokens(data[start:end].decode()) <= 150 for start, end in spans)
+    if mode == "paragraph":
+        assert all(data[start:end].startswith(b"p") for start, end in spans)  # Cortes en inicio de párrafo
+    with pytest.raises(ValueError):
+        list(split_chunks(data, "frases"))
+
+def test_group_keeps_at_least_two_parts():
+    assert _group(["a", "b", "c"], budget=1) == [["a", "b", "c"]]
+    assert len(_group(["palabra " * 10] * 6, budget=25)) == 3
+
+def test_map_reduce_runs_in_parallel_and_resumes_from_checkpoint(tmp_path):
+    document = tmp_path / "doc.txt"
+    document.write_text(_document())
+    checkpoint = tmp_path / "checkpoint.jsonl"
+
+    failing = FakeModel(fail_on="Fragmento 3 ")
+    job = MapReduceJob(document, "resume", chunk_tokens=150, parallel=3, checkpoint_path=checkpoint, complete=failing)
+    with pytest.raises(MapReduceError) as info:
+        job.run()
+    assert [where for where, _ in info.value.failures] == ["fragmento 3"]
+    chunks = job.stats["chunks"]
+    assert chunks > 4 and 1 < failing.max_active <= 3
+
+    model = FakeModel()
+    job = MapReduceJob(document, "resume", chunk_tokens=150, parallel=3, checkpoint_path=checkpoint, complete=model)
+    result = job.run()
+    # Solo se repite el fragmento que falló; el reduce combina los resultados en orden
+    assert sum("--- Fragmento" in prompt for prompt in model.calls) == 1
+    assert job.stats["cached"] == chunks - 1 and job.stats["levels"] >= 2
+    positions = [result.index(f"map:{number})") if f"map:{number})" in result else result.index(f"map:{number},")
+                 for number in range(1, chunks + 1)]
+    assert result.startswith("reduce(") and positions == sorted(positions)
+
+    again = FakeModel()
+    job = MapReduceJob(document, "resume", chunk_tokens=150, parallel=3, checkpoint_path=checkpoint, complete=again)
+    assert job.run() == result and again.calls == []
@@ -0,0 +1,207 @@
+import copy
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import pytest
+from chat_cli import mcp
+from chat_cli.mcp import MCPManager
+
+STUB_SERVER = Path(__file__).resolve().parent / "mcp_stub_server.py"
+from mcp_stub_server import handle_message
+
+@pytest.fixture
+def manager():
+    manager = MCPManager(servers={"stub": {"command": [sys.executable, str(STUB_SERVER)]}}, timeout=10)
+    assert manager.connect() == 3
+    yield manager
+    manager.close()
+
+def test_tools_are_advertised_in_anthropic_format(manager):
+    tools = {tool["name"]: tool for tool in manager.anthropic_tools()}
+    assert set(tools) == {"lookup", "counter", "fail"}
+    assert tools["lookup"]["input_schema"]["properties"]["key"] == {"type": "string"}
+    assert manager.is_cacheable("lookup") and not manager.is_cacheable("counter")
+
+def test_tool_calls_of_one_turn_run_concurrently(manager):
+    calls = [{"id": f"t{i}", "name": "lookup", "input": {"key": str(i), "delay": 0.3}} for i in range(4)]
+    start = time.perf_counter()
+    results = manager.call_tools(calls)
+    elapsed = time.perf_counter() - start
+    assert [r["id"] for r in results] == ["t0", "t1", "t2", "t3"]
+    assert [r["content"][0]["text"] for r in results] == [f"valor de {i}" for i in range(4)]
+    assert all(r["elapsed"] >= 0.3 and r["server"] == "stub" for r in results)
+    assert elapsed < 0.9  # En serie serían 1.2 s
+
+def test_idempotent_results_are_cached_with_ttl(manager):
+    first = manager.call_tool("lookup", {"key": "a", "delay": 0.2})
+    second = manager.call_tool("lookup", {"key": "a", "delay": 0.2})
+    assert not first["cached"] and second["cached"]
+    assert second["content"] == first["content"] and second["elapsed"] < 0.1
+    counts = [manager.call_tool("counter", {})["content"][0]["text"] for _ in range(2)]
+    assert int(counts[1]) == int(counts[0]) + 1
+    failed = manager.call_tool("fail", {})
+    assert failed["is_error"] and not failed["cached"]
+    unknown = manager.call_tool("nope", {})
+    assert unknown["is_error"]
+
+def test_http_transport_keeps_session_id():
+    seen_sessions = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            seen_sessions.append(self.headers.get("Mcp-Session-Id"))
+            message = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            response = handle_message(message)
+            body = json.dumps(response).encode() if response else b""
+            self.send_response(200 if response else 202)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Mcp-Session-Id", "sesion-1")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        manager = MCPManager(servers={"http": {"url": f"http://127.0.0.1:{server.server_port}/mcp"}})
+        assert manager.connect() == 3
+        result = manager.call_tool("lookup", {"key": "b"})
+        assert result["content"] == [{"type": "text", "text": "valor de b"}]
+        assert seen_sessions[0] is None and seen_sessions[-1] == "sesion-1"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_failed_servers_are_retried_on_request_and_after_backoff(monkeypatch):
+    manager = MCPManager(servers={"roto": {"command": ["servidor-inexistente"]}})
+    attempts = []
+
+    def connect_one(name, conf):
+        attempts.append(name)
+        if len(attempts) < 3:
+            raise mcp.MCPError("no arranca")
+        return mcp.HTTPMCPClient(name, "http://127.0.0.1:9/mcp"), [{"name": "lookup"}]
+    monkeypatch.setattr(manager, "_connect_one", connect_one)
+    clock = [100.0]
+    monkeypatch.setattr(mcp.time, "monotonic", lambda: clock[0])
+
+    assert manager.connect() == 0 and manager.errors == {"roto": "no arranca"}
+    assert manager.connect() == 0 and len(attempts) == 1  # Sin reintentar cada turno
+    assert manager.connect(retry_failed=True) == 0 and len(attempts) == 2  # /mcp on
+    clock[0] += mcp.RETRY_DELAY * 2  # La espera se duplicó tras el segundo fallo
+    assert manager.connect() == 1 and len(attempts) == 3
+    assert manager.errors == {} and "roto" in manager.clients
+
+class FakeResponse:
+    def __init__(self, body=None, lines=None):
+        self.body = body
+        self.lines = lines or []
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.closed = True
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.body
+
+    def iter_lines(self):
+        return iter(self.lines)
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def post(self, url, headers=None, json=None, stream=False):
+        self.requests.append(copy.deepcopy(json))
+        return self.responses.pop(0)
+
+def _anthropic_with_tools(monkeypatch, manager, responses):
+    from chat_cli.providers import anthropic
+    session = FakeSession(responses)
+    monkeypatch.setattr("chat_cli.config.load_config", lambda: {})
+    monkeypatch.setattr(mcp, "_manager", manager)
+    monkeypatch.setattr(anthropic, "get_session", lambda: session)
+    return anthropic.AnthropicProvider(api_key="test", mcp_enabled=True), session
+
+def test_anthropic_runs_tool_use_blocks_and_returns_final_text(monkeypatch, manager):
+    provider, session = _anthropic_with_tools(monkeypatch, manager, [
+        FakeResponse({"stop_reason": "tool_use", "usage": {"input_tokens": 10, "output_tokens": 4}, "content": [
+            {"type": "text", "text": "Consulto."},
+            {"type": "tool_use", "id": "t1", "name": "lookup", "input": {"key": "x"}},
+            {"type": "tool_use", "id": "t2", "name": "fail", "input": {}},
+        ]}),
+        FakeResponse({"stop_reason": "end_turn", "usage": {"input_tokens": 30, "output_tokens": 2},
+                      "content": [{"type": "text", "text": "Listo"}]}),
+    ])
+    assert provider.send_message("hola") == "Listo"
+    assert "mcp_config" not in session.requests[0]
+    assert {tool["name"] for tool in session.requests[0]["tools"]} == {"lookup", "counter", "fail"}
+    tool_results = session.requests[1]["messages"][-1]["content"]
+    assert [(r["tool_use_id"], r["is_error"]) for r in tool_results] == [("t1", False), ("t2", True)]
+    assert tool_results[0]["content"] == [{"type": "text", "text": "valor de x"}]
+    assert [call["name"] for call in provider.last_tool_calls] == ["lookup", "fail"]
+    assert provider.last_usage == {"prompt_tokens": 40, "completion_tokens": 6}
+    assert provider.history[-1] == {"role": "assistant", "content": "Listo"}
+
+def test_anthropic_last_tool_round_forces_a_text_answer(monkeypatch, manager):
+    from chat_cli.providers import anthropic
+    monkeypatch.setattr(anthropic, "MAX_TOOL_ROUNDS", 2)
+    tool_round = lambda: FakeResponse({"stop_reason": "tool_use", "content": [
+        {"type": "tool_use", "id": "t1", "name": "lookup", "input": {"key": "x"}}]})
+    provider, session = _anthropic_with_tools(monkeypatch, manager, [tool_round(), tool_round(), tool_round()])
+    reply = provider.send_message("hola")
+    # La última ronda pide texto; si el modelo insiste en herramientas, el turno falla con un error claro
+    assert [request.get("tool_choice") for request in session.requests] == [None, None, {"type": "none"}]
+    assert provider.last_error and "2 rondas" in reply
+    assert provider.history[-1]["role"] == "user"
+
+def _sse(*events):
+    return [b"data: " + json.dumps(event).encode() for event in events]
+
+def test_anthropic_stream_collects_tool_use_input_deltas(monkeypatch, manager):
+    provider, session = _anthropic_with_tools(monkeypatch, manager, [
+        FakeResponse(lines=_sse(
+            {"type": "message_start", "message": {"usage": {"input_tokens": 8}}},
+            {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}},
+            {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": "Busco. "}},
+            {"type": "content_block_start", "index": 1,
+             "content_block": {"type": "tool_use", "id": "t1", "name": "lookup", "input": {}}},
+            {"type": "content_block_delta", "index": 1, "delta": {"type": "input_json_delta", "partial_json": "{\"key\": "}},
+            {"type": "content_block_delta", "index": 1, "delta": {"type": "input_json_delta", "partial_json": "\"z\"}"}},
+            {"type": "message_delta", "delta": {"stop_reason": "tool_use"}, "usage": {"output_tokens": 3}},
+        )),
+        FakeResponse(lines=_sse(
+            {"type": "message_start", "message": {"usage": {"input_tokens": 20}}},
+            {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": "Es z."}},
+            {"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": 2}},
+        )),
+    ])
+    assert "".join(provider.stream_message("hola")) == "Busco. Es z."
+    assistant, results = session.requests[1]["messages"][-2:]
+    assert assistant["content"][1] == {"type": "tool_use", "id": "t1", "name": "lookup", "input": {"key": "z"}}
+    assert results["content"][0]["content"] == [{"type": "text", "text": "valor de z"}]
+    assert provider.last_usage == {"prompt_tokens": 28, "completion_tokens": 5}
+
+def test_anthropic_stream_closes_the_response_when_abandoned(monkeypatch, manager):
+    response = FakeResponse(lines=_sse(
+        {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": "uno "}},
+        {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": "dos"}},
+    ))
+    provider, _ = _anthropic_with_tools(monkeypatch, manager, [response])
+    stream = provider.stream_message("hola")
+    assert next(stream) == "uno "
+    stream.close()  # Como al descartar un intento de salida estructurada
+    assert response.closed
@@ -0,0 +1,34 @@
+import time
+from chat_cli.pipeline import PromptQueue, parse_prompt
+from chat_cli.tabs import ChatTab
+
+class EchoProvider:
+    provider_name = "ollama"
+    model = "llama-test"
+
+    def __init__(self):
+        self.history = []
+
+def test_parse_prompt_marks_independent_prompts():
+    assert parse_prompt("hola") == ("hola", False)
+    assert parse_prompt("& traduce esto") == ("traduce esto", True)
+
+def test_queue_dispatches_in_order_with_edit_and_cancel():
+    queue = PromptQueue()
+    first, second, third = queue.push("uno"), queue.push("dos"), queue.push("tres")
+    assert len(queue) == 3 and [item.number for item in queue] == [1, 2, 3]
+    assert queue.edit(2, "dos editado") is second and second.text == "dos editado"
+    assert queue.cancel(1) is first and queue.cancel(1) is None and queue.edit(9, "x") is None
+    time.sleep(0.02)
+    assert queue.oldest_wait() >= 0.02
+    assert queue.pop() is second and queue.average_wait() >= 0.02
+    assert queue.clear() == [third] and queue.pop() is None and queue.oldest_wait() == 0.0
+
+def test_tab_label_shows_queue_depth(monkeypatch):
+    monkeypatch.setattr("chat_cli.config.load_config", lambda: {})
+    tab = ChatTab(1, EchoProvider(), "llama-test")
+    tab.queue.push("siguiente")
+    tab.busy = True
+    assert "+1" in tab.label()
+    tab.busy, tab.parallel = False, 1
+    assert "⟳" in tab.label()
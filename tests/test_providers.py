@@ -1,6 +1,7 @@
 from chat_cli.providers.openai import OpenAIProvider
 from chat_cli.providers.ollama import OllamaProvider
 from chat_cli.providers.gemini import GeminiProvider
+import time
 import types
 
 def test_openai_send_message(monkeypatch):
@@ -21,3 +22,116 @@ def test_ollama_send_message(monkeypatch):
 def test_gemini_send_message():
     provider = GeminiProvider()
     assert "simulada" in provider.send_message("hola")
+
+def test_ollama_payload_includes_performance_options(monkeypatch):
+    conf = {"keep_alive": "1h", "num_ctx": 8192, "num_thread": 8, "num_gpu": 99}
+    monkeypatch.setattr("chat_cli.config.load_config", lambda: {"providers": {"ollama": conf}})
+    provider = OllamaProvider(model="llama2")
+    provider.history.append({"role": "user", "content": "hola"})
+    payload = provider._build_payload(stream=True)
+    assert payload["keep_alive"] == "1h"
+    assert payload["options"] == {"num_ctx": 8192, "num_thread": 8, "num_gpu": 99}
+    assert payload["stream"] is True
+
+def test_connection_warmer_probes_and_keeps_alive():
+    from chat_cli.providers.connection import ConnectionWarmer
+    calls = []
+
+    class FakeProvider:
+        def prewarm(self):
+            calls.append(1)
+            return True
+
+    warmer = ConnectionWarmer(FakeProvider(), interval=0.01).start()
+    assert warmer.wait(timeout=1) is True
+    time.sleep(0.05)
+    warmer.stop()
+    assert len(calls) >= 2
+
+def test_anthropic_stream_parser_collects_text_and_usage():
+    from chat_cli.providers.anthropic import AnthropicProvider
+    provider = AnthropicProvider(api_key="test", model="claude-3-haiku-20240307")
+    lines = [
+        b"event: message_start",
+        b'data: {"type": "message_start", "message": {"usage": {"input_tokens": 25, "output_tokens": 1}}}',
+        b"",
+        b'data: {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": "Hola"}}',
+        b'data: {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": " mundo"}}',
+        b'data: {"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": 7}}',
+        b'data: {"type": "message_stop"}',
+    ]
+    assert "".join(provider._iter_stream_text(lines)) == "Hola mundo"
+    assert provider.last_usage == {"prompt_tokens": 25, "completion_tokens": 7}
+
+def test_ollama_stream_parser_reads_eval_counts():
+    provider = OllamaProvider(model="llama2")
+    lines = [
+        b'{"message": {"role": "assistant", "content": "Ho"}, "done": false}',
+        b'{"message": {"role": "assistant", "content": "la"}, "done": false}',
+        b'{"message": {"role": "assistant", "content": ""}, "done": true, "prompt_eval_count": 11, "eval_count": 2}',
+    ]
+    assert "".join(provider._iter_stream_text(lines)) == "Hola"
+    assert provider.last_usage == {"prompt_tokens": 11, "completion_tokens": 2}
+
+def _gemini_chunk(text=None, finish_reason=None):
+    parts = [types.SimpleNamespace(text=text)] if text is not None else []
+    candidate = types.SimpleNamespace(content=types.SimpleNamespace(parts=parts),
+                                      finish_reason=types.SimpleNamespace(name=finish_reason) if finish_reason else None)
+    return types.SimpleNamespace(candidates=[candidate], usage_metadata=None)
+
+class FakeGeminiChat:
+    def __init__(self, history, sessions):
+        self.history = history
+        sessions.append(history)
+
+    def send_message(self, prompt, stream=False):
+        chunks = [_gemini_chunk(f"eco {prompt}"), _gemini_chunk(None, "SAFETY"), _gemini_chunk(" fin")]
+        return chunks if stream else _gemini_chunk(f"eco {prompt}")
+
+    async def send_message_async(self, prompt, stream=False):
+        async def chunks():
+            for chunk in self.send_message(prompt, stream=True):
+                yield chunk
+        return chunks()
+
+def _fake_gemini(monkeypatch, max_history=None):
+    import chat_cli.providers.gemini as gemini
+    sessions, created = [], []
+
+    class FakeModel:
+        def __init__(self, model):
+            created.append(model)
+
+        def start_chat(self, history):
+            return FakeGeminiChat(history, sessions)
+
+    monkeypatch.setattr(gemini, "_clients", {})
+    monkeypatch.setattr(gemini.genai, "configure", lambda api_key: None)
+    monkeypatch.setattr(gemini.genai, "GenerativeModel", FakeModel)
+    conf = {"max_history": max_history} if max_history is not None else {}
+    monkeypatch.setattr("chat_cli.config.load_config", lambda: {"providers": {"gemini": conf}})
+    return sessions, created
+
+def test_gemini_keeps_bounded_history_and_reuses_client(monkeypatch):
+    sessions, created = _fake_gemini(monkeypatch, max_history=2)
+    provider = GeminiProvider(api_key="k", model="gemini-test")
+    assert provider.send_message("uno") == "eco uno"
+    assert provider.send_message("dos") == "eco dos"
+    assert provider.send_message("tres") == "eco tres"
+    assert sessions[1] == [{"role": "user", "parts": ["uno"]}, {"role": "model", "parts": ["eco uno"]}]
+    # Solo los últimos max_history mensajes viajan en cada llamada
+    assert sessions[2] == [{"role": "user", "parts": ["dos"]}, {"role": "model", "parts": ["eco dos"]}]
+    GeminiProvider(api_key="k", model="gemini-test")
+    assert created == ["gemini-test"]
+
+def test_gemini_stream_skips_parts_without_text(monkeypatch):
+    import asyncio
+    _fake_gemini(monkeypatch)
+    provider = GeminiProvider(api_key="k", model="gemini-test")
+    assert list(provider.stream_message("hola")) == ["eco hola", " fin"]
+    assert provider.last_error is None
+
+    async def collect():
+        return [token async for token in provider.astream_message("otra")]
+    assert asyncio.run(collect()) == ["eco otra", " fin"]
+    assert [msg["content"] for msg in provider.history] == ["hola", "eco hola fin", "otra", "eco otra fin"]
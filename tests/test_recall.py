@@ -0,0 +1,95 @@
+import json
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from chat_cli.recall import RecallIndex, exchanges_of, format_recalled
+
+DIM = 64
+
+def fake_embedding(text):
+    """Bolsa de palabras con hashing: textos con palabras en común quedan cerca."""
+    vector = [0.0] * DIM
+    for word in text.lower().split():
+        vector[zlib.crc32(word.strip("¿?.,:").encode()) % DIM] += 1.0
+    return vector
+
+@pytest.fixture
+def ollama_embed_server(monkeypatch):
+    """Servidor local que imita /api/embed de Ollama y registra los textos recibidos."""
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            assert self.path == "/api/embed" and payload["model"] == "embed-test"
+            received.append(payload["input"])
+            body = json.dumps({"model": payload["model"],
+                               "embeddings": [fake_embedding(text) for text in payload["input"]]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    conf = {"providers": {"ollama": {"host": f"http://127.0.0.1:{server.server_port}"}},
+            "recall": {"model": "embed-test"}}
+    monkeypatch.setattr("chat_cli.config.load_config", lambda: conf)
+    yield received
+    server.shutdown()
+    server.server_close()
+
+def _history(*pairs):
+    history = []
+    for i, (question, answer) in enumerate(pairs):
+        history.append({"role": "user", "content": question, "timestamp": f"2025-05-0{i + 1} 10:00:00"})
+        history.append({"role": "assistant", "content": answer, "timestamp": f"2025-05-0{i + 1} 10:00:05"})
+    return history
+
+HISTORY = _history(
+    ("¿Cómo configuro keep_alive en Ollama?", "Usa providers.ollama.keep_alive en config.yaml."),
+    ("¿Qué es un mutex?", "Un mecanismo de exclusión mutua entre hilos."),
+    ("Receta de pan casero", "Harina, agua, sal y levadura."),
+)
+
+def test_exchanges_pair_user_and_assistant_messages():
+    exchanges = exchanges_of(HISTORY + [{"role": "user", "content": "sin respuesta", "timestamp": "x"}])
+    assert len(exchanges) == 3
+    assert exchanges[1][1] == "Usuario: ¿Qué es un mutex?\nAsistente: Un mecanismo de exclusión mutua entre hilos."
+
+def test_sync_is_incremental_and_persists_in_memmap(tmp_path, ollama_embed_server):
+    index = RecallIndex(tmp_path)
+    assert index.sync(HISTORY) == 3
+    assert index.sync(HISTORY) == 0
+    longer = HISTORY + _history(("¿Y el mutex recursivo?", "Puede tomarse varias veces por el mismo hilo."))[:2]
+    longer[-2]["timestamp"] = "2025-05-09 10:00:00"
+    assert index.sync(longer) == 1
+    assert [len(batch) for batch in ollama_embed_server] == [3, 1]
+    assert (tmp_path / "vectors.f32").stat().st_size == 4 * 4 * DIM
+
+    reopened = RecallIndex(tmp_path)
+    assert len(reopened.entries) == 4 and reopened.sync(longer) == 0
+    results = reopened.search("mutex entre hilos", top_k=2, min_score=0.0)
+    assert [r["timestamp"] for r in results][0] in ("2025-05-02 10:00:00", "2025-05-09 10:00:00")
+    assert all("mutex" in r["text"] for r in results)
+
+def test_search_filters_by_score_and_formats_context(tmp_path, ollama_embed_server):
+    index = RecallIndex(tmp_path)
+    index.sync(HISTORY)
+    results = index.search("¿cómo configuro keep_alive?", min_score=0.3)
+    assert [r["timestamp"] for r in results] == ["2025-05-01 10:00:00"]
+    assert results[0]["score"] > 0.3
+    context = format_recalled(results)
+    assert "keep_alive en config.yaml" in context and "[2025-05-01 10:00:00]" in context
+
+def test_changing_embedding_model_rebuilds_index(tmp_path, ollama_embed_server):
+    index = RecallIndex(tmp_path)
+    index.sync(HISTORY)
+    other = RecallIndex(tmp_path, model="otro-modelo", embed=lambda texts: [fake_embedding(t) for t in texts])
+    assert other.entries == [] and not (tmp_path / "vectors.f32").exists()
+    assert other.sync(HISTORY) == 3
@@ -0,0 +1,70 @@
+import asyncio
+import time
+import pytest
+from chat_cli.render import RenderScheduler, iterate_in_thread
+
+def test_scheduler_coalesces_fast_tokens_into_few_frames():
+    frames = []
+    tokens = [f"t{i} " for i in range(2000)]
+    scheduler = RenderScheduler(max_fps=10, min_fps=2, queue_size=64)
+    result = asyncio.run(scheduler.run(lambda: iter(tokens), frames.append))
+    assert result == "".join(tokens)
+    assert frames[-1] == result
+    assert scheduler.tokens == 2000
+    assert len(frames) < 50
+
+def test_scheduler_flushes_pending_tokens_while_stream_is_idle():
+    frames = []
+
+    def slow_stream():
+        yield "hola"
+        time.sleep(0.3)
+        yield " mundo"
+
+    scheduler = RenderScheduler(max_fps=20, min_fps=5)
+    asyncio.run(scheduler.run(slow_stream, frames.append))
+    # "hola" se muestra sin esperar al siguiente token
+    assert "hola" in frames
+    assert frames[-1] == "hola mundo"
+
+def test_reader_propagates_errors():
+    def broken():
+        yield "a"
+        raise RuntimeError("boom")
+
+    async def consume():
+        return [token async for token in iterate_in_thread(broken)]
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(consume())
+
+def test_reader_closes_generator_when_consumer_stops():
+    closed = []
+
+    def endless():
+        try:
+            while True:
+                yield "x"
+        finally:
+            closed.append(True)
+
+    async def consume():
+        async for _ in iterate_in_thread(endless, maxsize=4):
+            break
+        await asyncio.sleep(0.1)
+
+    asyncio.run(consume())
+    assert closed == [True]
+
+def test_scheduler_consumes_native_async_streams():
+    frames = []
+
+    async def stream():
+        for word in ["uno ", "dos ", "tres"]:
+            await asyncio.sleep(0.01)
+            yield word
+
+    scheduler = RenderScheduler(max_fps=30, min_fps=5)
+    result = asyncio.run(scheduler.run(stream, frames.append, asynchronous=True))
+    assert result == "uno dos tres"
+    assert frames[-1] == result
@@ -0,0 +1,43 @@
+import io
+from rich.console import Console
+from chat_cli.history import load_history, save_history
+from chat_cli.repl import Repl
+
+class FakeProvider:
+    model = "fake"
+
+    def __init__(self, fail=False):
+        self.history = []
+        self.fail = fail
+        self.last_usage = None
+
+    def stream_message(self, prompt):
+        self.history.append({"role": "user", "content": prompt})
+        if self.fail:
+            raise RuntimeError("sin conexión")
+        for token in ["# Título\n\n", "uno ", "dos ", "tres"]:
+            yield token
+
+def _repl(tmp_path, monkeypatch, provider):
+    monkeypatch.chdir(tmp_path)  # usage.jsonl se escribe en el directorio actual
+    save_history([{"role": "user", "content": "antes", "timestamp": "2025-01-01 00:00:00"}], tmp_path / "history.json")
+    console = Console(file=io.StringIO(), width=80, force_terminal=True)
+    return Repl(provider, console=console, history_file=str(tmp_path / "history.json")), console
+
+def test_repl_streams_markdown_and_appends_history(tmp_path, monkeypatch):
+    provider = FakeProvider()
+    repl, console = _repl(tmp_path, monkeypatch, provider)
+    assert len(provider.history) == 0  # Las sesiones anteriores quedan archivadas
+    assert repl.turn("hola") == "# Título\n\nuno dos tres"
+    assert "uno dos tres" in console.file.getvalue()
+    saved = load_history(tmp_path / "history.json")
+    assert [(m["role"], m["content"]) for m in saved] == [
+        ("user", "antes"), ("user", "hola"), ("assistant", "# Título\n\nuno dos tres")]
+    assert [m["role"] for m in provider.history] == ["user", "assistant"]
+    assert repl.usage.session["turns"] == 1
+
+def test_repl_records_user_message_on_error(tmp_path, monkeypatch):
+    repl, console = _repl(tmp_path, monkeypatch, FakeProvider(fail=True))
+    assert repl.turn("hola") is None
+    assert "sin conexión" in console.file.getvalue()
+    assert [m["content"] for m in load_history(tmp_path / "history.json")] == ["antes", "hola"]
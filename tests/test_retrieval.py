@@ -0,0 +1,79 @@
+import json
+import os
+import pytest
+from chat_cli import retrieval
+from chat_cli.retrieval import DocumentIndex, chunk_text, open_index
+from chat_cli.usage import estimate_tokens
+
+@pytest.fixture
+def docs(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setattr("chat_cli.config.load_config", lambda: {})
+    root = tmp_path / "docs"
+    root.mkdir()
+    (root / "ollama.md").write_text("Ollama corre modelos locales.\nEl parámetro keep_alive mantiene el modelo cargado.\n")
+    (root / "gemini.md").write_text("Gemini usa una API key de Google.\n")
+    (root / "imagen.bin").write_bytes(b"\0\1\2keep_alive")
+    (root / ".git").mkdir()
+    (root / ".git" / "config").write_text("keep_alive keep_alive keep_alive")
+    return root
+
+def test_chunk_text_cuts_on_line_boundaries():
+    text = "".join(f"línea {i}\n" for i in range(1, 101))
+    chunks = chunk_text(text, chunk_chars=100)
+    assert chunks[0][0] == 1 and chunks[1][0] == chunks[0][1].count("\n") + 1
+    assert "".join(chunk for _, chunk in chunks) == text
+    assert all(len(chunk) <= 100 for _, chunk in chunks)
+
+def test_search_ranks_with_bm25_and_skips_binary_and_hidden(docs):
+    index, stats = open_index(docs)
+    assert stats["files"] == 3 and stats["chunks"] == 2
+    results = index.search("¿qué hace keep_alive en ollama?")
+    assert [r["path"] for r in results] == ["ollama.md"]
+    assert results[0]["line"] == 1 and results[0]["score"] > 0
+    assert index.search("inexistente") == []
+
+def test_update_is_incremental_by_mtime(docs):
+    index, _ = open_index(docs)
+    _, stats = open_index(docs)
+    assert (stats["added"], stats["updated"], stats["removed"]) == (0, 0, 0)
+
+    (docs / "gemini.md").write_text("Gemini ahora admite streaming asíncrono.\n")
+    os.utime(docs / "gemini.md", ns=(1, 1))
+    (docs / "ollama.md").unlink()
+    (docs / "nuevo.txt").write_text("Un documento nuevo sobre streaming.\n")
+    index, stats = open_index(docs)
+    assert (stats["added"], stats["updated"], stats["removed"]) == (1, 1, 1)
+    assert {r["path"] for r in index.search("streaming")} == {"gemini.md", "nuevo.txt"}
+    assert index.search("api key google") == [] and "ollama" not in index.postings
+    assert index.total_length == sum(chunk[3] for chunk in index.chunks.values())
+
+def test_parallel_indexing_matches_serial(docs, monkeypatch):
+    for i in range(20):
+        (docs / f"nota{i}.txt").write_text(f"nota número {i}\n" + "contenido repetido\n" * i)
+    monkeypatch.setattr(retrieval, "PARALLEL_THRESHOLD", 1)
+    parallel = DocumentIndex(docs, docs.parent / "paralelo.json")
+    parallel.update(workers=2)
+    serial = DocumentIndex(docs, docs.parent / "serie.json")
+    serial.update(workers=1)
+    assert parallel.search("contenido repetido nota") == serial.search("contenido repetido nota")
+    assert DocumentIndex.load(docs, docs.parent / "paralelo.json").postings == parallel.postings
+
+def test_index_is_stored_as_plain_json(docs):
+    index, _ = open_index(docs)
+    with open(index.index_path, encoding="utf-8") as f:
+        assert json.load(f)["version"] == retrieval.INDEX_VERSION
+    loaded = DocumentIndex.load(docs)
+    assert (loaded.files, loaded.chunks, loaded.postings) == (index.files, index.chunks, index.postings)
+    assert loaded.search("keep_alive") == index.search("keep_alive")
+    index.index_path.write_bytes(b"\x80\x04basura")  # Un archivo dañado no se ejecuta: se reconstruye
+    assert DocumentIndex.load(docs).chunks == {}
+
+def test_augment_prompt_respects_token_budget(docs):
+    for i in range(10):
+        (docs / f"guia{i}.md").write_text(f"keep_alive guía {i}\n" + "detalle " * 200)
+    index, _ = open_index(docs)
+    context = index.build_context("keep_alive", token_budget=300)
+    assert 0 < estimate_tokens(context) <= 300
+    prompt = index.augment_prompt("¿Qué hace keep_alive en Ollama?", token_budget=300)
+    assert prompt.endswith("¿Qué hace keep_alive en Ollama?") and "--- ollama.md:1 ---" in prompt
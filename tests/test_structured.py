@@ -0,0 +1,134 @@
+import io
+import json
+import pytest
+from chat_cli import headless
+from chat_cli.structured import (IncrementalParser, SchemaViolation, StructuredOutputError, StructuredStream,
+                                 load_schema, validate)
+
+ITEMS_SCHEMA = {
+    "type": "array",
+    "maxItems": 3,
+    "items": {
+        "type": "object",
+        "required": ["name", "level"],
+        "additionalProperties": False,
+        "properties": {"name": {"type": "string"}, "level": {"enum": ["bajo", "alto"]}},
+    },
+}
+
+class ScriptedProvider:
+    """Proveedor falso: cada intento emite el siguiente guion de fragmentos y anota si se consumió entero."""
+
+    def __init__(self, *scripts):
+        self.scripts = list(scripts)
+        self.history = []
+        self.last_error = None
+        self.response_schema = None
+        self.prompts = []
+        self.consumed = []
+
+    def stream_message(self, prompt):
+        self.prompts.append(prompt)
+        self.history.append({"role": "user", "content": prompt})
+        chunks = self.scripts.pop(0)
+        self.consumed.append(0)
+        for chunk in chunks:
+            self.consumed[-1] += 1
+            yield chunk
+        self.history.append({"role": "assistant", "content": "".join(chunks)})
+
+def _chunks(text, size=3):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+def test_parser_yields_array_elements_as_they_complete():
+    parser = IncrementalParser(ITEMS_SCHEMA)
+    assert parser.feed('Claro:\n```json\n[{"name": "a\\"b", "level": "ba') == []
+    assert parser.feed('jo"}, {"name"') == [{"name": 'a"b', "level": "bajo"}]
+    assert parser.feed(': "c", "level": "alto"}]\n```') == [{"name": "c", "level": "alto"}]
+    assert parser.done and parser.value == [{"name": 'a"b', "level": "bajo"}, {"name": "c", "level": "alto"}]
+
+def test_parser_scalar_root_and_nested_values():
+    schema = {"type": "object", "properties": {"n": {"type": "integer", "minimum": 0}, "tags": {"type": "array"}}}
+    parser = IncrementalParser(schema)
+    assert parser.feed('{"n": 4') == []
+    assert parser.feed('2, "tags": [true, null, -1.5e2, "\\u00e9"]} resto') == [
+        {"n": 42, "tags": [True, None, -150.0, "é"]}]
+    number = IncrementalParser({"type": "number"})
+    assert number.feed("Resultado: 3.5") == [] and number.close() == [3.5]
+
+@pytest.mark.parametrize("partial, path", [
+    ('[{"name": 1', "$[0].name"),                            # Tipo equivocado al empezar el valor
+    ('[{"name": "a", "color"', "$[0]"),                       # Clave no permitida
+    ('[{"name": "a", "level": "me', "$[0].level"),            # Prefijo que no está en el enum
+    ('[{"name": "a", "level": "alto"}, {}', "$[1]"),          # Falta una propiedad requerida
+    ('[{"name": "a", "level": "alto"}' + ', {"name": "a", "level": "alto"}' * 2 + ", {", "$"),  # maxItems
+])
+def test_parser_rejects_partial_documents_early(partial, path):
+    parser = IncrementalParser(ITEMS_SCHEMA)
+    with pytest.raises(SchemaViolation) as info:
+        parser.feed(partial)
+    assert info.value.path == path
+
+def test_validate_and_load_schema(tmp_path):
+    validate({"a": [1, 2]}, {"type": "object", "properties": {"a": {"type": "array", "items": {"type": "integer"}}}})
+    with pytest.raises(SchemaViolation, match=r"\$\.a\[1\]"):
+        validate({"a": [1, "x"]}, {"properties": {"a": {"items": {"type": "integer"}}}})
+    with pytest.raises(SchemaViolation):
+        validate("x", {"anyOf": [{"type": "integer"}, {"type": "string", "minLength": 2}]})
+    path = tmp_path / "schema.json"
+    path.write_text(json.dumps(ITEMS_SCHEMA))
+    assert load_schema(str(path)) == ITEMS_SCHEMA
+    assert load_schema('{"type": "string"}') == {"type": "string"}
+    with pytest.raises(ValueError):
+        load_schema("[1, 2]")
+
+def test_structured_stream_aborts_and_restarts_elements_after_retry():
+    good = '[{"name": "c", "level": "bajo"}, {"name": "b", "level": "alto"}]'
+    bad = '[{"name": "a", "level": "bajo"}, {"name": "b", "level": "medio"}, ' + '{"name": "z"}' * 20 + "]"
+    provider = ScriptedProvider(_chunks(bad), _chunks(good))
+    structured = StructuredStream(provider, ITEMS_SCHEMA, retries=2)
+    events = [(kind, value) for kind, value in structured.events("dame niveles") if kind != "text"]
+    # El elemento del intento descartado queda antes del "retry"; el nuevo intento empieza desde el primero
+    assert [kind for kind, _ in events] == ["element", "retry", "element", "element"]
+    assert events[0][1] == {"name": "a", "level": "bajo"} and events[1][1].path == "$[1].level"
+    assert [value for _, value in events[2:]] == json.loads(good)
+    # El primer intento se cortó en cuanto "me..." dejó de poder estar en el enum
+    assert provider.consumed[0] < len(_chunks(bad)) // 2
+    assert provider.response_schema == ITEMS_SCHEMA
+    assert "JSON Schema" in provider.prompts[0] and "$[1].level" in provider.prompts[1]
+    # El intento fallido no queda en el historial del proveedor
+    assert [m["role"] for m in provider.history] == ["user", "assistant"]
+    assert structured.value == json.loads(good) and structured.attempts == 2
+
+def test_structured_stream_gives_up_after_retries():
+    provider = ScriptedProvider(["no sé"], ['{"x": 1}'])
+    structured = StructuredStream(provider, {"type": "array"}, retries=1)
+    with pytest.raises(StructuredOutputError) as info:
+        list(structured.elements("hola"))
+    assert len(info.value.errors) == 2 and not info.value.provider_error
+
+def test_run_ask_writes_validated_elements_as_jsonl():
+    # El primer intento entrega un elemento válido antes de fallar: no debe llegar a la salida
+    provider = ScriptedProvider(_chunks('[{"name": "x", "level": "bajo"}, {"name": "a", "level": "mal"}]'),
+                                _chunks('[{"name": "a", "level": "alto"}, {"name": "b", "level": "bajo"}]'))
+    out, err = io.BytesIO(), io.StringIO()
+    out.fileno = lambda: 1
+    code = headless.run_ask("ollama", None, "hola", out=out, err=err, provider=provider, schema=ITEMS_SCHEMA)
+    assert code == headless.EXIT_OK
+    assert [json.loads(line) for line in out.getvalue().decode().splitlines()] == [
+        {"name": "a", "level": "alto"}, {"name": "b", "level": "bajo"}]
+    assert "reintentando" in err.getvalue()
+
+    provider = ScriptedProvider(["[1]"], ["[2]"], ["[3]"])
+    code = headless.run_ask("ollama", None, "hola", out=out, err=err, provider=provider,
+                            schema={"type": "array", "items": {"type": "string"}})
+    assert code == headless.EXIT_SCHEMA_ERROR
+
+def test_openai_schema_name_matches_api_pattern(monkeypatch):
+    from chat_cli.providers.openai import OpenAIProvider
+    monkeypatch.setattr("chat_cli.config.load_config", lambda: {})
+    provider = OpenAIProvider(api_key="sk-prueba", model="gpt-4o-mini")
+    provider.response_schema = {"type": "object", "title": "Lista de tareas (v2)"}
+    assert provider._structured_options()["response_format"]["json_schema"]["name"] == "Lista_de_tareas_v2"
+    provider.response_schema = {"type": "object", "title": "¿?"}
+    assert provider._structured_options()["response_format"]["json_schema"]["name"] == "response"
@@ -0,0 +1,69 @@
+import asyncio
+import time
+from chat_cli.tabs import ChatTab, history_file_for
+
+class SlowProvider:
+    def __init__(self, name, delay=0.02, count=10):
+        self.provider_name = name
+        self.model = f"{name}-model"
+        self.history = []
+        self.delay = delay
+        self.count = count
+
+    def stream_message(self, prompt):
+        for i in range(self.count):
+            time.sleep(self.delay)
+            yield f"{self.provider_name}{i} "
+
+def test_tab_state_labels_and_history_files(monkeypatch):
+    monkeypatch.setattr("chat_cli.config.load_config", lambda: {})
+    assert history_file_for(1) == "history.json" and history_file_for(3) == "history-3.json"
+    provider = SlowProvider("ollama")
+    tab = ChatTab(2, provider, provider.model, stream=True)
+    assert provider.history is tab.conversation and tab.history_file == "history-2.json"
+
+    tab.add("user", "hola", "Tú", visible=False)
+    entry = tab.add("llm", "respuesta", "LLM", visible=False)
+    assert tab.unread == 1 and "●1" in tab.label()
+    entry.widget = object()
+    tab.release_widgets()
+    assert entry.widget is None
+    tab.busy, tab.live_tokens = True, 12
+    assert "⟳ 12 tok" in tab.label(active=True) and tab.label(active=True).startswith("[reverse")
+
+def test_tabs_stream_concurrently_with_their_own_history(monkeypatch):
+    monkeypatch.setattr("chat_cli.config.load_config", lambda: {})
+    tabs = [ChatTab(number, SlowProvider(name), f"{name}-model", stream=True)
+            for number, name in ((1, "uno"), (2, "dos"))]
+    frames = {1: [], 2: []}
+
+    async def run():
+        return await asyncio.gather(*(tab.stream_response("hola", frames[tab.number].append) for tab in tabs))
+
+    start = time.perf_counter()
+    responses = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+    assert responses == ["".join(f"{name}{i} " for i in range(10)) for name in ("uno", "dos")]
+    # Las dos respuestas se solapan: el total se acerca al de una sola, no a la suma
+    assert elapsed < 2 * 10 * 0.02 * 0.9
+    assert frames[1][-1] == responses[0] and frames[2][-1] == responses[1]
+    assert all(tab.live_tokens == 0 for tab in tabs)
+    assert tabs[0].provider.history is not tabs[1].provider.history
+
+def test_concurrent_turns_on_one_tab_count_their_own_live_tokens(monkeypatch):
+    monkeypatch.setattr("chat_cli.config.load_config", lambda: {})
+    tab = ChatTab(1, SlowProvider("uno", count=5), "uno-model", stream=True)
+    longer = SlowProvider("dos", count=20)
+    seen = []
+
+    async def run():
+        short = asyncio.ensure_future(tab.stream_response("hola", lambda text: None))
+        other = asyncio.ensure_future(tab.stream_response("hola", lambda text: None,
+                                                          lambda: longer.stream_message("hola")))
+        await short
+        # Al terminar el turno corto solo queda la estimación del otro, que sigue llegando
+        seen.append(tab.live_tokens)
+        await other
+
+    asyncio.run(run())
+    assert seen[0] > 0 and tab.live_tokens == 0
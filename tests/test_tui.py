@@ -0,0 +1,235 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+import pytest
+from chat_cli import providers
+from chat_cli.tui import ChatApp
+
+class EchoProvider:
+    """Responde "eco: <prompt>"; con `gate` cada respuesta espera a que se abra."""
+
+    def __init__(self, name="ollama", model=None, gate=None):
+        self.provider_name = name
+        self.model = model or f"{name}-model"
+        self.history = []
+        self.last_usage = None
+        self.last_error = None
+        self.gate = gate
+        self.prompts = []
+
+    def stream_message(self, prompt):
+        self.prompts.append(prompt)
+        self.history.append({"role": "user", "content": prompt})
+        if self.gate is not None:
+            assert self.gate.wait(5)
+        for word in ("eco:", prompt):
+            time.sleep(0.01)
+            yield word + " "
+        self.history.append({"role": "assistant", "content": f"eco: {prompt} "})
+
+class RoutedProvider(EchoProvider):
+    """Como AutoProvider: tras el primer turno, provider_name y model son los del backend elegido."""
+
+    def __init__(self, model=None, gate=None):
+        super().__init__("auto", gate=gate)
+        self.policy = model or "fastest"
+        self.route = None
+
+    @property
+    def provider_name(self):
+        return self.route.provider_name if self.route else "auto"
+
+    @provider_name.setter
+    def provider_name(self, value):
+        pass
+
+    @property
+    def model(self):
+        return self.route.key if self.route else f"auto ({self.policy})"
+
+    @model.setter
+    def model(self, value):
+        pass
+
+    def stream_message(self, prompt):
+        self.route = SimpleNamespace(key="openai:gpt-4o-mini", provider_name="openai", model="gpt-4o-mini",
+                                     reason="más rápido")
+        yield from super().stream_message(prompt)
+
+class Warmer:
+    def __init__(self):
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+@pytest.fixture
+def created(tmp_path, monkeypatch):
+    """Aísla la app (historial y uso en tmp_path, sin config) y anota los proveedores que crea."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("chat_cli.config.load_config", lambda: {})
+    calls = []
+
+    def factory(name, model=None, **kwargs):
+        calls.append((name, model))
+        return RoutedProvider(model) if name == "auto" else EchoProvider(name, model)
+    monkeypatch.setattr("chat_cli.providers.create_provider", factory)
+    return calls
+
+async def _until(pilot, condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "la condición no se cumplió a tiempo"
+        await pilot.pause(0.02)
+
+async def _submit(pilot, app, text):
+    app.query_one("#input_panel").value = text
+    await pilot.press("enter")
+
+def _idle(app):
+    return all(not tab.busy and not tab.parallel and not tab.queue for tab in app.tabs)
+
+def test_new_tab_and_reload_keep_auto_after_a_routed_turn(created):
+    async def scenario():
+        app = ChatApp(RoutedProvider(), "auto (fastest)", stream=True)
+        async with app.run_test() as pilot:
+            await _submit(pilot, app, "hola")
+            await _until(pilot, lambda: _idle(app) and len(app.tab.conversation) == 2)
+            assert app.tab.provider_name == "openai" and app.tab.provider_key == "auto"
+            await pilot.press("ctrl+t")
+            await _until(pilot, lambda: len(app.tabs) == 2)
+            assert isinstance(app.tabs[1].provider, RoutedProvider) and app.tabs[1].provider_key == "auto"
+            # Cambiar la sección del backend elegido no convierte la pestaña auto en un OpenAIProvider
+            app._on_config_reloaded({"providers": {"openai": {"timeout": 1}}}, {"providers": {"openai": {"timeout": 2}}})
+            await _until(pilot, lambda: "Configuración recargada" in str(app.tab.transcript[-1].content))
+            assert all(isinstance(tab.provider, RoutedProvider) for tab in app.tabs)
+
+    asyncio.run(scenario())
+    assert created == [("auto", "fastest")]
+
+def test_reload_recreates_provider_with_history_and_prewarm(created, monkeypatch):
+    from chat_cli.providers.ollama import OllamaProvider
+    monkeypatch.setenv("OLLAMA_HOST", "http://127.0.0.1:9")  # Sin servidor: el precalentamiento falla al instante
+    prewarmed = []
+    monkeypatch.setattr("chat_cli.providers.connection.start_prewarm", prewarmed.append)
+    factory, threads = providers.create_provider, []
+
+    def in_thread(*args, **kwargs):
+        threads.append(threading.current_thread())
+        return factory(*args, **kwargs)
+    monkeypatch.setattr("chat_cli.providers.create_provider", in_thread)
+
+    async def scenario():
+        # Un proveedor de chat_cli.providers (los remotos del daemon no se recrean)
+        provider = OllamaProvider(model="llama-test")
+        provider.connection_warmer = Warmer()
+        app = ChatApp(provider, "llama-test", stream=True)
+        async with app.run_test() as pilot:
+            app.tab.conversation.add("user", "hola", "2025-01-01 10:00:00")
+            app._on_config_reloaded({"providers": {"ollama": {"num_ctx": 1}}}, {"providers": {"ollama": {"num_ctx": 2}}})
+            await _until(pilot, lambda: app.tab.provider is not provider)
+            replacement = app.tab.provider
+            assert replacement is not provider and replacement.history is app.tab.conversation
+            assert provider.connection_warmer.stopped and prewarmed == [replacement]
+            assert "ollama actualizado" in str(app.tab.transcript[-1].content)
+
+    asyncio.run(scenario())
+    assert created == [("ollama", "llama-test")]
+    assert threads and threading.main_thread() not in threads  # El bucle de eventos no se bloquea
+
+def test_closing_a_tab_or_the_app_stops_keepalive_probes(created):
+    provider = EchoProvider()
+    provider.connection_warmer = Warmer()
+
+    async def scenario():
+        app = ChatApp(provider, "ollama-model")
+        async with app.run_test() as pilot:
+            await pilot.press("ctrl+t")
+            await _until(pilot, lambda: len(app.tabs) == 2)
+            second = app.tabs[1].provider
+            second.connection_warmer = Warmer()
+            await _submit(pilot, app, "/tab close")
+            await _until(pilot, lambda: len(app.tabs) == 1)
+            assert second.connection_warmer.stopped and not provider.connection_warmer.stopped
+
+    asyncio.run(scenario())
+    assert provider.connection_warmer.stopped  # Al salir de la app
+
+def test_loadhistory_reports_whether_the_model_receives_it(created):
+    class NoHistoryProvider:
+        provider_name = "remoto"
+        model = "m"
+
+        def send_message(self, prompt):
+            return "ok"
+
+    async def scenario(provider):
+        app = ChatApp(provider, "m")
+        async with app.run_test() as pilot:
+            app.tab.conversation.add("user", "antes", "2025-01-01 10:00:00")
+            app.tab.conversation.start = 1  # Archivado, como al arrancar
+            await _submit(pilot, app, "/loadhistory")
+            await pilot.pause(0.05)
+            return str(app.tab.transcript[-1].content)
+
+    assert "en el contexto del modelo" in asyncio.run(scenario(EchoProvider()))
+    assert "no los recibe" in asyncio.run(scenario(NoHistoryProvider()))
+
+def test_prompts_wait_in_queue_while_the_tab_is_busy(created):
+    gate = threading.Event()
+    provider = EchoProvider("ollama", "llama-test", gate=gate)
+
+    async def scenario():
+        app = ChatApp(provider, "llama-test", stream=True)
+        async with app.run_test() as pilot:
+            tab = app.tab
+            await _submit(pilot, app, "a")
+            await _until(pilot, lambda: tab.busy)
+            for text in ("b", "c"):
+                await _submit(pilot, app, text)
+            assert [item.text for item in tab.queue] == ["b", "c"] and "+2" in tab.label()
+            assert "Cola:" in app.status_text
+            await _submit(pilot, app, "/queue edit 2 c editado")
+            await _submit(pilot, app, "/queue cancel 1")
+            assert [item.text for item in tab.queue] == ["c editado"]
+            gate.set()
+            await _until(pilot, lambda: _idle(app) and len(tab.conversation) == 4)
+            return [message["content"] for message in tab.conversation]
+
+    assert asyncio.run(scenario()) == ["a", "eco: a ", "c editado", "eco: c editado "]
+    assert provider.prompts == ["a", "c editado"]
+
+def test_independent_prompt_runs_in_parallel_on_a_routed_auto_tab(created, monkeypatch):
+    gate = threading.Event()
+    gate.set()
+    provider = RoutedProvider(gate=gate)
+    parallel = []
+    factory = providers.create_provider  # La del fixture `created`
+    monkeypatch.setattr("chat_cli.providers.create_provider",
+                        lambda *args, **kwargs: parallel.append(factory(*args, **kwargs)) or parallel[-1])
+
+    async def scenario():
+        app = ChatApp(provider, "auto (fastest)", stream=True)
+        async with app.run_test() as pilot:
+            tab = app.tab
+            await _submit(pilot, app, "hola")
+            await _until(pilot, lambda: _idle(app) and len(tab.conversation) == 2)
+            gate.clear()
+            await _submit(pilot, app, "lento")
+            await _until(pilot, lambda: tab.busy)
+            # `&` no espera al turno en curso: se crea otra instancia de auto (no de su backend)
+            await _submit(pilot, app, "& rápido")
+            await _until(pilot, lambda: tab.deferred_turns)
+            assert tab.busy and not tab.queue and tab.parallel == 0
+            gate.set()
+            await _until(pilot, lambda: _idle(app) and not tab.deferred_turns)
+            return [message["content"] for message in tab.conversation]
+
+    # El turno independiente terminó antes, pero se registra después del que estaba en curso
+    assert asyncio.run(scenario()) == ["hola", "eco: hola ", "lento", "eco: lento ", "rápido", "eco: rápido "]
+    assert created == [("auto", "fastest")]
+    # Su contexto son los intercambios completos: sin el prompt "lento", que aún no tenía respuesta
+    history = parallel[0].history
+    assert [message["content"] for message in history] == ["hola", "eco: hola ", "rápido", "eco: rápido "]
+    assert history[-3]["role"] == "assistant"
@@ -0,0 +1,38 @@
+import os
+import tempfile
+import types
+from chat_cli import usage
+
+def test_estimate_tokens_is_reasonable():
+    assert usage.estimate_tokens("") == 0
+    assert usage.estimate_tokens("hola") == 1
+    text = "The quick brown fox jumps over the lazy dog."
+    assert 8 <= usage.estimate_tokens(text) <= 14
+
+def test_resolve_usage_prefers_provider_data():
+    provider = types.SimpleNamespace(last_usage={"prompt_tokens": 12, "completion_tokens": 34})
+    result = usage.resolve_usage(provider, "hola", "respuesta")
+    assert result == {"prompt_tokens": 12, "completion_tokens": 34, "estimated": False}
+
+def test_resolve_usage_falls_back_to_estimate():
+    provider = types.SimpleNamespace(last_usage=None)
+    result = usage.resolve_usage(provider, "hola mundo", "respuesta")
+    assert result["estimated"] is True
+    assert result["prompt_tokens"] == usage.estimate_tokens("hola mundo")
+
+def test_compute_cost_uses_longest_prefix():
+    cost = usage.compute_cost("openai", "gpt-4o-mini-2024-07-18", 1_000_000, 0)
+    assert cost == 0.15
+    assert usage.compute_cost("ollama", "llama3", 10**6, 10**6) == 0.0
+
+def test_tracker_persists_and_reports():
+    with tempfile.TemporaryDirectory() as tmp:
+        log = os.path.join(tmp, "usage.jsonl")
+        tracker = usage.UsageTracker(log)
+        provider = types.SimpleNamespace(last_usage={"prompt_tokens": 100, "completion_tokens": 50})
+        tracker.record_turn("openai", "gpt-4o", provider, "hola", "respuesta")
+        tracker.record_turn("openai", "gpt-4o", provider, "hola", "respuesta")
+        assert tracker.session_tokens == 300
+        assert usage.UsageTracker(log).today_tokens == 300
+        rows = usage.usage_report(log, days=1)
+        assert len(rows) == 1 and rows[0]["turns"] == 2